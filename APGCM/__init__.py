@@ -11,6 +11,7 @@ from file_handlers.gen_file import (
     TextFileHandler,
 )
 from handler.save_handler import AbstractCWSaveHandler, JsonSaveHandler
+from handler.save_search import SaveSearcher
 from handler.stream_handler import (
     AbstractStreamOutputHandler,
     DisMessageSplitStreamHandler,
@@ -21,6 +22,7 @@ from settings import SETTINGS_BAG
 from templates.cw_factory import ChatFactory
 from templates.template_selector import TemplateSelector, template_select
 from chat.exporter import export_data
+from chat.profiles import ModeProfile, register_profile, get_profile
 
 def print_dir():
     print(dir())
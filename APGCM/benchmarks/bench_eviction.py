@@ -0,0 +1,89 @@
+"""Compares the eviction policies(see chat/eviction.py) with fifo on the chat logs in testing/test_chat_logs.
+Each chat log is added one message at a time to a TrimChatLog with a 4000 token limit, then the trimmed chat log is scored:
+    useful: the share of its tokens in messages whose content isn't already in it(repeated messages add nothing).
+    words/100: distinct words per 100 tokens.
+    first user: whether the first user message(what the conversation is about) is still there, the message itself rather than a repeat of it.
+Run from APGCM: python benchmarks/bench_eviction.py
+"""
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat  # noqa: E402
+from chat.eviction import eviction_policies  # noqa: E402
+
+CHAT_LOGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "testing", "test_chat_logs")
+MAX_TOKENS = 4000
+MAX_COMPLETION_TOKENS = 1000
+
+
+def score(trim: chat.TrimChatLog, first_user: chat.Message) -> dict:
+    seen = set()
+    useful = 0
+    words = set()
+    for msg in trim.trimmed_chatlog:
+        if msg.content not in seen:
+            seen.add(msg.content)
+            useful += trim._message_token_bounds(msg)[1]
+        words.update(msg.content.lower().split())
+    tokens = max(trim.trimmed_chatlog_tokens, 1)
+    return {
+        "messages": len(trim.trimmed_chatlog),
+        "tokens": trim.trimmed_chatlog_tokens,
+        "useful": useful / tokens,
+        "words": 100 * len(words) / tokens,
+        "first_user": any(msg is first_user for msg in trim.trimmed_chatlog),
+    }
+
+
+def run(messages: list[dict], policy: str) -> tuple[float, dict]:
+    trim = chat.TrimChatLog(max_tokens=MAX_TOKENS, max_completion_tokens=MAX_COMPLETION_TOKENS, eviction_policy=policy)
+    factory = trim.get_message_factory()
+    first_user = None
+    start = time.perf_counter()
+    for message in messages:
+        msg = factory(message["content"], message["role"])
+        if first_user is None and msg.role == "user":
+            first_user = msg
+        trim.add_message(msg)
+    elapsed = time.perf_counter() - start
+    result = score(trim, first_user)
+    result["evicted_tokens"] = trim.eviction_stats["evicted_tokens"]
+    return elapsed, result
+
+
+def main():
+    # warm up tiktoken
+    chat.tokenizer.count_tokens("warm up", "gpt-4")
+    totals = {policy: {"useful": 0.0, "words": 0.0, "first_user": 0, "time": 0.0} for policy in eviction_policies}
+    paths = sorted(glob.glob(os.path.join(CHAT_LOGS, "*.json")))
+    for path in paths:
+        with open(path) as f:
+            messages = [message for message in json.load(f) if message.get("role") in ("user", "assistant")]
+        print(f"{os.path.basename(path)}: {len(messages)} messages")
+        for policy in eviction_policies:
+            elapsed, result = run(messages, policy)
+            total = totals[policy]
+            total["useful"] += result["useful"]
+            total["words"] += result["words"]
+            total["first_user"] += result["first_user"]
+            total["time"] += elapsed
+            print(
+                f"  {policy:<18} {result['messages']:>4} messages {result['tokens']:>5} tokens, useful {result['useful']:.2f},"
+                f" words/100 {result['words']:5.1f}, first user {str(result['first_user']):<5}, evicted {result['evicted_tokens']:>6} tokens,"
+                f" {elapsed * 1000:7.1f} ms"
+            )
+    print(f"mean over {len(paths)} chat logs:")
+    for policy, total in totals.items():
+        print(
+            f"  {policy:<18} useful {total['useful'] / len(paths):.2f}, words/100 {total['words'] / len(paths):5.1f},"
+            f" first user kept in {total['first_user']}/{len(paths)}, {total['time'] * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
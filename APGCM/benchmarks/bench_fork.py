@@ -0,0 +1,68 @@
+"""Benchmarks forking a TrimChatLog with a 10k message history, against saving it and loading it back(what help mode used to do).
+Run from APGCM: python benchmarks/bench_fork.py
+
+Compares:
+    - fork(), and fork() then reset() like help mode
+    - the first message added to a fork, which copies the chat log's list of messages
+    - make_save_dict, json and load_from_save_dict, and load_full_history after it(the chat log is only loaded when it is needed, see TrimChatLog Lazy Loading)
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat  # noqa: E402
+
+MESSAGES = 10_000
+REPEATS = 20
+WORDS = "the quick brown fox jumps over a lazy dog while python code runs tests and prints results".split()
+
+
+def make_trim() -> chat.TrimChatLog:
+    random.seed(0)
+    trim = chat.TrimChatLog(model="gpt-4", max_tokens=8000, system_prompt="You are a helpful assistant.")
+    messages = []
+    for i in range(MESSAGES):
+        content = " ".join(random.choice(WORDS) for _ in range(random.randint(20, 200)))
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append(chat.Message(role, content, "gpt-4"))
+    trim.add_messages(messages)
+    return trim
+
+
+def timed(function) -> float:
+    """The best of REPEATS runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def save_and_load(trim: chat.TrimChatLog, full: bool) -> None:
+    loaded = chat.TrimChatLog()
+    loaded.load_from_save_dict(json.loads(json.dumps(trim.make_save_dict())))
+    if full:
+        loaded.load_full_history()
+
+
+def fork_and_add(trim: chat.TrimChatLog) -> None:
+    trim.fork().user_message = "one more message"
+
+
+def main():
+    trim = make_trim()
+    print(f"{MESSAGES} messages, {len(trim.trimmed_chatlog)} in the trimmed chat log")
+    print(f"fork: {timed(trim.fork):.3f} ms")
+    print(f"fork and reset(help mode): {timed(lambda: trim.fork().reset()):.3f} ms")
+    print(f"fork and add a message: {timed(lambda: fork_and_add(trim)):.3f} ms")
+    print(f"save and load: {timed(lambda: save_and_load(trim, False)):.1f} ms")
+    print(f"save and load, full history: {timed(lambda: save_and_load(trim, True)):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmarks switching the model of a TrimChatLog with a 10k message history.
+Run from APGCM: python benchmarks/bench_retokenize.py
+
+Compares:
+    - switching to a model with the same encoding(nothing is recounted)
+    - switching to a model with a different encoding(TrimChatLog.retokenize, one batch on tokenizer threads)
+    - counting each message on its own, the way new Message objects are counted
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat  # noqa: E402
+from chat import tokenizer  # noqa: E402
+
+MESSAGES = 10_000
+WORDS = "the quick brown fox jumps over a lazy dog while python code runs tests and prints results".split()
+
+
+def make_trim() -> chat.TrimChatLog:
+    random.seed(0)
+    trim = chat.TrimChatLog(model="gpt-4", max_tokens=8000)
+    messages = []
+    for i in range(MESSAGES):
+        content = " ".join(random.choice(WORDS) for _ in range(random.randint(20, 200)))
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append(chat.Message(role, content, "gpt-4"))
+    trim.add_messages(messages)
+    return trim
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    trim = make_trim()
+    print(f"{MESSAGES} messages, {len(trim.trimmed_chatlog)} in the trimmed chat log, {os.cpu_count()} CPUs")
+    print(f"same encoding(gpt-4 -> gpt-3.5-turbo): {timed(lambda: setattr(trim, 'model', 'gpt-3.5-turbo')) * 1000:.1f} ms")
+    print(f"other encoding(gpt-3.5-turbo -> text-davinci-003): {timed(lambda: setattr(trim, 'model', 'text-davinci-003')) * 1000:.1f} ms")
+    contents = [msg.content for msg in trim.chatlog.data]
+    for threads in (1, 4):
+        print(f"count_tokens_batch, {threads} threads: {timed(lambda: tokenizer.count_tokens_batch(contents, 'gpt-4', num_threads=threads)) * 1000:.1f} ms")
+    print(f"one message at a time: {timed(lambda: [chat.Message('user', content, 'gpt-4') for content in contents]) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
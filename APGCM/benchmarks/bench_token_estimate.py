@@ -0,0 +1,48 @@
+"""Benchmarks adding a 10k message history to a TrimChatLog with exact token counts and with token estimates.
+Run from APGCM: python benchmarks/bench_token_estimate.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat  # noqa: E402
+from chat import tokenizer  # noqa: E402
+
+MESSAGES = 10_000
+WORDS = "the quick brown fox jumps over a lazy dog while python code runs tests and prints results".split()
+
+
+def make_history() -> list[dict]:
+    random.seed(0)
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": " ".join(random.choice(WORDS) for _ in range(random.randint(20, 200)))}
+        for i in range(MESSAGES)
+    ]
+
+
+def run(history: list[dict], token_estimate: bool) -> tuple[float, chat.TrimChatLog]:
+    tokenizer.estimator.reset_stats()
+    trim = chat.TrimChatLog(model="gpt-4", max_tokens=8000, token_estimate=token_estimate)
+    start = time.perf_counter()
+    trim.add_messages_from_dict(history)
+    trim.get_finished_chatlog()
+    return time.perf_counter() - start, trim
+
+
+def main():
+    history = make_history()
+    # warm up tiktoken
+    tokenizer.count_tokens("warm up", "gpt-4")
+    exact_time, exact = run(history, False)
+    estimate_time, estimated = run(history, True)
+    print(f"{MESSAGES} messages, {len(exact.trimmed_chatlog)} in the trimmed chat log")
+    print(f"exact:     {exact_time * 1000:.1f} ms, {exact.trimmed_chatlog_tokens} tokens")
+    print(f"estimated: {estimate_time * 1000:.1f} ms, {estimated.trimmed_chatlog_tokens} tokens, {len(estimated.trimmed_chatlog)} messages")
+    print(f"stats: {estimated.token_estimate_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,28 @@ import unittest
 import exceptions
 
 from chat.chatlog import ChatLog, AbstractChatLog
+from chat.stored_chatlog import StoredChatLog, embed_saved_messages, refers_to_storage, saved_message_count
+from chat.jsonl_chatlog import JsonlChatLog
+from chat.sqlite_chatlog import SqliteChatLog
+from chat.tiered_chatlog import TieredChatLog
+from chat.chatlog_handlers import make_chatlog, get_chatlog_class
 from chat.exporter import Exporter, MarkdownExporter, TextExporter, export_data
 from chat.message import Message, MessageFactory
+from chat.views import MessageView, MessageWindow
+from chat.search import InvertedIndex, SearchResult
+from chat.eviction import (
+    EvictionPolicy,
+    EvictionQueue,
+    KeepFirstUserEviction,
+    LongestLowValueEviction,
+    RoleWeightedEviction,
+    register_eviction_policy,
+)
+from chat.arrays import MessageArrays, ArraysView
+from chat.retrieval import VectorIndex, Embedder, HashingEmbedder, RetrievalResult, register_embedder
+from chat.compaction import HistoryCompactor, Summarizer, ExtractiveSummarizer, CompletionSummarizer
+from chat.wildcards import Wildcard, WildcardRenderer, register_wildcard, unregister_wildcard
 from chat.system_prompt import SystemPrompt, Reminder
-from chat.trim_chat_log import TrimChatLog
+from chat.profiles import ModeProfile, PreparedProfile, register_profile, unregister_profile, get_profile
+from chat.trim_chat_log import TrimChatLog, OversizePolicy
 
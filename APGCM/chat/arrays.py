@@ -0,0 +1,251 @@
+import base64
+import binascii
+import time
+from collections import namedtuple
+from typing import Iterable
+
+import exceptions
+from chat.message import Message
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""Message arrays, the token counts, roles and times of a chat log's messages as numpy arrays kept next to its Message objects(see ChatLog.arrays).
+Questions about the whole history(how many tokens each role has, how many of the newest messages fit in a budget, which messages were sent in a time range) are then a few vectorized operations(bincount, cumsum, searchsorted) instead of a loop over every Message.
+Needs numpy, see is_available.
+"""
+# tests can be found in tests/test_arrays.py
+
+ArraysView = namedtuple("ArraysView", ["tokens", "roles", "timestamps"])
+
+
+def is_available() -> bool:
+    """Returns True if numpy is installed, which the message arrays need."""
+    return np is not None
+
+
+class MessageArrays:
+    """Parallel arrays with an entry for each message of a chat log, in order.
+    Columns:
+        tokens(int32): The most tokens each message can have(its count once it is counted, see chat/tokenizer.py TokenEstimator), without the chat format overhead.
+        roles(int8): The code of each message's role, the position of the role in role_names.
+        timestamps(float64): When each message was added(seconds since the epoch), 0 if it isn't known(ie messages added before the arrays were built). Never decreases, a message is never before the one before it.
+    The arrays are allocated with room to spare and doubled when full, so adding a message is amortized O(1). The columns(and view) are slices of them, numpy views that share their memory.
+    Methods:
+        append(tokens, role, timestamp), extend(messages): Add messages at the end.
+        view(start, end) -> ArraysView: The columns of some of the messages, without copying them.
+        set_tokens(counts): Replaces the token column, used when the chat log is counted again.
+        set_timestamps(timestamps, start): Replaces the times of some of the messages.
+        role_totals(start, end) -> dict: The messages and tokens of each role.
+        fit_from_end(budget, overhead, max_messages, end) -> int: Where the newest messages that fit in a budget start.
+        time_range(start_time, end_time) -> tuple[int, int]: The positions of the messages added in a time range.
+        stats() -> dict: Totals for the whole history.
+        to_dict, from_dict: Saving and loading.
+        extend_saved: Adds messages to saved arrays.
+        copy() -> MessageArrays: A copy that doesn't share memory, for ChatLog.fork.
+    Raises MessageArraysNotAvailableError if numpy isn't installed.
+    """
+
+    version = 1
+    initial_size = 64
+
+    def __init__(self) -> None:
+        if np is None:
+            raise exceptions.MessageArraysNotAvailableError("numpy")
+        self.clear()
+
+    def clear(self) -> None:
+        self._tokens = np.zeros(self.initial_size, dtype=np.int32)
+        self._roles = np.zeros(self.initial_size, dtype=np.int8)
+        self._timestamps = np.zeros(self.initial_size, dtype=np.float64)
+        self._length = 0
+        self.role_names: list[str] = list(Message.allowed_roles)
+        self._role_codes = {role: code for code, role in enumerate(self.role_names)}
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def tokens(self) -> "np.ndarray":
+        return self._tokens[: self._length]
+
+    @property
+    def roles(self) -> "np.ndarray":
+        return self._roles[: self._length]
+
+    @property
+    def timestamps(self) -> "np.ndarray":
+        return self._timestamps[: self._length]
+
+    def view(self, start: int = 0, end: int = None) -> ArraysView:
+        """The columns of the messages from start to end(like a slice of the chat log), views of the arrays rather than copies."""
+        start, end, _ = slice(start, end).indices(self._length)
+        return ArraysView(self._tokens[start:end], self._roles[start:end], self._timestamps[start:end])
+
+    def role_code(self, role: str) -> int:
+        """The code of a role, giving it the next code if it is new."""
+        code = self._role_codes.get(role)
+        if code is None:
+            code = len(self.role_names)
+            self.role_names.append(role)
+            self._role_codes[role] = code
+        return code
+
+    def _reserve(self, size: int) -> None:
+        """Makes room for size messages, doubling the arrays until they fit."""
+        if size <= len(self._tokens):
+            return
+        capacity = max(len(self._tokens) * 2, size)
+        for name in ("_tokens", "_roles", "_timestamps"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: self._length] = old[: self._length]
+            setattr(self, name, new)
+
+    def append(self, tokens: int, role: str, timestamp: float = None) -> None:
+        """Adds a message, timestamp defaults to now."""
+        self._reserve(self._length + 1)
+        last = self._timestamps[self._length - 1] if self._length > 0 else 0.0
+        self._tokens[self._length] = tokens
+        self._roles[self._length] = self.role_code(role)
+        self._timestamps[self._length] = max(time.time() if timestamp is None else timestamp, last)
+        self._length += 1
+
+    def extend(self, messages: Iterable[Message], timestamp: float = None) -> None:
+        """Adds messages, all with the same timestamp(defaults to now, use 0 if it isn't known)."""
+        messages = list(messages)
+        end = self._length + len(messages)
+        self._reserve(end)
+        last = self._timestamps[self._length - 1] if self._length > 0 else 0.0
+        self._tokens[self._length : end] = [msg.token_bounds[1] for msg in messages]
+        self._roles[self._length : end] = [self.role_code(msg.role) for msg in messages]
+        self._timestamps[self._length : end] = max(time.time() if timestamp is None else timestamp, last)
+        self._length = end
+
+    def set_timestamps(self, timestamps: Iterable[float], start: int) -> None:
+        """Replaces the times of the messages from start, ie messages added to a chat log after they were sent. The times are raised where needed so they never decrease."""
+        timestamps = np.fromiter(timestamps, dtype=np.float64)
+        end = start + len(timestamps)
+        if len(timestamps) == 0 or start < 0 or end > self._length:
+            return
+        previous = self._timestamps[start - 1] if start > 0 else 0.0
+        self._timestamps[start:end] = np.maximum.accumulate(np.maximum(timestamps, previous))
+        if end < self._length:
+            self._timestamps[end : self._length] = np.maximum(self._timestamps[end : self._length], self._timestamps[end - 1])
+
+    def set_tokens(self, counts: Iterable[int]) -> None:
+        """Replaces the token count of every message."""
+        counts = np.fromiter(counts, dtype=np.int32, count=self._length)
+        self._tokens[: self._length] = counts
+
+    def role_totals(self, start: int = 0, end: int = None) -> dict[str, dict[str, int]]:
+        """The number of messages and tokens of each role from start to end, {role: {"messages": int, "tokens": int}}. Roles without messages are left out."""
+        tokens, roles, _ = self.view(start, end)
+        counts = np.bincount(roles, minlength=len(self.role_names))
+        totals = np.bincount(roles, weights=tokens, minlength=len(self.role_names))
+        return {
+            role: {"messages": int(counts[code]), "tokens": int(totals[code])}
+            for code, role in enumerate(self.role_names)
+            if counts[code] > 0
+        }
+
+    def costs(self, overhead: dict[str, int] = None, start: int = 0, end: int = None) -> "np.ndarray":
+        """The tokens of each message from start to end plus the overhead of its role(ie the chat format, see tokenizer.message_overhead), a new array."""
+        tokens, roles, _ = self.view(start, end)
+        if not overhead:
+            return tokens.astype(np.int64)
+        per_code = np.array([overhead.get(role, 0) for role in self.role_names], dtype=np.int64)
+        return tokens + per_code[roles]
+
+    def fit_from_end(self, budget: int, overhead: dict[str, int] = None, max_messages: int = None, end: int = None) -> int:
+        """Returns the position of the oldest message of the newest messages(before end) whose costs fit in budget, end if not even the newest fits.
+        The costs are summed from the newest back(cumsum) and the budget is found with a binary search(searchsorted), so it costs a few passes over the arrays whatever the budget.
+        """
+        _, end, _ = slice(0, end).indices(self._length)
+        sums = np.cumsum(self.costs(overhead, 0, end)[::-1])
+        fitting = int(np.searchsorted(sums, budget, side="right"))
+        if max_messages is not None:
+            fitting = min(fitting, max_messages)
+        return end - fitting
+
+    def time_range(self, start_time: float = None, end_time: float = None) -> tuple[int, int]:
+        """The start and end positions of the messages added from start_time up to(not including) end_time, found with a binary search."""
+        timestamps = self.timestamps
+        start = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, side="left"))
+        end = self._length if end_time is None else int(np.searchsorted(timestamps, end_time, side="left"))
+        return start, max(start, end)
+
+    def stats(self) -> dict:
+        """The messages and tokens of the whole history, of each role, the longest message and when the first and last messages(with a known time) were added."""
+        tokens = self.tokens
+        known = self.timestamps[self.timestamps > 0]
+        return {
+            "messages": self._length,
+            "tokens": int(tokens.sum()),
+            "longest": int(tokens.max()) if self._length > 0 else 0,
+            "roles": self.role_totals(),
+            "first_time": float(known[0]) if len(known) > 0 else None,
+            "last_time": float(known[-1]) if len(known) > 0 else None,
+        }
+
+    def copy(self) -> "MessageArrays":
+        """Returns a copy of the arrays(with the same room to spare) that doesn't share their memory."""
+        copied = MessageArrays.__new__(MessageArrays)
+        copied._tokens = self._tokens.copy()
+        copied._roles = self._roles.copy()
+        copied._timestamps = self._timestamps.copy()
+        copied._length = self._length
+        copied.role_names = list(self.role_names)
+        copied._role_codes = dict(self._role_codes)
+        return copied
+
+    def to_dict(self) -> dict:
+        """Returns a json friendly dictionary of the arrays, each column as a base64 little endian array."""
+        return {
+            "version": self.version,
+            "length": self._length,
+            "role_names": list(self.role_names),
+            "tokens": _encode(self.tokens, "<i4"),
+            "roles": _encode(self.roles, "<i1"),
+            "timestamps": _encode(self.timestamps, "<f8"),
+        }
+
+    @classmethod
+    def from_dict(cls, save: dict) -> "MessageArrays":
+        """Loads arrays saved with to_dict. Raises BadSaveDictionaryError if they aren't formatted correctly."""
+        arrays = cls()
+        try:
+            length = int(save["length"])
+            role_names = [str(role) for role in save["role_names"]]
+            columns = [_decode(save["tokens"], "<i4"), _decode(save["roles"], "<i1"), _decode(save["timestamps"], "<f8")]
+            if any(len(column) != length for column in columns) or (length > 0 and (columns[1].min() < 0 or columns[1].max() >= len(role_names))):
+                raise ValueError
+        except (KeyError, TypeError, ValueError, binascii.Error):
+            raise exceptions.BadSaveDictionaryError("The message arrays in the save are not formatted correctly.")
+        arrays.role_names = role_names
+        arrays._role_codes = {role: code for code, role in enumerate(role_names)}
+        arrays._reserve(length)
+        arrays._tokens[:length], arrays._roles[:length], arrays._timestamps[:length] = columns
+        arrays._length = length
+        return arrays
+
+    @classmethod
+    def extend_saved(cls, save: dict, messages: Iterable[Message], timestamps: Iterable[float]) -> dict:
+        """Returns arrays saved with to_dict with more messages added, used by TrimChatLog to save messages added before its full chat log was loaded. Raises BadSaveDictionaryError if the save isn't formatted correctly."""
+        arrays = cls.from_dict(save)
+        for msg, timestamp in zip(messages, timestamps):
+            arrays.append(msg.token_bounds[1], msg.role, timestamp)
+        return arrays.to_dict()
+
+    def __repr__(self) -> str:
+        return f"MessageArrays({self._length} messages, {int(self.tokens.sum())} tokens)"
+
+
+def _encode(array: "np.ndarray", dtype: str) -> str:
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode("ascii")
+
+
+def _decode(encoded: str, dtype: str) -> "np.ndarray":
+    return np.frombuffer(base64.b64decode(encoded, validate=True), dtype=dtype)
@@ -1,8 +1,13 @@
 import tiktoken
 import exceptions
-from chat import message, exporter
+from chat import message, exporter, tokenizer, retrieval, arrays
+from chat.views import MessageView
+from chat.search import InvertedIndex, SearchResult, make_snippet, parse_query
+from chat.retrieval import Embedder, RetrievalResult, VectorIndex
+from chat.arrays import MessageArrays
 from abc import ABC, abstractmethod
 from collections import UserList
+import copy
 import csv
 import datetime
 from typing import (
@@ -25,10 +30,12 @@ from typing import (
 )
 import json
 import uuid
+import weakref
 
 
 class AbstractChatLog(ABC):
-
+    # the embedder of the vector index, None for the default(see chat/retrieval.py)
+    embedder: Embedder = None
 
     @property
     @abstractmethod
@@ -98,6 +105,75 @@ class AbstractChatLog(ABC):
     def __len__(self) -> int:
         pass
 
+    def last(self, role: str = None) -> message.Message | None:
+        """Returns the newest message, or the newest message of a role, or None. Subclasses with an index should override this."""
+        for msg in self.get_messages(role=role, limit=1, reverse=True):
+            return msg
+        return None
+
+    def recount_tokens(self) -> int:
+        """Counts the tokens of the messages again with the chat log's model, after it was changed to a model with a different encoding. Returns the number of messages recounted. Chat logs that store token counts override this."""
+        return 0
+
+    def fork(self) -> "ChatLog":
+        """Returns a copy of the chat log that can be changed without changing this one, see ChatLog.fork. This default copies every message(and the saved indexes) into an in-memory ChatLog, for chat logs that don't implement their own(ChatLog and the stored chat logs do, see StoredChatLog Forking)."""
+        forked = ChatLog(self.model)
+        forked.load_from_dict(self.make_save_dict())
+        return forked
+
+    def hint_window_size(self, size: int) -> None:
+        """Called by TrimChatLog with the number of messages in its trimmed window. Chat logs that move old messages out of memory(TieredChatLog) keep at least that many in memory, the rest ignore it."""
+        pass
+
+    def _message_at(self, position: int) -> message.Message:
+        return self.data[position]
+
+    def _get_search_index(self) -> InvertedIndex:
+        """Returns a search index of every message. This default builds a new one each time, subclasses keep theirs up to date."""
+        index = InvertedIndex()
+        index.extend(msg.content for msg in self.get_messages(reverse=False))
+        return index
+
+    @property
+    def arrays(self) -> MessageArrays:
+        """The token counts, roles and times of the messages as numpy arrays, see chat/arrays.py. Needs numpy, raises MessageArraysNotAvailableError without it."""
+        return self._get_arrays()
+
+    def _get_arrays(self) -> MessageArrays:
+        """Returns message arrays of every message. This default builds new ones(without times) each time, subclasses keep theirs up to date."""
+        message_arrays = MessageArrays()
+        message_arrays.extend(self.get_messages(reverse=False), timestamp=0)
+        return message_arrays
+
+    def _get_vector_index(self) -> VectorIndex:
+        """Returns a vector index of every message. This default builds a new one each time, subclasses keep theirs up to date."""
+        index = VectorIndex(self.embedder)
+        index.extend(msg.content for msg in self.get_messages(reverse=False))
+        return index
+
+    def retrieve(self, query: str, limit: int = 3, keep: Callable[[int], bool] = None, min_score: float = 0.0) -> list[RetrievalResult]:
+        """Finds the messages most similar to the query with the vector index, see chat/retrieval.py. Needs numpy, raises RetrievalNotAvailableError without it.
+        Returns up to limit RetrievalResults(position, score, message), most similar first, skipping the positions keep returns False for.
+        """
+        index = self._get_vector_index()
+        return [RetrievalResult(position, score, self._message_at(position)) for position, score in index.search(query, limit=limit, keep=keep, min_score=min_score)]
+
+    def search(self, query: str, limit: int = 5, role: str = None, snippet_width: int = 160) -> list[SearchResult]:
+        """Searches the messages, see chat/search.py for the query syntax.
+        Returns up to limit SearchResults(position, score, message, snippet), best match first, optionally only messages of one role.
+        """
+        index = self._get_search_index()
+        keep = None
+        if role is not None:
+            keep = lambda position: self._message_at(position).role == role
+        phrases, keywords = parse_query(query)
+        terms = keywords + [word for phrase in phrases for word in phrase]
+        results = []
+        for position, score in index.search(query, limit=limit, keep=keep):
+            msg = self._message_at(position)
+            results.append(SearchResult(position, score, msg, make_snippet(msg.content, terms, snippet_width)))
+        return results
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}()"
 
@@ -139,13 +215,24 @@ class ChatLog( AbstractChatLog, UserList):
                 get_pretty_messages(self, role: str = None, reverse: bool = False,  limit: int = None): -> Iterator[str] Gets message(s) from the chatlog,
                 get_messages_as_dict(self, role: str = None, limit: int = None, reverse: bool = True, pretty: bool = False): -> list:  Gets message(s) from the chatlog,
                 get_finished_chat_log() -> List[dict] 
+                view(self, role: str = None, limit: int = None, reverse: bool = True, pretty: bool = False) -> MessageView: A copy free view of the messages, see chat/views.py
+                last(self, role: str = None) -> Message: The newest message(of a role), O(1)
+                search(self, query: str, limit: int = 5, role: str = None) -> list[SearchResult]: Ranked full text search, see chat/search.py
+                retrieve(self, query: str, limit: int = 3, keep = None) -> list[RetrievalResult]: The most similar messages from the vector index, see chat/retrieval.py
+            Analytics:
+                arrays -> MessageArrays: The token counts, roles and times of every message as numpy arrays, for per role totals, what fits in a budget and time ranges without a loop over the messages, see chat/arrays.py
             Saving:
                 make_save_dict(self) -> dict: Makes a save dictionary from the chatlog
                 load_from_save_dict(self, save_dict: dict) -> None: Loads a chatlog from a save dictionary
+            Forking:
+                fork(self) -> ChatLog: A copy that shares the messages until one of them is changed(copy on write), see Forking
             Misc:
                 __str__(self) -> str: Returns pretty printed chatlog
                 __repr__(self) -> str: Returns a representation of the chatlog
-            
+    Forking:
+        fork returns a copy of the chat log in O(1), the copy and the original share data(and its indexes) until one of them is changed. The first change copies data(a list of references, the Message objects are still shared), the role positions and the message arrays, the search and vector indexes are rebuilt the first time they are used.
+        Only add_message, add_messages, load_from_dict, reset and recount_tokens copy first, data must not be changed in place another way while it is shared.
+        Messages are shared by every fork even after the copy, so recount_tokens gives a forked chat log new Message objects rather than changing them.
                 
         
         
@@ -155,6 +242,22 @@ class ChatLog( AbstractChatLog, UserList):
         self._model = model
         self.uuid = str(uuid.uuid4())
         self.data = []
+        # positions of each role's messages in data, rebuilt if data is replaced or changed other than through add_message
+        self._role_positions: dict[str, list[int]] = {}
+        self._indexed_data = None
+        self._indexed_length = 0
+        # full text search index of data, updated by add_message and rebuilt if data is replaced or changed other than through add_message
+        self._search_index = InvertedIndex()
+        self._search_data = self.data
+        # vector index of data(see chat/retrieval.py), only built the first time retrieve is used, then updated by add_message like the search index
+        self._vector_index: VectorIndex = None
+        self._vector_data = self.data
+        # token counts, roles and times of data(see chat/arrays.py), updated by add_message and rebuilt(without the times) if data is replaced or changed other than through add_message, None without numpy
+        self._arrays: MessageArrays = MessageArrays() if arrays.is_available() else None
+        self._arrays_data = self.data
+        # see Forking, weak references to the chat logs that share data(one list shared by all of them, None if it isn't shared) and whether the Message objects are shared with another chat log
+        self._sharing: list[weakref.ref] = None
+        self._shares_messages = False
 
     # model getter and setter
     @property
@@ -185,10 +288,59 @@ class ChatLog( AbstractChatLog, UserList):
             )
         return msg
 
+    def fork(self) -> "ChatLog":
+        """Returns a copy of the chat log that shares data, its indexes and its Message objects with this one until one of them is changed, see Forking. Costs the same however many messages there are."""
+        forked = ChatLog.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        forked.uuid = str(uuid.uuid4())
+        if self._sharing is None:
+            self._sharing = [weakref.ref(self)]
+        self._sharing.append(weakref.ref(forked))
+        forked._sharing = self._sharing
+        self._shares_messages = forked._shares_messages = True
+        return forked
+
+    @property
+    def _is_shared(self) -> bool:
+        """True if data is shared with a fork that still exists, forks that were dropped are forgotten."""
+        if self._sharing is None:
+            return False
+        self._sharing[:] = [ref for ref in self._sharing if ref() is not None]
+        return len(self._sharing) > 1
+
+    def _stop_sharing(self) -> None:
+        """Leaves the chat logs sharing data, before it is replaced."""
+        if self._sharing is not None:
+            self._sharing[:] = [ref for ref in self._sharing if ref() is not None and ref() is not self]
+            self._sharing = None
+
+    def _unshare(self) -> None:
+        """Copies data before it is changed, with the role positions and message arrays if they are up to date, see Forking. The search and vector indexes go stale and are rebuilt when they are next used."""
+        self._stop_sharing()
+        data = list(self.data)
+        if self._indexed_data is self.data:
+            self._role_positions = {role: list(positions) for role, positions in self._role_positions.items()}
+            self._indexed_data = data
+        if self._arrays is not None and self._arrays_data is self.data:
+            self._arrays = self._arrays.copy()
+            self._arrays_data = data
+        self.data = data
+
     def add_message(self, msg: message.Message) -> None:
         """Adds a message to the chatlog. Must be a Message object. Use ChatLog.get_message_factory() to create a Message objects without worrying about the model."""
         msg = self._verify_Message(msg)
+        if self._is_shared:
+            self._unshare()
         self.data.append(msg)
+        if self._indexed_data is self.data and self._indexed_length == len(self.data) - 1:
+            self._role_positions.setdefault(msg.role, []).append(self._indexed_length)
+            self._indexed_length += 1
+        if self._search_data is self.data and len(self._search_index) == len(self.data) - 1:
+            self._search_index.add(msg.content)
+        if self._vector_index is not None and self._vector_data is self.data and len(self._vector_index) == len(self.data) - 1:
+            self._vector_index.add(msg.content)
+        if self._arrays is not None and self._arrays_data is self.data and len(self._arrays) == len(self.data) - 1:
+            self._arrays.append(msg.token_bounds[1], msg.role)
 
     def add_messages(self, messages: list) -> None:
         """Adds a list of messages to the chatlog."""
@@ -207,15 +359,25 @@ class ChatLog( AbstractChatLog, UserList):
 
     def make_save_dict(self) -> dict:
         """Creates a save file for the chatlog.
-        Returns a dictionary with the following keys: meta, model, messages.
+        Returns a dictionary with the following keys: meta, model, messages, token_counts, search_index, arrays if numpy is installed, and vector_index if it has been built.
         Meta includes the version and uuid of the chatlog.(for debugging purposes)
+        token_counts is the number of tokens in each message, so loading doesn't have to count them again.
+        search_index is the full text search index(see chat/search.py), so loading doesn't have to rebuild it. vector_index is the same for the vector index(see chat/retrieval.py).
+        arrays are the message arrays(see chat/arrays.py), so the times the messages were added are kept.
 
         """
         save_dict = {
             "meta": {"version": self.version, "uuid": self.uuid},
             "model": self.model,
             "messages": self.get_finished_chatlog(),
+            # estimated messages that were never counted are saved as None and counted when loaded
+            "token_counts": [msg.counted_tokens for msg in self.data],
+            "search_index": self._get_search_index().to_dict(),
         }
+        if self._vector_index is not None:
+            save_dict["vector_index"] = self._get_vector_index().to_dict()
+        if self._arrays is not None:
+            save_dict["arrays"] = self._get_arrays().to_dict()
         return save_dict
 
     def _verify_save_dict(self, save: dict) -> dict:
@@ -266,21 +428,115 @@ class ChatLog( AbstractChatLog, UserList):
         """Loads parameters from a save dictionary into the ChatLog object
         Parameters
             save: dict The save dictionary to load from, must have the following keys: model, messages. If a uuid is provided, it will be used instead of the uuid in the save dictionary.
+                If token_counts is provided(and has a count for every message) the counts are used instead of counting the tokens again.
+                If search_index is provided it is used instead of indexing the saved messages again, when the chatlog is empty. The same for vector_index and arrays.
         Returns
             None, but loads the save into the ChatLog object.
         """
         save = self._verify_save_dict(save)
+        if self._is_shared:
+            self._unshare()
         self.model = save["model"]
         self.uuid = save["meta"].get("uuid", self.uuid)
-        for msg in save["messages"]:
+        saved_index = self._saved_search_index(save)
+        if saved_index is not None:
+            # add_message only indexes a message when the index is one message behind, so only messages the index doesn't cover are indexed
+            self._search_index = saved_index
+            self._search_data = self.data
+        saved_vectors = self._saved_vector_index(save)
+        if saved_vectors is not None:
+            self._vector_index = saved_vectors
+            self._vector_data = self.data
+        saved_arrays = self._saved_arrays(save)
+        if saved_arrays is not None:
+            self._arrays = saved_arrays
+            self._arrays_data = self.data
+        token_counts = save.get("token_counts")
+        if not isinstance(token_counts, list) or len(token_counts) != len(save["messages"]):
+            token_counts = [None] * len(save["messages"])
+        # the saved arrays have the most tokens of the messages that weren't counted, loading counts them
+        recount_arrays = saved_arrays is not None and None in token_counts[: len(saved_arrays)]
+        for msg, tokens in zip(save["messages"], token_counts):
             msg = self._verify_message_dict(msg)
             self.add_message(
                 message.Message(
-                    role=msg["role"], content=msg["content"], model=self.model
+                    role=msg["role"], content=msg["content"], model=self.model, tokens=tokens
                 )
             )
+        if recount_arrays and self._arrays_data is self.data and len(self._arrays) == len(self.data):
+            self._arrays.set_tokens(msg.token_bounds[1] for msg in self.data)
         return None
 
+    def _saved_search_index(self, save: dict) -> InvertedIndex | None:
+        """Returns the search index from a save if it can be used(the chatlog is empty and it covers the first saved messages), otherwise None.
+        An index covering only the first messages(ie a save made by TrimChatLog before its history was loaded) is fine, add_message indexes the rest.
+        """
+        if len(self.data) != 0 or not isinstance(save.get("search_index"), dict):
+            return None
+        try:
+            index = InvertedIndex.from_dict(save["search_index"])
+        except exceptions.BadSaveDictionaryError:
+            return None
+        if len(index) > len(save["messages"]):
+            return None
+        return index
+
+    def _saved_vector_index(self, save: dict) -> VectorIndex | None:
+        """Returns the vector index from a save if it can be used, see _saved_search_index. None if numpy isn't installed, the index is rebuilt if retrieval is used later."""
+        if len(self.data) != 0 or not isinstance(save.get("vector_index"), dict) or not retrieval.is_available():
+            return None
+        try:
+            index = VectorIndex.from_dict(save["vector_index"])
+        except exceptions.BadSaveDictionaryError:
+            return None
+        if len(index) > len(save["messages"]):
+            return None
+        return index
+
+    def _saved_arrays(self, save: dict) -> MessageArrays | None:
+        """Returns the message arrays from a save if they can be used, see _saved_search_index."""
+        if len(self.data) != 0 or not isinstance(save.get("arrays"), dict) or not arrays.is_available():
+            return None
+        try:
+            saved = MessageArrays.from_dict(save["arrays"])
+        except exceptions.BadSaveDictionaryError:
+            return None
+        if len(saved) > len(save["messages"]):
+            return None
+        return saved
+
+    def _get_arrays(self) -> MessageArrays:
+        """Returns the message arrays, rebuilding them if data was replaced or its length changed outside of add_message. Raises MessageArraysNotAvailableError without numpy."""
+        if self._arrays is None:
+            raise exceptions.MessageArraysNotAvailableError("numpy")
+        if self._arrays_data is not self.data or len(self._arrays) != len(self.data):
+            self._arrays = MessageArrays()
+            self._arrays.extend(self.data, timestamp=0)
+            self._arrays_data = self.data
+        return self._arrays
+
+    def _get_vector_index(self) -> VectorIndex:
+        """Returns the vector index, building it the first time and rebuilding it if data was replaced or its length changed outside of add_message."""
+        if (
+            self._vector_index is None
+            or self._vector_data is not self.data
+            or len(self._vector_index) != len(self.data)
+            or (self.embedder is not None and self._vector_index.embedder is not self.embedder)
+        ):
+            embedder = self.embedder if self.embedder is not None or self._vector_index is None else self._vector_index.embedder
+            self._vector_index = VectorIndex(embedder)
+            self._vector_index.extend(msg.content for msg in self.data)
+            self._vector_data = self.data
+        return self._vector_index
+
+    def _get_search_index(self) -> InvertedIndex:
+        """Returns the search index, rebuilding it if data was replaced or its length changed outside of add_message."""
+        if self._search_data is not self.data or len(self._search_index) != len(self.data):
+            self._search_index = InvertedIndex()
+            self._search_index.extend(msg.content for msg in self.data)
+            self._search_data = self.data
+        return self._search_index
+
     def get_messages(
         self,
         role: str = None,
@@ -298,14 +554,32 @@ class ChatLog( AbstractChatLog, UserList):
         Returns
             Iterable[Union[message.Message, str]]: A generator that yields messages from the chatlog, optionally filtered by role and limited by limit. Starts from the end of the chatlog if reverse is True, otherwise starts from the beginning.
         """
-        count = 0
-        msg_list = self.data[::-1] if reverse else self.data
-        for message in msg_list:
-            if message.role == role or role is None:
-                yield message if not pretty else message.pretty
-                count += 1
-            if limit is not None and count >= limit:
-                break
+        yield from self.view(role=role, limit=limit, reverse=reverse, pretty=pretty)
+
+    def _role_index(self) -> dict[str, list[int]]:
+        """Returns the positions of each role's messages, rebuilding them if data was replaced or its length changed outside of add_message."""
+        if self._indexed_data is not self.data or self._indexed_length != len(self.data):
+            self._role_positions = {}
+            for position, msg in enumerate(self.data):
+                self._role_positions.setdefault(msg.role, []).append(position)
+            self._indexed_data = self.data
+            self._indexed_length = len(self.data)
+        return self._role_positions
+
+    def view(
+        self,
+        role: str = None,
+        limit: int = None,
+        reverse: bool = True,
+        pretty: bool = False,
+    ) -> MessageView:
+        """Returns a copy free view of the messages, see chat/views.py. With a role only that role's positions are visited, and iteration stops at limit."""
+        positions = None if role is None else self._role_index().get(role, [])
+        return MessageView(self.data, positions=positions, reverse=reverse, limit=limit, pretty=pretty)
+
+    def last(self, role: str = None) -> message.Message | None:
+        """Returns the newest message, or the newest message of a role, or None. O(1)."""
+        return self.view(role=role, limit=1).first()
 
     def get_messages_as_list(
         self,
@@ -354,8 +628,38 @@ class ChatLog( AbstractChatLog, UserList):
 
     def reset(self) -> None:
         """Resets the chatlog, clearing all messages."""
+        self._stop_sharing()
+        self._shares_messages = False
         self.data = []
         self.uuid = str(uuid.uuid4())
+        self._search_index = InvertedIndex()
+        self._search_data = self.data
+        if self._vector_index is not None:
+            self._vector_index = VectorIndex(self._vector_index.embedder)
+            self._vector_data = self.data
+        if self._arrays is not None:
+            self._arrays = MessageArrays()
+            self._arrays_data = self.data
+
+    def recount_tokens(self) -> int:
+        """Counts the tokens of the messages that were counted with a model of a different encoding again, in one batch(see tokenizer.count_tokens_batch). The messages are updated in place, so a TrimChatLog sharing them sees the new counts.
+        A forked chat log gets new Message objects instead, the other forks keep theirs and their counts(see Forking).
+        """
+        stale = [position for position, msg in enumerate(self.data) if not tokenizer.same_encoding(msg.model, self.model)]
+        if len(stale) == 0:
+            return 0
+        if self._is_shared:
+            self._unshare()
+        counts = tokenizer.count_tokens_batch([self.data[position].content for position in stale], self.model)
+        for position, tokens in zip(stale, counts):
+            msg = self.data[position]
+            if self._shares_messages:
+                msg = self.data[position] = copy.copy(msg)
+            msg.model = self.model
+            msg.tokens = tokens
+        if self._arrays is not None and self._arrays_data is self.data and len(self._arrays) == len(self.data):
+            self._arrays.set_tokens(msg.token_bounds[1] for msg in self.data)
+        return len(stale)
 
     def get_pretty_messages(
         self, role: str = None, reverse: bool = False, limit: int = None
@@ -0,0 +1,31 @@
+import exceptions
+from chat.chatlog import AbstractChatLog, ChatLog
+from chat.jsonl_chatlog import JsonlChatLog
+from chat.sqlite_chatlog import SqliteChatLog
+from chat.tiered_chatlog import TieredChatLog
+from settings import ChatLogHandlers, DEFAULT_CHATLOG_HANDLER
+
+"""Picks the concrete chat log class from the DEFAULT_CHATLOG_HANDLER setting, used by TrimChatLog when it makes its own chat log."""
+
+CHATLOG_HANDLERS = {
+    ChatLogHandlers.CHATLOG_USERLIST.value: ChatLog,
+    ChatLogHandlers.CHATLOG_JSONL.value: JsonlChatLog,
+    ChatLogHandlers.CHATLOG_SQLITE.value: SqliteChatLog,
+    ChatLogHandlers.CHATLOG_TIERED.value: TieredChatLog,
+}
+
+
+def get_chatlog_class(handler: str = None) -> type[AbstractChatLog]:
+    """Returns the chat log class for a ChatLogHandlers value(defaults to DEFAULT_CHATLOG_HANDLER). Raises UnknownChatLogHandlerError for anything else."""
+    if handler is None:
+        handler = DEFAULT_CHATLOG_HANDLER
+    if isinstance(handler, ChatLogHandlers):
+        handler = handler.value
+    if handler not in CHATLOG_HANDLERS:
+        raise exceptions.UnknownChatLogHandlerError(handler, list(CHATLOG_HANDLERS))
+    return CHATLOG_HANDLERS[handler]
+
+
+def make_chatlog(model: str = None, handler: str = None) -> AbstractChatLog:
+    """Makes a new, empty chat log of the given handler type(defaults to DEFAULT_CHATLOG_HANDLER)."""
+    return get_chatlog_class(handler)(model=model)
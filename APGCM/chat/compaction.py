@@ -0,0 +1,352 @@
+import copy
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Iterable
+
+from chat import tokenizer
+from chat.message import Message
+from chat.search import tokenize
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import COMPACTION_SUMMARY_TOKENS, COMPACTION_BATCH
+
+"""History compaction for TrimChatLog, the messages trimmed from the trimmed chat log are summarized instead of dropped.
+HistoryCompactor collects the trimmed messages and summarizes them in batches on a background thread, so adding a message never waits for a summary.
+The summary is rolling: each batch is summarized together with the summary so far, and it is kept under a token budget.
+Summarizers are pluggable, ExtractiveSummarizer(the default) keeps the most informative sentences and runs locally, CompletionSummarizer asks a model through a ChatCompletionWrapper.
+"""
+# tests can be found in tests/test_compaction.py
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+# common words that say nothing about what a sentence is about
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it its me my no not of on or so that the this to was we what when which who will with you your".split()
+)
+
+
+class Summarizer:
+    """The base summarizer, subclass and override summarize.
+    Methods:
+        summarize(summary, messages, budget, model) -> str: Returns a new summary of the summary so far(None if there isn't one) and the messages, in at most budget tokens of model.
+    """
+
+    def summarize(self, summary: str | None, messages: list[Message], budget: int, model: str) -> str:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+class ExtractiveSummarizer(Summarizer):
+    """Summarizes by picking whole sentences, one per line as "role: sentence", no model needed.
+    Sentences are picked one at a time by the words they add that no picked sentence has(ignoring STOP_WORDS), each worth more the rarer it is(inverse document frequency), divided by the square root of their length so long sentences don't win by size.
+    So a rare name or fact is kept over the tenth sentence about the same thing, and repeated sentences add nothing. User sentences count user_weight times.
+    Sentences already in the summary count summary_decay as much and ties go to the newest, so newer ones replace them as the summary fills.
+    Sentences are picked until the budget is full, and kept in the order they were said.
+    Args:
+        user_weight (float): How much more a user sentence is worth than any other.
+        summary_decay (float): How much a sentence already in the summary is worth compared to a new one.
+        most_sentence_tokens (int): Sentences longer than this are cut, so one paste can't fill the summary.
+    """
+
+    def __init__(self, user_weight: float = 1.5, summary_decay: float = 0.8, most_sentence_tokens: int = 60) -> None:
+        self.user_weight = user_weight
+        self.summary_decay = summary_decay
+        self.most_sentence_tokens = most_sentence_tokens
+
+    def _sentences(self, summary: str | None, messages: list[Message]) -> list[tuple[str, float]]:
+        """Returns every line of the summary and "role: sentence" of the messages, with how much each is worth before scoring."""
+        lines = []
+        if summary:
+            lines.extend((line, self.summary_decay) for line in summary.splitlines() if line.strip())
+        for msg in messages:
+            weight = self.user_weight if msg.role == "user" else 1.0
+            for sentence in SENTENCE_PATTERN.split(msg.content):
+                sentence = " ".join(sentence.split())
+                if len(sentence) > 0:
+                    lines.append((f"{msg.role}: {sentence}", weight))
+        return lines
+
+    def summarize(self, summary: str | None, messages: list[Message], budget: int, model: str) -> str:
+        lines = self._sentences(summary, messages)
+        words = [set(word for word in tokenize(line.split(": ", 1)[-1]) if word not in STOP_WORDS) for line, _ in lines]
+        frequency = Counter(word for line_words in words for word in line_words)
+        idf = {word: math.log(1 + len(lines) / count) for word, count in frequency.items()}
+        covered = set()
+
+        def gain(i: int) -> float:
+            new_words = words[i] - covered
+            return lines[i][1] * sum(idf[word] for word in new_words) / (len(words[i]) ** 0.5)
+
+        # lazy greedy: a sentence's gain only goes down as words are covered, so it is only worked out again when it reaches the top
+        heap = [(-gain(i), -i) for i in range(len(lines)) if len(words[i]) > 0]
+        heapq.heapify(heap)
+        chosen = {}
+        used = 0
+        while heap and budget - used >= 3:
+            _, negative_i = heapq.heappop(heap)
+            i = -negative_i
+            score = gain(i)
+            if score <= 0:
+                continue
+            if heap and score < -heap[0][0]:
+                heapq.heappush(heap, (-score, negative_i))
+                continue
+            line = lines[i][0]
+            tokens = tokenizer.count_tokens(line, model)
+            if tokens > self.most_sentence_tokens:
+                line = tokenizer.TokenizedText(line, model).head(self.most_sentence_tokens, "...")
+                tokens = tokenizer.count_tokens(line, model)
+            # each line after the first costs its newline too
+            tokens += 1 if chosen else 0
+            if used + tokens > budget:
+                continue
+            chosen[i] = line
+            used += tokens
+            covered.update(words[i])
+        return "\n".join(chosen[i] for i in sorted(chosen))
+
+    def __repr__(self) -> str:
+        return f"ExtractiveSummarizer(user_weight={self.user_weight}, summary_decay={self.summary_decay}, most_sentence_tokens={self.most_sentence_tokens})"
+
+
+class CompletionSummarizer(Summarizer):
+    """Summarizes with a model, through a ChatCompletionWrapper(or anything with the same chat(messages, max_tokens) method).
+    Args:
+        completion_wrapper (ChatCompletionWrapper): What the request is sent with.
+        prompt (str): The system prompt of the request, defaults to CompletionSummarizer.prompt.
+    The reply is cut to the budget in case the model goes over it.
+    """
+
+    prompt = (
+        "You keep a running summary of a conversation that no longer fits in the context. "
+        "Update the summary with the new messages. Keep names, facts, decisions, requests and open questions, drop small talk. "
+        "Reply with the summary only."
+    )
+
+    def __init__(self, completion_wrapper, prompt: str = None) -> None:
+        self.completion_wrapper = completion_wrapper
+        if prompt is not None:
+            self.prompt = prompt
+
+    def summarize(self, summary: str | None, messages: list[Message], budget: int, model: str) -> str:
+        transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in messages)
+        request = [
+            {"role": "system", "content": self.prompt},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}\n\nThe summary must be under {budget} tokens."},
+        ]
+        reply = self.completion_wrapper.chat(request, max_tokens=budget)
+        return tokenizer.TokenizedText(str(reply).strip(), model).head(budget)
+
+    def __repr__(self) -> str:
+        return f"CompletionSummarizer(completion_wrapper={type(self.completion_wrapper).__name__})"
+
+
+class HistoryCompactor:
+    """Summarizes trimmed messages in the background, keeping one rolling summary.
+    Args:
+        model (str): The model the summary is counted with.
+        summarizer (Summarizer): Defaults to an ExtractiveSummarizer.
+        summary_tokens (int): The most tokens the summary can have, defaults to COMPACTION_SUMMARY_TOKENS.
+        batch_messages (int): How many trimmed messages are collected before they are summarized, defaults to COMPACTION_BATCH. A batch is every message waiting when the thread starts it, so a slow summarizer gets bigger batches rather than falling behind.
+        background (bool): Summarize on a background thread, started when a batch is ready and ending once nothing is left to summarize, so an idle compactor(ie a dropped fork) has no thread keeping it alive. If False submit summarizes in place, for tests and scripts.
+    Attributes:
+        summary (str): The summary, None until there is one.
+        summary_tokens_used (int): The tokens of summary_message's content.
+        prefix (str): Put before the summary in summary_message.
+        batches (int): The number of batches summarized.
+        errors (int): The number of batches the summarizer failed on, those messages are dropped(and logged) rather than retried.
+    Methods:
+        submit(messages): Adds trimmed messages, returns straight away.
+        flush(timeout) -> bool: Summarizes everything submitted so far, waits until it is done. Returns False on timeout.
+        snapshot() -> tuple[str, int]: The summary message's content and tokens, or (None, 0).
+        set_model(model): Changes the model and counts the summary again.
+        pending -> list[Message]: The messages waiting to be summarized.
+        load(summary, pending): Restores a saved summary and the messages it was waiting on.
+        reset(): Drops the summary and the pending messages.
+        fork() -> HistoryCompactor: A compactor with the same summary and pending messages that carries on separately, for TrimChatLog.fork.
+        close(wait): Stops the background thread after the batch it is on, waiting for it unless wait is False.
+    """
+
+    prefix = "Summary of the earlier conversation:\n"
+
+    def __init__(
+        self,
+        model: str,
+        summarizer: Summarizer = None,
+        summary_tokens: int = COMPACTION_SUMMARY_TOKENS,
+        batch_messages: int = COMPACTION_BATCH,
+        background: bool = True,
+    ) -> None:
+        self.logger = BaseLogger(
+            module_name=__file__,
+            filename="compaction.log",
+            level=DEFAULT_LOGGING_LEVEL,
+            identifier="HistoryCompactor",
+        )
+        self.model = model
+        self.summarizer = summarizer if summarizer is not None else ExtractiveSummarizer()
+        self.summary_tokens = summary_tokens
+        self.batch_messages = batch_messages
+        self.background = background
+        self.batches = 0
+        self.errors = 0
+        self._summary: str = None
+        self._snapshot: tuple[str, int] = (None, 0)
+        self._pending: list[Message] = []
+        # submitted and not yet summarized, including a batch being summarized now
+        self._unfinished = 0
+        self._flush_requested = False
+        self._closed = False
+        # bumped by reset, a batch started before it is thrown away
+        self._generation = 0
+        self._condition = threading.Condition()
+        self._thread: threading.Thread = None
+
+    @property
+    def summary(self) -> str | None:
+        return self._summary
+
+    @property
+    def summary_tokens_used(self) -> int:
+        return self._snapshot[1]
+
+    @property
+    def pending(self) -> list[Message]:
+        with self._condition:
+            return list(self._pending)
+
+    def snapshot(self) -> tuple[str | None, int]:
+        return self._snapshot
+
+    def set_model(self, model: str) -> None:
+        with self._condition:
+            self.model = model
+            self._set_summary(self._summary)
+
+    def _set_summary(self, summary: str | None) -> None:
+        self._summary = summary if summary else None
+        if self._summary is None:
+            self._snapshot = (None, 0)
+        else:
+            content = self.prefix + self._summary
+            self._snapshot = (content, tokenizer.count_tokens(content, self.model))
+
+    def submit(self, messages: Iterable[Message]) -> None:
+        messages = list(messages)
+        if len(messages) == 0:
+            return
+        with self._condition:
+            self._pending.extend(messages)
+            self._unfinished += len(messages)
+            ready = len(self._pending) >= self.batch_messages
+            if self.background and ready:
+                self._start()
+                self._condition.notify_all()
+        if not self.background and ready:
+            self._summarize_pending()
+
+    def flush(self, timeout: float = None) -> bool:
+        if not self.background:
+            self._summarize_pending()
+            return True
+        with self._condition:
+            if self._unfinished == 0:
+                return True
+            self._flush_requested = True
+            self._start()
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def _start(self) -> None:
+        """Starts the background thread if it isn't running(a closing one carries on instead). Called with the condition held."""
+        self._closed = False
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="HistoryCompactor", daemon=True)
+            self._thread.start()
+
+    def _is_ready(self) -> bool:
+        return len(self._pending) >= self.batch_messages or (self._flush_requested and len(self._pending) > 0)
+
+    def _run(self) -> None:
+        """Summarizes batches until none is ready, then ends. The thread is dropped with the condition held, so a submit after that starts a new one."""
+        while True:
+            with self._condition:
+                if self._closed or not self._is_ready():
+                    self._thread = None
+                    self._condition.notify_all()
+                    return
+                batch, self._pending = self._pending, []
+                generation = self._generation
+            self._summarize(batch, generation)
+
+    def _summarize_pending(self) -> None:
+        with self._condition:
+            batch, self._pending = self._pending, []
+            generation = self._generation
+        if batch:
+            self._summarize(batch, generation)
+
+    def _summarize(self, batch: list[Message], generation: int) -> None:
+        """Summarizes a batch with the summary so far, outside the lock so submitting never waits for it."""
+        try:
+            summary = self.summarizer.summarize(self._summary, batch, self.summary_tokens, self.model)
+        except Exception as e:
+            self.logger.error(f"Summarizing {len(batch)} messages failed, they are dropped: {e!r}")
+            summary = None
+            self.errors += 1
+        with self._condition:
+            if generation == self._generation:
+                if summary is not None:
+                    self._set_summary(summary)
+                    self.batches += 1
+                self._unfinished -= len(batch)
+            if self._unfinished <= 0 or len(self._pending) == 0:
+                self._flush_requested = False
+            self._condition.notify_all()
+        self.logger.info(f"Summarized {len(batch)} messages, the summary has {self.summary_tokens_used} tokens")
+
+    def load(self, summary: str | None, pending: Iterable[Message] = ()) -> None:
+        self.reset()
+        with self._condition:
+            self._set_summary(summary)
+        self.submit(pending)
+
+    def fork(self) -> "HistoryCompactor":
+        """Returns a compactor with the same summarizer, settings, summary and pending messages, sharing the logger. Its thread is started when it is first needed.
+        A batch being summarized right now only ends up in this compactor's summary.
+        """
+        with self._condition:
+            forked = copy.copy(self)
+            forked._pending = list(self._pending)
+        forked._unfinished = len(forked._pending)
+        forked._flush_requested = False
+        forked._closed = False
+        forked._generation = 0
+        forked._condition = threading.Condition()
+        forked._thread = None
+        return forked
+
+    def reset(self) -> None:
+        with self._condition:
+            self._generation += 1
+            self._pending = []
+            self._unfinished = 0
+            self._flush_requested = False
+            self._set_summary(None)
+            self._condition.notify_all()
+
+    def close(self, wait: bool = True) -> None:
+        with self._condition:
+            self._closed = True
+            thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def __repr__(self) -> str:
+        return (
+            f"HistoryCompactor(summarizer={self.summarizer!r}, summary_tokens={self.summary_tokens}, batch_messages={self.batch_messages}, "
+            f"summary_tokens_used={self.summary_tokens_used}, pending={len(self._pending)}, batches={self.batches})"
+        )
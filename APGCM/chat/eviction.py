@@ -0,0 +1,238 @@
+import copy
+import heapq
+from typing import Iterable
+
+from chat.message import Message
+
+"""Eviction policies for TrimChatLog, which message is trimmed first when the trimmed chat log is over its limits.
+Every policy gives a message a priority when it is added to the trimmed chat log, the lowest priority is evicted first.
+EvictionQueue keeps the messages in a heap so the next message to evict is found in O(log n) instead of scanning the window, messages that leave the window some other way(trimmed from the left, cut to fit) are tombstoned and skipped when they reach the top.
+"""
+# tests can be found in tests/test_eviction.py
+
+DEFAULT_ROLE_WEIGHTS = {"system": 4.0, "user": 2.0, "assistant": 1.0, "function": 0.5, "tool": 0.5}
+
+
+class EvictionPolicy:
+    """The base eviction policy, first in first out: the oldest message is evicted first.
+    Args:
+        keep_recent (int): The newest messages that are only evicted once nothing else can be, so the question being answered is never evicted for an older one.
+        keep_first_user (bool): Pin the first user message of the trimmed chat log(usually what the conversation is about).
+        role_weights (dict[str, float]): How much each role is worth, roles that aren't in it are worth 1. Defaults to DEFAULT_ROLE_WEIGHTS.
+    Attributes:
+        name (str): The name the policy is registered and saved with, see register_eviction_policy.
+        evicted_messages (int): The messages this policy has evicted.
+        evicted_tokens (int): The tokens of those messages, with the chat format overhead(the most they could have if they were estimated).
+    Methods:
+        priority(message, seq) -> float: The priority of a message, seq is its position in the trimmed chat log counting every message added. Lower is evicted first.
+        weight(message) -> float: The role weight of a message.
+        record(tokens): Adds an evicted message to the stats.
+        stats() -> dict: The name, evicted_messages and evicted_tokens.
+    Subclass and override priority for a new policy, priorities can't change once a message is added.
+    """
+
+    name = "fifo"
+
+    def __init__(self, keep_recent: int = 2, keep_first_user: bool = False, role_weights: dict[str, float] = None) -> None:
+        self.keep_recent = keep_recent
+        self.keep_first_user = keep_first_user
+        self.role_weights = dict(DEFAULT_ROLE_WEIGHTS if role_weights is None else role_weights)
+        self.evicted_messages = 0
+        self.evicted_tokens = 0
+
+    @property
+    def is_fifo(self) -> bool:
+        """True if the policy always evicts the oldest message, TrimChatLog then pops it from the left without the heap."""
+        return type(self).priority is EvictionPolicy.priority and not self.keep_first_user
+
+    def priority(self, message: Message, seq: int) -> float:
+        return seq
+
+    def weight(self, message: Message) -> float:
+        return self.role_weights.get(message.role, 1.0)
+
+    def record(self, tokens: int) -> None:
+        self.evicted_messages += 1
+        self.evicted_tokens += tokens
+
+    def stats(self) -> dict:
+        return {"policy": self.name, "evicted_messages": self.evicted_messages, "evicted_tokens": self.evicted_tokens}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(keep_recent={self.keep_recent}, keep_first_user={self.keep_first_user}, evicted_messages={self.evicted_messages}, evicted_tokens={self.evicted_tokens})"
+
+
+class KeepFirstUserEviction(EvictionPolicy):
+    """First in first out, but the first user message is kept(pinned) until only pinned and recent messages are left."""
+
+    name = "keep_first_user"
+
+    def __init__(self, keep_recent: int = 2, keep_first_user: bool = True, role_weights: dict[str, float] = None) -> None:
+        super().__init__(keep_recent, keep_first_user, role_weights)
+
+
+class LongestLowValueEviction(EvictionPolicy):
+    """Evicts the message with the fewest weight per token first, so long messages of low value roles(tool output, long replies) go before short questions. Ties go to the oldest."""
+
+    name = "longest_low_value"
+
+    def priority(self, message: Message, seq: int) -> float:
+        return self.weight(message) / max(message.token_bounds[1], 1)
+
+
+class RoleWeightedEviction(EvictionPolicy):
+    """Oldest first, but a message is kept as if it were weight * role_horizon messages newer, with the default weights a user message outlives the next 16 assistant messages.
+    Args:
+        role_horizon (int): The messages a weight of 1 is worth.
+    """
+
+    name = "role_weighted"
+
+    def __init__(self, keep_recent: int = 2, keep_first_user: bool = False, role_weights: dict[str, float] = None, role_horizon: int = 8) -> None:
+        super().__init__(keep_recent, keep_first_user, role_weights)
+        self.role_horizon = role_horizon
+
+    def priority(self, message: Message, seq: int) -> float:
+        return seq + self.weight(message) * self.role_horizon
+
+
+eviction_policies: dict[str, type[EvictionPolicy]] = {}
+
+
+def register_eviction_policy(policy: type[EvictionPolicy]) -> type[EvictionPolicy]:
+    """Registers an eviction policy class under its name, so TrimChatLog(and saves) can use it by name. Returns the class, so it can be used as a decorator."""
+    eviction_policies[policy.name] = policy
+    return policy
+
+
+for _policy in (EvictionPolicy, KeepFirstUserEviction, LongestLowValueEviction, RoleWeightedEviction):
+    register_eviction_policy(_policy)
+
+
+class EvictionQueue:
+    """The messages of a trimmed chat log in a heap ordered by an EvictionPolicy's priority.
+    Args:
+        policy (EvictionPolicy): The policy that orders the messages.
+    Entries:
+        Each entry is [priority, seq, message, alive], seq is the order the message was added(and its position in the trimmed chat log, messages are only ever added at the end).
+        Removing a message marks its entry dead(a tombstone) instead of searching the heap for it, dead entries are dropped when they reach the top, and the heap is rebuilt without them once they are over half of it.
+        Pinned messages are taken out of the heap and put back with the same seq when they are unpinned.
+    Methods:
+        push(message): Adds a message added to the end of the trimmed chat log.
+        discard(message): Removes a message that left the trimmed chat log.
+        pop() -> Message | None: Removes and returns the message to evict, None if only pinned and recent messages are left.
+        rebuild(messages): Starts again from the messages of a trimmed chat log, keeping the pins of the ones still in it.
+        copy(policy) -> EvictionQueue: A queue with the same messages, order and pins that can be changed separately, for TrimChatLog.fork.
+        pin(message), unpin(message), is_pinned(message) -> bool
+    """
+
+    def __init__(self, policy: EvictionPolicy) -> None:
+        self.policy = policy
+        self._heap: list[list] = []
+        # id of each message in the queue to its entry, the entry keeps the message alive so ids aren't reused
+        self._entries: dict[int, list] = {}
+        self._pinned: dict[int, list] = {}
+        self._dead = 0
+        self._seq = 0
+        self._has_first_user = False
+
+    @property
+    def is_fifo(self) -> bool:
+        """True if popping would always return the oldest message, see EvictionPolicy.is_fifo."""
+        return self.policy.is_fifo and len(self._pinned) == 0
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._pinned)
+
+    def push(self, message: Message) -> None:
+        entry = [self.policy.priority(message, self._seq), self._seq, message, True]
+        self._seq += 1
+        self._entries[id(message)] = entry
+        heapq.heappush(self._heap, entry)
+        if self.policy.keep_first_user and not self._has_first_user and message.role == "user":
+            self._has_first_user = True
+            self.pin(message)
+
+    def discard(self, message: Message) -> None:
+        if self._pinned.pop(id(message), None) is not None:
+            return
+        entry = self._entries.pop(id(message), None)
+        if entry is None:
+            return
+        entry[3] = False
+        self._dead += 1
+        if self._dead > 64 and self._dead > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if entry[3]]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def pop(self) -> Message | None:
+        recent = self._seq - self.policy.keep_recent
+        held = []
+        victim = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if not entry[3]:
+                self._dead -= 1
+                continue
+            if entry[1] >= recent:
+                held.append(entry)
+                continue
+            victim = entry[2]
+            del self._entries[id(victim)]
+            break
+        for entry in held:
+            heapq.heappush(self._heap, entry)
+        return victim
+
+    def rebuild(self, messages: Iterable[Message]) -> None:
+        # the old entries keep the pinned messages alive, so their ids can't be reused while checking
+        pinned = self._pinned
+        self._heap = []
+        self._entries = {}
+        self._pinned = {}
+        self._dead = 0
+        self._seq = 0
+        self._has_first_user = False
+        for message in messages:
+            self.push(message)
+            if id(message) in pinned:
+                self.pin(message)
+
+    def copy(self, policy: EvictionPolicy = None) -> "EvictionQueue":
+        """Returns a copy of the queue with its own entries, without the tombstones. The policy(and its stats) is copied too unless one is given."""
+        copied = EvictionQueue(policy if policy is not None else copy.copy(self.policy))
+        copied._entries = {key: list(entry) for key, entry in self._entries.items()}
+        copied._pinned = {key: list(entry) for key, entry in self._pinned.items()}
+        # every live entry in the heap is in _entries, dropping the dead ones means it has to be a heap again
+        copied._heap = [copied._entries[id(entry[2])] for entry in self._heap if entry[3]]
+        heapq.heapify(copied._heap)
+        copied._seq = self._seq
+        copied._has_first_user = self._has_first_user
+        return copied
+
+    def pin(self, message: Message) -> bool:
+        """Keeps a message in the trimmed chat log until only pinned and recent messages are left. Returns False if it isn't in the queue."""
+        entry = self._entries.pop(id(message), None)
+        if entry is None:
+            return id(message) in self._pinned
+        entry[3] = False
+        self._dead += 1
+        self._pinned[id(message)] = entry
+        return True
+
+    def unpin(self, message: Message) -> bool:
+        """Lets a pinned message be evicted again. Returns False if it wasn't pinned."""
+        entry = self._pinned.pop(id(message), None)
+        if entry is None:
+            return False
+        entry = [entry[0], entry[1], message, True]
+        self._entries[id(message)] = entry
+        heapq.heappush(self._heap, entry)
+        return True
+
+    def is_pinned(self, message: Message) -> bool:
+        return id(message) in self._pinned
+
+    def __repr__(self) -> str:
+        return f"EvictionQueue(policy={self.policy.name}, messages={len(self)}, pinned={len(self._pinned)}, tombstones={self._dead})"
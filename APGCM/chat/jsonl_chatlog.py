@@ -0,0 +1,341 @@
+import json
+import uuid
+import weakref
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+import exceptions
+from chat import message
+from chat.stored_chatlog import StoredChatLog, saved_message_count
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import CHATLOG_DIR, STORED_CHATLOG_EMBED
+
+# bytes copied at a time when a fork copies its owner's file
+COPY_CHUNK = 1 << 20
+# tests can be found in tests/test_jsonl_chatlog.py
+
+
+class JsonlChatLog(StoredChatLog):
+    """A chat log that appends each message to a JSONL file(one json object per line) and only keeps an index in memory: the offset, role and token count of each message.
+    Memory use doesn't grow with the length of the conversation, while the full history stays available for exporting, printing and searching.
+    Selected with DEFAULT_CHATLOG_HANDLER = ChatLogJsonl, see chatlog_handlers.make_chatlog.
+
+    Relies on:
+        - Message, MessageFactory from chat/message.py
+        - StoredChatLog from chat/stored_chatlog.py
+        - CHATLOG_DIR from settings.py
+    Raises:
+        - NotAMessageError if a message is not a Message object
+        - BadSaveDictionaryError if a save dictionary is not formatted correctly
+        - ChatLogFileError if the file is corrupt or already used by another JsonlChatLog
+    Args:
+        model (str): AI model used to count tokens
+        path (str): Optional, the file to use. If it exists it is opened and indexed, otherwise it is created when the first message is added. Defaults to <uuid>.jsonl in directory.
+        directory (str): The directory for the default file, defaults to CHATLOG_DIR.
+        embed_messages (bool): Whether saves have every message instead of referring to the file, defaults to STORED_CHATLOG_EMBED.
+    Attributes:
+        path (Path): The file the messages are appended to.
+        data (StoredMessages): A read only sequence of the messages, read from the file when used.
+        model, uuid, version: See ChatLog.
+    File Format:
+        One line per message: {"role": ..., "content": ..., "tokens": ...}. Json escapes newlines, so a line is always one message.
+        A partly written last line(ie from a crash) is cut off when the file is opened.
+    Saving:
+        Saves record the path and size of the file and the number of messages, and the token counts from the index. Every message is only read into the save with embed_messages(see StoredChatLog Saving).
+        Loading into an empty JsonlChatLog reopens that file instead of writing the messages again if it hasn't changed since and isn't used by another JsonlChatLog, otherwise the saved messages are copied from the start of it(the file is only appended to, so they are still there).
+        A file a save refers to is kept when the chat log is reset.
+    Forking:
+        A fork reads the first file_size bytes of its owner's file(see StoredChatLog Forking), only its index is copied. Before it stores a message those bytes are copied to a file of its own(<uuid>.jsonl in directory), without reading the messages.
+    Methods:
+        The same as ChatLog. get_messages reads from the end of the file when reverse is True, and only reads the messages it returns.
+        close: Closes the file handles, they are reopened when needed.
+    """
+
+    version = "1.0.0"
+    storage = "jsonl"
+    # files used by a live chat log, so two chat logs never append to the same file
+    _open_paths: "weakref.WeakValueDictionary[str, JsonlChatLog]" = weakref.WeakValueDictionary()
+    _role_codes = {role: code for code, role in enumerate(message.Message.allowed_roles)}
+
+    def __init__(self, model: str = None, path: str = None, directory: str = CHATLOG_DIR, embed_messages: bool = STORED_CHATLOG_EMBED):
+        self.logger = BaseLogger(
+            __file__,
+            filename="chatlog.log",
+            identifier="JsonlChatLog",
+            level=DEFAULT_LOGGING_LEVEL,
+        )
+        self._model = model
+        self.uuid = str(uuid.uuid4())
+        self.directory = Path(directory)
+        self.embed_messages = embed_messages
+        self.path: Path = None
+        self._writer = None
+        self._reader = None
+        self._clear_index()
+        self._claim(Path(path) if path is not None else self._default_path())
+        self._index_file()
+
+    # ==========(PROPERTIES)==========
+    @property
+    def file_size(self) -> int:
+        """The number of bytes of the file covered by the index."""
+        return self._end
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    # ==========(FILE AND INDEX)==========
+    def _default_path(self) -> Path:
+        return self.directory / f"{self.uuid}.jsonl"
+
+    def _clear_index(self) -> None:
+        # offset of each line, role code and token count of each message
+        self._offsets = array("q")
+        self._roles = array("b")
+        self._tokens = array("q")
+        self._end = 0
+
+    def _claim(self, path: Path) -> None:
+        """Makes path the file of this chat log. Raises ChatLogFileError if another live chat log uses it."""
+        key = str(path.resolve())
+        owner = self._open_paths.get(key)
+        if owner is not None and owner is not self:
+            raise exceptions.ChatLogFileError(f"The chat log file {path} is already used by another chat log.")
+        self._open_paths[key] = self
+        self.path = path
+
+    def _release(self) -> None:
+        """Closes the file handles and stops using the file."""
+        self.close()
+        if self.path is not None:
+            key = str(self.path.resolve())
+            if self._open_paths.get(key) is self:
+                del self._open_paths[key]
+        self.path = None
+
+    def close(self) -> None:
+        """Closes the file handles, they are reopened when needed."""
+        for handle in (self._writer, self._reader):
+            if handle is not None:
+                handle.close()
+        self._writer = None
+        self._reader = None
+
+    def _index_file(self) -> None:
+        """Builds the index from the file, if it exists. Cuts off a partly written last line."""
+        self._clear_index()
+        if not self.path.exists():
+            return
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    self.logger.warning(f"Cutting off a partly written message at the end of {self.path}")
+                    break
+                try:
+                    msg = json.loads(line)
+                    role_code = self._role_codes[msg["role"]]
+                    tokens = msg["tokens"]
+                except (ValueError, KeyError, TypeError):
+                    raise exceptions.ChatLogFileError(f"The chat log file {self.path} has a corrupt message at byte {offset}.")
+                self._offsets.append(offset)
+                self._roles.append(role_code)
+                self._tokens.append(tokens)
+                offset += len(line)
+        self._end = offset
+        if self.path.stat().st_size != offset:
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        self.logger.info(f"Indexed {len(self)} messages from {self.path}")
+
+    def _get_writer(self):
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = open(self.path, "ab")
+        return self._writer
+
+    def _get_reader(self):
+        if self._reader is None:
+            self._reader = open(self.path, "rb")
+        return self._reader
+
+    def _append(self, msgs: list[message.Message]) -> None:
+        """Appends the messages to the file with one write, then adds them to the index."""
+        if self._is_shared:
+            self._unshare()
+        lines = [
+            json.dumps({"role": msg.role, "content": msg.content, "tokens": msg.tokens}).encode("utf-8") + b"\n"
+            for msg in msgs
+        ]
+        writer = self._get_writer()
+        writer.write(b"".join(lines))
+        writer.flush()
+        for msg, line in zip(msgs, lines):
+            self._offsets.append(self._end)
+            self._roles.append(self._role_codes[msg.role])
+            self._tokens.append(msg.tokens)
+            self._end += len(line)
+
+    def _read_message(self, index: int) -> message.Message:
+        reader = self._get_reader()
+        reader.seek(self._offsets[index])
+        msg = json.loads(reader.readline())
+        msg["tokens"] = self._tokens[index]
+        return self._make_message(msg)
+
+    def _iter_message_dicts(self) -> Iterator[dict]:
+        """Reads the messages in order, with a separate handle so other reads can happen while iterating. Token counts come from the index, which is newer than the file after recount_tokens."""
+        if len(self) == 0:
+            return
+        with open(self.path, "rb") as f:
+            for i in range(len(self)):
+                msg = json.loads(f.readline())
+                msg["tokens"] = self._tokens[i]
+                yield msg
+
+    def _set_token_counts(self, counts: list[int]) -> None:
+        """Replaces the token counts in the index. The file keeps the old counts, saves have the new ones and are used when the file is reopened."""
+        self._tokens = array("q", counts)
+
+    # ==========(FORKING)==========
+    def _new_fork(self) -> "JsonlChatLog":
+        """Returns a chat log reading this one's file, with a copy of the index."""
+        forked = JsonlChatLog.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        forked._writer = None
+        forked._reader = None
+        forked._offsets = array("q", self._offsets)
+        forked._roles = array("b", self._roles)
+        forked._tokens = array("q", self._tokens)
+        self._share_with(forked)
+        return forked
+
+    def _unshare(self) -> None:
+        """Copies the shared part of the owner's file to a file of its own, see Forking."""
+        source = self.path
+        self._stop_sharing()
+        self.close()
+        self._claim(self._default_path())
+        if self._end == 0:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(source, "rb") as src, open(self.path, "wb") as dst:
+            remaining = self._end
+            while remaining > 0:
+                chunk = src.read(min(remaining, COPY_CHUNK))
+                if not chunk:
+                    raise exceptions.ChatLogFileError(f"The chat log file {source} is shorter than the fork of it.")
+                dst.write(chunk)
+                remaining -= len(chunk)
+        self.logger.info(f"Copied {self._end} bytes of {source} to {self.path}")
+
+    # ==========(GETTING MESSAGES)==========
+    def get_messages(
+        self,
+        role: str = None,
+        limit: int = None,
+        reverse: bool = True,
+        pretty: bool = False,
+    ) -> Iterable[Union[message.Message, str]]:
+        """Generator that yields messages, optionally filtered by role and limited by limit. Starts from the end of the file if reverse is True.
+        Roles are checked in the index, so only the messages that are returned are read from the file.
+        """
+        if role is not None and role not in self._role_codes:
+            return
+        role_code = self._role_codes.get(role)
+        indexes = range(len(self) - 1, -1, -1) if reverse else range(len(self))
+        count = 0
+        for i in indexes:
+            if limit is not None and count >= limit:
+                break
+            if role_code is not None and self._roles[i] != role_code:
+                continue
+            msg = self._read_message(i)
+            yield msg if not pretty else msg.pretty
+            count += 1
+
+    # ==========(SAVING AND LOADING)==========
+    def make_save_dict(self) -> dict:
+        """Creates a save dictionary referring to the file(or with every message, see Saving), with the path and size of the file so loading can reopen it."""
+        return self._make_stored_save({"path": str(self.path), "file_size": self._end})
+
+    def _token_counts(self) -> list[int]:
+        """The counts in the index, newer than the file's after recount_tokens."""
+        return list(self._tokens)
+
+    @classmethod
+    def _iter_saved(cls, save: dict) -> Iterator[dict]:
+        """Reads the messages a save refers to from the start of its file."""
+        path = Path(save["meta"].get("path", ""))
+        count = saved_message_count(save)
+        try:
+            if path.stat().st_size < save["meta"].get("file_size", 0):
+                raise OSError()
+            f = open(path, "rb")
+        except OSError:
+            raise exceptions.ChatLogFileError(f"The chat log file {path} a save refers to is missing or shorter than when it was saved.")
+        with f:
+            for _ in range(count):
+                yield json.loads(f.readline())
+
+    def _reopen_saved(self, save: dict) -> bool:
+        """Switches to the file recorded in the save if it is unchanged since the save was made and not used by another chat log. Returns True if it did."""
+        path = save["meta"].get("path")
+        if len(self) != 0 or path is None or Path(path) == self.path:
+            return False
+        if self._is_shared:
+            self._unshare()
+        path = Path(path)
+        try:
+            if path.stat().st_size != save["meta"].get("file_size"):
+                return False
+        except OSError:
+            return False
+        old_path = self.path
+        self._release()
+        try:
+            self._claim(path)
+            self._index_file()
+        except exceptions.ChatLogFileError:
+            self._release()
+            self._claim(old_path)
+            self._clear_index()
+            return False
+        if len(self) != saved_message_count(save):
+            # the save has messages that were never written to the file(ie added while the history was pending)
+            self._release()
+            self._claim(old_path)
+            self._clear_index()
+            return False
+        token_counts = save.get("token_counts")
+        if isinstance(token_counts, list) and len(token_counts) == len(self) and all(isinstance(tokens, int) for tokens in token_counts):
+            # the file has the counts from when each message was written, the save's are newer if the tokens were recounted
+            self._tokens = array("q", token_counts)
+        if old_path.exists() and old_path.stat().st_size == 0:
+            old_path.unlink()
+        self.logger.info(f"Reopened chat log file {path} instead of writing {len(self)} messages")
+        return True
+
+    def reset(self) -> None:
+        """Clears the chat log. Its file is deleted, unless a save refers to it(see Saving), and a new one is used. Forks reading the file copy it first, a fork never deletes its owner's file."""
+        old_path = self.path
+        self._unshare_forks()
+        keep = self._is_shared or self._referenced
+        self._stop_sharing()
+        self._release()
+        self._referenced = False
+        if not keep and old_path.exists():
+            old_path.unlink()
+        self.uuid = str(uuid.uuid4())
+        self._search_index = None
+        self._vector_index = None
+        self._arrays = None
+        self._clear_index()
+        self._claim(self._default_path())
+
+    # ==========(MISC)==========
+    def __repr__(self):
+        constructor = f"JsonlChatLog({self.model}, {self.path})"
+        info = f"JsonlChatLog Object with the following attributes:\n\tModel: {self.model}\n\tMessages: {len(self)}\n\tFile Size: {self._end}"
+        return f"{constructor}\n{info}"
@@ -1,4 +1,4 @@
-import tiktoken
+from chat import tokenizer
 from collections import namedtuple, UserDict, UserList
 import exceptions
 from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
@@ -20,7 +20,7 @@ class Message(UserDict):
         Python:
             UserDict, namedtuple from collections
             Enum from enum
-            tiktoken
+            tokenizer from chat/tokenizer.py(tiktoken)
     Raises:
         exceptions.BadRoleError: If the role is not one of the allowed roles.
     Required By:
@@ -31,13 +31,18 @@ class Message(UserDict):
         role (str): The role of the message. Must be one of "user", "assistant", or "system".
         content (str): The content of the message.
         model (str): The model, used to count tokens
+        tokens (int): Optional, the number of tokens in the message if it is already known(ie from a save), skips counting them again. Must have been counted with the same model.
+        estimate (bool): Optional, estimate the tokens from the size of the content(see chat/tokenizer.py TokenEstimator) instead of counting them. They are counted the first time tokens is used.
         
             
     Attributes:
         role (str): The role of the message. Must be one of "user", "assistant", or "system".
         content (str): The content of the message.
         model (str): The model, used to count tokens 
-        tokens (int): The number of tokens in the message.
+        tokens (int): The number of tokens in the message. Counted when first used if the message was estimated.
+        token_estimate (TokenEstimate): The estimate of an estimated message, None if the tokens were counted when it was made.
+        token_bounds (tuple[int, int]): The fewest and most tokens the message can have, both are the count once it is known.
+        is_counted (bool): Whether the exact number of tokens is known.
         data (dict): The data of the message, with keys "role" and "content".
         pretty (str): A pretty string representation of the message, styled with the get_pretty_message method.
     Methods:
@@ -49,9 +54,9 @@ class Message(UserDict):
         __repr__: Returns a string representation of the message, with the constructor and info, including the number of tokens and characters.
     
     """
-    def __init__(self, role: str, content: str, model: str):
-        self.logger = BaseLogger(__file__, identifier="Message", filename="message.log", level=DEFAULT_LOGGING_LEVEL)
-
+    # shared by every message, a logger per message added a file handler(and an open file) per message and was most of the cost of making one
+    logger = BaseLogger(__file__, identifier="Message", filename="message.log", level=DEFAULT_LOGGING_LEVEL)
+    def __init__(self, role: str, content: str, model: str, tokens: int = None, estimate: bool = False):
         self._verify_roles(role)
         
 
@@ -59,7 +64,13 @@ class Message(UserDict):
         self.role = role
         self.content = content
         self.model = model
-        self.tokens = self._count_tokens(content, model)
+        self.token_estimate: tokenizer.TokenEstimate = None
+        self._tokens = tokens
+        if tokens is None:
+            if estimate:
+                self.token_estimate = tokenizer.estimate_tokens(content, model)
+            else:
+                self._tokens = self._count_tokens(content, model)
         self.pretty = self.get_pretty_message()
     roles = Roles
     allowed_roles = (roles.USER.value, roles.ASSISTANT.value, roles.SYSTEM.value)
@@ -68,16 +79,34 @@ class Message(UserDict):
         if role not in self.allowed_roles:
             self.logger.error(f"Bad Role: {role}")
             raise exceptions.BadRoleError(role, self.allowed_roles)
+    @property
+    def tokens(self) -> int:
+        """The number of tokens in the message, counted now if the message was estimated and hasn't been counted yet."""
+        if self._tokens is None:
+            self.tokens = self._count_tokens(self.content, self.model)
+        return self._tokens
+    @tokens.setter
+    def tokens(self, tokens: int) -> None:
+        """Sets the number of tokens(ie after counting them in a batch). The first count of an estimated message calibrates the estimator."""
+        if self._tokens is None and self.token_estimate is not None and self.token_estimate.encoding == tokenizer.encoding_name(self.model):
+            tokenizer.estimator.record_count(self.token_estimate, tokens)
+        self._tokens = tokens
+    @property
+    def is_counted(self) -> bool:
+        return self._tokens is not None
+    @property
+    def counted_tokens(self) -> int | None:
+        """The number of tokens if they have been counted, otherwise None. Doesn't count them."""
+        return self._tokens
+    @property
+    def token_bounds(self) -> tuple[int, int]:
+        """The fewest and most tokens the message can have, (tokens, tokens) once they are counted."""
+        if self._tokens is not None:
+            return self._tokens, self._tokens
+        return self.token_estimate.low, self.token_estimate.high
     def _count_tokens(self, string: str, model: str) -> int:
-        """Returns the number of tokens in a string."""
-        encoding = None 
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-            
-        except KeyError:
-            self.logger.error(f"Tiktoken does not have an encoding for {model}, using cl100k_base")
-            encoding = tiktoken.get_encoding("cl100k_base")
-        return (len(encoding.encode(string)))
+        """Returns the number of tokens in a string, see chat/tokenizer.py."""
+        return tokenizer.count_tokens(string, model)
     def get_pretty_message(self):
         """Returns a pretty string representation of the message."""
         if self.data['role'] == 'user':
@@ -94,21 +123,23 @@ class Message(UserDict):
         return self.data
     def __repr__(self):
         constructor =  f"Message({self.data['role']}, {self.data['content']}, {self.model})"
-        info = f"Message Object with {self.tokens} tokens, and {len(self.data['content'])} characters."
+        tokens = self._tokens if self._tokens is not None else f"about {self.token_estimate.estimate}"
+        info = f"Message Object with {tokens} tokens, and {len(self.data['content'])} characters."
         
         return f"{constructor}\n{info}"
     
 class MessageFactory:
     """Creates a message with a given role and model."""
-    def __init__(self, model: str, role: str = None):
+    def __init__(self, model: str, role: str = None, estimate: bool = False):
         self.model = model
         self.role = role
+        self.estimate = estimate
     def __call__(self, content: str, role: str = None):
         if role is None:
             role = self.role
         if role is None:
             raise exceptions.NoRoleProvidedError("Must provide a role either during initialization or during call.")
-        return Message(role, content, self.model)
+        return Message(role, content, self.model, estimate=self.estimate)
     def set_model(self, model: str):
         self.model = model
             
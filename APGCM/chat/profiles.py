@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+import exceptions
+from chat import tokenizer
+from chat.system_prompt import Reminder, SystemPrompt
+
+"""Mode profiles, a named system prompt and reminder that a TrimChatLog switches to at once(see TrimChatLog.apply_profile).
+Each profile compiles and counts its prompt and reminder once for each model, so switching mode is swapping in copies of the prepared objects and trimming once, instead of compiling and counting both and trimming after each.
+"""
+# tests can be found in tests/test_profiles.py
+
+# a profile ready for a model, budget is the tokens the prompt and reminder take from the chat log(with their chat format overhead)
+PreparedProfile = namedtuple("PreparedProfile", ["system_prompt", "reminder", "budget"])
+
+
+class ModeProfile:
+    """A system prompt and reminder to switch to together, see register_profile.
+    Args:
+        name (str): The name of the profile, ie "casual".
+        system_prompt (str): The system prompt, with wildcards, None for no system prompt.
+        reminder (str): The reminder, with wildcards, None for no reminder.
+        description (str): What the profile is for.
+    Methods:
+        prepare(model, time_granularity) -> PreparedProfile: The SystemPrompt and Reminder of the profile, compiled and counted for a model the first time and kept.
+        budget(model, time_granularity) -> int: The tokens the prompt and reminder take from the chat log with that model.
+    """
+
+    def __init__(self, name: str, system_prompt: str = None, reminder: str = None, description: str = "") -> None:
+        for value, what in ((system_prompt, "system_prompt"), (reminder, "reminder")):
+            if value is not None and not isinstance(value, str):
+                raise exceptions.BadTypeError(f"{what} must be a string or None, not {type(value)}")
+        self.name = name
+        self.system_prompt = system_prompt
+        self.reminder = reminder
+        self.description = description
+        self._prepared: dict[tuple[str, int], PreparedProfile] = {}
+
+    def prepare(self, model: str, time_granularity: int = 0) -> PreparedProfile:
+        """Returns the profile compiled and counted for a model(with the wildcards as they are now), making it the first time. The objects are shared, use copies of them."""
+        key = (model, time_granularity)
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            system_prompt = SystemPrompt(model, self.system_prompt, time_granularity=time_granularity)
+            reminder = Reminder(model, self.reminder)
+            budget = 0
+            if system_prompt.has_system_prompt:
+                budget += system_prompt.system_prompt_tokens + tokenizer.message_overhead("system", model)
+            if reminder.is_reminder_set:
+                budget += reminder.tokens + tokenizer.message_overhead("system", model)
+            prepared = PreparedProfile(system_prompt, reminder, budget)
+            self._prepared[key] = prepared
+        return prepared
+
+    def budget(self, model: str, time_granularity: int = 0) -> int:
+        return self.prepare(model, time_granularity).budget
+
+    def __repr__(self) -> str:
+        return f"ModeProfile({self.name!r}, {len(self._prepared)} models prepared)"
+
+
+registry: dict[str, ModeProfile] = {}
+
+
+def register_profile(profile: ModeProfile, models: list[str] = ()) -> ModeProfile:
+    """Registers a profile under its name(replacing one with the same name), preparing it for each of models now rather than the first time it is used. Returns the profile."""
+    if not isinstance(profile, ModeProfile):
+        raise exceptions.IncorrectObjectTypeError(f"Expected {ModeProfile}, got {type(profile)}")
+    for model in models:
+        profile.prepare(model)
+    registry[profile.name] = profile
+    return profile
+
+
+def unregister_profile(name: str) -> None:
+    registry.pop(name, None)
+
+
+def get_profile(name: str) -> ModeProfile:
+    """Returns the registered profile called name, raises UnknownProfileError if there isn't one."""
+    profile = registry.get(name)
+    if profile is None:
+        raise exceptions.UnknownProfileError(name, list(registry))
+    return profile
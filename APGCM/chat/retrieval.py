@@ -0,0 +1,317 @@
+import base64
+import binascii
+import math
+import zlib
+from collections import namedtuple
+from typing import Callable, Iterable
+
+import exceptions
+from chat.search import tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""Retrieval memory, a vector index of a chat log so old messages like the newest one can be found again(see TrimChatLog Retrieval).
+Every message is turned into a vector by an Embedder when it is added, the vectors are the rows of one contiguous matrix, so a search is a single matrix vector product over the whole history.
+The default embedder hashes the words of a message into a fixed number of dimensions(no vocabulary to keep, nothing to download), weighted by tf-idf at search time.
+Needs numpy, see is_available.
+"""
+# tests can be found in tests/test_retrieval.py
+
+RetrievalResult = namedtuple("RetrievalResult", ["position", "score", "message"])
+
+
+def is_available() -> bool:
+    """Returns True if numpy is installed, which retrieval needs."""
+    return np is not None
+
+
+def _check_available() -> None:
+    if np is None:
+        raise exceptions.RetrievalNotAvailableError("numpy")
+
+
+class Embedder:
+    """Turns texts into vectors for a VectorIndex.
+    Args:
+        dims (int): The length of each vector.
+    Attributes:
+        name (str): The name the embedder is registered and saved with, see register_embedder.
+        use_idf (bool): Whether the index weighs each dimension by its inverse document frequency when searching, for embedders whose dimensions are words.
+    Methods:
+        embed(texts) -> np.ndarray: A float32 matrix with a row for each text. Rows of all zeros never match anything.
+        to_dict() -> dict: The name and arguments, from_dict makes the same embedder again.
+    Subclass and override embed for another embedder(ie a local sentence embedding model), and register it so saved indexes can be loaded.
+    """
+
+    name = "abstract"
+    use_idf = False
+
+    def __init__(self, dims: int = 1024) -> None:
+        self.dims = dims
+
+    def embed(self, texts: list[str]) -> "np.ndarray":
+        raise NotImplementedError
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "dims": self.dims}
+
+    @classmethod
+    def from_dict(cls, save: dict) -> "Embedder":
+        """Makes the embedder saved with to_dict, it has to be registered. Raises BadSaveDictionaryError if it isn't."""
+        try:
+            save = dict(save)
+            embedder_cls = embedders[save.pop("name")]
+            return embedder_cls(**save)
+        except (KeyError, TypeError, AttributeError):
+            raise exceptions.BadSaveDictionaryError("The embedder of the vector index in the save is unknown or not formatted correctly.")
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(dims={self.dims})"
+
+
+class HashingEmbedder(Embedder):
+    """Hashed term frequency vectors: each word(and pair of words, with bigrams) is hashed to a dimension, and the dimension gets 1 + log(count).
+    The hash is crc32, not hash(), so the same text gives the same vector in every process and saved vectors stay valid.
+    The index weighs the dimensions by idf when searching(use_idf), so vectors never have to be worked out again as the history grows.
+    Args:
+        dims (int): The number of dimensions words are hashed into, more means fewer words share one.
+        bigrams (bool): Also hash each pair of neighbouring words, so "new york" is more like "new york" than "york new". Off by default, most pairs are only used once so they get the highest idf, and a pair that lands on the same dimension as an unrelated word outweighs the words that really match.
+    """
+
+    name = "hashing"
+    use_idf = True
+
+    def __init__(self, dims: int = 1024, bigrams: bool = False) -> None:
+        super().__init__(dims)
+        self.bigrams = bigrams
+
+    def _features(self, text: str) -> dict[int, int]:
+        """The count of each dimension's terms in the text."""
+        words = tokenize(text)
+        terms = words
+        if self.bigrams:
+            terms = words + [first + " " + second for first, second in zip(words, words[1:])]
+        counts: dict[int, int] = {}
+        for term in terms:
+            dim = zlib.crc32(term.encode("utf-8")) % self.dims
+            counts[dim] = counts.get(dim, 0) + 1
+        return counts
+
+    def embed(self, texts: list[str]) -> "np.ndarray":
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for dim, count in self._features(text).items():
+                rows.append(row)
+                cols.append(dim)
+                values.append(1.0 + math.log(count))
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        matrix[rows, cols] = values
+        return matrix
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "dims": self.dims, "bigrams": self.bigrams}
+
+
+embedders: dict[str, type[Embedder]] = {}
+
+
+def register_embedder(embedder: type[Embedder]) -> type[Embedder]:
+    """Registers an embedder class under its name, so saved vector indexes using it can be loaded. Returns the class, so it can be used as a decorator."""
+    embedders[embedder.name] = embedder
+    return embedder
+
+
+register_embedder(HashingEmbedder)
+
+
+class VectorIndex:
+    """An incremental vector index over a sequence of messages, row i of the matrix is the vector of message i.
+    The matrix is allocated with room to spare and doubled when full, so adding a message costs one embed and a row copy, and the used rows are always one contiguous block.
+    Args:
+        embedder (Embedder): Turns the messages and queries into vectors. Defaults to a HashingEmbedder.
+    Searching:
+        The query is embedded and every message is scored with cosine similarity in one batch: a matrix vector product, divided by the norms of the rows.
+        With use_idf each dimension is weighted by its smoothed idf, log((1 + n) / (1 + df)) + 1, where df is the number of messages using it(kept up to date as messages are added).
+        The weighted norms change as messages are added, so they are worked out again for each search from the non zero values of the rows(kept as they are added), which is much faster than squaring the whole matrix. Without idf the norms never change and are kept per row.
+        Only the best few scores are sorted(argpartition), unless keep skips most of them.
+    Methods:
+        add(text) -> int: Embeds and adds the next message, returns its position.
+        extend(texts): Embeds and adds several messages at once.
+        search(query, limit, keep, min_score) -> list[tuple[int, float]]: The positions and scores of the most similar messages, most similar first.
+        clear: Empties the index.
+        to_dict, from_dict: Saving and loading, the vectors are saved sparse(the non zero values of each row).
+    Raises RetrievalNotAvailableError if numpy isn't installed.
+    """
+
+    version = 1
+    initial_rows = 64
+
+    def __init__(self, embedder: Embedder = None) -> None:
+        _check_available()
+        self.embedder = embedder if embedder is not None else HashingEmbedder()
+        self.clear()
+
+    def clear(self) -> None:
+        self._matrix = np.zeros((self.initial_rows, self.embedder.dims), dtype=np.float32)
+        self._length = 0
+        # the number of messages using each dimension, for the idf weights
+        self._df = np.zeros(self.embedder.dims, dtype=np.float64)
+        # the norm of each row without idf, and with it the row, dimension and square of every non zero value(in chunks, joined when searching)
+        self._norms = np.zeros(self.initial_rows, dtype=np.float32)
+        self._nonzero: list[tuple["np.ndarray", "np.ndarray", "np.ndarray"]] = []
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def matrix(self) -> "np.ndarray":
+        """The vectors of the messages, a view of the used rows."""
+        return self._matrix[: self._length]
+
+    def add(self, text: str) -> int:
+        self.extend([text])
+        return self._length - 1
+
+    def extend(self, texts: Iterable[str]) -> None:
+        texts = list(texts)
+        if len(texts) > 0:
+            self._append(self.embedder.embed(texts))
+
+    def _append(self, vectors: "np.ndarray") -> None:
+        end = self._length + len(vectors)
+        if end > len(self._matrix):
+            capacity = max(len(self._matrix) * 2, end)
+            matrix = np.zeros((capacity, self.embedder.dims), dtype=np.float32)
+            matrix[: self._length] = self._matrix[: self._length]
+            self._matrix = matrix
+            norms = np.zeros(capacity, dtype=np.float32)
+            norms[: self._length] = self._norms[: self._length]
+            self._norms = norms
+        self._matrix[self._length : end] = vectors
+        if self.embedder.use_idf:
+            rows, cols = np.nonzero(vectors)
+            values = vectors[rows, cols]
+            self._nonzero.append((rows + self._length, cols, values * values))
+        else:
+            self._norms[self._length : end] = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+        self._length = end
+        self._df += np.count_nonzero(vectors, axis=0)
+
+    def _weighted_norms(self, weights: "np.ndarray") -> "np.ndarray":
+        """The norm of every row with each dimension weighted by the square root of weights."""
+        if len(self._nonzero) > 1:
+            self._nonzero = [tuple(np.concatenate(parts) for parts in zip(*self._nonzero))]
+        if len(self._nonzero) == 0:
+            return np.zeros(self._length, dtype=np.float32)
+        rows, cols, squares = self._nonzero[0]
+        return np.sqrt(np.bincount(rows, weights=squares * weights[cols], minlength=self._length)).astype(np.float32)
+
+    def _weights(self) -> "np.ndarray | None":
+        """The squared idf weight of each dimension, None if the embedder doesn't use idf."""
+        if not self.embedder.use_idf:
+            return None
+        idf = np.log((1.0 + self._length) / (1.0 + self._df)) + 1.0
+        return (idf * idf).astype(np.float32)
+
+    def scores(self, query: str) -> "np.ndarray":
+        """The cosine similarity of the query to every message, in one batch."""
+        query_vector = self.embedder.embed([query])[0]
+        matrix = self.matrix
+        weights = self._weights()
+        if weights is None:
+            row_norms = self._norms[: self._length]
+            query_norm = math.sqrt(float(query_vector @ query_vector))
+        else:
+            # the rows are weighted by idf without making a weighted copy of the matrix: (q*w).(r*w) = r.(q*w^2)
+            row_norms = self._weighted_norms(weights)
+            query_norm = math.sqrt(float((query_vector * query_vector) @ weights))
+            query_vector = query_vector * weights
+        if query_norm == 0.0:
+            return np.zeros(self._length, dtype=np.float32)
+        dots = matrix @ query_vector
+        return np.divide(dots, row_norms * query_norm, out=np.zeros_like(dots), where=row_norms > 0)
+
+    def search(self, query: str, limit: int = 5, keep: Callable[[int], bool] = None, min_score: float = 0.0) -> list[tuple[int, float]]:
+        """Returns the positions and scores of up to limit messages scoring over min_score, most similar first, skipping the positions keep returns False for."""
+        if self._length == 0 or limit <= 0:
+            return []
+        scores = self.scores(query)
+        results = []
+        for position in self._ranked(scores, limit if keep is None else limit * 4):
+            score = float(scores[position])
+            if score <= min_score:
+                break
+            if keep is not None and not keep(int(position)):
+                continue
+            results.append((int(position), score))
+            if len(results) == limit:
+                break
+        return results
+
+    def _ranked(self, scores: "np.ndarray", first: int):
+        """Yields every position from the highest score down, sorting only the first few unless they are all used."""
+        first = min(first, len(scores))
+        top = np.argpartition(-scores, first - 1)[:first]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        yield from top
+        if first < len(scores):
+            seen = set(top.tolist())
+            for position in np.argsort(-scores, kind="stable"):
+                if int(position) not in seen:
+                    yield position
+
+    def to_dict(self) -> dict:
+        """Returns a json friendly dictionary of the index.
+        Each row is saved as its non zero dimensions and values, counts(the non zero values of each row), indices and values are base64 little endian arrays.
+        Indices are 16 bit when there are few enough dimensions and values are half precision(plenty for a cosine similarity), so a message costs about 5 characters for each of its words.
+        """
+        matrix = self.matrix
+        rows, cols = np.nonzero(matrix)
+        counts = np.bincount(rows, minlength=self._length)
+        index_type = "<u2" if self.embedder.dims <= 1 << 16 else "<i4"
+        return {
+            "version": self.version,
+            "embedder": self.embedder.to_dict(),
+            "length": self._length,
+            "index_type": index_type,
+            "counts": _encode(counts, "<i4"),
+            "indices": _encode(cols, index_type),
+            "values": _encode(matrix[rows, cols], "<f2"),
+        }
+
+    @classmethod
+    def from_dict(cls, save: dict) -> "VectorIndex":
+        """Loads an index saved with to_dict. Raises BadSaveDictionaryError if it isn't formatted correctly or its embedder isn't registered."""
+        _check_available()
+        try:
+            index = cls(Embedder.from_dict(save["embedder"]))
+            length = int(save["length"])
+            counts = _decode(save["counts"], "<i4")
+            if save["index_type"] not in ("<u2", "<i4"):
+                raise ValueError
+            indices = _decode(save["indices"], save["index_type"])
+            values = _decode(save["values"], "<f2")
+            if len(counts) != length or int(counts.sum()) != len(indices) or len(indices) != len(values):
+                raise ValueError
+            if len(indices) > 0 and (indices.min() < 0 or indices.max() >= index.embedder.dims):
+                raise ValueError
+            vectors = np.zeros((length, index.embedder.dims), dtype=np.float32)
+            vectors[np.repeat(np.arange(length), counts), indices] = values
+        except (KeyError, TypeError, ValueError, AttributeError, binascii.Error):
+            raise exceptions.BadSaveDictionaryError("The vector index in the save is not formatted correctly.")
+        index._append(vectors)
+        return index
+
+    def __repr__(self) -> str:
+        return f"VectorIndex({self._length} messages, {self.embedder!r})"
+
+
+def _encode(array: "np.ndarray", dtype: str) -> str:
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode("ascii")
+
+
+def _decode(encoded: str, dtype: str) -> "np.ndarray":
+    return np.frombuffer(base64.b64decode(encoded, validate=True), dtype=dtype)
@@ -0,0 +1,257 @@
+import math
+import re
+from collections import namedtuple
+from typing import Callable, Iterable
+
+import exceptions
+
+"""Full text search over chat history.
+InvertedIndex maps each word to the positions of the messages it appears in(and where in the message), it is updated as messages are added so searching never scans the history.
+Results are ranked with BM25, and quoted phrases in a query must appear in a message word for word.
+"""
+# tests can be found in tests/test_search.py
+
+WORD_PATTERN = re.compile(r"\w+")
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+
+SearchResult = namedtuple("SearchResult", ["position", "score", "message", "snippet"])
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lower case words, the terms of the index."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def parse_query(query: str) -> tuple[list[list[str]], list[str]]:
+    """Splits a query into its quoted phrases(each a list of terms) and its other keywords."""
+    phrases = [tokenize(phrase) for phrase in PHRASE_PATTERN.findall(query)]
+    phrases = [phrase for phrase in phrases if len(phrase) > 0]
+    keywords = tokenize(PHRASE_PATTERN.sub(" ", query))
+    return phrases, keywords
+
+
+def make_snippet(text: str, terms: Iterable[str], width: int = 160) -> str:
+    """Returns about width characters of text around the first match of any of the terms, with ... where it was cut."""
+    terms = [term for term in terms if term]
+    if len(text) <= width or len(terms) == 0:
+        return text if len(text) <= width else text[:width] + "..."
+    match = re.search(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\b", text, re.IGNORECASE)
+    center = match.start() if match is not None else 0
+    start = max(0, min(center - width // 3, len(text) - width))
+    end = start + width
+    return ("..." if start > 0 else "") + text[start:end] + ("..." if end < len(text) else "")
+
+
+class InvertedIndex:
+    """An incremental inverted index over a sequence of messages, term -> {message position: [word offsets in the message]}.
+    Messages are added in order with add, which costs O(message length), and the index can be saved with to_dict and loaded with from_dict so it isn't rebuilt on every load.
+    A loaded index only decodes a term's postings the first time the term is used, so loading costs about as much as parsing the save.
+    Args:
+        k1 (float), b (float): BM25 parameters, term frequency saturation and length normalization.
+    Methods:
+        add(text) -> int: Indexes the next message, returns its position.
+        extend(texts): Indexes several messages.
+        search(query, limit, keep) -> list[tuple[int, float]]: The positions and scores of the best matches, best first.
+        clear: Empties the index.
+        to_dict, from_dict: Saving and loading.
+        extend_saved: Adds messages to a saved index without loading it.
+    Query syntax:
+        Words are keywords, a message matching any of them is a candidate. "quoted phrases" must appear in a message word for word.
+        Candidates are ranked by the BM25 score of every term in the query.
+    """
+
+    version = "1.0.0"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, list[int]]] = {}
+        # the saved form of each term's postings(see to_dict), terms loaded from a save are only decoded when used and terms in _dirty are encoded again when saving
+        self._encoded: dict[str, str] = {}
+        self._dirty: set[str] = set()
+        # number of words in each message
+        self._lengths: list[int] = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings.keys() | self._encoded.keys())
+
+    def _get_postings(self, term: str) -> dict[int, list[int]] | None:
+        """Returns the postings of a term, decoding them if they were loaded from a save, or None if the term isn't in the index."""
+        postings = self._postings.get(term)
+        if postings is None and term in self._encoded:
+            try:
+                postings = self._postings[term] = self._decode(self._encoded[term])
+            except ValueError:
+                raise exceptions.BadSaveDictionaryError(f"The saved search index has corrupt postings for {term}.")
+        return postings
+
+    # ==========(ADDING)==========
+    def add(self, text: str) -> int:
+        """Indexes the next message and returns its position."""
+        position = len(self._lengths)
+        words = tokenize(text)
+        for offset, word in enumerate(words):
+            postings = self._get_postings(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+            offsets = postings.get(position)
+            if offsets is None:
+                postings[position] = [offset]
+                self._dirty.add(word)
+            else:
+                offsets.append(offset)
+        self._lengths.append(len(words))
+        self._total_length += len(words)
+        return position
+
+    def extend(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            self.add(text)
+
+    def clear(self) -> None:
+        self._postings = {}
+        self._encoded = {}
+        self._dirty = set()
+        self._lengths = []
+        self._total_length = 0
+
+    # ==========(SEARCHING)==========
+    def _phrase_positions(self, phrase: list[str]) -> set[int]:
+        """Returns the positions of the messages that contain the phrase word for word."""
+        postings = [self._get_postings(word) for word in phrase]
+        if any(p is None for p in postings):
+            return set()
+        # start from the rarest word's messages
+        candidates = set(min(postings, key=len))
+        result = set()
+        for position in candidates:
+            if not all(position in p for p in postings):
+                continue
+            starts = set(postings[0][position])
+            for i, p in enumerate(postings[1:], 1):
+                starts &= {offset - i for offset in p[position]}
+                if not starts:
+                    break
+            if starts:
+                result.add(position)
+        return result
+
+    def _score(self, term: str, position: int, idf: float, average_length: float) -> float:
+        tf = len(self._postings[term][position])
+        norm = 1 - self.b + self.b * self._lengths[position] / average_length
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+    def search(self, query: str, limit: int = 5, keep: Callable[[int], bool] = None) -> list[tuple[int, float]]:
+        """Returns (position, score) of the messages that best match the query, best first.
+        keep is an optional filter called with each candidate position(ie to only return one role's messages).
+        """
+        phrases, keywords = parse_query(query)
+        if len(self) == 0 or (len(phrases) == 0 and len(keywords) == 0):
+            return []
+        if len(phrases) > 0:
+            candidates = None
+            for phrase in phrases:
+                matches = self._phrase_positions(phrase)
+                candidates = matches if candidates is None else candidates & matches
+        else:
+            candidates = set()
+            for word in keywords:
+                candidates.update(self._get_postings(word) or ())
+        if keep is not None:
+            candidates = {position for position in candidates if keep(position)}
+        if not candidates:
+            return []
+        terms = set(keywords)
+        for phrase in phrases:
+            terms.update(phrase)
+        average_length = max(self._total_length / len(self), 1)
+        idfs = {}
+        for term in terms:
+            df = len(self._get_postings(term) or ())
+            if df > 0:
+                idfs[term] = math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+        scored = []
+        for position in candidates:
+            score = 0.0
+            for term, idf in idfs.items():
+                if position in self._postings[term]:
+                    score += self._score(term, position, idf, average_length)
+            scored.append((position, score))
+        # best first, newest first for equal scores
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored if limit is None else scored[:limit]
+
+    # ==========(SAVING AND LOADING)==========
+    @staticmethod
+    def _encode(postings: dict[int, list[int]]) -> str:
+        return " ".join(f"{position}:{','.join(map(str, offsets))}" for position, offsets in postings.items())
+
+    @staticmethod
+    def _decode(encoded: str) -> dict[int, list[int]]:
+        postings = {}
+        for entry in encoded.split(" "):
+            position, _, offsets = entry.partition(":")
+            postings[int(position)] = [int(offset) for offset in offsets.split(",")]
+        return postings
+
+    def to_dict(self) -> dict:
+        """Returns a json friendly dictionary of the index.
+        Each term's postings are a string, "position:offset,offset position:offset", json parses strings much faster than lists of numbers and they are smaller.
+        Only the terms added to since the last save are encoded again.
+        """
+        for term in self._dirty:
+            self._encoded[term] = self._encode(self._postings[term])
+        self._dirty = set()
+        return {
+            "version": self.version,
+            "k1": self.k1,
+            "b": self.b,
+            "lengths": list(self._lengths),
+            "postings": dict(self._encoded),
+        }
+
+    @classmethod
+    def extend_saved(cls, save: dict, texts: Iterable[str]) -> dict:
+        """Returns a copy of an index saved with to_dict with more messages added, without loading it.
+        Used by TrimChatLog to save messages added before its full chat log was loaded.
+        """
+        save = dict(save)
+        lengths = list(save["lengths"])
+        postings = dict(save["postings"])
+        for text in texts:
+            position = len(lengths)
+            offsets: dict[str, list[int]] = {}
+            words = tokenize(text)
+            for offset, word in enumerate(words):
+                offsets.setdefault(word, []).append(offset)
+            for word, word_offsets in offsets.items():
+                entry = cls._encode({position: word_offsets})
+                postings[word] = f"{postings[word]} {entry}" if word in postings else entry
+            lengths.append(len(words))
+        save["lengths"] = lengths
+        save["postings"] = postings
+        return save
+
+    @classmethod
+    def from_dict(cls, save: dict) -> "InvertedIndex":
+        """Loads an index saved with to_dict. Each term's postings are only decoded the first time the term is searched for or added to.
+        Raises BadSaveDictionaryError if it isn't formatted correctly.
+        """
+        try:
+            index = cls(k1=save.get("k1", 1.5), b=save.get("b", 0.75))
+            index._lengths = list(save["lengths"])
+            index._total_length = sum(index._lengths)
+            if not all(isinstance(encoded, str) for encoded in save["postings"].values()):
+                raise TypeError
+            index._encoded = dict(save["postings"])
+        except (KeyError, TypeError, AttributeError):
+            raise exceptions.BadSaveDictionaryError("The search index in the save is not formatted correctly.")
+        return index
+
+    def __repr__(self):
+        return f"InvertedIndex({len(self)} messages, {self.terms} terms)"
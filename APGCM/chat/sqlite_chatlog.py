@@ -0,0 +1,370 @@
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+import exceptions
+from chat import message
+from chat.stored_chatlog import StoredChatLog, saved_message_count
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import CHATLOG_DATABASE, STORED_CHATLOG_EMBED
+
+# tests can be found in tests/test_sqlite_chatlog.py
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS messages (
+        session_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        tokens INTEGER NOT NULL,
+        timestamp REAL NOT NULL,
+        PRIMARY KEY (session_id, position)
+    )""",
+    "CREATE INDEX IF NOT EXISTS messages_by_role ON messages (session_id, role, position)",
+    "CREATE INDEX IF NOT EXISTS messages_by_time ON messages (session_id, timestamp)",
+)
+# rows fetched per query when iterating without a limit, so iterating never holds the connection for long
+PAGE_SIZE = 256
+
+
+class SqliteChatLog(StoredChatLog):
+    """A chat log kept in a SQLite database, one row per message with its role, content, token count, timestamp and session id.
+    Many chat logs(sessions) share one database file and one connection, so a bot with many channels doesn't keep every channel's history in memory.
+    Selected with DEFAULT_CHATLOG_HANDLER = ChatLogSqlite, see chatlog_handlers.make_chatlog.
+
+    Relies on:
+        - Message, MessageFactory from chat/message.py
+        - StoredChatLog from chat/stored_chatlog.py
+        - CHATLOG_DATABASE from settings.py
+        - sqlite3(standard library)
+    Raises:
+        - NotAMessageError if a message is not a Message object
+        - BadSaveDictionaryError if a save dictionary is not formatted correctly
+        - ChatLogFileError if the session is already used by another live SqliteChatLog
+    Args:
+        model (str): AI model used to count tokens
+        session_id (str): Optional, the session to use. An existing session is continued. Defaults to a new session(the chat log's uuid).
+        database (str): The database file, defaults to CHATLOG_DATABASE. ":memory:" works for testing, and is shared by every chat log in the process.
+        embed_messages (bool): Whether saves have every message instead of referring to the session, defaults to STORED_CHATLOG_EMBED.
+    Attributes:
+        session_id (str): The session the messages belong to.
+        database (str): The database file.
+        data (StoredMessages): A read only sequence of the messages, read from the database when used.
+        model, uuid, version: See ChatLog.
+    Indexes:
+        (session_id, position) is the primary key, (session_id, role, position) serves get_messages with a role and (session_id, timestamp) serves get_messages_between.
+        get_messages(role=..., limit=..., reverse=True) is one indexed query that stops after limit rows, instead of a scan over a reversed copy of the history.
+    Saving:
+        Saves record the database, session and number of messages. Every message is only read into the save with embed_messages(see StoredChatLog Saving).
+        Loading into an empty SqliteChatLog continues that session instead of copying the messages if it still has exactly the saved messages, otherwise the saved messages(the first message_count of the session) are copied.
+        (Sessions are append only, so the same number of messages means the same messages.) A session a save refers to is kept when the chat log is reset.
+    Forking:
+        A fork reads the first len(fork) rows of its owner's session(see StoredChatLog Forking), every query stops at its own length. Before it stores a message or recounts its tokens the rows are copied to a session of its own with one INSERT ... SELECT, without reading them into Python.
+    Methods:
+        The same as ChatLog, plus:
+        get_messages_between: Messages in a time range, using the timestamp index.
+        sessions: Class method, the sessions in a database and their message counts.
+    """
+
+    version = "1.0.0"
+    storage = "sqlite"
+    # one connection(and lock) per database, shared by every chat log using it
+    _connections: dict[str, sqlite3.Connection] = {}
+    _locks: dict[str, threading.RLock] = {}
+    # sessions used by a live chat log, so two chat logs never append to the same session
+    _open_sessions: "weakref.WeakValueDictionary[tuple, SqliteChatLog]" = weakref.WeakValueDictionary()
+
+    def __init__(self, model: str = None, session_id: str = None, database: str = CHATLOG_DATABASE, embed_messages: bool = STORED_CHATLOG_EMBED):
+        self.logger = BaseLogger(
+            __file__,
+            filename="chatlog.log",
+            identifier="SqliteChatLog",
+            level=DEFAULT_LOGGING_LEVEL,
+        )
+        self._model = model
+        self.uuid = str(uuid.uuid4())
+        self.embed_messages = embed_messages
+        self.database = self._database_key(database)
+        self._connection, self._lock = self._connect(self.database)
+        self.session_id: str = None
+        self._length = 0
+        self._claim(session_id if session_id is not None else self.uuid)
+
+    # ==========(CONNECTION AND SESSION)==========
+    @staticmethod
+    def _database_key(database: str) -> str:
+        if database == ":memory:":
+            return database
+        return str(Path(database).resolve())
+
+    @classmethod
+    def _connect(cls, database: str) -> tuple[sqlite3.Connection, threading.RLock]:
+        """Returns the shared connection and lock for the database, making them and the tables if needed."""
+        if database not in cls._connections:
+            if database != ":memory:":
+                Path(database).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(database, check_same_thread=False)
+            if database != ":memory:":
+                # write ahead logging lets readers work while a message is written
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            cls._connections[database] = connection
+            cls._locks[database] = threading.RLock()
+        return cls._connections[database], cls._locks[database]
+
+    @classmethod
+    def close_database(cls, database: str = CHATLOG_DATABASE) -> None:
+        """Closes the shared connection to a database, it is reopened by the next chat log that uses it."""
+        database = cls._database_key(database)
+        connection = cls._connections.pop(database, None)
+        cls._locks.pop(database, None)
+        if connection is not None:
+            connection.close()
+
+    @classmethod
+    def sessions(cls, database: str = CHATLOG_DATABASE) -> dict[str, int]:
+        """Returns the sessions in the database and the number of messages in each."""
+        connection, lock = cls._connect(cls._database_key(database))
+        with lock:
+            rows = connection.execute("SELECT session_id, COUNT(*) FROM messages GROUP BY session_id").fetchall()
+        return dict(rows)
+
+    def _count_session(self, session_id: str) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def _claim(self, session_id: str) -> None:
+        """Makes session_id the session of this chat log. Raises ChatLogFileError if another live chat log uses it."""
+        key = (self.database, session_id)
+        owner = self._open_sessions.get(key)
+        if owner is not None and owner is not self:
+            raise exceptions.ChatLogFileError(f"The chat log session {session_id} is already used by another chat log.")
+        self._open_sessions[key] = self
+        self.session_id = session_id
+        self._length = self._count_session(session_id)
+
+    def _release(self) -> None:
+        key = (self.database, self.session_id)
+        if self._open_sessions.get(key) is self:
+            del self._open_sessions[key]
+        self.session_id = None
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    # ==========(STORAGE)==========
+    def _append(self, msgs: list[message.Message]) -> None:
+        """Inserts the messages in one transaction."""
+        if self._is_shared:
+            self._unshare()
+        now = time.time()
+        rows = [
+            (self.session_id, self._length + i, msg.role, msg.content, msg.tokens, now)
+            for i, msg in enumerate(msgs)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (session_id, position, role, content, tokens, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._length += len(rows)
+
+    def _set_token_counts(self, counts: list[int]) -> None:
+        """Updates the token count of every message in one transaction."""
+        if self._is_shared:
+            self._unshare()
+        self._unshare_forks()
+        rows = [(tokens, self.session_id, position) for position, tokens in enumerate(counts)]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE messages SET tokens = ? WHERE session_id = ? AND position = ?",
+                rows,
+            )
+
+    def _row_to_message(self, row: tuple) -> message.Message:
+        return message.Message(role=row[0], content=row[1], model=self.model, tokens=row[2])
+
+    def _read_message(self, index: int) -> message.Message:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT role, content, tokens FROM messages WHERE session_id = ? AND position = ?",
+                (self.session_id, index),
+            ).fetchone()
+        return self._row_to_message(row)
+
+    def _query_pages(self, role: str = None, reverse: bool = False) -> Iterator[tuple]:
+        """Yields (role, content, tokens) rows in position order, a page at a time. Each page is an indexed range query starting after the last position seen."""
+        role_filter = "AND role = ? " if role is not None else ""
+        order = "DESC" if reverse else "ASC"
+        compare = "<" if reverse else ">"
+        last_position = self._length if reverse else -1
+        while True:
+            params = [self.session_id, last_position, self._length]
+            if role is not None:
+                params.append(role)
+            params.append(PAGE_SIZE)
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT position, role, content, tokens FROM messages WHERE session_id = ? AND position {compare} ? AND position < ? {role_filter}"
+                    f"ORDER BY position {order} LIMIT ?",
+                    params,
+                ).fetchall()
+            for row in rows:
+                yield row[1:]
+            if len(rows) < PAGE_SIZE:
+                return
+            last_position = rows[-1][0]
+
+    def _iter_message_dicts(self) -> Iterator[dict]:
+        for role, content, tokens in self._query_pages():
+            yield {"role": role, "content": content, "tokens": tokens}
+
+    # ==========(FORKING)==========
+    def _new_fork(self) -> "SqliteChatLog":
+        """Returns a chat log reading this one's session, without claiming it."""
+        forked = SqliteChatLog.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        self._share_with(forked)
+        return forked
+
+    def _unshare(self) -> None:
+        """Copies the shared rows of the owner's session to a session of its own, see Forking."""
+        source = self.session_id
+        length = self._length
+        self._stop_sharing()
+        self._claim(self.uuid)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO messages (session_id, position, role, content, tokens, timestamp) "
+                "SELECT ?, position, role, content, tokens, timestamp FROM messages WHERE session_id = ? AND position < ?",
+                (self.session_id, source, length),
+            )
+        self._length = length
+        self.logger.info(f"Copied {length} messages of session {source} to {self.session_id}")
+
+    # ==========(GETTING MESSAGES)==========
+    def get_messages(
+        self,
+        role: str = None,
+        limit: int = None,
+        reverse: bool = True,
+        pretty: bool = False,
+    ) -> Iterable[Union[message.Message, str]]:
+        """Generator that yields messages, optionally filtered by role and limited by limit. Starts from the newest message if reverse is True.
+        With a limit this is a single indexed query that reads only limit rows.
+        """
+        if limit is not None:
+            role_filter = "AND role = ? " if role is not None else ""
+            order = "DESC" if reverse else "ASC"
+            params = [self.session_id, self._length] + ([role] if role is not None else []) + [limit]
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT role, content, tokens FROM messages WHERE session_id = ? AND position < ? {role_filter}ORDER BY position {order} LIMIT ?",
+                    params,
+                ).fetchall()
+        else:
+            rows = self._query_pages(role=role, reverse=reverse)
+        for row in rows:
+            msg = self._row_to_message(row)
+            yield msg if not pretty else msg.pretty
+
+    def get_messages_between(self, start: float = None, end: float = None, role: str = None) -> list[message.Message]:
+        """Returns the messages added between two timestamps(seconds since the epoch, either can be None), oldest first, optionally filtered by role."""
+        query = "SELECT role, content, tokens FROM messages WHERE session_id = ? AND position < ?"
+        params = [self.session_id, self._length]
+        if start is not None:
+            query += " AND timestamp >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND timestamp <= ?"
+            params.append(end)
+        if role is not None:
+            query += " AND role = ?"
+            params.append(role)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY timestamp, position", params).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    # ==========(SAVING AND LOADING)==========
+    def make_save_dict(self) -> dict:
+        """Creates a save dictionary referring to the session(or with every message, see Saving), with the database and session so loading can continue it."""
+        return self._make_stored_save({"database": self.database, "session_id": self.session_id})
+
+    @classmethod
+    def _iter_saved(cls, save: dict) -> Iterator[dict]:
+        """Reads the messages a save refers to from its session, a page at a time."""
+        database, session_id = save["meta"].get("database"), save["meta"].get("session_id")
+        count = saved_message_count(save)
+        if database is None or (database != ":memory:" and not Path(database).exists()):
+            raise exceptions.ChatLogFileError(f"The chat log database {database} a save refers to is missing.")
+        connection, lock = cls._connect(database)
+        with lock:
+            stored = connection.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ? AND position < ?", (session_id, count)
+            ).fetchone()[0]
+        if stored != count:
+            raise exceptions.ChatLogFileError(f"The chat log session {session_id} a save refers to has {stored} of its {count} messages.")
+        last_position = -1
+        while last_position < count - 1:
+            with lock:
+                rows = connection.execute(
+                    "SELECT position, role, content, tokens FROM messages WHERE session_id = ? AND position > ? AND position < ? ORDER BY position LIMIT ?",
+                    (session_id, last_position, count, PAGE_SIZE),
+                ).fetchall()
+            for row in rows:
+                yield {"role": row[1], "content": row[2], "tokens": row[3]}
+            last_position = rows[-1][0]
+
+    def _reopen_saved(self, save: dict) -> bool:
+        """Continues the session recorded in the save if it is in this database, still has exactly the saved messages and isn't used by another chat log. Returns True if it did."""
+        session_id = save["meta"].get("session_id")
+        if len(self) != 0 or session_id is None or session_id == self.session_id:
+            return False
+        if save["meta"].get("database") != self.database:
+            return False
+        if self._is_shared:
+            self._unshare()
+        if self._count_session(session_id) != saved_message_count(save) or saved_message_count(save) == 0:
+            return False
+        old_session = self.session_id
+        self._release()
+        try:
+            self._claim(session_id)
+        except exceptions.ChatLogFileError:
+            self._claim(old_session)
+            return False
+        self.logger.info(f"Continued chat log session {session_id} instead of copying {len(self)} messages")
+        return True
+
+    def reset(self) -> None:
+        """Clears the chat log, deleting its session's messages unless a save refers to them(see Saving), and starting a new session. Forks reading the session copy it first, a fork never deletes its owner's session."""
+        self._unshare_forks()
+        if self._is_shared:
+            self._stop_sharing()
+        else:
+            if not self._referenced:
+                with self._lock, self._connection:
+                    self._connection.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+            self._release()
+        self._referenced = False
+        self.uuid = str(uuid.uuid4())
+        self._search_index = None
+        self._vector_index = None
+        self._arrays = None
+        self._claim(self.uuid)
+
+    # ==========(MISC)==========
+    def __repr__(self):
+        constructor = f"SqliteChatLog({self.model}, {self.session_id}, {self.database})"
+        info = f"SqliteChatLog Object with the following attributes:\n\tModel: {self.model}\n\tSession: {self.session_id}\n\tMessages: {len(self)}"
+        return f"{constructor}\n{info}"
@@ -0,0 +1,497 @@
+import uuid
+import weakref
+from abc import abstractmethod
+from collections.abc import Sequence
+from typing import Iterator, Union
+
+import exceptions
+from chat import message, exporter, tokenizer, retrieval, arrays
+from chat.chatlog import AbstractChatLog
+from chat.search import InvertedIndex
+from chat.retrieval import VectorIndex
+from chat.arrays import MessageArrays
+
+"""Shared base for chat logs that keep their messages outside of memory(JsonlChatLog, SqliteChatLog, TieredChatLog)."""
+
+# messages stored at a time when a save's messages are copied from the file or session it refers to
+SAVE_PAGE = 256
+# the chat logs whose saves can refer to their storage, by the storage name recorded in the save
+_storages: dict[str, type["StoredChatLog"]] = {}
+
+
+def refers_to_storage(save: dict) -> bool:
+    """Returns True if a chat log save refers to the file or session its messages are in instead of having them, see StoredChatLog Saving."""
+    return isinstance(save, dict) and "messages" not in save and isinstance(save.get("meta"), dict) and save["meta"].get("storage") in _storages
+
+
+def saved_message_count(save: dict) -> int:
+    """Returns the number of messages in a chat log save, whether it has them or refers to them."""
+    if isinstance(save.get("messages"), list):
+        return len(save["messages"])
+    return save.get("message_count", 0)
+
+
+def embed_saved_messages(save: dict) -> dict:
+    """Returns a self contained copy of a save that refers to its storage(see StoredChatLog Saving), with the messages read from the file or session, for chat logs that can't read it themselves. Other saves are returned as they are.
+    Raises ChatLogFileError if the messages can't be read.
+    """
+    if not refers_to_storage(save):
+        return save
+    messages = []
+    token_counts = []
+    for msg in _storages[save["meta"]["storage"]]._iter_saved(save):
+        messages.append({"role": msg["role"], "content": msg["content"]})
+        token_counts.append(msg["tokens"])
+    embedded = dict(save)
+    embedded.pop("message_count", None)
+    embedded["messages"] = messages
+    saved_counts = save.get("token_counts")
+    embedded["token_counts"] = saved_counts if isinstance(saved_counts, list) and len(saved_counts) == len(messages) else token_counts
+    return embedded
+
+
+class StoredMessages(Sequence):
+    """A read only sequence view of the messages in a StoredChatLog, used as its data so code written for ChatLog.data(exporting, printing history) works unchanged.
+    Messages are read from storage when indexed or iterated, nothing is kept in memory.
+    """
+
+    def __init__(self, chatlog: "StoredChatLog"):
+        self._chatlog = chatlog
+
+    def __len__(self) -> int:
+        return len(self._chatlog)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._chatlog._read_message(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chat log index out of range")
+        return self._chatlog._read_message(index)
+
+    def __iter__(self) -> Iterator[message.Message]:
+        for msg in self._chatlog._iter_message_dicts():
+            yield self._chatlog._make_message(msg)
+
+    def __reversed__(self) -> Iterator[message.Message]:
+        for i in range(len(self) - 1, -1, -1):
+            yield self._chatlog._read_message(i)
+
+
+class StoredChatLog(AbstractChatLog):
+    """Base class for chat logs that keep their messages outside of memory. Has everything ChatLog has, built on a few storage methods.
+    Subclasses implement:
+        __len__: The number of messages.
+        _append(msgs): Stores a list of Message objects, in one write if possible.
+        _read_message(index): Reads one message as a Message object.
+        _iter_message_dicts(): Yields every message in order as a dictionary with role, content and tokens.
+        get_messages(role, limit, reverse, pretty): See ChatLog.get_messages, should only read the messages it returns.
+        _set_token_counts(counts): Replaces the token count of every message, used by recount_tokens.
+        _reopen_saved(save): Optional, switches to the storage recorded in a save instead of storing its messages again. Returns True if it did.
+        _new_fork(): Returns a chat log of the same type holding the same messages, see Forking.
+        _unshare(): Optional, copies the messages a fork shares into storage of its own, see Forking.
+        make_save_dict, reset, close.
+    Saving:
+        Subclasses that keep their messages somewhere that outlives them(a file or a database) set storage and implement _iter_saved. Their saves have every message, unless embed_messages is False(STORED_CHATLOG_EMBED), then they refer to it, recording where the messages are and how many there are(message_count) instead of reading every message into the save.
+        Storage a save refers to is kept when the chat log is reset(a new file or session is started instead) and is never deleted here, however many saves are rotated or deleted, so that is left to whoever turned embed_messages off.
+        A chat log of any storage can load such a save(StoredChatLog copies the messages a page at a time), chat logs that can't(ChatLog) load embed_saved_messages(save). Saves that embed every message, like ChatLog saves, work everywhere.
+    The search index is kept in memory, so it is only built the first time search is used, then kept up to date as messages are stored and saved with the chat log.
+    The vector index(see chat/retrieval.py) is kept the same way, from the first time retrieve is used, and so are the message arrays(see chat/arrays.py) from the first time arrays is used.
+    Subclasses set _search_index, _vector_index and _arrays to None when they reset.
+    Forking:
+        fork returns a chat log of the same type without reading the messages. Stored messages are never changed, only added to, so a fork can read the messages stored so far where they are(the file or session of the chat log it was forked from, its owner) until one of them would change them.
+        A fork copies what it shares into storage of its own(_unshare) before it would change it(storing a message, or recounting if the counts are stored with the messages), and the owner has every fork that still shares its storage do that before it deletes or changes stored messages(_unshare_forks). A fork that is reset first never copies anything and never touches the owner's storage.
+        The search and vector indexes are rebuilt the first time a fork uses them, the message arrays are copied.
+    """
+
+    _search_index: InvertedIndex = None
+    _vector_index: VectorIndex = None
+    _arrays: MessageArrays = None
+    # see Forking, the chat log whose storage a fork reads(None once it has its own) and weak references to the forks reading this chat log's storage
+    _shared_from: "StoredChatLog" = None
+    _forks: list[weakref.ref] = None
+    # see Saving, the name recorded in saves that refer to the storage(None if they can't) and whether a save refers to it
+    storage: str = None
+    embed_messages = True
+    _referenced = False
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if cls.storage is not None:
+            _storages[cls.storage] = cls
+
+    @property
+    def model(self) -> str:
+        """Returns the model of the chatlog. Required for the Message Factory to correctly count tokens."""
+        return self._model
+
+    @model.setter
+    def model(self, model: str) -> None:
+        """Sets the model of the chatlog. Required for the Message Factory to correctly count tokens."""
+        self._model = model
+
+    @property
+    def data(self) -> StoredMessages:
+        """A read only sequence of the messages, read from storage when used."""
+        return StoredMessages(self)
+
+    # ==========(STORAGE)==========
+    @abstractmethod
+    def _append(self, msgs: list[message.Message]) -> None:
+        pass
+
+    @abstractmethod
+    def _read_message(self, index: int) -> message.Message:
+        pass
+
+    @abstractmethod
+    def _iter_message_dicts(self) -> Iterator[dict]:
+        pass
+
+    def _reopen_saved(self, save: dict) -> bool:
+        return False
+
+    @abstractmethod
+    def _set_token_counts(self, counts: list[int]) -> None:
+        """Replaces the stored token count of every message, see recount_tokens."""
+        pass
+
+    def close(self) -> None:
+        """Closes any open handles, they are reopened when needed."""
+        pass
+
+    # ==========(FORKING)==========
+    @abstractmethod
+    def _new_fork(self) -> "StoredChatLog":
+        pass
+
+    def fork(self) -> "StoredChatLog":
+        """Returns a chat log of the same type that can be changed without changing this one, sharing the stored messages instead of copying them, see Forking."""
+        forked = self._new_fork()
+        forked.uuid = str(uuid.uuid4())
+        forked._forks = None
+        forked._referenced = False
+        forked._search_index = None
+        forked._vector_index = None
+        if self._arrays is not None:
+            forked._arrays = self._arrays.copy()
+        return forked
+
+    def _share_with(self, forked: "StoredChatLog") -> None:
+        """Makes forked read the storage this chat log reads, registering it with the owner of that storage."""
+        owner = self._shared_from if self._shared_from is not None else self
+        if owner._forks is None:
+            owner._forks = []
+        owner._forks.append(weakref.ref(forked))
+        forked._shared_from = owner
+
+    @property
+    def _is_shared(self) -> bool:
+        """True if this chat log reads another's storage."""
+        return self._shared_from is not None
+
+    def _stop_sharing(self) -> None:
+        """Stops reading the owner's storage, before switching to storage of its own."""
+        owner = self._shared_from
+        if owner is not None and owner._forks is not None:
+            owner._forks = [ref for ref in owner._forks if ref() is not None and ref() is not self]
+        self._shared_from = None
+
+    def _unshare(self) -> None:
+        """Copies the shared messages into storage of its own, see Forking. Only chat logs that share storage override this."""
+        self._stop_sharing()
+
+    def _unshare_forks(self) -> None:
+        """Has every fork still reading this chat log's storage copy what it shares, before the storage is changed or deleted."""
+        forks = self._forks or []
+        self._forks = None
+        for ref in forks:
+            forked = ref()
+            if forked is not None and forked._shared_from is self:
+                forked._unshare()
+
+    def _store(self, msgs: list[message.Message]) -> None:
+        """Stores the messages, and indexes them if the search index(or vector index) has been built."""
+        self._append(msgs)
+        if self._search_index is not None and len(self._search_index) == len(self) - len(msgs):
+            self._search_index.extend(msg.content for msg in msgs)
+        if self._vector_index is not None and len(self._vector_index) == len(self) - len(msgs):
+            self._vector_index.extend(msg.content for msg in msgs)
+        if self._arrays is not None and len(self._arrays) == len(self) - len(msgs):
+            self._arrays.extend(msgs)
+
+    def _get_search_index(self) -> InvertedIndex:
+        """Returns the search index, building it from storage the first time(or if it no longer covers every message)."""
+        if self._search_index is None or len(self._search_index) != len(self):
+            self._search_index = InvertedIndex()
+            self._search_index.extend(msg["content"] for msg in self._iter_message_dicts())
+        return self._search_index
+
+    def _get_arrays(self) -> MessageArrays:
+        """Returns the message arrays, building them from storage(without times) the first time, or if they no longer cover every message."""
+        if self._arrays is None or len(self._arrays) != len(self):
+            self._arrays = MessageArrays()
+            self._arrays.extend(self.get_messages(reverse=False), timestamp=0)
+        return self._arrays
+
+    def _get_vector_index(self) -> VectorIndex:
+        """Returns the vector index, building it from storage the first time(or if it no longer covers every message, or the embedder was changed)."""
+        if self._vector_index is None or len(self._vector_index) != len(self) or (self.embedder is not None and self._vector_index.embedder is not self.embedder):
+            self._vector_index = VectorIndex(self.embedder)
+            self._vector_index.extend(msg["content"] for msg in self._iter_message_dicts())
+        return self._vector_index
+
+    def recount_tokens(self) -> int:
+        """Counts the tokens of every stored message again with the chat log's model, in one batch(see tokenizer.count_tokens_batch). Stored messages don't record the model they were counted with, so every message is recounted."""
+        if len(self) == 0:
+            return 0
+        counts = tokenizer.count_tokens_batch([msg["content"] for msg in self._iter_message_dicts()], self.model)
+        self._set_token_counts(counts)
+        return len(counts)
+
+    def _make_message(self, msg: dict) -> message.Message:
+        return message.Message(role=msg["role"], content=msg["content"], model=self.model, tokens=msg.get("tokens"))
+
+    # ==========(ADDING MESSAGES)==========
+    def get_message_factory(self, role: str = None) -> message.MessageFactory:
+        """Creates a message factory with a given role and model. See message. MessageFactory for more information."""
+        if self.model is None:
+            raise exceptions.MissingValueError(
+                "Must provide a model to get a message factory."
+            )
+        return message.MessageFactory(self.model, role)
+
+    def _verify_Message(self, msg: message.Message) -> message.Message:
+        """Verifies that the message is a Message object."""
+        if not isinstance(msg, message.Message):
+            raise exceptions.NotAMessageError(
+                f"Must provide a Message object, not {type(msg)}"
+            )
+        return msg
+
+    def add_message(self, msg: message.Message) -> None:
+        """Stores a message. Must be a Message object."""
+        self._store([self._verify_Message(msg)])
+
+    def add_messages(self, messages: list) -> None:
+        """Stores a list of messages."""
+        self._store([self._verify_Message(msg) for msg in messages])
+
+    def add_messages_as_dict(self, messages: list[dict]) -> None:
+        msgs = []
+        for msg in messages:
+            try:
+                msgs.append(message.Message(role=msg["role"], content=msg["content"], model=self.model))
+            except KeyError:
+                raise exceptions.BadMessageDictionaryError(
+                    "Message dictionary must have 'role' and 'content' keys."
+                )
+        self._store(msgs)
+
+    # ==========(GETTING MESSAGES)==========
+    def get_messages_as_list(
+        self,
+        role: str = None,
+        limit: int = None,
+        reverse: bool = True,
+        pretty: bool = False,
+    ) -> list[Union[message.Message, str]]:
+        """See ChatLog.get_messages_as_list. Returns None if there are no messages."""
+        result = list(self.get_messages(role, limit, reverse, pretty))
+        if result == []:
+            return None
+        return result
+
+    def get_messages_as_dict(
+        self,
+        role: str = None,
+        limit: int = None,
+        reverse: bool = False,
+        pretty: bool = False,
+    ) -> list[dict]:
+        return [msg.as_dict() for msg in self.get_messages(role, limit, reverse)]
+
+    def get_finished_chatlog(self) -> list[dict]:
+        """Returns every message as a dictionary, reading storage once."""
+        return [{"role": msg["role"], "content": msg["content"]} for msg in self._iter_message_dicts()]
+
+    def get_pretty_messages(
+        self, role: str = None, reverse: bool = False, limit: int = None
+    ) -> str:
+        """See ChatLog.get_pretty_messages."""
+        return "\n".join(self.get_messages(role, limit, pretty=True, reverse=reverse))
+
+    # ==========(SAVING AND LOADING)==========
+    def _saved_messages_and_counts(self) -> tuple[list[dict], list[int]]:
+        """Reads every message once, returning the message dictionaries and token counts for a save. See also _add_search_index."""
+        messages = []
+        token_counts = []
+        for msg in self._iter_message_dicts():
+            messages.append({"role": msg["role"], "content": msg["content"]})
+            token_counts.append(msg["tokens"])
+        return messages, token_counts
+
+    @classmethod
+    def _iter_saved(cls, save: dict) -> Iterator[dict]:
+        """Yields the messages a save refers to as dictionaries with role, content and tokens, see Saving. Raises ChatLogFileError if they can't be read."""
+        raise exceptions.ChatLogFileError(f"{cls.__name__} saves can't refer to their storage.")
+
+    def _make_stored_save(self, meta: dict) -> dict:
+        """Makes a save with the given meta, referring to the storage unless embed_messages is set, see Saving."""
+        save = {"meta": {"version": self.version, "uuid": self.uuid, "storage": self.storage, **meta}, "model": self.model}
+        if self.embed_messages:
+            save["messages"], save["token_counts"] = self._saved_messages_and_counts()
+        else:
+            save["message_count"] = len(self)
+            token_counts = self._token_counts()
+            if token_counts is not None:
+                save["token_counts"] = token_counts
+            # the storage read by a fork is its owner's
+            owner = self._shared_from if self._shared_from is not None else self
+            owner._referenced = True
+        return self._add_search_index(save)
+
+    def _token_counts(self) -> list[int] | None:
+        """The token count of every message for a save that refers to the storage, None if the storage has them. Subclasses whose storage can have older counts(JsonlChatLog) override this."""
+        return None
+
+    def _store_saved(self, save: dict) -> None:
+        """Stores the messages a save refers to, a page at a time, with the save's token counts if it has one for each message."""
+        token_counts = save.get("token_counts")
+        if not isinstance(token_counts, list) or len(token_counts) != saved_message_count(save):
+            token_counts = None
+        page = []
+        for position, msg in enumerate(_storages[save["meta"]["storage"]]._iter_saved(save)):
+            tokens = token_counts[position] if token_counts is not None else msg["tokens"]
+            page.append(message.Message(role=msg["role"], content=msg["content"], model=self.model, tokens=tokens))
+            if len(page) == SAVE_PAGE:
+                self._store(page)
+                page = []
+        self._store(page)
+
+    def _add_search_index(self, save: dict) -> dict:
+        """Adds the search index(and vector index and message arrays) to a save if it has been built and covers every message."""
+        if self._search_index is not None and len(self._search_index) == len(self):
+            save["search_index"] = self._search_index.to_dict()
+        if self._vector_index is not None and len(self._vector_index) == len(self):
+            save["vector_index"] = self._vector_index.to_dict()
+        if self._arrays is not None and len(self._arrays) == len(self):
+            save["arrays"] = self._arrays.to_dict()
+        return save
+
+    def _load_search_index(self, save: dict) -> None:
+        """Uses the search index(and vector index and message arrays) in a save if the chat log holds exactly the saved messages, indexing any saved messages the index doesn't cover.
+        A save that refers to its storage has no messages to index, so only indexes covering every message are used.
+        """
+        if len(self) != saved_message_count(save):
+            return
+        # the messages an index doesn't cover, from the save
+        messages = save.get("messages") if isinstance(save.get("messages"), list) else None
+
+        def usable(length: int) -> bool:
+            return length == len(self) or (messages is not None and length < len(self))
+
+        if isinstance(save.get("vector_index"), dict) and retrieval.is_available():
+            try:
+                vectors = VectorIndex.from_dict(save["vector_index"])
+            except exceptions.BadSaveDictionaryError:
+                vectors = None
+            if vectors is not None and usable(len(vectors)):
+                if len(vectors) < len(self):
+                    vectors.extend(msg["content"] for msg in messages[len(vectors):])
+                self._vector_index = vectors
+        if isinstance(save.get("arrays"), dict) and arrays.is_available():
+            try:
+                saved_arrays = MessageArrays.from_dict(save["arrays"])
+            except exceptions.BadSaveDictionaryError:
+                saved_arrays = None
+            if saved_arrays is not None and usable(len(saved_arrays)):
+                if len(saved_arrays) < len(self):
+                    saved_arrays.extend(self._make_message(msg) for msg in messages[len(saved_arrays):])
+                self._arrays = saved_arrays
+        if not isinstance(save.get("search_index"), dict):
+            return
+        try:
+            index = InvertedIndex.from_dict(save["search_index"])
+        except exceptions.BadSaveDictionaryError:
+            return
+        if usable(len(index)):
+            if len(index) < len(self):
+                index.extend(msg["content"] for msg in messages[len(index):])
+            self._search_index = index
+
+    def _verify_save_dict(self, save: dict) -> dict:
+        """Verifies that the save is a dictionary with a model and a list of messages, see ChatLog._verify_save_dict."""
+        if not isinstance(save, dict):
+            raise exceptions.BadSaveDictionaryError(
+                f"Must provide a dict , not {type(save)}"
+            )
+        if not (isinstance(save.get("messages"), list) or refers_to_storage(save)) or not isinstance(save.get("model"), str):
+            raise exceptions.BadSaveDictionaryError(
+                "Chat Log Saves must have a model string and a list of messages, or refer to the storage they are in."
+            )
+        if "meta" not in save:
+            save["meta"] = {}
+        return save
+
+    def load_from_dict(self, save: dict) -> None:
+        """Loads a save dictionary(from any chat log), appending its messages like ChatLog.load_from_dict does.
+        If the subclass can reopen the storage recorded in the save(see _reopen_saved) it does that instead, otherwise the messages of a save that refers to its storage are copied from it(see Saving).
+        A saved search index is used if the chat log was empty.
+        """
+        save = self._verify_save_dict(save)
+        self.model = save["model"]
+        self.uuid = save["meta"].get("uuid", self.uuid)
+        was_empty = len(self) == 0
+        if self._reopen_saved(save):
+            self._referenced = self._referenced or refers_to_storage(save)
+            self._load_search_index(save)
+            return None
+        if refers_to_storage(save):
+            self._store_saved(save)
+            if was_empty:
+                self._load_search_index(save)
+            return None
+        token_counts = save.get("token_counts")
+        if not isinstance(token_counts, list) or len(token_counts) != len(save["messages"]):
+            token_counts = [None] * len(save["messages"])
+        msgs = []
+        for msg, tokens in zip(save["messages"], token_counts):
+            if not isinstance(msg, dict) or "role" not in msg or "content" not in msg:
+                raise exceptions.BadMessageDictionaryError(
+                    "Message Dictionary is missing required keys: {'role', 'content'}"
+                )
+            msgs.append(message.Message(role=msg["role"], content=msg["content"], model=self.model, tokens=tokens))
+        self._store(msgs)
+        if was_empty:
+            self._load_search_index(save)
+        return None
+
+    # ==========(MISC)==========
+    def export(self, format: str = "markdown", **kwargs):
+        """See ChatLog.export."""
+        if format in ("md", "markdown"):
+            exporter_type = "markdown"
+        elif format in ("txt", "text"):
+            exporter_type = "text"
+        else:
+            raise exceptions.BadFormatError(
+                f"Invalid format: {format}, available formats: md, markdown, txt, text"
+            )
+        return exporter.export_data(
+            self.data,
+            self.model,
+            system_prompt=None,
+            exporter_type=exporter_type,
+            **kwargs,
+        )
+
+    def __str__(self):
+        return self.get_pretty_messages()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -1,49 +1,37 @@
 import exceptions
 from chat.message import Message, MessageFactory
 import func
-import tiktoken
+from chat import tokenizer, wildcards
 from typing import List, Dict, Union
-import datetime
-from collections import namedtuple
 import uuid
 from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
 
-wildcard_info = namedtuple(
-    "wildcard_info", "wildcard_name, wildcard_value, wildcard_description"
-)
-system_prompt_wildcards = {
-    "model": wildcard_info("model", "__model__", "The name of the model."),
-    "cut_off": wildcard_info(
-        "cut_off", "September 21, 2021", "The cut off for the chat log."
-    ),
-    "date": wildcard_info("date", "__date__", "the current date."),
-    "time": wildcard_info("time", "__time__", "the current time."),
-}
-
 
 class SystemPrompt:
     """Manages the system prompt for a chat log.
-    Dependencies: func, exceptions, tiktoken, datetime, collections.namedtuple, uuid, Message (from chat.message), MessageFactory (from chat.message)
+    Dependencies: func, exceptions, chat.tokenizer, chat.wildcards, uuid, Message (from chat.message), MessageFactory (from chat.message)
 
     Attributes:
         version (str): The version of the system prompt object.
         model (str): The name of the model.
+        time_granularity (int): The ||time|| wildcard is rounded down to this many seconds, so the prompt stays the same between requests(see TrimChatLog prefix_stable). 0(the default) is the exact time.
         uuid (str): The uuid of the system prompt object(useful in debugging and logging).
         self.system_prompt (str): The system prompt, with wildcards
-        self.system_prompt_tokens (int): The number of tokens in the system prompt.
-        wildcard_info (namedtuple): A namedtuple containing information about a wildcard.
-        system_prompt_wildcards (dict): A dictionary containing the wildcards for the system prompt.(represented as a namedtuple)
+        self.system_prompt_tokens (int): The number of tokens in the system prompt, with the wildcards filled in.
+        registered_wildcards (dict): The registered wildcards by name(see chat/wildcards.py, new ones can be added with register_wildcard).
         system_prompt_message (Message): The system prompt as a Message object with wildcards added.
+    Wildcards:
+        Setting the system prompt compiles it into a WildcardRenderer(see chat/wildcards.py), so each render is one join and the tokens are only counted again when a wildcard value changes.
     Methods:
         Private:
-            _add_wildcards_to_string(string: str) -> str: Adds wildcards to a string.
+            _context() -> WildcardContext: What the wildcards are rendered with now(the model and the time, rounded down to time_granularity).
             _count_tokens_in_str(string: str) -> int: Counts the number of tokens in a string.
         Public:
             Getters and setters:
                 system_prompt (str): The system prompt, with wildcards, getter and setter.
                 system_prompt_tokens(int), system_prompt_message(Message): The number of tokens in the system prompt, and the system prompt as a Message object with wildcards added. Getters only
             Misc:
-                __init__(model: str, system_prompt_content: str = None) -> None: Initialises the system prompt object. If system_prompt_content is None, the system prompt is set to None, and the system_prompt_tokens is set to None. Otherwise, the system prompt is set to system_prompt_content, and the system_prompt_tokens is set to the number of tokens in the system prompt, plus 20 (padding for the system prompt, as wildcards may be replaced with longer strings).
+                __init__(model: str, system_prompt_content: str = None, time_granularity: int = 0) -> None: Initialises the system prompt object. If system_prompt_content is None, the system prompt is set to None, and the system_prompt_tokens is set to None. Otherwise, the system prompt is set to system_prompt_content, and system_prompt_tokens counts it with the wildcards filled in the first time it is used.
                 __str__() -> str: Returns a string representation of the system prompt object.(Using Message.pretty)
                 __repr__() -> str: Returns information about the system prompt object, including the model, uuid, system_prompt, and system_prompt_tokens.
         Example Usage:
@@ -57,55 +45,32 @@ class SystemPrompt:
 
     version = "0.0.1"
 
-    def __init__(self, model: str, system_prompt_content: str = None) -> None:
+    def __init__(self, model: str, system_prompt_content: str = None, time_granularity: int = 0) -> None:
         self.model = model
+        self.time_granularity = time_granularity
         self.uuid = str(uuid.uuid4())
         self._system_prompt = system_prompt_content
         self.system_prompt = system_prompt_content
-        self._system_prompt_tokens = None
-
-    # for wildcard system (values replaced with wildcards in system prompt)
-    wildcard_info = wildcard_info
-    system_prompt_wildcards = system_prompt_wildcards
-
-    def _add_wildcards_to_string(self, string: str) -> str:
-        """Adds wildcards to the system prompt. Wildcards start with || and end with ||."""
-
-        def add_chars(string: str):
-            """Adds || to the beginning and || to the end of the string."""
-            return f"||{string}||"
-
-        wild_card_dict = {
-            add_chars(name): value.wildcard_value
-            for name, value in self.system_prompt_wildcards.items()
-        }
-
-        for name in wild_card_dict:
-            if wild_card_dict[name] == "__model__":
-                wild_card_dict[name] = self.model
-            elif wild_card_dict[name] == "__date__":
-                wild_card_dict[name] = datetime.date.today().strftime("%B %d, %Y")
-            elif wild_card_dict[name] == "__time__":
-                wild_card_dict[name] = datetime.datetime.now().strftime("%H:%M:%S")
-            string = string.replace(name, wild_card_dict[name])
-        return string
+
+    # the wildcards(values replaced with wildcards in system prompt), see chat/wildcards.py
+    registered_wildcards = wildcards.registry
+
+    def _context(self) -> wildcards.WildcardContext:
+        """Returns what the wildcards are rendered with now."""
+        return wildcards.make_context(self.model, self.time_granularity)
 
     @property
     def system_prompt(self) -> str:
         """Returns the system prompt with wildcards."""
-        if self._system_prompt == None:
+        if self._renderer is None:
             return None
-        return self._add_wildcards_to_string(self._system_prompt)
+        return self._renderer.render(self._context())
 
     @system_prompt.setter
     def system_prompt(self, system_prompt: str) -> None:
-        """Sets the system prompt, and works out the number of tokens in the system prompt(plus padding).)"""
+        """Sets the system prompt and compiles its wildcards, the tokens are counted when system_prompt_tokens is next used."""
         self._system_prompt = system_prompt
-        if system_prompt == None:
-            self._system_prompt_tokens = None
-        else:
-            self._system_prompt_tokens = self._count_tokens_in_str(system_prompt) + 20
-        # 20 is padding for the system prompt, as wildcards may be replaced with longer strings.
+        self._renderer = wildcards.WildcardRenderer(system_prompt) if system_prompt is not None else None
 
     @property
     def system_prompt_raw(self) -> str:
@@ -114,33 +79,24 @@ class SystemPrompt:
 
     @property
     def system_prompt_tokens(self) -> int:
-        """Gets the number of tokens in the system prompt. If the system prompt is None, returns None. If for some reason the system prompt tokens are not set, it will set them."""
-        if self.system_prompt == None:
+        """Gets the number of tokens in the system prompt with the wildcards filled in(what is sent), 0 if the system prompt is None. Only counted again when a wildcard value or the model changes."""
+        if self._renderer is None:
             return 0
-        elif self._system_prompt_tokens == None:
-            self._system_prompt_tokens = (
-                self._count_tokens_in_str(self.system_prompt_raw) + 20
-            )
-        return (
-            self._system_prompt_tokens if self._system_prompt_tokens != None else 0 + 20
-        )
+        return self._renderer.count_tokens(self._context())
     @property
     def has_system_prompt(self):
         return self._system_prompt is not None
     def _count_tokens_in_str(self, string: str) -> int:
         """Counts the number of token in a string using the model and the tiktoken library."""
-        try:
-            encoding = tiktoken.encoding_for_model(self.model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(string))
+        return tokenizer.count_tokens(string, self.model)
 
     @property
     def system_prompt_message(self) -> Message:
         """Generates a Message object from the system prompt, including wildcards."""
-        if self.system_prompt == None:
+        if self._renderer is None:
             return None
-        return Message(role="system", content=self.system_prompt, model=self.model)
+        content, tokens = self._renderer.render_with_tokens(self._context())
+        return Message(role="system", content=content, model=self.model, tokens=tokens)
 
     def __str__(self) -> str:
         """Returns the system prompt as a string, using the Message object's pretty property."""
@@ -159,13 +115,12 @@ class Reminder:
     Dependencies:
         Custom:
             BaseLogger  and DEFAULT_LOGGING_LEVEL(from log_config)
-            system_prompt_wildcards, wildcard_info (from this module)
+            chat.wildcards(WildcardRenderer and the registered wildcards)
             Message, MessageFactory (from chat.message)
             BadTypeError (from exceptions)
             
         Python:
             uuid
-            datetime
             typing (for type hints)
             collections.namedtuple
     Raises:
@@ -197,16 +152,15 @@ class Reminder:
             model (str): The name of the model.
         Setters:
             set_reminder_content(value: str | None) -> None: Sets the reminder content. Can be either a string or None.
+            count_tokens() -> int: Counts the tokens in the reminder again, with the wildcards filled in now, and returns them.
             Can also be set using the reminder_content property.
             model = value: Sets the model.
             prepend = value: Sets the prepend.
             padding = value: Sets the padding.
             
         Private:
-            _add_wildcards_to_string(string: str) -> str: Adds wildcards to a string.
-            _add_reminder_prepend(string: str) -> str: Adds the prepend to the reminder.
+            _compile() -> None: Compiles the prepend and reminder into a WildcardRenderer(see chat/wildcards.py). Used when the prepend or reminder is changed.
             _count_tokens(string: str) -> int: Counts the number of tokens in a string.
-            _prepare_reminder(string: str) -> str: Adds wildcards and the prepend to the reminder.
             _recheck_tokens() -> None: Checks the number of tokens in the reminder. Used when the model, prepend, or padding is changed.
     Example Usage:
         reminder = Reminder('gpt-4')
@@ -233,15 +187,16 @@ class Reminder:
         )
         self.tokens = 0
         self._model = model
-        self.reminder_content = reminder_content
+        self._reminder_content = None
+        self._renderer: wildcards.WildcardRenderer = None
         self.uuid = str(uuid.uuid4())
     
         self.padding = padding
         self.prepend = prepend
-        self._recheck_tokens()
+        # after the prepend, counting the reminder needs it
+        self.reminder_content = reminder_content
 
-    system_prompt_wildcards = system_prompt_wildcards
-    wildcard_info = wildcard_info
+    registered_wildcards = wildcards.registry
     @property
     def model(self) -> str:
         """Sets the model. Must be a string. Uses the _recheck_tokens method."""
@@ -265,6 +220,7 @@ class Reminder:
             raise exceptions.BadTypeError("Prepend must be a string.")
         self.logger.info(f"Setting prepend to {value}")
         self._prepend = value
+        self._compile()
         self._recheck_tokens()
     @property
     def padding(self) -> int:
@@ -280,45 +236,17 @@ class Reminder:
         self._padding = value
         self._recheck_tokens()
 
-    def _add_wildcards_to_string(self, string: str) -> str:
-        """Adds wildcards to the system prompt. Wildcards start with || and end with ||."""
-
-        def add_chars(string: str):
-            """Adds || to the beginning and || to the end of the string."""
-            return f"||{string}||"
-
-        wild_card_dict = {
-            add_chars(name): value.wildcard_value
-            for name, value in self.system_prompt_wildcards.items()
-        }
-
-        for name in wild_card_dict:
-            if wild_card_dict[name] == "__model__":
-                wild_card_dict[name] = self.model
-            elif wild_card_dict[name] == "__date__":
-                wild_card_dict[name] = datetime.date.today().strftime("%B %d, %Y")
-            elif wild_card_dict[name] == "__time__":
-                wild_card_dict[name] = datetime.datetime.now().strftime("%h:%M:%S")
-            string = string.replace(name, wild_card_dict[name])
-        return string
-
-    def _add_reminder_prepend(self, string: str) -> str:
-        """Adds the prepend to the reminder(The word reminder )."""
-        return f"{self.prepend}{string}"
+    def _compile(self) -> None:
+        """Compiles the prepend and reminder into a WildcardRenderer, the prepend can have wildcards too."""
+        if self._reminder_content is None:
+            self._renderer = None
+        else:
+            self._renderer = wildcards.WildcardRenderer(f"{self._prepend}{self._reminder_content}")
 
     def _count_tokens(self, string) -> int:
         """Counts the number of tokens in a string using the model and the tiktoken library."""
-        model = self.model
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            self.logger.warning(f"Model {model} not found, using cl100k_base instead.")
-            encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(string))
-
-    def _prepare_reminder(self, string: str) -> str:
-        """Adds wildcards and the prepend to the reminder."""
-        return self._add_reminder_prepend(self._add_wildcards_to_string(string))
+        return tokenizer.count_tokens(string, self.model)
+
     def set_reminder_content(self, value: str | None ) -> None:
         """Sets the reminder content. Can be either a string or None."""
         if not isinstance(value, str) and value is not None:
@@ -326,6 +254,7 @@ class Reminder:
         log_value = f"Setting reminder content to {value}" if value else "Setting reminder content to None."
         self.logger.info(log_value)
         self._reminder_content = value
+        self._compile()
         self._recheck_tokens()
     @property
     def reminder_content(self) -> str:
@@ -338,8 +267,10 @@ class Reminder:
 
     @property
     def prepared_reminder(self) -> str:
-        """Returns the reminder(with wildcards)."""
-        return self._prepare_reminder(self._reminder_content)
+        """Returns the reminder(with wildcards and the prepend), None if the reminder is not set."""
+        if self._renderer is None:
+            return None
+        return self._renderer.render(wildcards.make_context(self.model))
     
     def _recheck_tokens(self) -> None:
         """Counts the number of  tokens in the reminder. Sets the tokens attribute to the number of tokens in the reminder."""
@@ -347,9 +278,14 @@ class Reminder:
             self.logger.info("Reminder not set, returning 0.")
             self.tokens = 0
             return 
-        self.tokens = self._count_tokens(self.prepared_reminder)
+        self.tokens = self._renderer.count_tokens(wildcards.make_context(self.model))
 
 
+    def count_tokens(self) -> int:
+        """Counts the tokens in the reminder again(the wildcards, ie the time, change what is sent) and returns them, 0 if the reminder is not set."""
+        self._recheck_tokens()
+        return self.tokens
+
     @property
     def is_reminder_set(self) -> bool:
         """Returns True if the reminder is set, False if it is not."""
@@ -361,4 +297,5 @@ class Reminder:
     @property
     def reminder_as_message(self) -> Message:
         """Creates a Message object from the reminder(with wildcards)."""
-        return Message(role="system", content=self.prepared_reminder, model=self.model)
+        content, tokens = self._renderer.render_with_tokens(wildcards.make_context(self.model))
+        return Message(role="system", content=content, model=self.model, tokens=tokens)
@@ -0,0 +1,315 @@
+import copy
+import json
+import os
+import uuid
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+from chat import message
+from chat.stored_chatlog import StoredChatLog
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import CHATLOG_DIR, TIERED_HOT_MESSAGES, TIERED_BLOCK_MESSAGES, TIERED_WARM_BLOCKS
+
+# tests can be found in tests/test_tiered_chatlog.py
+
+
+def _remove_file(path: Path, handle: list) -> None:
+    if handle[0] is not None:
+        handle[0].close()
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+class _ColdFile:
+    """The scratch file cold blocks are appended to. Shared by a TieredChatLog and its forks(see TieredChatLog Forking), and deleted once none of them has a block in it."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.end = 0
+        # in a list so the finalizer can close the handle without keeping the object alive
+        self._handle = [None]
+        weakref.finalize(self, _remove_file, path, self._handle)
+
+    def _open(self):
+        if self._handle[0] is None:
+            self._handle[0] = open(self.path, "a+b")
+        return self._handle[0]
+
+    def write(self, data: bytes) -> int:
+        """Appends a block, returning its offset."""
+        handle = self._open()
+        handle.seek(0, os.SEEK_END)
+        handle.write(data)
+        handle.flush()
+        offset = self.end
+        self.end += len(data)
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        handle = self._open()
+        handle.seek(offset)
+        return handle.read(length)
+
+    def close(self) -> None:
+        if self._handle[0] is not None:
+            self._handle[0].close()
+            self._handle[0] = None
+
+
+class TieredChatLog(StoredChatLog):
+    """A chat log that keeps recent messages as Message objects and packs older ones into compressed blocks, so memory stops growing with the age of the conversation.
+    Selected with DEFAULT_CHATLOG_HANDLER = ChatLogTiered, see chatlog_handlers.make_chatlog.
+
+    Relies on:
+        - Message from chat/message.py
+        - StoredChatLog from chat/stored_chatlog.py
+        - CHATLOG_DIR, TIERED_HOT_MESSAGES, TIERED_BLOCK_MESSAGES, TIERED_WARM_BLOCKS from settings.py
+        - zlib(standard library)
+    Raises:
+        - NotAMessageError if a message is not a Message object
+        - BadSaveDictionaryError if a save dictionary is not formatted correctly
+    Args:
+        model (str): AI model used to count tokens
+        hot_messages (int): The fewest messages kept as Message objects, defaults to TIERED_HOT_MESSAGES. TrimChatLog raises it to its window size, see hint_window_size.
+        block_messages (int): Messages per compressed block, defaults to TIERED_BLOCK_MESSAGES.
+        warm_blocks (int): Compressed blocks kept in memory before the oldest are written to disk, defaults to TIERED_WARM_BLOCKS. None never writes to disk.
+        directory (str): Where cold blocks are written, defaults to CHATLOG_DIR.
+    Tiers:
+        hot: The newest messages, at least the trimmed window, as Message objects. When TrimChatLog adds a message it is the same object as in its window, so the hot tier costs nothing extra.
+        warm: Older messages, block_messages at a time, as zlib compressed json in memory.
+        cold: The oldest blocks, appended to a scratch file(<uuid>.blocks in directory) that is deleted when the chat log is reset or garbage collected.
+        The role and token count of every message are kept in arrays(9 bytes a message), so filtering by role and counting tokens never decompresses anything.
+        The last few decompressed blocks are cached, so reading through old messages(get_messages, exporting) decompresses each block once.
+    Forking:
+        Blocks are never changed once packed, so a fork shares them(the compressed bytes of warm blocks and the file of cold ones) and copies only the hot list and the role and token arrays. Each chat log spills its own warm blocks to a file of its own, a cold file is deleted once no chat log has a block in it.
+        The hot Message objects are shared too, so recount_tokens gives a forked chat log new Message objects rather than changing them(see ChatLog Forking).
+    Saving:
+        Saves are self contained, they include every message like ChatLog saves do, so they can be loaded by any chat log.
+    Methods:
+        The same as ChatLog, plus:
+        hint_window_size: Keeps at least that many messages hot, called by TrimChatLog as it trims.
+        tier_sizes: The number of messages in each tier.
+    """
+
+    version = "1.0.0"
+    _role_codes = {role: code for code, role in enumerate(message.Message.allowed_roles)}
+    # decompressed blocks kept for repeated reads
+    _cached_blocks = 2
+
+    def __init__(
+        self,
+        model: str = None,
+        hot_messages: int = TIERED_HOT_MESSAGES,
+        block_messages: int = TIERED_BLOCK_MESSAGES,
+        warm_blocks: int = TIERED_WARM_BLOCKS,
+        directory: str = CHATLOG_DIR,
+    ):
+        self.logger = BaseLogger(
+            __file__,
+            filename="chatlog.log",
+            identifier="TieredChatLog",
+            level=DEFAULT_LOGGING_LEVEL,
+        )
+        self._model = model
+        self.uuid = str(uuid.uuid4())
+        self.hot_messages = max(hot_messages, 0)
+        self.block_messages = max(block_messages, 1)
+        self.warm_blocks = warm_blocks
+        self.directory = Path(directory)
+        self._window_size = 0
+        self._cold: _ColdFile = None
+        # see Forking, whether the hot Message objects are shared with a fork
+        self._shares_messages = False
+        self._clear()
+
+    def _clear(self) -> None:
+        self._hot: list[message.Message] = []
+        # compressed bytes(warm) or (cold file, offset, length)(cold), one per block
+        self._blocks: list[Union[bytes, tuple[_ColdFile, int, int]]] = []
+        self._warm_count = 0
+        self._block_cache: OrderedDict[int, list] = OrderedDict()
+        self._roles = array("b")
+        self._tokens = array("q")
+
+    # ==========(TIERS)==========
+    @property
+    def _hot_start(self) -> int:
+        """Position of the first hot message, every message before it is in a block."""
+        return len(self._blocks) * self.block_messages
+
+    @property
+    def _cold_path(self) -> Path:
+        """The file this chat log spills blocks to, None until it has spilled one."""
+        return self._cold.path if self._cold is not None else None
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    def hint_window_size(self, size: int) -> None:
+        """Keeps at least size messages hot, so the messages of TrimChatLog's window are never compressed."""
+        self._window_size = max(size, 0)
+
+    def tier_sizes(self) -> dict:
+        """Returns the number of messages in each tier and the bytes used by warm blocks."""
+        cold = len(self._blocks) - self._warm_count
+        return {
+            "hot": len(self._hot),
+            "warm": self._warm_count * self.block_messages,
+            "cold": cold * self.block_messages,
+            "warm_bytes": sum(len(block) for block in self._blocks if isinstance(block, bytes)),
+            "cold_bytes": sum(block[2] for block in self._blocks if not isinstance(block, bytes)),
+        }
+
+    def _demote(self) -> None:
+        """Packs the oldest hot messages into warm blocks while more than the hot size(plus a block, so messages aren't packed one at a time) are hot, then spills warm blocks to disk."""
+        keep = max(self.hot_messages, self._window_size)
+        while len(self._hot) >= keep + 2 * self.block_messages:
+            block = self._hot[: self.block_messages]
+            del self._hot[: self.block_messages]
+            data = json.dumps([[msg.role, msg.content, msg.tokens] for msg in block], separators=(",", ":"))
+            self._blocks.append(zlib.compress(data.encode("utf-8")))
+            self._warm_count += 1
+        if self.warm_blocks is not None:
+            first_warm = len(self._blocks) - self._warm_count
+            while self._warm_count > self.warm_blocks:
+                self._spill(first_warm)
+                first_warm += 1
+
+    def _spill(self, block_index: int) -> None:
+        """Writes a warm block to the cold file."""
+        if self._cold is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._cold = _ColdFile(self.directory / f"{self.uuid}.blocks")
+        data = self._blocks[block_index]
+        self._blocks[block_index] = (self._cold, self._cold.write(data), len(data))
+        self._warm_count -= 1
+
+    def _load_block(self, block_index: int) -> list:
+        """Returns the [role, content, tokens] lists of a block, decompressing it(and reading it from disk if it is cold) unless it is cached."""
+        cached = self._block_cache.get(block_index)
+        if cached is not None:
+            self._block_cache.move_to_end(block_index)
+            return cached
+        block = self._blocks[block_index]
+        if not isinstance(block, bytes):
+            cold, offset, length = block
+            block = cold.read(offset, length)
+        messages = json.loads(zlib.decompress(block))
+        self._block_cache[block_index] = messages
+        if len(self._block_cache) > self._cached_blocks:
+            self._block_cache.popitem(last=False)
+        return messages
+
+    # ==========(STORAGE)==========
+    def _append(self, msgs: list[message.Message]) -> None:
+        for msg in msgs:
+            self._roles.append(self._role_codes[msg.role])
+            self._tokens.append(msg.tokens)
+        self._hot.extend(msgs)
+        self._demote()
+
+    def _read_message(self, index: int) -> message.Message:
+        hot_start = self._hot_start
+        if index >= hot_start:
+            return self._hot[index - hot_start]
+        role, content, _ = self._load_block(index // self.block_messages)[index % self.block_messages]
+        return message.Message(role=role, content=content, model=self.model, tokens=self._tokens[index])
+
+    def _iter_message_dicts(self) -> Iterator[dict]:
+        """Yields every message in order. Token counts come from the token array, blocks keep the counts from when they were packed."""
+        position = 0
+        for block_index in range(len(self._blocks)):
+            for role, content, _ in self._load_block(block_index):
+                yield {"role": role, "content": content, "tokens": self._tokens[position]}
+                position += 1
+        for msg in list(self._hot):
+            yield {"role": msg.role, "content": msg.content, "tokens": msg.tokens}
+
+    def _set_token_counts(self, counts: list[int]) -> None:
+        """Replaces the token array and updates the hot messages in place, or replaces them if they are shared with a fork(see Forking)."""
+        self._tokens = array("q", counts)
+        hot_start = self._hot_start
+        for offset, msg in enumerate(self._hot):
+            if self._shares_messages:
+                msg = self._hot[offset] = copy.copy(msg)
+            msg.model = self.model
+            msg.tokens = counts[hot_start + offset]
+        self._shares_messages = False
+
+    # ==========(FORKING)==========
+    def _new_fork(self) -> "TieredChatLog":
+        """Returns a chat log sharing this one's blocks and hot Message objects, see Forking."""
+        forked = TieredChatLog.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        forked._hot = list(self._hot)
+        forked._blocks = list(self._blocks)
+        forked._block_cache = OrderedDict()
+        forked._roles = array("b", self._roles)
+        forked._tokens = array("q", self._tokens)
+        forked._cold = None
+        self._shares_messages = forked._shares_messages = True
+        return forked
+
+    # ==========(GETTING MESSAGES)==========
+    def get_messages(
+        self,
+        role: str = None,
+        limit: int = None,
+        reverse: bool = True,
+        pretty: bool = False,
+    ) -> Iterable[Union[message.Message, str]]:
+        """Generator that yields messages, optionally filtered by role and limited by limit. Starts from the newest message if reverse is True.
+        Roles are checked in the role array, so only blocks holding a returned message are decompressed.
+        """
+        if role is not None and role not in self._role_codes:
+            return
+        role_code = self._role_codes.get(role)
+        indexes = range(len(self) - 1, -1, -1) if reverse else range(len(self))
+        count = 0
+        for i in indexes:
+            if limit is not None and count >= limit:
+                break
+            if role_code is not None and self._roles[i] != role_code:
+                continue
+            msg = self._read_message(i)
+            yield msg if not pretty else msg.pretty
+            count += 1
+
+    # ==========(SAVING AND LOADING)==========
+    def make_save_dict(self) -> dict:
+        """Creates a save dictionary with every message, the same as ChatLog's."""
+        messages, token_counts = self._saved_messages_and_counts()
+        return self._add_search_index({
+            "meta": {"version": self.version, "uuid": self.uuid},
+            "model": self.model,
+            "messages": messages,
+            "token_counts": token_counts,
+        })
+
+    def close(self) -> None:
+        """Closes the cold file, it is reopened when needed."""
+        if self._cold is not None:
+            self._cold.close()
+
+    def reset(self) -> None:
+        """Clears the chat log and deletes its cold file, unless a fork still has blocks in it(see Forking)."""
+        self.close()
+        self._cold = None
+        self._shares_messages = False
+        self.uuid = str(uuid.uuid4())
+        self._search_index = None
+        self._vector_index = None
+        self._arrays = None
+        self._clear()
+
+    # ==========(MISC)==========
+    def __repr__(self):
+        constructor = f"TieredChatLog({self.model})"
+        info = f"TieredChatLog Object with the following attributes:\n\tModel: {self.model}\n\tMessages: {len(self)}\n\tTiers: {self.tier_sizes()}"
+        return f"{constructor}\n{info}"
@@ -0,0 +1,269 @@
+import math
+import os
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from itertools import accumulate
+from typing import Callable
+
+import tiktoken
+
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import TOKEN_COUNT_THREADS, TOKEN_ESTIMATE_ERROR
+
+"""Token counting shared by Message, SystemPrompt and TrimChatLog.
+Models are mapped to their tiktoken encoding once, so models that share an encoding(gpt-4 and gpt-3.5-turbo both use cl100k_base) can be told apart from ones that don't, and a model switch only recounts tokens when the encoding changes.
+count_tokens_batch counts many strings at once on tiktoken's thread pool(tiktoken releases the GIL while encoding).
+estimate_tokens guesses a count from the size of a string without tokenizing it, see TokenEstimator.
+count_chat_tokens counts a whole request the way the API does, with the per message overhead of the chat format(see ChatFormat).
+TokenizedText encodes a string once so it can be cut at any token, used to fit a message that is too long on its own.
+"""
+# tests can be found in tests/test_tokenizer.py
+
+FALLBACK_ENCODING = "cl100k_base"
+# below this many strings a batch is counted in this thread, starting a pool costs more than it saves
+MIN_THREADED_BATCH = 64
+# utf-8 bytes per token of english prose, the starting ratio of every encoding before any counts calibrate it
+DEFAULT_BYTES_PER_TOKEN = 4.0
+
+TokenEstimate = namedtuple("TokenEstimate", ["low", "estimate", "high", "encoding", "size"])
+# tokens_per_message wraps every message(<|start|>{role}<|message|>...<|end|>), a name replaces the role in the oldest models, reply_tokens prime the reply(<|start|>assistant<|message|>)
+ChatFormat = namedtuple("ChatFormat", ["tokens_per_message", "tokens_per_name", "reply_tokens"])
+
+DEFAULT_CHAT_FORMAT = ChatFormat(3, 1, 3)
+# model name prefix -> chat format, the longest matching prefix wins
+CHAT_FORMATS = {
+    "gpt-3.5-turbo-0301": ChatFormat(4, -1, 3),
+    "gpt-3.5-turbo": DEFAULT_CHAT_FORMAT,
+    "gpt-4": DEFAULT_CHAT_FORMAT,
+}
+
+logger = BaseLogger(__file__, filename="message.log", identifier="Tokenizer", level=DEFAULT_LOGGING_LEVEL)
+
+
+@lru_cache(maxsize=None)
+def encoding_name(model: str) -> str:
+    """Returns the name of the tiktoken encoding of a model, FALLBACK_ENCODING if tiktoken doesn't know the model."""
+    try:
+        return tiktoken.encoding_for_model(model).name
+    except KeyError:
+        logger.error(f"Tiktoken does not have an encoding for {model}, using {FALLBACK_ENCODING}")
+        return FALLBACK_ENCODING
+
+
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding of a model, see encoding_name."""
+    return tiktoken.get_encoding(encoding_name(model))
+
+
+def same_encoding(model: str, other_model: str) -> bool:
+    """Returns True if token counts made with one model are right for the other."""
+    if model == other_model:
+        return True
+    if model is None or other_model is None:
+        return False
+    return encoding_name(model) == encoding_name(other_model)
+
+
+def count_tokens(string: str, model: str) -> int:
+    """Returns the number of tokens in a string."""
+    return len(get_encoding(model).encode(string))
+
+
+def count_tokens_batch(strings: list[str], model: str, num_threads: int = TOKEN_COUNT_THREADS) -> list[int]:
+    """Returns the number of tokens in each string, counted on num_threads threads(0 is one per CPU)."""
+    encoding = get_encoding(model)
+    if num_threads is None or num_threads <= 0:
+        num_threads = os.cpu_count() or 1
+    if num_threads == 1 or len(strings) < MIN_THREADED_BATCH:
+        return [len(encoding.encode(string)) for string in strings]
+    return [len(tokens) for tokens in encoding.encode_batch(list(strings), num_threads=num_threads)]
+
+
+@lru_cache(maxsize=None)
+def chat_format(model: str) -> ChatFormat:
+    """Returns the ChatFormat of a model, DEFAULT_CHAT_FORMAT if no prefix in CHAT_FORMATS matches."""
+    if model is None:
+        return DEFAULT_CHAT_FORMAT
+    matches = [prefix for prefix in CHAT_FORMATS if model.startswith(prefix)]
+    if len(matches) == 0:
+        return DEFAULT_CHAT_FORMAT
+    return CHAT_FORMATS[max(matches, key=len)]
+
+
+@lru_cache(maxsize=256)
+def message_overhead(role: str, model: str) -> int:
+    """Returns the tokens a message with this role costs on top of its content."""
+    return chat_format(model).tokens_per_message + count_tokens(role, model)
+
+
+def count_chat_tokens(messages: list[dict], model: str) -> int:
+    """Returns the number of prompt tokens a list of message dictionaries costs when sent to the API, including the reply priming."""
+    tokens = chat_format(model).reply_tokens
+    for message in messages:
+        tokens += message_overhead(message["role"], model) + count_tokens(message["content"], model)
+        if message.get("name") is not None:
+            tokens += count_tokens(message["name"], model) + chat_format(model).tokens_per_name
+    return tokens
+
+
+class TokenizedText:
+    """A string encoded once, with the byte offset of every token, so it can be cut at any token without encoding the whole string again.
+    Used by TrimChatLog to fit a message that is too long for the trimmed chat log on its own(see TrimChatLog oversize_policy).
+    Args:
+        string (str): The text.
+        model (str): The model whose encoding is used.
+    Cutting:
+        text(start, end) is the text of tokens start to end, a character split between two tokens goes to the piece it ends in, so pieces next to each other join back into the string.
+        The tokens of a cut piece are not always the same as the tokens it had in the whole string(ie where it was cut), so fit counts each candidate piece exactly.
+        fit searches the token offsets for the longest piece that fits, trying the longest first(which usually fits) then halving, so only a few pieces are counted and never the whole string.
+    Methods:
+        __len__: The number of tokens in the string.
+        text(start, end) -> str: The text of tokens start to end.
+        fit(make_text, budget, most) -> int: The largest n up to most where make_text(n) has at most budget tokens.
+        head(budget, suffix) -> str: The most text from the start that fits in budget tokens, with suffix added.
+        head_tail(budget, marker) -> str: Up to half the budget from the start, then marker, then the most text from the end that fits in the rest.
+        chunks(budget, most_pieces) -> list[str]: The string cut into pieces of at most budget tokens, cut from the end so only the first piece is short. With most_pieces only the last ones are cut.
+    """
+
+    def __init__(self, string: str, model: str):
+        self.model = model
+        encoding = get_encoding(model)
+        self._tokens = encoding.encode(string)
+        token_bytes = encoding.decode_tokens_bytes(self._tokens)
+        self._data = b"".join(token_bytes)
+        self._offsets = [0, *accumulate(len(token) for token in token_bytes)]
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _char_start(self, offset: int) -> int:
+        """Moves a byte offset back to the start of the character it is in, tokens can end part way through a character."""
+        while 0 < offset < len(self._data) and self._data[offset] & 0xC0 == 0x80:
+            offset -= 1
+        return offset
+
+    def text(self, start: int = 0, end: int = None) -> str:
+        if end is None:
+            end = len(self)
+        return self._data[self._char_start(self._offsets[start]):self._char_start(self._offsets[end])].decode("utf-8", errors="ignore")
+
+    def fit(self, make_text: Callable[[int], str], budget: int, most: int) -> int:
+        def fits(n: int) -> bool:
+            return count_tokens(make_text(n), self.model) <= budget
+
+        if most <= 0 or fits(most):
+            return max(most, 0)
+        low, high = 0, most - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def head(self, budget: int, suffix: str = "") -> str:
+        end = self.fit(lambda n: self.text(0, n) + suffix, budget, min(len(self), budget))
+        return self.text(0, end) + suffix
+
+    def head_tail(self, budget: int, marker: str) -> str:
+        head_end = self.fit(lambda n: self.text(0, n), budget // 2, min(len(self), budget // 2))
+        head = self.text(0, head_end) + marker
+        size = self.fit(lambda n: head + self.text(len(self) - n), budget, min(len(self) - head_end, budget))
+        return head + self.text(len(self) - size)
+
+    def chunks(self, budget: int, most_pieces: int = None) -> list[str]:
+        result = []
+        end = len(self)
+        # cut from the end, so every piece but the first is full
+        while end > 0 and (most_pieces is None or len(result) < most_pieces):
+            size = self.fit(lambda n: self.text(end - n, end), budget, min(end, budget))
+            # a single token always fits, a zero size piece would never end
+            size = max(size, 1)
+            result.append(self.text(end - size, end))
+            end -= size
+        result.reverse()
+        return result
+
+
+class TokenEstimator:
+    """Estimates token counts from the size of a string, with bounds, so most messages never need to be tokenized.
+    Used by Message(estimate=True) and TrimChatLog(token_estimate=True).
+    Args:
+        error (float): How far(as a fraction of the estimate) the real count may be from it, defaults to TOKEN_ESTIMATE_ERROR.
+    Estimates:
+        estimate = utf-8 bytes / bytes per token of the model's encoding, low = estimate * (1 - error), high = estimate * (1 + error) + 1.
+        A token is at least one byte, so the number of bytes is a hard upper bound for any text and high never goes over it.
+        The bounds are not a guarantee(ie code or non latin text has fewer bytes per token), TrimChatLog counts every estimated message before sending, so the estimates only decide which messages are counted.
+    Calibration:
+        Every estimated message that is later counted adds its size and count to its encoding's ratio, which starts at DEFAULT_BYTES_PER_TOKEN(weighted as 1000 tokens, so a few odd messages don't swing it).
+    Methods:
+        estimate(string, model) -> TokenEstimate: low, estimate, high, encoding and size in bytes.
+        record_count(estimate, tokens): Records the real count of an estimated message.
+        stats() -> dict: Messages estimated, counted, how many never had to be counted, and how many were outside their bounds.
+        reset_stats: Clears the stats, keeps the calibration.
+    """
+
+    prior_tokens = 1000
+
+    def __init__(self, error: float = TOKEN_ESTIMATE_ERROR):
+        self.error = min(max(error, 0.0), 0.99)
+        self._lock = threading.Lock()
+        # encoding -> [bytes, tokens] of the counted messages, plus the prior
+        self._calibration: dict[str, list[float]] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.estimated = 0
+        self.counted = 0
+        self.outside_bounds = 0
+
+    def bytes_per_token(self, encoding: str) -> float:
+        calibration = self._calibration.get(encoding)
+        if calibration is None:
+            return DEFAULT_BYTES_PER_TOKEN
+        return max(calibration[0] / calibration[1], 1.0)
+
+    def estimate(self, string: str, model: str) -> TokenEstimate:
+        encoding = encoding_name(model)
+        size = len(string.encode("utf-8"))
+        estimate = size / self.bytes_per_token(encoding)
+        low = int(estimate * (1 - self.error))
+        high = min(size, math.ceil(estimate * (1 + self.error)) + 1)
+        with self._lock:
+            self.estimated += 1
+        return TokenEstimate(low, round(estimate), high, encoding, size)
+
+    def record_count(self, estimate: TokenEstimate, tokens: int) -> None:
+        with self._lock:
+            self.counted += 1
+            if not estimate.low <= tokens <= estimate.high:
+                self.outside_bounds += 1
+            calibration = self._calibration.setdefault(
+                estimate.encoding, [DEFAULT_BYTES_PER_TOKEN * self.prior_tokens, self.prior_tokens]
+            )
+            calibration[0] += estimate.size
+            calibration[1] += tokens
+
+    def stats(self) -> dict:
+        avoided = max(self.estimated - self.counted, 0)
+        return {
+            "estimated": self.estimated,
+            "counted": self.counted,
+            "avoided": avoided,
+            "avoided_ratio": avoided / self.estimated if self.estimated else 0.0,
+            "outside_bounds": self.outside_bounds,
+            "bytes_per_token": {encoding: round(self.bytes_per_token(encoding), 3) for encoding in self._calibration},
+        }
+
+    def __repr__(self):
+        return f"TokenEstimator(error={self.error}, {self.stats()})"
+
+
+estimator = TokenEstimator()
+
+
+def estimate_tokens(string: str, model: str) -> TokenEstimate:
+    """Returns a TokenEstimate of a string, see TokenEstimator."""
+    return estimator.estimate(string, model)
@@ -1,12 +1,23 @@
 import chat
 import exceptions
+import copy
 import uuid
+import time
 
 import datetime
 
 from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import TOKEN_ESTIMATE, OVERSIZE_POLICY, EVICTION_POLICY, PREFIX_STABLE, PREFIX_TIME_GRANULARITY, PREFIX_TRIM_FRACTION
+from settings import ADAPTIVE_COMPLETION, ADAPTIVE_COMPLETION_MIN, ADAPTIVE_COMPLETION_CAP, COMPACTION
+from settings import RETRIEVAL, RETRIEVAL_TOKENS, RETRIEVAL_TOP_K
 from typing import List, Dict, Union, Optional, Any, Tuple, Generator, Iterable
 from collections import deque, namedtuple
+from chat import tokenizer
+from chat.views import MessageWindow
+from chat.eviction import EvictionPolicy, EvictionQueue, eviction_policies
+from chat.compaction import HistoryCompactor
+from chat import retrieval as retrieval_module
+from chat.retrieval import RetrievalResult
 from enum import Enum
 
 class MessageReturnType(Enum):
@@ -15,10 +26,30 @@ class MessageReturnType(Enum):
     STRING = "string"
 
 
+class OversizePolicy(Enum):
+    """What TrimChatLog does with a message that is too long for the trimmed chat log on its own, see TrimChatLog Oversized Messages."""
+    TRUNCATE = "truncate"
+    HEAD_TAIL = "head_tail"
+    SPLIT = "split"
+    DROP = "drop"
+
+
 
 
 class TrimChatLog:
     message_return_types = MessageReturnType
+    oversize_policies = OversizePolicy
+    # put between the start and end of a message cut by OversizePolicy.HEAD_TAIL
+    oversize_marker = "\n\n[...]\n\n"
+    # the most tokens in each message made by OversizePolicy.SPLIT
+    oversize_split_tokens = 512
+    # see Adaptive Completion, the number of recent replies kept and the share of them the reservation is long enough for
+    reply_history = 32
+    reply_percentile = 0.9
+    # see Retrieval, the start of the retrieval message, the lowest similarity a message can be retrieved with and the fewest tokens a message is cut to before it is skipped instead
+    retrieval_prefix = "Earlier messages from this conversation that may be relevant:\n"
+    retrieval_min_score = 0.1
+    retrieval_least_tokens = 32
 
     """ 
     TrimChatLog is a class that is used to trim a chat log to a certain number of tokens, and acts as a wrapper for the chatlog, message, and system prompt classes.
@@ -35,6 +66,10 @@ class TrimChatLog:
             datetime -> For getting the current time
             typing -> For type hinting
             collections -> deque and namedtuple for the trimmed chat log
+            chat.views -> MessageWindow, the deque used for the trimmed chat log
+            chat.eviction -> EvictionPolicy and EvictionQueue, which message is trimmed first
+            chat.compaction -> HistoryCompactor, summarizes trimmed messages
+            chat.retrieval -> VectorIndex, finds old messages like the newest one(needs numpy)
         Args:
             model= "gpt-4": The model to use for the chatlog, message, and system prompt objects. Required to correctly count the number of tokens in a string. Defaults to "gpt-4".
             system_prompt: The system prompt string. Optional but recommended. Can be set later using the system_prompt property.
@@ -42,7 +77,14 @@ class TrimChatLog:
             max_tokens=8000: The max amount of tokens allowed in the trimmed chatlog, gets set to 8000 by default(max for gpt-4)
             max_messages=200: The max amount of messages allowed in the trimmed chatlog, gets set to 200 by default. Can be disabled by setting to None.
             max_completion_tokens=1000: The max amount of tokens allowed in a completion, gets set to 1000 by default.
-            token_padding=500: The amount of tokens subtracted from the max tokens to allow for the system prompt, gets set to 500 by default(everything, including model params is counted as a token so this helps prevent errors)
+            token_padding=0: Extra tokens subtracted from the max tokens as a safety margin, 0 by default since the system prompt, reminder and chat format are counted exactly(see Token Accounting).
+            token_estimate=TOKEN_ESTIMATE: Estimate the tokens of new messages instead of counting them, see Token Estimates.
+            oversize_policy=OVERSIZE_POLICY: What to do with a message too long to fit on its own, an OversizePolicy or its value, see Oversized Messages.
+            eviction_policy=EVICTION_POLICY: Which message is trimmed first, an EvictionPolicy or the name of a registered one, see Eviction.
+            prefix_stable=PREFIX_STABLE: Keep the start of each request the same between requests, see Prefix Stability.
+            adaptive_completion=ADAPTIVE_COMPLETION: Reserve room for the reply from recent replies and give it the rest of the context, see Adaptive Completion.
+            compaction=COMPACTION: Summarize trimmed messages instead of dropping them, see Compaction.
+            retrieval=RETRIEVAL: Send the old messages most like the newest user message with each request, see Retrieval.
         Attributes:
             Objects:
                 chatlog: The chatlog object, see chatlog.py for more information.
@@ -53,13 +95,14 @@ class TrimChatLog:
                 is_set_up: Weather or not the tokens have been worked out and the class is ready to use
                 is_sys_set: Weather or not the system prompt has been set
                 is_loaded: Weather or not the chatlog has been loaded from a save dict
+                is_history_pending: Weather or not the full chat log from a save is still waiting to be loaded(see Lazy Loading)
             Debug and Identification:
                 version: The version of the class
                 uuid: The uuid of the instance, used to save the chatlog, for debugging purposes and to identify the chatlog.
             Token Information:
-                trimmed_chatlog_tokens: The number of tokens in the trimmed chatlog
+                trimmed_chatlog_tokens: The number of tokens the trimmed chatlog costs in a request, including the chat format overhead of each message(the most it can have while messages are estimated, see Token Estimates)
                 max_tokens(int): The max amount of tokens allowed in the trimmed chatlog, gets set to 8000 by default(max for gpt-4)
-                token_padding(int): The amount of tokens subtracted from the max tokens to allow for the system prompt, gets set to 500 by default(everything, including model params is counted as a token so this helps prevent errors)
+                token_padding(int): Extra tokens subtracted from the max tokens as a safety margin, 0 by default(see Token Accounting).
                 max_chatlog_tokens(int): The number of tokens that can be in the chat log, calculated by the work_out_tokens method.
                 max_completion_tokens: The max amount of tokens allowed in a completion, gets set to 1000 by default.
                 max_messages(int): The max amount of messages allowed in the trimmed chatlog, gets set to 200 by default.
@@ -67,6 +110,32 @@ class TrimChatLog:
             Trim Information:
                 trimmed_messages(int): The number of messages trimmed from the chatlog
                 most_recent_trimmed_message(Message): The last message trimmed from the chatlog
+                oversize_policy(OversizePolicy): What to do with a message too long to fit on its own, can be set as a string.
+                oversized_messages(int): The number of messages that were cut to fit, see Oversized Messages.
+                eviction_policy(EvictionPolicy): Which message is trimmed first, can be set as the name of a registered policy.
+                eviction_stats(dict): The messages and tokens the eviction policy has trimmed.
+            Prefix Stability:
+                prefix_stable(bool): Whether the start of each request is kept the same between requests, see Prefix Stability.
+                time_granularity(int): With prefix_stable, the system prompt's ||time|| wildcard is rounded down to this many seconds, defaults to PREFIX_TIME_GRANULARITY.
+                trim_fraction(float): With prefix_stable, the fraction of the limits trimmed below them, defaults to PREFIX_TRIM_FRACTION.
+                prefix_stats(dict): How much of each request was the same as the one before.
+            Adaptive Completion:
+                adaptive_completion(bool): Whether the reply's tokens are worked out from recent replies and the rest of the context, see Adaptive Completion.
+                min_completion_tokens(int): The fewest tokens reserved for a reply, defaults to ADAPTIVE_COMPLETION_MIN.
+                completion_cap(int): The most tokens a reply can be given, None for the rest of the context, defaults to ADAPTIVE_COMPLETION_CAP.
+                completion_reservation(int): The tokens kept free for the reply when trimming.
+                reply_lengths(deque): The tokens of the last reply_history replies.
+                prompt_tokens(int): The exact tokens of the last request from get_finished_chatlog.
+                completion_tokens(int): The completion limit to send with the last request.
+            Compaction:
+                compaction(bool): Whether trimmed messages are summarized, setting it makes or closes the compactor.
+                compactor(HistoryCompactor): Summarizes the trimmed messages, None without compaction. Its summarizer can be changed(see chat/compaction.py).
+                summary(str): The summary of the trimmed messages, None if there isn't one.
+            Retrieval:
+                retrieval(bool): Whether old messages are retrieved for each request, raises RetrievalNotAvailableError if set without numpy.
+                retrieval_tokens(int): The tokens kept for the retrieval message, with its chat format overhead, defaults to RETRIEVAL_TOKENS.
+                retrieval_top_k(int): The most messages retrieved, defaults to RETRIEVAL_TOP_K.
+                retrieved(list[RetrievalResult]): The messages sent with the last request from get_finished_chatlog, with their positions in the full chat log and similarity.
             Misc:
                 _system_prompt_string: The system prompt string.
                 _model: The model to use for the chatlog, message, and system prompt objects. Required to correctly count the number of tokens in a string.
@@ -99,11 +168,86 @@ class TrimChatLog:
                 make_save_dict: Returns a dictionary containing all the information needed to load the object's state.
                 load_from_save_dict: Loads the object's state from a save dict.
                 _check_save_dict: Verifies that a save dict is valid. Private method. Private.
+                load_full_history: Loads the full chat log from the save now instead of waiting until it is needed.
+            Forking:
+                fork: Returns a copy that can go a different way(another mode, prompt or model) without changing this one, see Forking.
+            Mode Profiles:
+                apply_profile: Switches to the system prompt and reminder of a mode profile, see Mode Profiles.
+            Eviction:
+                pin_message: Keeps a message in the trimmed chat log until only pinned and recent messages are left.
+                unpin_message: Lets a pinned message be trimmed again.
+            Searching:
+                search: Ranked full text search over the full chat log(see chat/search.py), returns SearchResults with the position, score, message and a snippet.
+                history_stats: Totals for the full chat log(tokens of each role, how many of the newest messages fit) from its message arrays, see chat/arrays.py.
             Misc:
                 _check_message: Checks that a message is valid. Private method.
                 get_message_factory: Returns the message factory object, used to create messages with the correct model.
                 __repr__: Returns a string representation of the object.
                 __str__: Returns a pretty string of the entire chat log, using the __str__ method of the chatlog object.
+        Lazy Loading:
+            Loading a save only restores what is needed to answer the next request: the trimmed chat log(using the saved token counts), the system prompt, reminder and token info.
+            The full chat log is kept as the raw save dictionary and only turned into Message objects the first time the chatlog property is used(printing history, exporting, searching).
+            Messages added before then are queued and added after the saved ones, and saving before then writes the raw save dictionary back out, so loading costs the same no matter how long the history is.
+        Save Layout:
+            When the trimmed chat log is the end of the chatlog(the usual case, both get every message) it is saved as trimmed_chatlog_range, a start and end index into the chatlog's messages, instead of a second copy of the messages.
+            Loading the full chat log then shares the Message objects of the trimmed chat log with the chatlog instead of keeping two copies.
+        Token Estimates:
+            With token_estimate the message factory makes estimated messages(see chat/tokenizer.py TokenEstimator), the tokens are guessed from the size of the message with a low and high bound.
+            trimmed_chatlog_tokens is then the most tokens the trimmed chat log can have. While even the fewest are over the limit the oldest message is trimmed without counting anything, when the limit is between the two the estimated messages are counted in one batch.
+            get_finished_chatlog and make_save_dict count every estimated message in the trimmed chat log first, so what is sent(and saved) never goes over max_tokens. Messages trimmed before then, ie when adding a long history, are never counted.
+            token_estimate_stats shows how often counting was avoided.
+        Token Accounting:
+            Every message costs its content plus the chat format overhead of its role(see chat/tokenizer.py ChatFormat), trimmed_chatlog_tokens includes the overhead.
+            work_out_tokens subtracts the system prompt, summary(see Compaction), retrieval_tokens(see Retrieval) and reminder as they are sent(wildcards filled in, with their overhead), the tokens that prime the reply, max_completion_tokens(completion_reservation, see Adaptive Completion) and token_padding from max_tokens.
+            get_finished_chatlog works the budget out again before sending, so a request(tokenizer.count_chat_tokens) never goes over max_tokens - completion_reservation.
+        Oversized Messages:
+            A message that is too long for the trimmed chat log even on its own(ie a long paste or accumulated messages) would trim everything, itself included, and only the system prompt would be sent.
+            Instead, when it is the only message left and still over the limit, it is cut using oversize_policy:
+                TRUNCATE: The start of the message is kept.
+                HEAD_TAIL: The start and end of the message are kept, with oversize_marker between them.
+                SPLIT: The message becomes messages of the same role of up to oversize_split_tokens each, then the oldest are trimmed as usual(so the end is kept).
+                DROP: The message is trimmed like any other.
+            The message is encoded once and cut at token offsets(see chat/tokenizer.py TokenizedText), and every piece is counted exactly.
+            Only the trimmed chat log gets the cut message, the chatlog keeps the whole one.
+        Eviction:
+            By default the oldest message is trimmed first(EvictionPolicy, fifo). eviction_policy picks another, see chat/eviction.py:
+                keep_first_user: The oldest first, but the first user message is kept.
+                longest_low_value: The message with the least role weight per token first, ie long replies before short questions.
+                role_weighted: The oldest first, but user messages are kept longer than replies.
+            Every message in the trimmed chat log is in an EvictionQueue, a heap ordered by the policy, so each message trimmed costs O(log n). Messages trimmed from the middle are removed from the trimmed chat log in one pass when trimming is done.
+            Pinned messages(pin_message) and the newest keep_recent messages are only trimmed, oldest first, once nothing else can be. A pinned message that is trimmed or cut to fit is no longer pinned.
+            With fifo and nothing pinned the oldest message is popped from the left as before, and add_messages skips the messages that can't fit without adding them.
+            Trimming from the middle means the trimmed chat log is no longer the end of the chatlog, so it is saved as a list(see Save Layout), with the positions of the pinned messages.
+        Prefix Stability:
+            Providers cache the start of a request, a request that starts the same way as an earlier one is cheaper and faster. Two things change the start of every request:
+                The ||time|| wildcard in the system prompt, with prefix_stable it is rounded down to time_granularity seconds(the reminder is at the end, so it can have the exact time).
+                Trimming one message at a time moves the start of the trimmed chat log every message once it is full. With prefix_stable, trimming goes trim_fraction of the limit(and of max_messages) below it, so the next messages fit without trimming anything.
+            prefix_stats counts, for every request from get_finished_chatlog, how many of its tokens were in the same messages at the start of the request before, the ones a provider can cache.
+        Adaptive Completion:
+            Normally max_completion_tokens is kept free for every reply, however long the replies really are, and the reply can never be longer.
+            With adaptive_completion only completion_reservation is kept free: long enough for reply_percentile of the last reply_history replies(the most tokens an estimated reply can have), between min_completion_tokens and max_completion_tokens, and max_completion_tokens until there is a reply.
+            get_finished_chatlog then works out the exact prompt_tokens, and completion_tokens is the rest of max_tokens, up to completion_cap. ChatWrapper sends it as the max_tokens of the request.
+            If the prompt alone leaves less than min_completion_tokens(ie a system prompt bigger than max_tokens, see work_out_tokens) completion_tokens is min_completion_tokens(at least 1) and a warning is logged, the request is then too long for the model rather than sent with no room to reply.
+            Short replies then leave more room for history, and long replies aren't cut off when there is room.
+        Compaction:
+            With compaction every message trimmed(by trim_chatlog, or skipped by add_messages) is given to compactor, which summarizes them in batches on a background thread(see chat/compaction.py), so adding a message or sending a request never waits for a summary.
+            The summary is sent as a system message right after the system prompt. work_out_tokens takes the summary as it is then and subtracts its tokens, so what is sent still fits, and the summary is never more than compactor.summary_tokens.
+            The summary and the messages still waiting to be summarized are saved and loaded.
+        Retrieval:
+            With retrieval every message in the full chat log is in a vector index(see chat/retrieval.py, hashed tf-idf vectors by default), built the first time it is used and then updated as messages are added, and saved with the chat log.
+            get_finished_chatlog searches it with the newest user message, and up to retrieval_top_k of the most similar messages that aren't in the trimmed chat log(and score over retrieval_min_score) are sent in one system message, in the order they were sent, after the trimmed chat log.
+            It is sent last(before the reminder) so it never changes the start of the request(see Prefix Stability), and work_out_tokens subtracts all of retrieval_tokens, so what is sent still fits however much is retrieved. A message too long for what is left of retrieval_tokens is cut.
+            Nothing is searched while the trimmed chat log holds the whole chat log. Searching loads a pending chat log(see Lazy Loading).
+        Forking:
+            fork returns a TrimChatLog that carries on from the same point without a save and load. The two share what doesn't change once added and copy the rest:
+                Shared: the Message objects, the chatlog's messages(ChatLog.fork, copy on write, so the first message added to either copies the list, not the messages), a pending chat log's save dictionary and the logger.
+                Copied: the trimmed chat log(at most max_messages references), the eviction queue and pins, the system prompt, reminder and message factory objects, the compactor's summary and pending messages, reply_lengths and prefix_stats.
+            So forking costs about the same however long the history is, and a fork that is reset(ie help mode) never copies the history at all. Dropping a fork is enough to discard it, its compactor's thread only runs while it has a batch to summarize(see chat/compaction.py).
+            A disk backed chatlog(chat/stored_chatlog.py) forks in its own storage type, reading the file or session of the chat log it was forked from until one of them changes it, and only then copying what it shares into storage of its own(see StoredChatLog Forking).
+            Messages are counted again in place when the model changes to another encoding(see retokenize), a fork that does that first gives itself its own copies of the messages, so the other forks keep their counts.
+        Mode Profiles:
+            A ModeProfile(see chat/profiles.py) is a named system prompt and reminder, compiled and counted once for each model. apply_profile swaps in copies of them and trims once,
+            where setting system_prompt and then reminder compiles and counts each and trims after each. Profiles registered with register_profile can be applied by name.
         Example Usage:
             trim_chat_log = TrimChatLog()
             trim_chat_log.user_message = "Hello"
@@ -124,9 +268,16 @@ class TrimChatLog:
         max_tokens: int = 8000,
         max_messages: int = 200,
         max_completion_tokens: int = 1000,
-        token_padding: int = 500,
+        token_padding: int = 0,
         reminder: str = None,
-        auto_setup_chatlog: bool = True
+        auto_setup_chatlog: bool = True,
+        token_estimate: bool = TOKEN_ESTIMATE,
+        oversize_policy: str | OversizePolicy = OVERSIZE_POLICY,
+        eviction_policy: str | EvictionPolicy = EVICTION_POLICY,
+        prefix_stable: bool = PREFIX_STABLE,
+        adaptive_completion: bool = ADAPTIVE_COMPLETION,
+        compaction: bool = COMPACTION,
+        retrieval: bool = RETRIEVAL,
     ) -> None:
         self.logger = BaseLogger(
            module_name= __file__,
@@ -137,13 +288,55 @@ class TrimChatLog:
         
         self.logger.info(f"TrimChatLog version: {str(self.version)} Initialized.")
         self._model = model
+        # see Lazy Loading, the chatlog save dict and messages added since loading it
+        self._chatlog: chat.AbstractChatLog = None
+        self._pending_chatlog: dict = None
+        self._pending_messages: list[chat.Message] = []
+        # when each pending message was added, for the chatlog's message arrays(see chat/arrays.py)
+        self._pending_times: list[float] = []
+        # whether the trimmed chat log is the end of the pending chat log, see Save Layout
+        self._pending_window_aligned = False
+        # whether the chatlog was made by auto_make_chatlog rather than given
+        self._chatlog_is_auto_made = False
         if auto_setup_chatlog and chatlog is None:
             self.auto_make_chatlog()
         else:
             self.chatlog = chatlog
-        self.trimmed_chatlog = deque()
+        # see Eviction, the ids of the messages trimmed from the middle that are still to be removed
+        self._eviction_queue: EvictionQueue = None
+        self._evicted_ids: set[int] = set()
+        self.eviction_policy = eviction_policy
+        self.trimmed_chatlog = MessageWindow()
         self.is_set_up = False
         self.trimmed_chatlog_tokens = 0
+        # see Token Estimates, the difference between the most and fewest tokens the trimmed chat log can have
+        self._token_slack = 0
+        self.token_estimate = token_estimate
+        self.oversize_policy = oversize_policy
+        self.oversized_messages = 0
+        # see Prefix Stability
+        self.time_granularity = PREFIX_TIME_GRANULARITY
+        self.trim_fraction = PREFIX_TRIM_FRACTION
+        self._prefix_stable = prefix_stable
+        self._last_request: list[dict] = []
+        self.reset_prefix_stats()
+        # see Adaptive Completion
+        self.adaptive_completion = adaptive_completion
+        self.min_completion_tokens = ADAPTIVE_COMPLETION_MIN
+        self.completion_cap = ADAPTIVE_COMPLETION_CAP if ADAPTIVE_COMPLETION_CAP > 0 else None
+        self.reply_lengths: deque[int] = deque(maxlen=self.reply_history)
+        self.prompt_tokens = 0
+        self.completion_tokens = max_completion_tokens
+        # see Compaction, the summary message's content and tokens as of the last work_out_tokens, and the messages trimmed since the last submit
+        self.compactor: HistoryCompactor = None
+        self._summary_snapshot: tuple[str, int] = (None, 0)
+        self._compaction_batch: list[chat.Message] = []
+        # see Retrieval
+        self._retrieval = False
+        self.retrieval = retrieval
+        self.retrieval_tokens = RETRIEVAL_TOKENS
+        self.retrieval_top_k = RETRIEVAL_TOP_K
+        self.retrieved: list[RetrievalResult] = []
         
         self.most_recent_trimmed_message: chat.Message = None
         self.most_recent_message: chat.Message = None
@@ -156,12 +349,12 @@ class TrimChatLog:
             chatlog.model = model
         self._system_prompt_string = system_prompt
         if system_prompt is None:
-            self.system_prompt_object: chat.SystemPrompt = chat.SystemPrompt(model)
+            self.system_prompt_object: chat.SystemPrompt = chat.SystemPrompt(model, time_granularity=self._system_prompt_time_granularity)
             self.is_sys_set = False
         else:
             self._system_prompt_string = system_prompt
             self.system_prompt_object: chat.SystemPrompt = chat.SystemPrompt(
-                model, system_prompt
+                model, system_prompt, time_granularity=self._system_prompt_time_granularity
             )
             self.is_sys_set = True
        
@@ -172,8 +365,11 @@ class TrimChatLog:
         self.max_messages = max_messages
         self.max_completion_tokens = max_completion_tokens
         self.token_padding = token_padding
-        self.message_factory = chat.MessageFactory(model)
+        self.message_factory = chat.MessageFactory(model, estimate=token_estimate)
         self.max_chatlog_tokens = 0
+        # see Forking, whether the Message objects are shared with another fork
+        self._shares_messages = False
+        self.compaction = compaction
         self.work_out_tokens()
         self.trimmed_messages = 0
         
@@ -192,6 +388,237 @@ class TrimChatLog:
             self.chatlog = chatlog
             self.logger.info("Chatlog set to: " + repr(chatlog))
     @property
+    def chatlog(self) -> chat.AbstractChatLog | None:
+        """Returns the chatlog object, loading the full chat log from the save first if it is still pending(see Lazy Loading)."""
+        if self._pending_chatlog is not None:
+            self._load_pending_chatlog()
+        return self._chatlog
+    @chatlog.setter
+    def chatlog(self, chatlog: chat.AbstractChatLog | None) -> None:
+        """Sets the chatlog object, replacing any chat log still pending from a save."""
+        self._pending_chatlog = None
+        self._pending_messages = []
+        self._pending_times = []
+        self._pending_window_aligned = False
+        self._chatlog_is_auto_made = False
+        self._chatlog = chatlog
+    @property
+    def is_history_pending(self) -> bool:
+        """Returns True if the full chat log from a save hasn't been loaded yet."""
+        return self._pending_chatlog is not None
+    def load_full_history(self) -> None:
+        """Loads the full chat log from the save if it is still pending, otherwise does nothing."""
+        if self._pending_chatlog is not None:
+            self._load_pending_chatlog()
+    def _load_pending_chatlog(self) -> None:
+        """Turns the pending chatlog save dict into the chatlog, then adds the messages added since loading."""
+        save, new_messages, new_times = self._pending_chatlog, self._pending_messages, self._pending_times
+        self._pending_chatlog = None
+        self._pending_messages = []
+        self._pending_times = []
+        if self._chatlog is None:
+            self._chatlog = chat.make_chatlog(model=self.model)
+            self._chatlog_is_auto_made = True
+        self.logger.info(f"Loading full chat log, {chat.saved_message_count(save)} saved messages and {len(new_messages)} new messages")
+        if not isinstance(self._chatlog, chat.StoredChatLog):
+            # a save that refers to a file or database(see StoredChatLog Saving) is read into the save first
+            save = chat.embed_saved_messages(save)
+        self._chatlog.load_from_dict(save)
+        self._chatlog.model = self.model
+        if not tokenizer.same_encoding(save.get("model"), self.model):
+            # the model was changed to one with a different encoding while the history was pending
+            self._chatlog.recount_tokens()
+        self._chatlog.add_messages(new_messages)
+        if len(new_times) > 0 and chat.arrays.is_available():
+            # the messages were added when they were queued, not now
+            self._chatlog.arrays.set_timestamps(new_times, len(self._chatlog) - len(new_times))
+        if self._pending_window_aligned and isinstance(self._chatlog, chat.ChatLog) and len(self.trimmed_chatlog) > 0:
+            # share the Message objects instead of keeping the copies made for the trimmed chat log
+            self.trimmed_chatlog = MessageWindow(self._chatlog.data[-len(self.trimmed_chatlog):])
+        self._pending_window_aligned = False
+    def _make_pending_chatlog_save_dict(self) -> dict:
+        """Makes the chatlog save dict from the pending save dict and the messages added since, without loading the full chat log.
+        A save that refers to a file or database(see StoredChatLog Saving) is kept as it is, or the chat log is loaded(reopening its storage) if messages were added since.
+        """
+        if chat.refers_to_storage(self._pending_chatlog):
+            if len(self._pending_messages) > 0:
+                self._load_pending_chatlog()
+                return self._chatlog.make_save_dict()
+            save = dict(self._pending_chatlog)
+            save["model"] = self.model
+            return save
+        save = dict(self._pending_chatlog)
+        saved_messages = save["messages"]
+        save["meta"] = dict(save.get("meta", {}))
+        save["model"] = self.model
+        save["messages"] = list(saved_messages) + [msg.as_dict() for msg in self._pending_messages]
+        token_counts = save.get("token_counts")
+        if isinstance(token_counts, list) and len(token_counts) == len(saved_messages):
+            save["token_counts"] = list(token_counts) + [msg.tokens for msg in self._pending_messages]
+        else:
+            save.pop("token_counts", None)
+        search_index = save.get("search_index")
+        if isinstance(search_index, dict) and len(self._pending_messages) > 0:
+            try:
+                save["search_index"] = chat.InvertedIndex.extend_saved(search_index, [msg.content for msg in self._pending_messages])
+            except (KeyError, TypeError, AttributeError):
+                save.pop("search_index", None)
+        if isinstance(save.get("arrays"), dict) and len(self._pending_messages) > 0:
+            try:
+                save["arrays"] = chat.MessageArrays.extend_saved(save["arrays"], self._pending_messages, self._pending_times)
+            except exceptions.BadSaveDictionaryError:
+                save.pop("arrays", None)
+        return save
+    def _trimmed_chatlog_range(self) -> tuple[int, int] | None:
+        """Returns the start and end index of the trimmed chat log in the chatlog if it is the end of the chatlog, otherwise None. Doesn't load a pending chat log."""
+        window_length = len(self.trimmed_chatlog)
+        if self._pending_chatlog is not None and self._chatlog is None:
+            if not self._pending_window_aligned:
+                return None
+            end = self._chatlog_length()
+        elif isinstance(self._chatlog, chat.ChatLog) and self._pending_chatlog is None:
+            data = self._chatlog.data
+            end = len(data)
+            if window_length > end:
+                return None
+            # the same objects, not just equal ones, so the window really is the end of the chatlog
+            for chatlog_message, window_message in zip(data[end - window_length:], self.trimmed_chatlog):
+                if chatlog_message is not window_message:
+                    return None
+        else:
+            return None
+        return end - window_length, end
+    def _chatlog_length(self) -> int:
+        """Returns the number of messages in the chatlog without loading a pending chat log."""
+        if self._pending_chatlog is not None and self._chatlog is None:
+            return chat.saved_message_count(self._pending_chatlog) + len(self._pending_messages)
+        return len(self.chatlog)
+    @property
+    def trimmed_chatlog(self) -> MessageWindow:
+        """The trimmed chat log, a MessageWindow(a deque that keeps the positions of each role, see chat/views.py)."""
+        return self._trimmed_chatlog
+    @trimmed_chatlog.setter
+    def trimmed_chatlog(self, messages: Iterable[chat.Message]) -> None:
+        """Sets the trimmed chat log, any iterable of messages is turned into a MessageWindow."""
+        self._trimmed_chatlog = messages if isinstance(messages, MessageWindow) else MessageWindow(messages)
+        self._evicted_ids = set()
+        self._eviction_queue.rebuild(self._trimmed_chatlog)
+    @property
+    def oversize_policy(self) -> OversizePolicy:
+        """What to do with a message too long to fit on its own, see Oversized Messages."""
+        return self._oversize_policy
+    @oversize_policy.setter
+    def oversize_policy(self, policy: str | OversizePolicy) -> None:
+        """Sets the oversize policy from an OversizePolicy or its value. Raises UnknownOversizePolicyError if it is neither."""
+        try:
+            self._oversize_policy = OversizePolicy(policy)
+        except ValueError:
+            raise exceptions.UnknownOversizePolicyError(policy, [policy.value for policy in OversizePolicy])
+    @property
+    def eviction_policy(self) -> EvictionPolicy:
+        """Which message is trimmed first, see Eviction."""
+        return self._eviction_queue.policy
+    @eviction_policy.setter
+    def eviction_policy(self, policy: str | EvictionPolicy) -> None:
+        """Sets the eviction policy from an EvictionPolicy or the name of a registered one. Raises UnknownEvictionPolicyError if it is neither."""
+        if not isinstance(policy, EvictionPolicy):
+            if policy not in eviction_policies:
+                raise exceptions.UnknownEvictionPolicyError(policy, list(eviction_policies))
+            policy = eviction_policies[policy]()
+        old_queue = self._eviction_queue
+        self._eviction_queue = EvictionQueue(policy)
+        if old_queue is not None:
+            self._remove_evicted()
+            self._eviction_queue.rebuild(self.trimmed_chatlog)
+            for msg in self.trimmed_chatlog:
+                if old_queue.is_pinned(msg):
+                    self._eviction_queue.pin(msg)
+    @property
+    def eviction_stats(self) -> dict:
+        """The name of the eviction policy and the messages and tokens it has trimmed, and the number of pinned messages."""
+        stats = self.eviction_policy.stats()
+        stats["pinned_messages"] = sum(1 for msg in self.trimmed_chatlog if self._eviction_queue.is_pinned(msg))
+        return stats
+    def pin_message(self, message: chat.Message) -> bool:
+        """Keeps a message of the trimmed chat log until only pinned and recent messages are left, see Eviction. Returns False if it isn't in the trimmed chat log."""
+        return self._eviction_queue.pin(message)
+    def unpin_message(self, message: chat.Message) -> bool:
+        """Lets a pinned message be trimmed again. Returns False if it wasn't pinned."""
+        return self._eviction_queue.unpin(message)
+    @property
+    def compaction(self) -> bool:
+        """Whether trimmed messages are summarized, see Compaction."""
+        return self.compactor is not None
+    @compaction.setter
+    def compaction(self, value: bool) -> None:
+        """Makes a compactor, or closes and drops it(and its summary)."""
+        if value and self.compactor is None:
+            self.compactor = HistoryCompactor(self.model)
+        elif not value and self.compactor is not None:
+            self.compactor.close()
+            self.compactor = None
+            self._summary_snapshot = (None, 0)
+            self._compaction_batch = []
+    @property
+    def retrieval(self) -> bool:
+        """Whether old messages are retrieved for each request, see Retrieval."""
+        return self._retrieval
+    @retrieval.setter
+    def retrieval(self, value: bool) -> None:
+        if value and not retrieval_module.is_available():
+            raise exceptions.RetrievalNotAvailableError("numpy")
+        self._retrieval = bool(value)
+        if not self._retrieval:
+            self.retrieved = []
+    @property
+    def summary(self) -> str | None:
+        """The summary of the trimmed messages, None if there isn't one or compaction is off."""
+        return self.compactor.summary if self.compactor is not None else None
+    def _submit_trimmed(self) -> None:
+        """Gives the messages trimmed since the last call to the compactor, in one batch."""
+        if len(self._compaction_batch) > 0:
+            batch, self._compaction_batch = self._compaction_batch, []
+            if self.compactor is not None:
+                self.compactor.submit(batch)
+    @property
+    def prefix_stable(self) -> bool:
+        """Whether the start of each request is kept the same between requests, see Prefix Stability."""
+        return self._prefix_stable
+    @prefix_stable.setter
+    def prefix_stable(self, value: bool) -> None:
+        """Turns prefix stability on or off, the system prompt's time wildcard follows."""
+        self._prefix_stable = value
+        self.system_prompt_object.time_granularity = self._system_prompt_time_granularity
+    @property
+    def _system_prompt_time_granularity(self) -> int:
+        """The time granularity of the system prompt, 0(the exact time) unless prefix_stable."""
+        return self.time_granularity if self._prefix_stable else 0
+    @property
+    def prefix_stats(self) -> dict:
+        """How much of each request(from get_finished_chatlog) started the same as the request before, see Prefix Stability.
+        Returns a dictionary with requests, prompt_tokens(of every request but the first), shared_tokens(of those, in the messages shared with the request before), shared_ratio and the shared messages and tokens of the last request.
+        """
+        stats = dict(self._prefix_stats)
+        stats["shared_ratio"] = stats["shared_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return stats
+    def reset_prefix_stats(self) -> None:
+        """Clears prefix_stats."""
+        self._prefix_stats = {"requests": 0, "prompt_tokens": 0, "shared_tokens": 0, "last_shared_messages": 0, "last_shared_tokens": 0}
+    def _record_prefix(self, request: list[dict], costs: list[int]) -> None:
+        """Adds a request and the tokens of each of its messages to prefix_stats."""
+        previous = self._last_request
+        shared = 0
+        while shared < len(previous) and shared < len(request) and previous[shared] == request[shared]:
+            shared += 1
+        stats = self._prefix_stats
+        if stats["requests"] > 0:
+            stats["prompt_tokens"] += sum(costs)
+            stats["shared_tokens"] += sum(costs[:shared])
+        stats["requests"] += 1
+        stats["last_shared_messages"] = shared
+        stats["last_shared_tokens"] = sum(costs[:shared])
+        self._last_request = request
+    @property
     def reminder(self) -> str: 
         """Returns the reminder string"""
         return self._reminder_obj.prepared_reminder
@@ -209,14 +636,16 @@ class TrimChatLog:
         else:
             return result 
     def _has_chatlog(self) -> bool:
-        if self.chatlog is None:
+        """Returns True if there is a chatlog, or one pending from a save. Doesn't load a pending chat log."""
+        if self._chatlog is None and self._pending_chatlog is None:
             return False
         else:
             return True
     def auto_make_chatlog(self) -> None:
-        """Makes a chatlog object using the default user list concrete chatlog class, if one is provided in save dict."""
+        """Makes a chatlog object using the concrete chatlog class set by DEFAULT_CHATLOG_HANDLER(see chat.make_chatlog), if one is provided in save dict."""
         self.logger.info("Auto making chatlog")
-        self.chatlog = chat.ChatLog(model=self.model)
+        self.chatlog = chat.make_chatlog(model=self.model)
+        self._chatlog_is_auto_made = True
         self.logger.info("Chatlog set to: " + repr(self.chatlog))
         self.logger.warning("Chatlog ")
         assert self._has_chatlog()
@@ -243,11 +672,24 @@ class TrimChatLog:
     def system_prompt(self, system_prompt: str) -> None:
         """Sets the system prompt. If the system prompt is not set, sets the system prompt object, and then works out the tokens. If the system prompt is set, changes the system prompt object, and then works out the tokens."""
         self._system_prompt_string = system_prompt
-        self.system_prompt_object = chat.SystemPrompt(self.model, system_prompt)
+        self.system_prompt_object = chat.SystemPrompt(self.model, system_prompt, time_granularity=self._system_prompt_time_granularity)
         self.logger.info("System prompt set to: " + system_prompt)
         self._rework_tokens()
         self.is_sys_set = True
 
+    def apply_profile(self, profile: "chat.ModeProfile | str") -> None:
+        """Switches to the system prompt and reminder of a mode profile(or the name of a registered one), see Mode Profiles. Raises UnknownProfileError if there is no profile with that name."""
+        if isinstance(profile, str):
+            profile = chat.get_profile(profile)
+        prepared = profile.prepare(self.model, self._system_prompt_time_granularity)
+        # copies share the compiled text and its count with the profile
+        self.system_prompt_object = copy.copy(prepared.system_prompt)
+        self._reminder_obj = copy.copy(prepared.reminder)
+        self._system_prompt_string = profile.system_prompt
+        self.is_sys_set = profile.system_prompt is not None
+        self.logger.info(f"Mode profile {profile.name} applied")
+        self._rework_tokens()
+
     @property
     def model(self) -> str:
         """Returns the model for the chat log."""
@@ -255,15 +697,64 @@ class TrimChatLog:
 
     @model.setter
     def model(self, model: str) -> None:
-        """Sets the model for the chat log, and then changes all objects in the class and works out tokens again."""
+        """Sets the model for the chat log, and then changes all objects in the class and works out tokens again.
+        If the new model has a different encoding(see chat/tokenizer.py) every message is counted again, see retokenize.
+        """
+        old_model = self._model
         self._model = model
         self.system_prompt_object.model = model
-        if self._has_chatlog():
-            self.chatlog.model = model
+        self._reminder_obj.model = model
+        if self._chatlog is not None:
+            # a pending chat log gets the model when it is loaded
+            self._chatlog.model = model
         self.logger.info("Model set to: " + model)
         self.message_factory.set_model(model)
+        if self.compactor is not None:
+            self.compactor.set_model(model)
+        if not tokenizer.same_encoding(old_model, model):
+            self.retokenize()
+        elif tokenizer.chat_format(old_model) != tokenizer.chat_format(model):
+            self.recount_tokens()
         self.work_out_tokens()
         self.trim_chatlog()
+
+    def retokenize(self) -> None:
+        """Counts the tokens of every message again with the current model, used when the model changes to one with a different encoding.
+        The chat log is counted first, in one batch, and updates the Message objects the trimmed chat log shares with it. The trimmed chat log's remaining messages are counted in a second batch and its token total is worked out once.
+        A pending chat log(see Lazy Loading) is counted when it is loaded.
+        """
+        recounted = 0
+        # see Forking, other forks keep the old Message objects
+        aligned = self._trimmed_chatlog_range() if self._shares_messages and isinstance(self._chatlog, chat.ChatLog) and self._pending_chatlog is None else None
+        if self._chatlog is not None:
+            recounted = self._chatlog.recount_tokens()
+        if self._shares_messages:
+            self._copy_stale_messages(aligned)
+        stale = [msg for msg in self.trimmed_chatlog if not tokenizer.same_encoding(msg.model, self.model)]
+        if len(stale) > 0:
+            counts = tokenizer.count_tokens_batch([msg.content for msg in stale], self.model)
+            for msg, tokens in zip(stale, counts):
+                msg.model = self.model
+                msg.tokens = tokens
+        self.logger.info(f"Retokenized for {self.model}, {recounted} chat log messages and {len(stale)} trimmed chat log messages")
+        self.recount_tokens()
+        if len(stale) > 0 and not self.eviction_policy.is_fifo:
+            # priorities can depend on the tokens, see Eviction
+            self._eviction_queue.rebuild(self.trimmed_chatlog)
+    def _copy_stale_messages(self, aligned: tuple[int, int] | None) -> None:
+        """Replaces the messages of the trimmed chat log that retokenize is about to count with copies, keeping the pins, see Forking.
+        If the trimmed chat log was the end of the chatlog(aligned is its range) it takes the chatlog's messages, which the chatlog already copied, so the two still share them.
+        """
+        if all(tokenizer.same_encoding(msg.model, self.model) for msg in self.trimmed_chatlog):
+            return
+        pinned = [position for position, msg in enumerate(self.trimmed_chatlog) if self._eviction_queue.is_pinned(msg)]
+        if aligned is not None:
+            messages = self._chatlog.data[aligned[0]:aligned[1]]
+        else:
+            messages = [msg if tokenizer.same_encoding(msg.model, self.model) else copy.copy(msg) for msg in self.trimmed_chatlog]
+        self.trimmed_chatlog = MessageWindow(messages)
+        for position in pinned:
+            self._eviction_queue.pin(self.trimmed_chatlog[position])
     def _rework_tokens(self, recount: bool = False ) -> None:
         """Reworks the tokens in the chatlog. Calls work_out_tokens, recount_tokens and trim_chatlog."""
         self.work_out_tokens()
@@ -272,23 +763,51 @@ class TrimChatLog:
         self.trim_chatlog()
 
     def work_out_tokens(self) -> None:
-        """Works out the max tokens that can be used for the chat log. One of the core methods of this class."""
+        """Works out the max tokens that can be used for the chat log(see Token Accounting). One of the core methods of this class."""
         self.is_set_up = True
-        system_prompt_tokens = self.system_prompt_tokens if self.is_sys_set else 0
+        system_prompt_tokens = 0
+        if self.system_prompt_object.has_system_prompt:
+            system_prompt_tokens = self.system_prompt_object.system_prompt_tokens + tokenizer.message_overhead("system", self.model)
+        reminder_tokens = 0
+        if self._has_reminder:
+            reminder_tokens = self._reminder_obj.count_tokens() + tokenizer.message_overhead("system", self.model)
+        summary_tokens = 0
+        self._summary_snapshot = self.compactor.snapshot() if self.compactor is not None else (None, 0)
+        if self._summary_snapshot[0] is not None:
+            summary_tokens = self._summary_snapshot[1] + tokenizer.message_overhead("system", self.model)
+        retrieval_tokens = self.retrieval_tokens if self.retrieval else 0
         max_tokens = self.max_tokens
         token_padding = self.token_padding
-        max_completion_tokens = self.max_completion_tokens
-        reminder_tokens = self._reminder_obj.tokens # will be 0 if reminder is not set
+        max_completion_tokens = self.completion_reservation
+        reply_tokens = tokenizer.chat_format(self.model).reply_tokens
         self.max_chatlog_tokens = max_tokens - (
-            system_prompt_tokens + token_padding + max_completion_tokens
+            system_prompt_tokens + summary_tokens + retrieval_tokens + reminder_tokens + reply_tokens + token_padding + max_completion_tokens
         )
         self.logger.info("Max chatlog tokens set to: " + str(self.max_chatlog_tokens))
         if self.max_chatlog_tokens < 0:
             self.logger.warning("Max chatlog tokens is less than 0, setting to 1000")
             self.max_chatlog_tokens = 1000
+    @property
+    def completion_reservation(self) -> int:
+        """The tokens kept free for the reply, max_completion_tokens unless adaptive_completion(see Adaptive Completion)."""
+        if not self.adaptive_completion or len(self.reply_lengths) == 0:
+            return self.max_completion_tokens
+        lengths = sorted(self.reply_lengths)
+        percentile = lengths[min(int(len(lengths) * self.reply_percentile), len(lengths) - 1)]
+        return min(max(percentile, self.min_completion_tokens), self.max_completion_tokens)
+
+    def _record_reply(self, message: chat.Message) -> None:
+        """Adds the length of an assistant message to reply_lengths, the most tokens it can have if it is estimated, and works the budget out again if the reservation changed."""
+        if message.role != "assistant":
+            return
+        reservation = self.completion_reservation
+        self.reply_lengths.append(message.token_bounds[1])
+        if self.adaptive_completion and self.is_set_up and self.completion_reservation != reservation:
+            self.work_out_tokens()
+
     def get_message_factory(self, role: str = None) -> chat.MessageFactory:
         """Returns a message factory for the chat log."""
-        self.message_factory = chat.MessageFactory(self.model)
+        self.message_factory = chat.MessageFactory(self.model, estimate=self.token_estimate)
         return self.message_factory
 
     def _check_message(self, message: chat.Message) -> chat.Message:
@@ -300,56 +819,214 @@ class TrimChatLog:
             )
         return message
 
+    def _message_token_bounds(self, message: chat.Message) -> tuple[int, int]:
+        """Returns the fewest and most tokens a message costs in a request, its content plus the chat format overhead(see Token Accounting)."""
+        low, high = message.token_bounds
+        overhead = tokenizer.message_overhead(message.role, self.model)
+        return low + overhead, high + overhead
+
     def add_message(self, message: chat.Message) -> None:
         """Adds a message to the chat log. Only accepts Message objects. One of the core methods of this class."""
         message = self._check_message(message)
-        self.trimmed_chatlog_tokens += message.tokens
-        if self._has_chatlog():
-            self.chatlog.add_message(message)
+        low, high = self._message_token_bounds(message)
+        self.trimmed_chatlog_tokens += high
+        self._token_slack += high - low
+        if self._pending_chatlog is not None:
+            self._pending_messages.append(message)
+            self._pending_times.append(time.time())
+        elif self._chatlog is not None:
+            self._chatlog.add_message(message)
         self.most_recent_message = message
+        self._record_reply(message)
         self.trimmed_chatlog.append(message)
+        self._eviction_queue.push(message)
         self.logger.debug("Got message: " + message.content)
 
         self.trim_chatlog()
     def reset(self)-> None:
         """Resets the chatlog but keeps the system prompt"""
-        if self._has_chatlog():
-            self.chatlog.reset()
-        self.trimmed_chatlog = deque()
+        if self._pending_chatlog is not None:
+            # no need to load the history just to clear it
+            self._pending_chatlog = None
+            self._pending_messages = []
+            self._pending_times = []
+            if self._chatlog is None:
+                self._chatlog = chat.make_chatlog(model=self.model)
+                self._chatlog_is_auto_made = True
+        if self._chatlog is not None:
+            self._chatlog.reset()
+        self.trimmed_chatlog = MessageWindow()
+        self._shares_messages = False
         self.most_recent_message = None
         self.most_recent_trimmed_message = None
         self.trimmed_chatlog_tokens = 0 
+        self._token_slack = 0
         self.trimmed_messages = 0
+        self.reply_lengths.clear()
+        self._compaction_batch = []
+        if self.compactor is not None:
+            self.compactor.reset()
+            self._summary_snapshot = (None, 0)
         self.is_loaded = False
         self.logger.info("Chatlog reset")
+    def fork(self) -> "TrimChatLog":
+        """Returns a TrimChatLog that carries on from this point separately, sharing the history with this one instead of copying it, see Forking.
+        The fork has the same settings, system prompt, reminder, trimmed chat log, pins and summary, and a new uuid.
+        """
+        self._remove_evicted()
+        forked = TrimChatLog.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        forked.uuid = str(uuid.uuid4())
+        if self._chatlog is not None:
+            forked._chatlog = self._chatlog.fork()
+        forked._pending_messages = list(self._pending_messages)
+        forked._pending_times = list(self._pending_times)
+        forked._trimmed_chatlog = MessageWindow(self._trimmed_chatlog)
+        forked._evicted_ids = set()
+        forked._eviction_queue = self._eviction_queue.copy()
+        forked._prefix_stats = dict(self._prefix_stats)
+        forked.reply_lengths = deque(self.reply_lengths, maxlen=self.reply_lengths.maxlen)
+        forked.compactor = self.compactor.fork() if self.compactor is not None else None
+        forked._compaction_batch = list(self._compaction_batch)
+        forked.retrieved = list(self.retrieved)
+        forked.system_prompt_object = copy.copy(self.system_prompt_object)
+        forked._reminder_obj = copy.copy(self._reminder_obj)
+        forked.message_factory = copy.copy(self.message_factory)
+        self._shares_messages = forked._shares_messages = True
+        self.logger.info(f"Forked {self.uuid} as {forked.uuid}, {len(self.trimmed_chatlog)} trimmed chat log messages")
+        return forked
     def recount_tokens(self) -> None:
-        """Recounts the tokens in the chatlog"""
+        """Recounts the tokens in the chatlog(the most tokens, if any messages are estimated, see Token Estimates)"""
         self.trimmed_chatlog_tokens = 0
+        self._token_slack = 0
         for msg in self.trimmed_chatlog:
-            self.trimmed_chatlog_tokens += msg.tokens
+            low, high = self._message_token_bounds(msg)
+            self.trimmed_chatlog_tokens += high
+            self._token_slack += high - low
         self.logger.info("Recounted tokens, new token count: " + str(self.trimmed_chatlog_tokens))
+
+    def count_estimated_tokens(self) -> int:
+        """Counts the tokens of the estimated messages in the trimmed chat log, in one batch, so trimmed_chatlog_tokens is exact. Returns the number of messages counted. See Token Estimates."""
+        if self._token_slack == 0:
+            return 0
+        estimated = [msg for msg in self.trimmed_chatlog if not msg.is_counted]
+        counts = tokenizer.count_tokens_batch([msg.content for msg in estimated], self.model)
+        for msg, tokens in zip(estimated, counts):
+            msg.tokens = tokens
+        self.recount_tokens()
+        return len(estimated)
+
+    @property
+    def token_estimate_stats(self) -> dict:
+        """How many messages were estimated, how many had to be counted and how many never were, see chat/tokenizer.py TokenEstimator.stats."""
+        return tokenizer.estimator.stats()
+
+    def _pop_trimmed_message(self) -> None:
+        trimmed_message: chat.Message = self.trimmed_chatlog.popleft()
+        self._eviction_queue.discard(trimmed_message)
+        self._trim_message(trimmed_message)
+
+    def _trim_message(self, trimmed_message: chat.Message) -> None:
+        """Takes a message that left the trimmed chat log off the token counts, and records it."""
+        self.most_recent_trimmed_message = trimmed_message
+        self.trimmed_messages += 1
+        low, high = self._message_token_bounds(trimmed_message)
+        self.trimmed_chatlog_tokens -= high
+        self._token_slack -= high - low
+        self.eviction_policy.record(high)
+        if self.compactor is not None:
+            self._compaction_batch.append(trimmed_message)
+
+    def _evict_message(self) -> None:
+        """Trims the message chosen by eviction_policy, the oldest if it is fifo or only pinned and recent messages are left(see Eviction).
+        A message from the middle is only counted as trimmed here, _remove_evicted removes it from the trimmed chat log.
+        """
+        victim = None if self._eviction_queue.is_fifo else self._eviction_queue.pop()
+        if victim is None:
+            self._remove_evicted()
+            self._pop_trimmed_message()
+        elif victim is self.trimmed_chatlog[0]:
+            self.trimmed_chatlog.popleft()
+            self._trim_message(victim)
+        else:
+            self._evicted_ids.add(id(victim))
+            self._trim_message(victim)
+            # the trimmed chat log is no longer the end of the chatlog, see Save Layout
+            self._pending_window_aligned = False
+
+    def _live_length(self) -> int:
+        """The number of messages in the trimmed chat log, not counting the ones evicted but not yet removed."""
+        return len(self.trimmed_chatlog) - len(self._evicted_ids)
+
+    def _remove_evicted(self) -> None:
+        """Removes the messages evicted from the middle of the trimmed chat log, in one pass."""
+        if len(self._evicted_ids) > 0:
+            self.trimmed_chatlog.remove_ids(self._evicted_ids)
+            self._evicted_ids = set()
+
+    def _fit_oversized_message(self) -> bool:
+        """Cuts the only message in the trimmed chat log to fit using oversize_policy(see Oversized Messages). Returns False if the message should be trimmed instead."""
+        message: chat.Message = self.trimmed_chatlog[0]
+        budget = self.max_chatlog_tokens - tokenizer.message_overhead(message.role, self.model)
+        if self.oversize_policy is OversizePolicy.DROP or budget < 1:
+            return False
+        text = tokenizer.TokenizedText(message.content, self.model)
+        if self.oversize_policy is OversizePolicy.SPLIT:
+            size = min(budget, self.oversize_split_tokens)
+            # only the pieces that can all fit, the rest would be trimmed straight away
+            overhead = tokenizer.message_overhead(message.role, self.model)
+            pieces = text.chunks(size, most_pieces=max(self.max_chatlog_tokens // (size + overhead), 1))
+        elif self.oversize_policy is OversizePolicy.HEAD_TAIL:
+            pieces = [text.head_tail(budget, self.oversize_marker)]
+        else:
+            pieces = [text.head(budget)]
+        self.logger.info(f"Message of {len(text)} tokens is over the limit of {budget}, cut into {len(pieces)} with {self.oversize_policy.value}")
+        self.trimmed_chatlog = MessageWindow(chat.Message(message.role, piece, self.model) for piece in pieces)
+        # the trimmed chat log is no longer the end of the chatlog, see Save Layout
+        self._pending_window_aligned = False
+        self.oversized_messages += 1
+        self.recount_tokens()
+        return True
+
     def trim_chatlog(self) -> None:
         """
         Trims a chat log to the max tokens and max messages.
         Core method of this class
+        With estimated messages the oldest message is trimmed while even the fewest tokens the trimmed chat log can have are over the limit, the estimated messages are only counted when the limit is between the fewest and the most(see Token Estimates).
+        A last message still over the limit is cut to fit instead of trimmed, see Oversized Messages.
+        With prefix_stable, once over a limit it trims trim_fraction below it, see Prefix Stability.
         """
-        while self.trimmed_chatlog_tokens > self.max_chatlog_tokens and len(self.trimmed_chatlog) > 0:
-            trimmed_message: chat.Message = self.trimmed_chatlog.popleft()
-            self.most_recent_trimmed_message = trimmed_message
-            self.trimmed_messages += 1
-            self.trimmed_chatlog_tokens -= trimmed_message.tokens
-
-        if self.max_messages is not None:
-            while len(self.trimmed_chatlog) > self.max_messages:
-                trimmed_message = self.trimmed_chatlog.popleft()
-                self.most_recent_trimmed_message = trimmed_message
-                self.trimmed_chatlog_tokens -= trimmed_message.tokens
-                self.trimmed_messages += 1
+        limit = self.max_chatlog_tokens
+        if self._prefix_stable and self.trimmed_chatlog_tokens > limit:
+            limit -= int(limit * self.trim_fraction)
+        while self.trimmed_chatlog_tokens > limit and self._live_length() > 0:
+            if self._token_slack > 0 and self.trimmed_chatlog_tokens - self._token_slack <= limit:
+                # it might fit, count to find out
+                self._remove_evicted()
+                self.count_estimated_tokens()
+                continue
+            if self._live_length() == 1:
+                self._remove_evicted()
+                # the last message is never trimmed for the lower limit, and is cut to fit rather than trimmed for the real one
+                if self.trimmed_chatlog_tokens <= self.max_chatlog_tokens or self._fit_oversized_message():
+                    break
+            self._evict_message()
+
+        if self.max_messages is not None and self._live_length() > self.max_messages:
+            max_messages = self.max_messages
+            if self._prefix_stable:
+                max_messages = max(max_messages - int(max_messages * self.trim_fraction), 1)
+            while self._live_length() > max_messages:
+                self._evict_message()
+        self._remove_evicted()
+        self._submit_trimmed()
         if self.trimmed_chatlog_tokens < 0:
             self.trimmed_chatlog_tokens = 0
         if self.trimmed_messages < 0:
             self.trimmed_messages = 0
-       
+        if self._chatlog is not None:
+            self._chatlog.hint_window_size(len(self.trimmed_chatlog))
+
 
     def get_trimmed_messages_as_dict(
         self, role: str = None, limit: int = None, reverse: bool = False
@@ -364,49 +1041,155 @@ class TrimChatLog:
 
         Only works on the trimmed chat log, use methods in chatlog to get messages from the full chat log
         """
-        result = []
-        chatlog = self.trimmed_chatlog[::-1] if reverse else self.trimmed_chatlog
-        count = 0
-        for message in chatlog:
-            if role is None or message.role == role:
-                result.append(message.as_dict())
-                count += 1
-            if limit is not None and count >= limit:
-                break
-                
-        return result
+        return [message.as_dict() for message in self.trimmed_chatlog.view(role=role, reverse=reverse, limit=limit)]
     
 
     def get_finished_chatlog(self) -> list[dict]:
-        """Returns the finished chat log, with the system prompt as a list of dictionaries for use with the API"""
+        """Returns the finished chat log, with the system prompt as a list of dictionaries for use with the API
+        The budget is worked out again(the wildcards in the system prompt and reminder may have changed) and estimated messages are counted before trimming, so what is sent always fits in max_tokens(see Token Estimates and Token Accounting).
+        """
+        self.work_out_tokens()
+        self.count_estimated_tokens()
+        self.trim_chatlog()
         result = []
+        # the tokens of each message, for prefix_stats
+        costs = []
         if self.system_prompt_object.has_system_prompt:
             result.append(self.system_prompt_object.system_prompt_message.as_dict())
+            costs.append(self.system_prompt_object.system_prompt_tokens + tokenizer.message_overhead("system", self.model))
+        summary, summary_tokens = self._summary_snapshot
+        if summary is not None:
+            result.append({"role": "system", "content": summary})
+            costs.append(summary_tokens + tokenizer.message_overhead("system", self.model))
        
         trimmed_chat_log = self.get_trimmed_messages_as_dict()
         result.extend(trimmed_chat_log)
+        costs.extend(self._message_token_bounds(msg)[1] for msg in self.trimmed_chatlog)
+        retrieved, retrieved_tokens = self._retrieve()
+        if retrieved is not None:
+            result.append({"role": "system", "content": retrieved})
+            costs.append(retrieved_tokens + tokenizer.message_overhead("system", self.model))
         if self._has_reminder is True:
             result.append(self._reminder_obj.reminder_as_message.as_dict())
+            costs.append(self._reminder_obj.tokens + tokenizer.message_overhead("system", self.model))
+        self._record_prefix(result, costs)
+        self.prompt_tokens = sum(costs) + tokenizer.chat_format(self.model).reply_tokens
+        self.completion_tokens = self.max_completion_tokens
+        if self.adaptive_completion:
+            # see Adaptive Completion
+            self.completion_tokens = self.max_tokens - self.prompt_tokens
+            if self.completion_cap is not None:
+                self.completion_tokens = min(self.completion_tokens, self.completion_cap)
+            floor = max(self.min_completion_tokens, 1)
+            if self.completion_tokens < floor:
+                self.logger.warning(f"Only {self.completion_tokens} tokens left for the completion after a prompt of {self.prompt_tokens}, setting to {floor}")
+                self.completion_tokens = floor
       
         return result
+    def _retrieve(self) -> tuple[str | None, int]:
+        """Finds the old messages most like the newest user message and makes the retrieval message, see Retrieval. Returns its content and tokens, (None, 0) if nothing was retrieved."""
+        self.retrieved = []
+        if not self.retrieval:
+            return None, 0
+        query = self.trimmed_chatlog.last("user")
+        if query is None or self._chatlog_length() <= len(self.trimmed_chatlog):
+            return None, 0
+        chatlog = self.chatlog
+        # by content, stored chat logs make new Message objects
+        window = {(msg.role, msg.content) for msg in self.trimmed_chatlog}
+
+        def keep(position: int) -> bool:
+            msg = chatlog._message_at(position)
+            return (msg.role, msg.content) not in window
+
+        results = chatlog.retrieve(query.content, limit=self.retrieval_top_k, keep=keep, min_score=self.retrieval_min_score)
+        budget = self.retrieval_tokens - tokenizer.message_overhead("system", self.model) - tokenizer.count_tokens(self.retrieval_prefix, self.model)
+        chosen = []
+        used = 0
+        for result in results:
+            line = f"{result.message.role}: {result.message.content}"
+            # and the newline before it
+            tokens = tokenizer.count_tokens(line, self.model) + 1
+            if used + tokens > budget:
+                if budget - used < self.retrieval_least_tokens:
+                    continue
+                line = tokenizer.TokenizedText(line, self.model).head(budget - used - 1, "...")
+                tokens = tokenizer.count_tokens(line, self.model) + 1
+            chosen.append((result, line))
+            used += tokens
+        while len(chosen) > 0:
+            # in the order they were sent, the counts of the lines can be off by a token where they are joined so the whole message is counted
+            lines = [line for _, line in sorted(chosen, key=lambda item: item[0].position)]
+            content = self.retrieval_prefix + "\n".join(lines)
+            tokens = tokenizer.count_tokens(content, self.model)
+            if tokens + tokenizer.message_overhead("system", self.model) <= self.retrieval_tokens:
+                self.retrieved = [result for result, _ in chosen]
+                return content, tokens
+            chosen.pop()
+        return None, 0
     @property
     def finished_chatlog(self) -> list[dict]:
         """Using the get_finished_chatlog method, returns the finished chat log, with the system prompt as a list of dictionaries for use with the API"""
         return self.get_finished_chatlog()
 
     def add_messages(self, lst: list[chat.Message]) -> None:
-        """Adds a list of messages to the chat log."""
-        for message in lst:
-            self.add_message(message)
+        """Adds a list of messages to the chat log, ending the same as adding them one at a time.
+        The messages are checked from the newest back, the ones that can't be in the trimmed chat log even with the fewest tokens they can have are never added to it, so estimated ones are never counted(see Token Estimates).
+        With an eviction policy other than fifo every message is added and then trimmed by the policy, see Eviction.
+        """
+        messages = [self._check_message(message) for message in lst]
+        if len(messages) == 0:
+            return
+        if self._pending_chatlog is not None:
+            self._pending_messages.extend(messages)
+            self._pending_times.extend([time.time()] * len(messages))
+        elif self._chatlog is not None:
+            self._chatlog.add_messages(messages)
+        self.most_recent_message = messages[-1]
+        for message in messages[-self.reply_history:]:
+            self._record_reply(message)
+        # other eviction policies might keep an older message over a newer one, so every message goes in the heap
+        start = self._first_fitting_message(messages) if self._eviction_queue.is_fifo else 0
+        if start == len(messages) and self.oversize_policy is not OversizePolicy.DROP:
+            # the newest message is too long on its own, trim_chatlog cuts it to fit
+            start -= 1
+        if start > 0:
+            # every message in the trimmed chat log and the ones before start are trimmed
+            self.trimmed_messages += len(self.trimmed_chatlog) + start
+            self.most_recent_trimmed_message = messages[start - 1]
+            if self.compactor is not None:
+                self._compaction_batch.extend(self.trimmed_chatlog)
+                self._compaction_batch.extend(messages[:start])
+            self.trimmed_chatlog = MessageWindow()
+            self.trimmed_chatlog_tokens = 0
+            self._token_slack = 0
+        for message in messages[start:]:
+            low, high = self._message_token_bounds(message)
+            self.trimmed_chatlog_tokens += high
+            self._token_slack += high - low
+            self.trimmed_chatlog.append(message)
+            self._eviction_queue.push(message)
+        self.logger.debug(f"Got {len(messages)} messages, {len(messages) - start} might fit")
+        self.trim_chatlog()
+
+    def _first_fitting_message(self, messages: list[chat.Message]) -> int:
+        """Returns the index of the oldest message that might still be in the trimmed chat log once all the messages are added, using the fewest tokens each message can have."""
+        fewest = 0
+        for i in range(len(messages) - 1, -1, -1):
+            fewest += self._message_token_bounds(messages[i])[0]
+            if fewest > self.max_chatlog_tokens or (self.max_messages is not None and len(messages) - i > self.max_messages):
+                return i + 1
+        return 0
 
     def add_messages_from_dict(self, lst: list[dict]) -> None:
         """Adds a list of messages from a list of dictionaries to the chat log."""
-        for message in lst:
-            self.add_message(self.message_factory(**message))
+        self.add_messages([self.message_factory(**message) for message in lst])
 
     def make_save_dict(self) -> dict:
         """Makes a save dictionary for the chat log."""
         self.logger.info("Making save dict.")
+        # saves have exact counts for the trimmed chat log
+        self.count_estimated_tokens()
         d =  {
             "model": self.model,
             "system_prompt": self.system_prompt_object.system_prompt_raw
@@ -431,13 +1214,33 @@ class TrimChatLog:
             else None,
             "is_set_up": self.is_set_up,
             "timestamp": str(datetime.datetime.now().timestamp()),
-            
-            "trimmed_chatlog": self.get_trimmed_messages_as_dict(),
+            "reminder": self._reminder_obj.reminder_content,
+            "oversize_policy": self.oversize_policy.value,
+            "eviction_policy": self.eviction_policy.name,
+            "pinned": [i for i, msg in enumerate(self.trimmed_chatlog) if self._eviction_queue.is_pinned(msg)],
+            "prefix_stable": self.prefix_stable,
+            "adaptive_completion": self.adaptive_completion,
+            "reply_lengths": list(self.reply_lengths),
+            "compaction": self.compaction,
+            "summary": self.summary,
+            "compaction_pending": [msg.as_dict() for msg in self.compactor.pending] if self.compactor is not None else [],
+            "retrieval": self.retrieval,
         }
-        if self._has_chatlog():
+        if self._pending_chatlog is not None and self._chatlog is None:
+            d["chatlog"] = self._make_pending_chatlog_save_dict()
+        elif self._has_chatlog():
             d["chatlog"] = self.chatlog.make_save_dict()
         else:
             d["chatlog"] = None
+        # a chat log save that refers to its storage has no messages for a range to point into
+        window_range = self._trimmed_chatlog_range() if d["chatlog"] is not None and "messages" in d["chatlog"] else None
+        if window_range is not None:
+            # see Save Layout
+            d["trimmed_chatlog"] = None
+            d["trimmed_chatlog_range"] = {"start": window_range[0], "end": window_range[1]}
+        else:
+            d["trimmed_chatlog"] = self.get_trimmed_messages_as_dict()
+            d["trimmed_chatlog_token_counts"] = [msg.tokens for msg in self.trimmed_chatlog]
         return d
     def _check_save_dict(self, save_dict: dict) -> dict:
         """Checks that a save dictionary is valid and has the correct keys. Raises BadSaveDictionaryError if not. Returns the save dictionary if it is valid."""
@@ -471,6 +1274,8 @@ class TrimChatLog:
         if save_dict['chatlog'] is not None:
             if not isinstance(save_dict['chatlog'], dict):
                 raise exceptions.BadSaveDictionaryError("Chatlog must be a dictionary or None.")
+        if save_dict["trimmed_chatlog"] is None:
+            self._check_trimmed_chatlog_range(save_dict)
         required_keys = {
             "max_tokens",
             "max_messages",
@@ -495,29 +1300,87 @@ class TrimChatLog:
                 )
         return save_dict
 
+    def _check_trimmed_chatlog_range(self, save_dict: dict) -> None:
+        """Checks that a save without a trimmed_chatlog list has a valid trimmed_chatlog_range into its chatlog. Raises BadSaveDictionaryError if not."""
+        window_range = save_dict.get("trimmed_chatlog_range")
+        if save_dict["chatlog"] is None or not isinstance(window_range, dict):
+            raise exceptions.BadSaveDictionaryError(
+                "Trimmed ChatLog must have either a trimmed_chatlog list or a trimmed_chatlog_range and a chatlog."
+            )
+        messages = save_dict["chatlog"].get("messages")
+        start, end = window_range.get("start"), window_range.get("end")
+        if not isinstance(messages, list) or not isinstance(start, int) or not isinstance(end, int) or not 0 <= start <= end <= len(messages):
+            raise exceptions.BadSaveDictionaryError(
+                "Trimmed ChatLog trimmed_chatlog_range must be a start and end index into the chatlog messages."
+            )
+
+    def _is_window_saved_aligned(self, save_dict: dict) -> bool:
+        """Returns True if the saved trimmed chat log is the end of the saved chatlog, either as a range or(for older saves) as a list of the same messages."""
+        if save_dict["trimmed_chatlog"] is None:
+            return save_dict["trimmed_chatlog_range"]["end"] == len(save_dict["chatlog"]["messages"])
+        window = save_dict["trimmed_chatlog"]
+        messages = save_dict["chatlog"].get("messages")
+        if not isinstance(messages, list) or len(window) > len(messages):
+            return False
+        return len(window) == 0 or messages[-len(window):] == window
+
     def load_from_save_dict(self, save_dict: dict) -> None:
-        """Loads a chat log from a save dictionary."""
+        """Loads a chat log from a save dictionary. The full chat log is loaded lazily, see Lazy Loading."""
         save_dict = self._check_save_dict(save_dict)
         # will raise an error is the save dict is bad, so we can assume it is good from here on out.
         self.logger.info("Loading from save dict.")
         if save_dict["chatlog"] is not None:
             if not  self._has_chatlog():
                 self.logger.warning("Chatlog is not set, auto making chatlog. If you want to use a custom chatlog, set it before loading from a save dict.")
-                self.auto_make_chatlog()
-            self.chatlog.load_from_dict(save_dict["chatlog"])
+            # loading a save into a chat log appends to it, so an earlier pending save has to be loaded first to keep the order
+            self.load_full_history()
+            if self._chatlog_is_auto_made and len(self._chatlog) == 0:
+                # an empty auto made chatlog is the same as the one made when loading, dropping it lets saving skip loading
+                self._chatlog = None
+            self._pending_chatlog = save_dict["chatlog"]
+            self._pending_messages = []
+            self._pending_times = []
+            self._pending_window_aligned = self._is_window_saved_aligned(save_dict)
+        # the old trimmed chat log would otherwise be trimmed against the new token info by the setters below
+        self.trimmed_chatlog = MessageWindow()
         self.uuid = save_dict["uuid"]
         self.is_sys_set = save_dict["is_sys_set"]
         if save_dict["is_sys_set"] is True:
             self.system_prompt = save_dict["system_prompt"]
-        self.trimmed_chatlog_tokens = save_dict["trimmed_chatlog_tokens"]
-        self.trimmed_messages = save_dict["trimmed_messages"]
+        if "reminder" in save_dict:
+            self.reminder = save_dict["reminder"]
+        if "oversize_policy" in save_dict:
+            self.oversize_policy = save_dict["oversize_policy"]
+        if "eviction_policy" in save_dict:
+            self.eviction_policy = save_dict["eviction_policy"]
+        if "prefix_stable" in save_dict:
+            self.prefix_stable = save_dict["prefix_stable"]
+        if "adaptive_completion" in save_dict:
+            self.adaptive_completion = save_dict["adaptive_completion"]
+        if isinstance(save_dict.get("reply_lengths"), list):
+            self.reply_lengths = deque(save_dict["reply_lengths"], maxlen=self.reply_history)
+        if "compaction" in save_dict:
+            self.compaction = save_dict["compaction"]
+        if "retrieval" in save_dict:
+            self.retrieval = save_dict["retrieval"] and retrieval_module.is_available()
+        # the model first, changing it recounts the current trimmed chat log
         self.model = save_dict["model"]
-        self.trimmed_chatlog = deque(
-            [
-                self.message_factory(**message)
-                for message in save_dict["trimmed_chatlog"]
-            ]
-        )
+        self.trimmed_messages = save_dict["trimmed_messages"]
+        if save_dict["trimmed_chatlog"] is None:
+            start, end = save_dict["trimmed_chatlog_range"]["start"], save_dict["trimmed_chatlog_range"]["end"]
+            token_counts = save_dict["chatlog"].get("token_counts")
+            self.trimmed_chatlog = MessageWindow(
+                self._messages_from_dicts(
+                    save_dict["chatlog"]["messages"][start:end],
+                    token_counts[start:end] if isinstance(token_counts, list) and len(token_counts) == len(save_dict["chatlog"]["messages"]) else None,
+                )
+            )
+        else:
+            self.trimmed_chatlog = MessageWindow(
+                self._messages_from_dicts(save_dict["trimmed_chatlog"], save_dict.get("trimmed_chatlog_token_counts"))
+            )
+        if self.compactor is not None:
+            self.compactor.load(save_dict.get("summary"), self._messages_from_dicts(save_dict.get("compaction_pending") or []))
         self.most_recent_message = (
             self.message_factory(**save_dict["most_recent_message"])
             if save_dict["most_recent_message"] is not None
@@ -528,6 +1391,9 @@ class TrimChatLog:
             if save_dict["most_recent_trimmed_message"] is not None
             else None
         )
+        for i in save_dict.get("pinned") or []:
+            if isinstance(i, int) and 0 <= i < len(self.trimmed_chatlog):
+                self.pin_message(self.trimmed_chatlog[i])
         self.is_loaded = True
         self.is_set_up = save_dict["is_set_up"]
         self.max_chatlog_tokens = save_dict["token_info"]["max_chatlog_tokens"]
@@ -535,12 +1401,22 @@ class TrimChatLog:
         self.max_messages = save_dict["token_info"]["max_messages"]
         self.max_tokens = save_dict["token_info"]["max_tokens"]
         self.token_padding = save_dict["token_info"]["token_padding"]
+        # older saves counted neither the chat format overhead nor the reminder, so the saved totals aren't used
+        self._rework_tokens(recount=True)
+    def _messages_from_dicts(self, messages: list[dict], token_counts: list[int] = None) -> list[chat.Message]:
+        """Makes Message objects from message dictionaries, using the saved token counts if there is one for every message."""
+        if not isinstance(token_counts, list) or len(token_counts) != len(messages):
+            token_counts = [None] * len(messages)
+        return [
+            chat.Message(role=message["role"], content=message["content"], model=self.model, tokens=tokens)
+            for message, tokens in zip(messages, token_counts)
+        ]
     
     @property
     def user_message(self) -> str | None:
         """Returns the user message."""
-        for msg in self.get_messages(role="user", limit=1, reverse=True):
-            return msg.content if msg is not None else None
+        msg = self.trimmed_chatlog.last("user")
+        return msg.content if msg is not None else None
 
     @user_message.setter
     def user_message(self, value: str) -> None:
@@ -550,11 +1426,8 @@ class TrimChatLog:
 
     @property
     def user_message_as_Message(self) -> chat.Message:
-        """Adds a user message to the chat log, as a Message object."""
-        for msg in self.get_messages(role="user", limit=1, reverse=True):
-            if msg is not None:
-                return msg
-        return None
+        """Returns the last user message as a Message object."""
+        return self.trimmed_chatlog.last("user")
 
     @user_message_as_Message.setter
     def user_message_as_Message(self, value: chat.Message) -> None:
@@ -564,10 +1437,8 @@ class TrimChatLog:
     @property
     def assistant_message(self) -> str:
         """Returns the  last assistant message as a string."""
-        
-        for msg in self.get_messages(role="assistant", limit=1, reverse=True):
-            return msg.content if msg is not None else None
-        return None
+        msg = self.trimmed_chatlog.last("assistant")
+        return msg.content if msg is not None else None
 
     @assistant_message.setter
     def assistant_message(self, value: str) -> None:
@@ -577,25 +1448,15 @@ class TrimChatLog:
     @property
     def assistant_message_as_Message(self) -> chat.Message:
         """Returns the assistant message as a Message object."""
-        for msg in self.get_messages_as_list(role="assistant", limit=1, reverse=True,format=MessageReturnType.MESSAGE ):
-            return msg
-        return None
+        return self.trimmed_chatlog.last("assistant")
 
     @assistant_message_as_Message.setter
     def assistant_message_as_Message(self, value: chat.Message) -> None:
         """Adds an assistant message to the chat log, as a Message object."""
         self.add_message(value)
     def get_messages(self,  role: str = None, limit: int = None, reverse: bool = True ) -> Iterable[chat.Message]:
-        """Gets the messages from the chatlog as a list of Message objects."""
-        chatlog = reversed(self.trimmed_chatlog) if reverse else self.trimmed_chatlog
-        counter = 0 
-        for msg in chatlog:
-            if role is None or msg.role == role:
-                if limit is not None and counter >= limit:
-                    break
-               
-                counter += 1
-                yield msg
+        """Gets the messages from the trimmed chat log as Message objects, without copying it(see MessageWindow.view)."""
+        yield from self.trimmed_chatlog.view(role=role, reverse=reverse, limit=limit)
             
     def get_messages_as_list(self, role: str = None, limit: int = None, reverse: bool = True, format: str = MessageReturnType.MESSAGE) -> List[chat.Message | dict | str]:
         """Returns the messages from the chatlog as a list of Message objects, dictionaries, or strings.
@@ -659,16 +1520,36 @@ class TrimChatLog:
             "most_recent_message: " + str(self.most_recent_message),
             "model: " + str(self.model),
         ]
-        if self._has_chatlog():
+        if self.is_history_pending:
+            msg_list.append("Chatlog: Pending(loaded when first used)")
+            msg_list.append("Chatlog length: " + str(self._chatlog_length()))
+        elif self._has_chatlog():
             msg_list.append("Chatlog: " + repr(self.chatlog))
             msg_list.append("Chatlog length: " + str(len(self.chatlog)))
         else: 
             msg_list.append("Chatlog: Unset(No history beyond trimmed chatlog)")
+        stats = self.history_stats()
+        if stats is not None:
+            msg_list.append(f"History tokens: {stats['tokens']}, longest message: {stats['longest']}")
+            msg_list.append("History by role: " + ", ".join(f"{role} {totals['messages']} messages {totals['tokens']} tokens" for role, totals in stats["roles"].items()))
+            msg_list.append(f"Newest history messages that fit in max_chatlog_tokens: {stats['fitting_messages']}")
         if self._has_reminder: 
             msg_list.append("Reminder: " + str(self.reminder))
         else:
             msg_list.append("Reminder: None")
         return "\n".join(msg_list)
+    def history_stats(self) -> dict | None:
+        """Totals for the full chat log from its message arrays(see chat/arrays.py), without a loop over the messages: messages, tokens, longest, roles(messages and tokens of each role), first_time and last_time.
+        fitting_messages is how many of the newest messages would fit in max_chatlog_tokens(and max_messages) with their chat format overhead, worked out with a cumsum and a binary search.
+        Returns None while the history is pending(see Lazy Loading), without a chatlog or without numpy.
+        """
+        if self.is_history_pending or not self._has_chatlog() or not chat.arrays.is_available():
+            return None
+        message_arrays = self.chatlog.arrays
+        stats = message_arrays.stats()
+        overhead = {role: tokenizer.message_overhead(role, self.model) for role in message_arrays.role_names}
+        stats["fitting_messages"] = len(message_arrays) - message_arrays.fit_from_end(self.max_chatlog_tokens, overhead, self.max_messages)
+        return stats
     @property
     def pretty_trimmed_chatlog(self) -> str:
         """Returns a pretty string of the trimmed chat log"""
@@ -684,6 +1565,10 @@ class TrimChatLog:
             return self.chatlog.data
         else:
             return list(self.trimmed_chatlog)
+    def search(self, query: str, limit: int = 5, role: str = None) -> list[chat.SearchResult]:
+        """Searches the full chat log(loading it if it is still pending), see AbstractChatLog.search. Positions are indexes into the full chat log."""
+        self.logger.info(f"Searching chat history for: {query}")
+        return self.chatlog.search(query, limit=limit, role=role)
     def get_pretty_ish_chat_history(self) -> str:
         """Returns a pretty string of chat history, except it doesn't include the ASNI color codes.
         This is different from the regular pretty chat history, as it doesn't include the ASNI color codes. Meant to be used to show to users outside of the terminal.
@@ -0,0 +1,195 @@
+from collections import deque
+from typing import Iterable, Iterator, Sequence
+
+from chat.message import Message
+
+"""Copy free views over the messages of ChatLog and TrimChatLog.
+MessageView iterates a sequence of messages in either direction, optionally only the positions of one role, and stops at a limit, without copying anything.
+MessageWindow is the deque used for TrimChatLog's trimmed chat log, it keeps the positions of each role so the newest message of a role is O(1).
+"""
+# tests can be found in tests/test_views.py
+
+
+class MessageView:
+    """A lazy, copy free view of messages, iterated by index(or by the deque's own iterators) in either direction.
+    Args:
+        messages (Sequence): The messages, a list, deque or anything else that can be indexed and reversed.
+        positions (Sequence[int]): Optional, the positions of the messages to include(ie the positions of one role), in order. None includes every message.
+        offset (int): Subtracted from positions to get an index into messages, for windows whose positions don't start at 0(see MessageWindow).
+        reverse (bool): Newest first if True.
+        limit (int): Optional, the most messages to return.
+        pretty (bool): Returns the pretty string of each message instead of the message.
+    Methods:
+        first: Returns the first message of the view(the newest if reverse is True) or None, without iterating further.
+        __iter__, __len__
+    """
+
+    def __init__(
+        self,
+        messages: Sequence[Message],
+        positions: Sequence[int] = None,
+        offset: int = 0,
+        reverse: bool = True,
+        limit: int = None,
+        pretty: bool = False,
+    ):
+        self.messages = messages
+        self.positions = positions
+        self.offset = offset
+        self.reverse = reverse
+        self.limit = limit
+        self.pretty = pretty
+
+    def _iter_messages(self) -> Iterator[Message]:
+        if self.positions is None:
+            return reversed(self.messages) if self.reverse else iter(self.messages)
+        positions = reversed(self.positions) if self.reverse else iter(self.positions)
+        return (self.messages[position - self.offset] for position in positions)
+
+    def __iter__(self) -> Iterator[Message]:
+        if self.limit is not None and self.limit <= 0:
+            return
+        count = 0
+        for msg in self._iter_messages():
+            yield msg.pretty if self.pretty else msg
+            count += 1
+            if self.limit is not None and count >= self.limit:
+                return
+
+    def __len__(self) -> int:
+        total = len(self.messages) if self.positions is None else len(self.positions)
+        if self.limit is not None:
+            return max(0, min(total, self.limit))
+        return total
+
+    def first(self) -> Message | str | None:
+        for msg in self:
+            return msg
+        return None
+
+    def __repr__(self):
+        return f"MessageView({len(self)} messages, reverse={self.reverse}, limit={self.limit})"
+
+
+class MessageWindow(deque):
+    """A deque of messages that also keeps the position of every message of each role, used as TrimChatLog.trimmed_chatlog.
+    Positions count every message ever appended, so popping from the left(trimming) doesn't renumber anything: the message at position p is self[p - start].
+    append and popleft keep the role positions up to date in O(1). Anything else that changes the deque(appendleft, pop, insert, rotate, remove_ids...) marks them stale and they are rebuilt the next time they are used.
+    Methods:
+        last(role): Returns the newest message, or the newest message of a role, or None. O(1).
+        view(role, reverse, limit, pretty): Returns a MessageView of the window.
+    """
+
+    def __init__(self, iterable: Iterable[Message] = (), maxlen: int = None):
+        super().__init__(iterable, maxlen)
+        self.start = 0
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._role_positions: dict[str, deque[int]] = {}
+        for position, msg in enumerate(self, self.start):
+            self._role_positions.setdefault(msg.role, deque()).append(position)
+        self._stale = False
+
+    def _positions(self, role: str) -> deque:
+        if self._stale:
+            self._rebuild()
+        return self._role_positions.get(role, deque())
+
+    # ==========(TRACKED CHANGES)==========
+    def append(self, msg: Message) -> None:
+        if self.maxlen is not None and len(self) == self.maxlen:
+            if self.maxlen == 0:
+                return
+            self.popleft()
+        position = self.start + len(self)
+        super().append(msg)
+        if not self._stale:
+            self._role_positions.setdefault(msg.role, deque()).append(position)
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for msg in messages:
+            self.append(msg)
+
+    def popleft(self) -> Message:
+        msg = super().popleft()
+        if not self._stale:
+            self._role_positions[msg.role].popleft()
+        self.start += 1
+        return msg
+
+    def clear(self) -> None:
+        super().clear()
+        self.start = 0
+        self._role_positions = {}
+        self._stale = False
+
+    # ==========(UNTRACKED CHANGES)==========
+    def _mark_stale(self) -> None:
+        self._stale = True
+
+    def appendleft(self, msg: Message) -> None:
+        super().appendleft(msg)
+        self._mark_stale()
+
+    def extendleft(self, messages: Iterable[Message]) -> None:
+        super().extendleft(messages)
+        self._mark_stale()
+
+    def pop(self) -> Message:
+        msg = super().pop()
+        self._mark_stale()
+        return msg
+
+    def insert(self, index: int, msg: Message) -> None:
+        super().insert(index, msg)
+        self._mark_stale()
+
+    def remove(self, msg: Message) -> None:
+        super().remove(msg)
+        self._mark_stale()
+
+    def rotate(self, n: int = 1) -> None:
+        super().rotate(n)
+        self._mark_stale()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._mark_stale()
+
+    def __setitem__(self, index, msg) -> None:
+        super().__setitem__(index, msg)
+        self._mark_stale()
+
+    def __delitem__(self, index) -> None:
+        super().__delitem__(index)
+        self._mark_stale()
+
+    def remove_ids(self, ids: set[int]) -> None:
+        """Removes every message whose id is in ids in one pass, used to evict messages from the middle(see chat/eviction.py)."""
+        kept = [msg for msg in self if id(msg) not in ids]
+        super().clear()
+        super().extend(kept)
+        self._mark_stale()
+
+    def __iadd__(self, messages: Iterable[Message]):
+        self.extend(messages)
+        return self
+
+    # ==========(VIEWS)==========
+    def last(self, role: str = None) -> Message | None:
+        """Returns the newest message, or the newest message of a role, or None if there isn't one."""
+        if role is None:
+            return self[-1] if len(self) > 0 else None
+        positions = self._positions(role)
+        if len(positions) == 0:
+            return None
+        return self[positions[-1] - self.start]
+
+    def view(self, role: str = None, reverse: bool = True, limit: int = None, pretty: bool = False) -> MessageView:
+        """Returns a MessageView of the window, optionally of one role."""
+        positions = None if role is None else self._positions(role)
+        return MessageView(self, positions=positions, offset=self.start, reverse=reverse, limit=limit, pretty=pretty)
+
+    def __reduce__(self):
+        return (type(self), (list(self), self.maxlen))
@@ -0,0 +1,198 @@
+import datetime
+import re
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Hashable
+
+from chat import tokenizer
+
+"""Wildcards for the system prompt and reminder, ||name|| in the text is replaced with the value of the wildcard called name.
+WildcardRenderer compiles a text once into literal and wildcard segments and renders it with a single join.
+Each Wildcard caches its value for its lifetime, and each renderer caches the token count of the last text it rendered, so a prompt is only counted again when a value in it changes.
+"""
+# tests can be found in tests/test_wildcards.py
+
+WILDCARD_PATTERN = re.compile(r"\|\|(\w+)\|\|")
+
+# what a wildcard is rendered with, now is rounded down to time_granularity seconds
+WildcardContext = namedtuple("WildcardContext", ["model", "now", "time_granularity"])
+
+
+class Wildcard:
+    """A value that ||name|| is replaced with, see register_wildcard.
+    Args:
+        name (str): The name used in the text, without the ||.
+        value (Callable[[WildcardContext], str]): Returns the value, given the model and the current time.
+        description (str): What the value is.
+        lifetime (float): How many seconds a value is used before value is called again. None(the default) never calls it again, 0 calls it every render.
+        per_model (bool): Whether the value depends on the model, and is worked out again when it changes.
+        key (Callable[[WildcardContext], Hashable]): Replaces the lifetime and per_model, the value is worked out again when the key changes.
+    Methods:
+        render(context) -> str: The value, from the cache if the key hasn't changed.
+        cache_key(context) -> Hashable: The key of the value for a context, None if it is never cached.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        value: Callable[[WildcardContext], str],
+        description: str = "",
+        lifetime: float = None,
+        per_model: bool = False,
+        key: Callable[[WildcardContext], Hashable] = None,
+    ) -> None:
+        self.name = name
+        self.value = value
+        self.description = description
+        self.lifetime = lifetime
+        self.per_model = per_model
+        self.key = key
+        self._lock = threading.Lock()
+        self._cached: tuple[Hashable, str] = None
+
+    def cache_key(self, context: WildcardContext) -> Hashable:
+        if self.key is not None:
+            return self.key(context)
+        if self.lifetime == 0:
+            return None
+        bucket = int(time.time() // self.lifetime) if self.lifetime is not None else 0
+        return (context.model, bucket) if self.per_model else bucket
+
+    def render(self, context: WildcardContext) -> str:
+        key = self.cache_key(context)
+        cached = self._cached
+        if key is not None and cached is not None and cached[0] == key:
+            return cached[1]
+        value = str(self.value(context))
+        if key is not None:
+            with self._lock:
+                self._cached = (key, value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"Wildcard(name={self.name}, lifetime={self.lifetime}, per_model={self.per_model}, description={self.description})"
+
+
+registry: dict[str, Wildcard] = {}
+# bumped by register_wildcard and unregister_wildcard, renderers compiled before then compile again
+_registry_version = 0
+
+
+def register_wildcard(wildcard: Wildcard) -> None:
+    """Adds a wildcard(or replaces the one with the same name) for every system prompt and reminder."""
+    global _registry_version
+    registry[wildcard.name] = wildcard
+    _registry_version += 1
+
+
+def unregister_wildcard(name: str) -> None:
+    """Removes a wildcard, ||name|| is then left as it is."""
+    global _registry_version
+    registry.pop(name, None)
+    _registry_version += 1
+
+
+def make_context(model: str, time_granularity: int = 0) -> WildcardContext:
+    """Makes the context to render with now, with the time rounded down to time_granularity seconds if it is over 0."""
+    now = datetime.datetime.now()
+    if time_granularity > 0:
+        now = now.replace(microsecond=0)
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
+        now -= datetime.timedelta(seconds=seconds % time_granularity)
+    return WildcardContext(model, now, time_granularity)
+
+
+register_wildcard(Wildcard("model", lambda context: context.model, "The name of the model.", per_model=True))
+register_wildcard(Wildcard("cut_off", lambda context: "September 21, 2021", "The cut off for the chat log."))
+register_wildcard(Wildcard("date", lambda context: context.now.strftime("%B %d, %Y"), "the current date.", key=lambda context: context.now.date()))
+register_wildcard(
+    Wildcard(
+        "time",
+        lambda context: context.now.strftime("%H:%M:%S"),
+        "the current time.",
+        key=lambda context: context.now.replace(microsecond=0),
+    )
+)
+
+
+class WildcardRenderer:
+    """Renders a text with wildcards, compiled once into literal and wildcard segments.
+    Args:
+        template (str): The text, with ||name|| wildcards. Names that aren't registered are left as they are.
+    Rendering:
+        render(context) gets each wildcard's value once(see Wildcard.render for the caching) and joins the segments, the text is kept until a value(or the model) changes.
+        count_tokens(context) counts the rendered text, and keeps the count with the text.
+        The whole text is counted rather than each segment, tokens can merge across the edges of a wildcard so counting segments on their own can be off by a token.
+    Methods:
+        render(context) -> str: The text with the wildcards filled in.
+        count_tokens(context) -> int: The number of tokens in the rendered text.
+        render_with_tokens(context) -> tuple[str, int]: Both, with the wildcard values worked out once.
+        is_static -> bool: True if the text has no wildcards.
+    """
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        self._compile()
+
+    def _compile(self) -> None:
+        self._version = _registry_version
+        self._segments: list[str] = []
+        # index in segments of each slot, and the index of its wildcard in _wildcards
+        self._slots: list[tuple[int, int]] = []
+        # each wildcard used, once, however many times it is in the text
+        self._wildcards: list[Wildcard] = []
+        position = 0
+        for match in WILDCARD_PATTERN.finditer(self.template):
+            wildcard = registry.get(match.group(1))
+            if wildcard is None:
+                continue
+            if wildcard not in self._wildcards:
+                self._wildcards.append(wildcard)
+            self._segments.append(self.template[position:match.start()])
+            self._slots.append((len(self._segments), self._wildcards.index(wildcard)))
+            self._segments.append("")
+            position = match.end()
+        self._segments.append(self.template[position:])
+        self._rendered = None
+
+    @property
+    def is_static(self) -> bool:
+        if self._version != _registry_version:
+            self._compile()
+        return len(self._slots) == 0
+
+    def _render(self, context: WildcardContext) -> list:
+        """Returns [key, text, tokens] of the text rendered with context, from the last render if no value(or the model) changed. tokens is None until counted."""
+        if self._version != _registry_version:
+            self._compile()
+        values = tuple(wildcard.render(context) for wildcard in self._wildcards)
+        key = (context.model, values)
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == key:
+            return rendered
+        if len(self._slots) == 0:
+            text = self.template
+        else:
+            segments = list(self._segments)
+            for index, value_index in self._slots:
+                segments[index] = values[value_index]
+            text = "".join(segments)
+        rendered = [key, text, None]
+        self._rendered = rendered
+        return rendered
+
+    def render(self, context: WildcardContext) -> str:
+        return self._render(context)[1]
+
+    def count_tokens(self, context: WildcardContext) -> int:
+        return self.render_with_tokens(context)[1]
+
+    def render_with_tokens(self, context: WildcardContext) -> tuple[str, int]:
+        rendered = self._render(context)
+        if rendered[2] is None:
+            rendered[2] = tokenizer.count_tokens(rendered[1], context.model)
+        return rendered[1], rendered[2]
+
+    def __repr__(self) -> str:
+        return f"WildcardRenderer(template={self.template!r}, wildcards={[wildcard.name for wildcard in self._wildcards]})"
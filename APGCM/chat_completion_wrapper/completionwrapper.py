@@ -1,4 +1,5 @@
 import chat_completion_wrapper.parameters
+import copy
 from handler.stream_handler import AbstractStreamOutputHandler, StdoutStreamHandler
 from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
 import uuid 
@@ -32,6 +33,7 @@ class ChatCompletionWrapper:
         Save/Load:
             make_save_dict: returns a dictionary that can be used to save the state of the ChatCompletionWrapper.
             load_from_save_dict: loads the state of the ChatCompletionWrapper from a save dict, raises a BadSaveDictionaryError if the save dict is invalid.
+            fork: returns a copy with its own parameters, used by ChatWrapper.fork.
         Misc:
             __repr__: returns a string representation of the ChatCompletionWrapper object.
             __str__: returns a string representation of the ChatCompletionWrapper object.
@@ -89,13 +91,19 @@ class ChatCompletionWrapper:
         See ModelParameters class for more information.
         """
         self.parameters.set_params(**kwargs)
-    def stream_chat(self, messages: list[dict] ) -> openai.ChatCompletion:
-        """Returns a ChatCompletion object directly from the OpenAI API, without any modifications."""
+    def _request_kwargs(self, max_tokens: int = None) -> dict:
+        """The parameters of a request, with max_tokens replaced for this request only if it is given."""
+        kwargs = self.parameters.get_param_kwargs()
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        return kwargs
+    def stream_chat(self, messages: list[dict], max_tokens: int = None) -> openai.ChatCompletion:
+        """Returns a ChatCompletion object directly from the OpenAI API, without any modifications. max_tokens replaces the max_tokens parameter for this request(ie the completion_tokens of an adaptive TrimChatLog)."""
         openai.api_key = self.API_KEY
         tries = 3
         while True:
             try:
-                return openai.ChatCompletion.create(model=self.model, messages=self._verify_messages(messages), **self.parameters.get_param_kwargs())
+                return openai.ChatCompletion.create(model=self.model, messages=self._verify_messages(messages), **self._request_kwargs(max_tokens))
 
             except openai.OpenAIError as e:
                 tries -= 1
@@ -105,23 +113,23 @@ class ChatCompletionWrapper:
                 print("Retrying {} more times".format(tries))
                 time.sleep(5)
                 continue
-    def chat(self, messages: list[dict]) -> str:
-        """Main method for the ChatCompletionWrapper class, takes a list of messages and returns a response as a string. """
+    def chat(self, messages: list[dict], max_tokens: int = None) -> str:
+        """Main method for the ChatCompletionWrapper class, takes a list of messages and returns a response as a string. max_tokens replaces the max_tokens parameter for this request."""
         openai.api_key = self.API_KEY
         tries = 3 
         while True:
             try:
                 if not self._is_streaming():
-                    self.logger.debug(self.parameters.get_param_kwargs())
+                    self.logger.debug(self._request_kwargs(max_tokens))
                     response = openai.ChatCompletion.create(
                         model = self.model,
                         messages = self._verify_messages(messages),
-                        **self.parameters.get_param_kwargs()
+                        **self._request_kwargs(max_tokens)
                     )
                     return response.choices[0].message.content
                 else:
                     
-                    response = openai.ChatCompletion.create(model=self.model, messages=self._verify_messages(messages),  **self.parameters.get_param_kwargs())
+                    response = openai.ChatCompletion.create(model=self.model, messages=self._verify_messages(messages),  **self._request_kwargs(max_tokens))
                     response_str = ""
                     for event in response:
                        stop_reason = event.choices[0].finish_reason
@@ -173,6 +181,12 @@ class ChatCompletionWrapper:
             "parameters": self.parameters.make_save_dict(),
             
         }
+    def fork(self) -> "ChatCompletionWrapper":
+        """Returns a copy with its own parameters(and uuid) that share the logger and stream handler, so the parameters can be changed without changing this one."""
+        forked = copy.copy(self)
+        forked.parameters = copy.copy(self.parameters)
+        forked.uuid = str(uuid.uuid4())
+        return forked
     def _check_save_dict(self, save_dict: dict ) -> dict:
         """Checks that the save dict is valid, returns a valid save dict Raises BadSaveDictionaryError if the save dict is invalid."""
         if not isinstance(save_dict, dict):
@@ -1,3 +1,4 @@
+import copy
 import datetime
 import json
 import logging
@@ -12,7 +13,9 @@ import func as f
 import openai
 import tiktoken
 from chat.chatlog import ChatLog
+from chat.compaction import CompletionSummarizer
 from chat.message import Message, MessageFactory
+from chat.profiles import ModeProfile
 from chat.system_prompt import SystemPrompt
 from chat.trim_chat_log import TrimChatLog
 from chat_completion_wrapper import (
@@ -22,6 +25,7 @@ from chat_completion_wrapper import (
     param_info,
 )
 from chat_wrapper.rotate_save import RotatingSave
+from chat_wrapper.snapshots import Snapshot, SnapshotInfo, SnapshotStack
 from handler.save_handler import AbstractCWSaveHandler
 from handler.stream_handler import AbstractStreamOutputHandler
 from log_config import DEFAULT_LOGGING_LEVEL, BaseLogger
@@ -95,6 +99,7 @@ class ChatWrapper:
             message_factory (MessageFactory): The MessageFactory object
             logger (BaseLogger): The logger object for logging(pre-configured logging object )
             rotating_save_handler (RotatingSave): The rotating save handler object
+            snapshots (SnapshotStack): The states the ChatWrapper object can go back to, see push_snapshot
             save_handler (AbstractCWSaveHandler): The save handler object
             stream_handler (AbstractStreamOutputHandler): The stream handler object
             
@@ -127,11 +132,12 @@ class ChatWrapper:
         --------------------
         3. Making/Managing Objects:
         Methods for creating and managing the main objects used by the ChatWrapper object
-            make_trim_object(max_tokens: int = 8000, max_completion: int = 1000, system_prompt: str = None, token_padding: int = 500, max_messages: int = 400) -> None: Creates a TrimChatLog object with the given parameters
+            make_trim_object(max_tokens: int = 8000, max_completion: int = 1000, system_prompt: str = None, token_padding: int = 0, max_messages: int = 400) -> None: Creates a TrimChatLog object with the given parameters
             make_chat_completion_wrapper(**kwargs) -> None: Creates a ChatCompletionWrapper object with the given parameters
             set_trim_object(trim_object: TrimChatLog) -> None: Sets the TrimChatLog object to the given object
             set_chat_completion_wrapper(completion_wrapper: ChatCompletionWrapper) -> None: Sets the ChatCompletionWrapper object to the given object
             set_trim_token_info(**kwargs) -> None: Sets the token info of the TrimChatLog object to the given parameters
+            use_model_summarizer(completion_wrapper: ChatCompletionWrapper = None) -> None: Turns on compaction in the TrimChatLog object, with the model summarizing the trimmed messages
         --------------------
         4. Special Values that must be the same across both objects:
         The following follows are synced across both objects
@@ -149,6 +155,7 @@ class ChatWrapper:
         Allows you to set the parameters of the TrimChatLog object and add messages directly to the log without sending anything to the model(While auto-saving if enabled )
             system_prompt (str): The system prompt to use (Setter and getter)
             reminder (str): The reminder to use (Setter and getter)
+            apply_profile(profile: ModeProfile | str) -> None: Sets the system prompt and reminder of a mode profile at once(see chat/profiles.py)
             user_message (str): The most recent user message as a string (Getter And Setter )
             assistant_message (str): The most recent assistant message as a string (Getter And Setter )
             get_most_recent_Message(role: str = User, pretty: bool = False) -> Message: Returns the most recent message as a Message object of a given role. Raises an error if the role is not valid. If pretty is True, returns the message as a pretty string.
@@ -166,6 +173,10 @@ class ChatWrapper:
             all_entry_names() -> List[str]: Returns a list of all the save names.(Getter)
             make_save_dict() -> dict: Makes a save dict from the ChatWrapper object
             load_from_save_dict(save_dict: dict) -> None: Loads the ChatWrapper object from the given save dict
+            fork() -> ChatWrapper: A ChatWrapper that carries on from this point separately without a save and load, the history is shared rather than copied(see TrimChatLog Forking)
+            push_snapshot(label: str = None) -> SnapshotInfo: Keeps the current state on the snapshot stack to go back to later(ie before help mode) and carries on with a fork of it
+            pop_snapshot() -> SnapshotInfo: Goes back to the newest snapshot, removing it from the stack. Raises SnapshotStackEmptyError if there isn't one.
+            peek_snapshot() -> SnapshotInfo | None: The label, time and size of the newest snapshot without going back to it
         --------------------   
         9. Handlers:
         Methods for adding handlers to the ChatWrapper object
@@ -357,6 +368,7 @@ class ChatWrapper:
         self.rotating_save_handler = RotatingSave(
             self.save_handler
         )  # can deal with save handler being None
+        self.snapshots = SnapshotStack(save_handler=self.save_handler)
         # load in the default values for the rotating save, can be changed with the set_rotating_save_params method
         self._auto_save_frequency = SETTINGS_BAG.AUTO_SAVE_FREQUENCY
         self._auto_save_max_saves = SETTINGS_BAG.AUTO_SAVE_MAX_SAVES
@@ -381,7 +393,7 @@ class ChatWrapper:
         user_message = self._process_user_message(user_message)
         self.trim_object.user_message_as_Message = user_message
         response_object = self.completion_wrapper.stream_chat(
-            self.trim_object.get_finished_chatlog()
+            self.trim_object.get_finished_chatlog(), **self._request_kwargs()
         )
 
         response_str = ""
@@ -422,7 +434,7 @@ class ChatWrapper:
 
         try:
             response = self.completion_wrapper.chat(
-                self.trim_object.get_finished_chatlog()
+                self.trim_object.get_finished_chatlog(), **self._request_kwargs()
             )
 
         except openai.OpenAIError as e:
@@ -434,6 +446,12 @@ class ChatWrapper:
 
         return self._format_return(response)
 
+    def _request_kwargs(self) -> dict:
+        """Extra arguments for the request just made by get_finished_chatlog: max_tokens is the trim object's completion_tokens if it is adaptive(see TrimChatLog Adaptive Completion), otherwise the completion wrapper's parameters are used."""
+        if self.trim_object.adaptive_completion:
+            return {"max_tokens": self.trim_object.completion_tokens}
+        return {}
+
     def reset(self) -> None:
         """Resets the trim chat log object but doesn't reset the completion wrapper object."""
         self.logger.info("Chat Wrapper Reseting")
@@ -502,7 +520,7 @@ class ChatWrapper:
             max_tokens: int The maximum number of tokens the model can work with. Typically the max for model, but can be lower to save money(costs are per token).
             max_completion: int The maximum number of tokens the model can use on completion. Used to work out how many tokens can be included in the finished chat log.
             system_prompt: str The system prompt to use for the TrimChatLog object.
-            token_padding: int The number of tokens to subtract from the max_tokens to prevent errors in case tokens are counted incorrectly or other parameters take up more tokens than expected.
+            token_padding: int Extra tokens to subtract from the max_tokens as a safety margin. The system prompt, reminder and chat format overhead are already counted exactly, so 0 by default.
             max_messages: int The maximum number of messages allowed in the trimmed chat log. Generally this is not reached however if it is the oldest messages are removed. Used to save on resources(trimming off and managing too many messages can be slow). Set to None to disable.
         Completion Parameters:
             temperature: float The temperature to use for completion. Higher temperatures make the model more creative, but also more nonsensical. Must be between 0 and 2(but 0-1 is recommended).
@@ -535,7 +553,7 @@ class ChatWrapper:
         max_tokens: int = 8000,
         max_completion: int = 1000,
         system_prompt: str = None,
-        token_padding: int = 500,
+        token_padding: int = 0,
         max_messages: int = 400,
     ) -> None:
         """Creates a TrimChatLog object with the given parameters."""
@@ -603,6 +621,19 @@ class ChatWrapper:
         """
         self.trim_object.set_token_info(**kwargs)
 
+    def use_model_summarizer(self, completion_wrapper: ChatCompletionWrapper = None) -> None:
+        """Turns on compaction in the TrimChatLog object(see chat/compaction.py) with the trimmed messages summarized by a model.
+        The summary requests are sent with completion_wrapper(ie a cheaper model) on the compactor's background thread. By default a fork of the one used for chatting with the default parameters and no stream handler, so summaries are never streamed to the user and don't use the chat's temperature and so on.
+        """
+        if completion_wrapper is None:
+            completion_wrapper = self.completion_wrapper.fork()
+            completion_wrapper.parameters = ModelParameters()
+            completion_wrapper.add_stream_output_handler(None)
+            completion_wrapper.stream = False
+        self.trim_object.compaction = True
+        self.trim_object.compactor.summarizer = CompletionSummarizer(completion_wrapper)
+        self.logger.info("Model summarizer set for compaction")
+
     # ==========================================================================
     # ========(SPECIAL VALUES THAT MUST BE THE SAME ACROSS BOTH OBJECTS)========
 
@@ -730,6 +761,12 @@ class ChatWrapper:
             reminder = "None"
         self.logger.debug("Reminder set to: " + reminder)
 
+    def apply_profile(self, profile: ModeProfile | str) -> None:
+        """Switches the system prompt and reminder to those of a mode profile, or the name of a registered one(see TrimChatLog Mode Profiles)."""
+        self._check_setup("trim")
+        self.trim_object.apply_profile(profile)
+        self.logger.debug(f"Mode profile applied: {self.trim_object.raw_system_prompt}")
+
     @property
     def user_message(self) -> str:
         """The most recent user message as a string."""
@@ -850,7 +887,7 @@ class ChatWrapper:
         saves = self.save_handler.entry_names
         result = []
         for saves in saves:
-            if self.rotating_save_handler.is_auto_save(saves):
+            if self.rotating_save_handler.is_auto_save(saves) or self.snapshots.is_snapshot_entry(saves):
                 continue 
             else:
                 result.append(saves)
@@ -881,6 +918,72 @@ class ChatWrapper:
         self.logger.info("Chat Wrapper Dictionary Created")
         return save_dict
 
+    def fork(self) -> "ChatWrapper":
+        """Returns a ChatWrapper that carries on from this point separately, ie to try another mode, prompt or parameters and then go back to this one. Costs about the same however long the history is, see TrimChatLog Forking.
+        The trim object is forked(sharing the history with this one) and the completion wrapper gets its own parameters. The save, stream and rotating save handlers are shared, so the fork doesn't auto save(both would write the same auto saves), set_is_saving(True) turns it on.
+        To discard the fork just drop it, to keep it use it instead of this one.
+        """
+        self._check_setup()
+        forked = ChatWrapper.__new__(type(self))
+        forked.__dict__.update(self.__dict__)
+        forked.uuid = str(uuid.uuid4())
+        forked.constructor_args = dict(self.constructor_args)
+        forked.trim_object = self.trim_object.fork()
+        forked.completion_wrapper = self.completion_wrapper.fork()
+        forked.message_factory = copy.copy(self.message_factory)
+        forked.snapshots = self.snapshots.fork()
+        forked._is_autosaving = False
+        forked._auto_save_counter = 0
+        self.logger.info(f"Chat Wrapper Forked as {forked.uuid}")
+        return forked
+
+    # Snapshots
+    # A snapshot keeps the objects in use(the trim object, completion wrapper...) on a bounded stack(SNAPSHOT_STACK_SIZE, the oldest are dropped) and the ChatWrapper carries on with forks of them(see fork), so taking one costs about the same however long the history is and going back to it is swapping objects, no save or load.
+    # Only the forks are changed until the snapshot is popped, so resetting the chat log(ie for help mode) clears the fork and never the snapshot's history, even when it is in a file or database(see StoredChatLog Forking).
+    # With a save handler and SNAPSHOT_SPILL_AFTER set, the oldest snapshots past that many are written to the save handler by a background thread, and read back if they are popped.
+    _snapshot_attributes = ("_model", "trim_object", "completion_wrapper", "message_factory", "return_type", "template", "is_trimmed_setup", "is_completion_setup", "is_loaded")
+
+    def push_snapshot(self, label: str = None) -> SnapshotInfo:
+        """Keeps the current state on the snapshot stack, to go back to it with pop_snapshot, and carries on with forks of it. Returns the label, time and size of the snapshot."""
+        forked = self.fork()
+        # the snapshot keeps the objects in use, this carries on with the forks
+        for name in self._snapshot_attributes:
+            original = getattr(self, name)
+            setattr(self, name, getattr(forked, name))
+            setattr(forked, name, original)
+        snapshot = Snapshot(label, forked, self._is_autosaving)
+        self.snapshots.push(snapshot)
+        self.logger.info(f"Snapshot {snapshot!r} pushed, {len(self.snapshots)} on the stack")
+        return snapshot.info
+
+    def pop_snapshot(self) -> SnapshotInfo:
+        """Goes back to the newest snapshot, dropping the current state and removing the snapshot from the stack. The uuid, handlers and auto save settings stay, whether it auto saves is restored.
+        The chat log of the dropped state is reset, so a stored chat log deletes what it stored since the snapshot(never the snapshot's history, see Snapshots), and its compactor is closed without waiting for a batch it is summarizing.
+        Raises SnapshotStackEmptyError if there are no snapshots.
+        """
+        snapshot = self.snapshots.pop()
+        self.trim_object.reset()
+        if self.trim_object.compactor is not None:
+            self.trim_object.compactor.close(wait=False)
+        if snapshot.is_spilled:
+            current_uuid = self.uuid
+            self.load_from_save_dict(self.snapshots.load(snapshot))
+            self.uuid = current_uuid
+        else:
+            for name in self._snapshot_attributes:
+                setattr(self, name, getattr(snapshot.wrapper, name))
+        if self._has_stream_handler():
+            self._add_stream_to_completion_wrapper()
+        self._is_autosaving = snapshot.is_autosaving
+        self._auto_save_counter = 0
+        self.logger.info(f"Snapshot {snapshot!r} popped, {len(self.snapshots)} left on the stack")
+        return snapshot.info
+
+    def peek_snapshot(self) -> SnapshotInfo | None:
+        """Returns the label, time and size of the newest snapshot, or None if there are none."""
+        snapshot = self.snapshots.peek()
+        return snapshot.info if snapshot is not None else None
+
     def load_from_save_dict(self, save_dict: dict) -> None:
         """Loads the ChatWrapper object from the given save dictionary."""
         self.auto_setup()
@@ -913,6 +1016,7 @@ class ChatWrapper:
                 + str(type(save_handler))
             )
         self.save_handler = save_handler
+        self.snapshots.save_handler = save_handler
         self.setup_auto_saving()
         self.logger.info("Save Handler Added")
 
@@ -0,0 +1,176 @@
+import copy
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import exceptions
+from handler.save_handler import AbstractCWSaveHandler
+from log_config import DEFAULT_LOGGING_LEVEL, BaseLogger
+from settings import SETTINGS_BAG
+
+"""The snapshot stack of a ChatWrapper(see ChatWrapper Snapshots), the state of the ChatWrapper at points it can go back to, newest on top.
+Used by the discord bot to go into help mode and come back out of it without saving and loading the chat.
+"""
+# tests can be found in tests/test_snapshots.py
+
+SnapshotInfo = namedtuple("SnapshotInfo", ["label", "created", "messages", "spilled"])
+
+
+class Snapshot:
+    """The state of a ChatWrapper at one point, a ChatWrapper holding the objects it was using then, which are never changed(the ChatWrapper carries on with forks of them, see ChatWrapper Snapshots), so it costs about the same however long the history is.
+    Once spilled, the wrapper is replaced by the name of the save handler entry it was written to.
+    Attributes:
+        label (str): What the snapshot is for, ie "help_mode".
+        created (float): When the snapshot was taken.
+        messages (int): The messages in the chat log when the snapshot was taken.
+        wrapper (ChatWrapper): The objects the ChatWrapper was using, None once spilled.
+        is_autosaving (bool): Whether the ChatWrapper was auto saving.
+        entry_name (str): The save handler entry of a spilled snapshot.
+        save_handler (AbstractCWSaveHandler): The save handler a spilled snapshot was written to.
+        save_dict (dict): The save of a spilled snapshot until it is written.
+        write (Future): The write of a spilled snapshot.
+    """
+
+    def __init__(self, label: str, wrapper, is_autosaving: bool) -> None:
+        self.label = label
+        self.created = time.time()
+        self.messages = len(wrapper.trim_object.chatlog) if wrapper.trim_object.chatlog is not None else 0
+        self.wrapper = wrapper
+        self.is_autosaving = is_autosaving
+        self.entry_name: str = None
+        self.save_handler: AbstractCWSaveHandler = None
+        self.save_dict: dict = None
+        self.write: Future = None
+
+    @property
+    def is_spilled(self) -> bool:
+        return self.entry_name is not None
+
+    @property
+    def info(self) -> SnapshotInfo:
+        return SnapshotInfo(self.label, self.created, self.messages, self.is_spilled)
+
+    def __repr__(self) -> str:
+        return f"Snapshot({self.label!r}, {self.messages} messages{', spilled' if self.is_spilled else ''})"
+
+
+class SnapshotStack:
+    """A bounded stack of Snapshots, see ChatWrapper Snapshots.
+    Only the newest max_snapshots are kept, pushing another drops the oldest. Past spill_after snapshots in memory the oldest in memory are spilled to the save handler, written by a background thread so pushing never waits on the disk. Popping a spilled snapshot reads it back, the only time the stack waits on the save handler.
+    Args:
+        max_snapshots (int): The most snapshots kept. Defaults to SNAPSHOT_STACK_SIZE.
+        spill_after (int): The most snapshots kept in memory when there is a save handler, 0 never spills. Defaults to SNAPSHOT_SPILL_AFTER.
+        save_handler (AbstractCWSaveHandler): Where spilled snapshots are written, None keeps them all in memory.
+        prefix (str): The start of the entry names of spilled snapshots.
+    Methods:
+        push(snapshot), pop() -> Snapshot, peek() -> Snapshot | None: The stack, pop raises SnapshotStackEmptyError if it is empty.
+        load(snapshot) -> dict: The save of a spilled snapshot, removing its entry.
+        clear(): Drops every snapshot.
+        fork() -> SnapshotStack: An empty stack with the same settings.
+        is_snapshot_entry(entry_name) -> bool: Whether an entry is a spilled snapshot.
+        wait(): Waits for the background writes and deletes.
+    """
+
+    def __init__(
+        self,
+        max_snapshots: int = SETTINGS_BAG.SNAPSHOT_STACK_SIZE,
+        spill_after: int = SETTINGS_BAG.SNAPSHOT_SPILL_AFTER,
+        save_handler: AbstractCWSaveHandler = None,
+        prefix: str = "SS_",
+    ) -> None:
+        if not isinstance(max_snapshots, int) or max_snapshots < 1:
+            raise exceptions.BadTypeError(f"max_snapshots must be an int of at least 1, not {max_snapshots!r}")
+        if not isinstance(spill_after, int) or spill_after < 0:
+            raise exceptions.BadTypeError(f"spill_after must be an int of at least 0, not {spill_after!r}")
+        self.logger = BaseLogger(__file__, "chat_wrapper.log", "snapshot_stack", level=DEFAULT_LOGGING_LEVEL)
+        self.max_snapshots = max_snapshots
+        self.spill_after = spill_after
+        self.save_handler = save_handler
+        self.prefix = prefix
+        self._snapshots: list[Snapshot] = []
+        self._writer: ThreadPoolExecutor = None
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def push(self, snapshot: Snapshot) -> None:
+        self._snapshots.append(snapshot)
+        while len(self._snapshots) > self.max_snapshots:
+            dropped = self._snapshots.pop(0)
+            self.logger.info(f"Snapshot stack full, dropped {dropped!r}")
+            self._discard(dropped)
+        if self.spill_after > 0 and self.save_handler is not None:
+            in_memory = [snapshot for snapshot in self._snapshots if not snapshot.is_spilled]
+            for oldest in in_memory[: len(in_memory) - self.spill_after]:
+                self._spill(oldest)
+
+    def pop(self) -> Snapshot:
+        if not self._snapshots:
+            raise exceptions.SnapshotStackEmptyError()
+        return self._snapshots.pop()
+
+    def peek(self) -> Snapshot | None:
+        return self._snapshots[-1] if self._snapshots else None
+
+    def clear(self) -> None:
+        while self._snapshots:
+            self._discard(self._snapshots.pop())
+
+    def fork(self) -> "SnapshotStack":
+        """Returns an empty stack with the same settings, save handler and logger, for ChatWrapper.fork. Snapshots belong to one ChatWrapper."""
+        forked = copy.copy(self)
+        forked._snapshots = []
+        forked._writer = None
+        return forked
+
+    def is_snapshot_entry(self, entry_name: str) -> bool:
+        return entry_name.startswith(self.prefix)
+
+    def _spill(self, snapshot: Snapshot) -> None:
+        """Replaces a snapshot's wrapper with its save, written by the background thread. The save is made here, only the disk is left to the thread."""
+        snapshot.save_dict = snapshot.wrapper.make_save_dict()
+        snapshot.wrapper = None
+        snapshot.entry_name = f"{self.prefix}{uuid.uuid4()}"
+        snapshot.save_handler = self.save_handler
+        snapshot.write = self._submit(self._write, snapshot)
+        self.logger.info(f"Spilling {snapshot!r} to {snapshot.entry_name}")
+
+    def _write(self, snapshot: Snapshot) -> None:
+        snapshot.save_handler.write_entry(snapshot.entry_name, snapshot.save_dict, overwrite=True)
+        snapshot.save_dict = None
+
+    def load(self, snapshot: Snapshot) -> dict:
+        """Returns the save of a spilled snapshot once it is written, and deletes its entry in the background. If it couldn't be written the save is still in memory."""
+        try:
+            snapshot.write.result()
+        except Exception as e:
+            self.logger.error(f"Writing {snapshot!r} failed, using the save kept in memory: {e!r}")
+        if snapshot.save_dict is not None:
+            return snapshot.save_dict
+        save_dict = snapshot.save_handler.read_entry(snapshot.entry_name)
+        self._submit(snapshot.save_handler.delete_entry, snapshot.entry_name)
+        return save_dict
+
+    def _discard(self, snapshot: Snapshot) -> None:
+        if snapshot.is_spilled:
+            self._submit(self._delete, snapshot)
+
+    def _delete(self, snapshot: Snapshot) -> None:
+        snapshot.write.result()
+        if snapshot.save_handler.check_entry(snapshot.entry_name):
+            snapshot.save_handler.delete_entry(snapshot.entry_name)
+
+    def _submit(self, fn, *args) -> Future:
+        """Runs fn on the writer thread, one at a time in order, so an entry is always written before it is deleted."""
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SnapshotStack")
+        return self._writer.submit(fn, *args)
+
+    def wait(self) -> None:
+        """Waits for the writes and deletes started so far."""
+        if self._writer is not None:
+            self._submit(lambda: None).result()
+
+    def __repr__(self) -> str:
+        return f"SnapshotStack({len(self)}/{self.max_snapshots} snapshots, {sum(snapshot.is_spilled for snapshot in self._snapshots)} spilled)"
@@ -195,4 +195,58 @@ class BadMessageReturnTypeError(PrettyGoodError):
         if msg is None:
             msg = "Bad message return type. Must be one of the following: 'str', 'dict', 'Message', 'pretty'"
         self.message = msg
-    
\ No newline at end of file
+    
+# for file_handlers.serializers
+class UnknownCodecError(PrettyGoodError):
+    def __init__(self, codec: str = None, allowed_codecs: list = None):
+        self.codec = codec
+        self.allowed_codecs = allowed_codecs
+        self.message = f"Unknown save codec {codec}, must be one of {allowed_codecs}"
+class CodecNotAvailableError(PrettyGoodError):
+    def __init__(self, codec: str = None, requires: str = None):
+        self.codec = codec
+        self.requires = requires
+        self.message = f"The {codec} save codec requires the {requires} package, which is not installed."
+# for chat.chatlog_handlers and the disk backed chat logs
+class UnknownChatLogHandlerError(PrettyGoodError):
+    def __init__(self, handler: str = None, allowed_handlers: list = None):
+        self.handler = handler
+        self.allowed_handlers = allowed_handlers
+        self.message = f"Unknown chat log handler {handler}, must be one of {allowed_handlers}"
+class UnknownOversizePolicyError(PrettyGoodError):
+    def __init__(self, policy: str = None, allowed_policies: list = None):
+        self.policy = policy
+        self.allowed_policies = allowed_policies
+        self.message = f"Unknown oversize policy {policy}, must be one of {allowed_policies}"
+class UnknownEvictionPolicyError(PrettyGoodError):
+    def __init__(self, policy: str = None, allowed_policies: list = None):
+        self.policy = policy
+        self.allowed_policies = allowed_policies
+        self.message = f"Unknown eviction policy {policy}, must be one of {allowed_policies}"
+# for chat.profiles
+class UnknownProfileError(PrettyGoodError):
+    def __init__(self, profile: str = None, allowed_profiles: list = None):
+        self.profile = profile
+        self.allowed_profiles = allowed_profiles
+        self.message = f"Unknown mode profile {profile}, must be one of {allowed_profiles}"
+# for chat.retrieval
+class RetrievalNotAvailableError(PrettyGoodError):
+    def __init__(self, requires: str = "numpy"):
+        self.requires = requires
+        self.message = f"Retrieval memory requires the {requires} package, which is not installed."
+# for chat.arrays
+class MessageArraysNotAvailableError(PrettyGoodError):
+    def __init__(self, requires: str = "numpy"):
+        self.requires = requires
+        self.message = f"Message arrays require the {requires} package, which is not installed."
+class ChatLogFileError(PrettyGoodError):
+    def __init__(self, message: str = None):
+        if message is None:
+            message = "The chat log file is corrupt or already in use."
+        self.message = message
+# for chat_wrapper.snapshots
+class SnapshotStackEmptyError(PrettyGoodError):
+    def __init__(self, message: str = None):
+        if message is None:
+            message = "There are no snapshots to go back to."
+        self.message = message
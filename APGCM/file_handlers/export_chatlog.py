@@ -5,7 +5,7 @@ from chat_wrapper import ChatWrapper
 import exceptions
 from file_handlers.gen_file import TextFileHandler, MarkDownFileHandler
 from log_config import DEFAULT_LOGGING_LEVEL, BaseLogger
-from settings import DEFAULT_SAVES_DIR, DEFAULT_EXPORT_DIR
+from settings import DEFAULT_SAVES_DIR, DEFAULT_EXPORT_DIR, EXPORT_COMPRESSION, EXPORT_COMPRESSION_LEVEL
 import uuid as uuid
 from chat import export_data
 
@@ -14,16 +14,18 @@ from chat import export_data
    
             
 class ChatExporter:
-    """Class for exporting a chat log to a file, abstracts away the process of exporting the chat log to a file."""
+    """Class for exporting a chat log to a file, abstracts away the process of exporting the chat log to a file.
+    Exports can be compressed with gzip or zstd(compression and compression_level, defaults from EXPORT_COMPRESSION and EXPORT_COMPRESSION_LEVEL in settings.py), compressed exports are saved as .md.gz or .md.zst
+    """
     version = "0.1.0"
-    def __init__(self, chat_wrapper_obj: ChatWrapper = None, save_dir: str = DEFAULT_EXPORT_DIR,):
+    def __init__(self, chat_wrapper_obj: ChatWrapper = None, save_dir: str = DEFAULT_EXPORT_DIR, compression: str = EXPORT_COMPRESSION, compression_level: int = EXPORT_COMPRESSION_LEVEL):
         self.logger = BaseLogger(
             __file__, filename="chat_exporter.log", identifier="chat_exporter", level=DEFAULT_LOGGING_LEVEL
         ) 
         self.logger.debug("ChatExporter initialized")
         self._chat_wrapper_obj: ChatWrapper = chat_wrapper_obj
         self.save_dir = save_dir 
-        self.file_handler = MarkDownFileHandler(save_folder=save_dir, name ="chatlog_md_exporter")
+        self.file_handler = MarkDownFileHandler(save_folder=save_dir, name ="chatlog_md_exporter", compression=compression, compression_level=compression_level)
         self.exporter = export_data
     @property
     def chat_wrapper(self) -> ChatWrapper | None:
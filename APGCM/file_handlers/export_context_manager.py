@@ -1,9 +1,11 @@
 import datetime
+import io
 import os
 from pathlib import Path
 
 import exceptions
 from chat import Message, export_data
+from file_handlers import serializers
 from log_config import DEFAULT_LOGGING_LEVEL, BaseLogger
 from settings import SETTINGS_BAG
 
@@ -16,6 +18,8 @@ class ExportContextManager:
         data: list[dict] = None,
         model: str = "GPT-4",
         system_prompt: str = None,
+        compression: str = SETTINGS_BAG.EXPORT_COMPRESSION,
+        compression_level: int = SETTINGS_BAG.EXPORT_COMPRESSION_LEVEL,
         **kwargs,
     ):
         self.logger = BaseLogger(
@@ -34,6 +38,9 @@ class ExportContextManager:
         self.model: str = model
         self.system_prompt: str = None or ""
         self.extra_data: dict = kwargs
+        # optional compression, when set the file is written compressed and opened in binary mode
+        self.compressor = serializers.get_compressor(compression)
+        self.compression_level: int = compression_level
         # the file object
         self.fp = None
         self.filepath: str = None
@@ -48,7 +55,14 @@ class ExportContextManager:
     def _make_filename(self) -> str:
         """Creates a filename for the export."""
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d__%H-%M-%S")
-        return f"{self.base_name}__{timestamp}.md"
+        return f"{self.base_name}__{timestamp}{self.extension}"
+
+    @property
+    def extension(self) -> str:
+        """The file extension of the export, .md or .md plus the compressor's suffix."""
+        if self.compressor is None:
+            return ".md"
+        return ".md" + self.compressor.suffix
 
     def _check_data(self, data: list[dict]) -> list[dict]:
         """Raises an error if the data is not a list of dictionaries."""
@@ -88,9 +102,14 @@ class ExportContextManager:
         if self.data is None:
             raise ValueError("No data to export.")
         self.filepath = os.path.join(self.folder, self.filename)
-        with open(self.filepath, "w") as f:
-            f.write(self._get_markdown_data())
-        self.logger.info("Wrote data to file: {self.filepath}")
+        if self.compressor is not None:
+            # compressed as it is written
+            with io.TextIOWrapper(serializers.open_writer(self.filepath, self.compressor, self.compression_level), encoding="utf-8") as f:
+                f.write(self._get_markdown_data())
+        else:
+            with open(self.filepath, "w") as f:
+                f.write(self._get_markdown_data())
+        self.logger.info(f"Wrote data to file: {self.filepath}")
         return self.filepath
 
     def _delete_file(self) -> None:
@@ -101,10 +120,12 @@ class ExportContextManager:
         self.logger.info(f"Deleted file: {self.filepath}")
 
     def __enter__(self):
-        """Creates the file, and then returns the file object. Must have entered the data before calling this."""
+        """Creates the file, and then returns the file object. Must have entered the data before calling this.
+        Compressed exports are opened in binary mode, so the compressed bytes can be sent as is.
+        """
         if self.filepath is None:
             filepath = self.make_file()
-        self.fp = open(self.filepath, "r")
+        self.fp = open(self.filepath, "r" if self.compressor is None else "rb")
         return self.fp
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
@@ -1,13 +1,14 @@
 import exceptions 
 from func import is_filename_valid
 import os 
+import io
 
 import logging
 import uuid
-import json
 from pathlib import Path
 from typing import Union, List, Dict, Any, Optional, Tuple, Callable, Iterable, TypeVar, Generic, Sequence, Mapping, Set, Deque, Iterator, NamedTuple, overload, cast, no_type_check
 from log_config  import DEFAULT_LOGGING_LEVEL 
+from file_handlers import serializers
 class GeneralFileHandler:
     """
     A class for handling files in a general way
@@ -17,7 +18,9 @@ class GeneralFileHandler:
         save_folder: str, path to the folder where files will be saved. Created if it does not exist.
         logging_level: int, logging level of the GeneralFileHandler object.
         version: str, version of the GeneralFileHandler object.
-        file_extension: str, file extension of the files that will be saved.
+        file_extension: str, file extension of the files that will be saved. Includes the compressor's suffix when compressed.
+        compressor: AbstractCompressor or None, compresses files as they are written and decompresses them as they are read. Set with the compression argument(None, "gzip" or "zstd"), see file_handlers/serializers.py.
+        compression_level: int or None, compression level to use, None for the compressor's default.
         logger: logging.Logger object, logger for the GeneralFileHandler object.
     Methods:
         Private:
@@ -27,6 +30,8 @@ class GeneralFileHandler:
         Core:
             write_to_file: writes the contents of a string to a file.
             get_file_contents: returns the contents of a file as a string.
+            write_bytes_to_file: writes bytes to a file.
+            get_file_bytes: returns the contents of a file as bytes.
             check_file_exists: returns True if the file exists, False otherwise.
             get_file_size: returns the size of the file in bytes.
            
@@ -55,7 +60,7 @@ class GeneralFileHandler:
     # the handler type is used for the logger
     handler_type = "GeneralFileHandler"
 
-    def __init__(self,  save_folder: str, file_extension: str, name: str = "gen_file_handler", ):
+    def __init__(self,  save_folder: str, file_extension: str, name: str = "gen_file_handler", compression: str = None, compression_level: int = None):
         self.name = name
         self.logging_level = DEFAULT_LOGGING_LEVEL
         self._make_logger()
@@ -69,8 +74,13 @@ class GeneralFileHandler:
             file_extension = '.'+file_extension
             self.logger.info("Added leading dot to file extension: "+file_extension)
         
+        # compressed files get the compressor's suffix(.md.gz, .txt.zst) so they can be opened with standard tools
+        self.compressor = serializers.get_compressor(compression)
+        self.compression_level = compression_level
+        if self.compressor is not None:
+            file_extension = file_extension + self.compressor.suffix
         self.file_extension = file_extension
-        self.logger.info(f"Initialized {self.handler_type} name" +self.name+ " with save_folder: "+save_folder+" and file_extension: "+file_extension)
+        self.logger.info(f"Initialized {self.handler_type} name" +self.name+ " with save_folder: "+str(save_folder)+" and file_extension: "+file_extension)
         
     def _make_logger(self)-> None:
         """Makes the logger for the GeneralFileHandler object"""
@@ -147,24 +157,53 @@ class GeneralFileHandler:
         filename = self._add_path(filename)
         if not self.check_if_file_exists(filename):
             raise exceptions.FileNotFoundError("File not found: "+filename)
+        if self.compressor is not None:
+            with io.TextIOWrapper(serializers.open_reader(filename)) as f:
+                return f.read()
         with open(filename, "r") as f:
             contents = f.read()
         return contents
     
     def write_to_file(self, filename: str, contents: str, overwrite = False) -> None:
-        """Writes the contents to the file"""
+        """Writes the contents to the file, compressing it as it is written if the handler has a compression set"""
         filename = self._add_path(filename)
         if not overwrite:
             if self.check_if_file_exists(filename):
                 raise exceptions.FileExistsError("File already exists: "+filename)
         self.logger.info("Writing to file: "+filename)
         try:
+            if self.compressor is not None:
+                with io.TextIOWrapper(serializers.open_writer(filename, self.compressor, self.compression_level)) as f:
+                    f.write(contents)
+                return
             with open(filename, "w") as f:
                 f.write(contents)   
         except Exception as e:
             self.logger.error("Error writing to file: "+filename)
             raise e
     
+    def get_file_bytes(self, filename: str) -> bytes:
+        """Gets the contents of the file as bytes"""
+        filename = self._add_path(filename)
+        if not self.check_if_file_exists(filename):
+            raise exceptions.FileNotFoundError("File not found: "+filename)
+        with open(filename, "rb") as f:
+            contents = f.read()
+        return contents
+    def write_bytes_to_file(self, filename: str, contents: bytes, overwrite = False) -> None:
+        """Writes bytes to the file"""
+        filename = self._add_path(filename)
+        if not overwrite:
+            if self.check_if_file_exists(filename):
+                raise exceptions.FileExistsError("File already exists: "+filename)
+        self.logger.info("Writing bytes to file: "+filename)
+        try:
+            with open(filename, "wb") as f:
+                f.write(contents)
+        except Exception as e:
+            self.logger.error("Error writing to file: "+filename)
+            raise e
+    
     def get_file_size(self, filename: str) -> int:
         """Gets the size of the file in bytes"""
         filename = self._add_path(filename)
@@ -220,35 +259,64 @@ class JsonFileHandler(GeneralFileHandler):
     Modified Methods:
         write_to_file - Writes the contents to the file, overwriting if overwrite is True. The contents must be a dict. 
         get_file_contents - Gets the file contents as a dict
-    
+    Codecs:
+        The codec argument picks how dictionaries are encoded, see file_handlers/serializers.py. It can be a codec name(json, json_compact, orjson, msgpack) or a codec object.
+        The default, json, writes indented json exactly like earlier versions did.
+        Reading does not depend on the codec argument, the codec is detected from the file, so files written with different codecs can share a folder.
+    Compression:
+        compression can be gzip or zstd(requires the zstandard package), compression_level sets the level(None for the compressor's default).
+        Unlike the other handlers, compressed json files keep the .json extension, the compression is recorded in the file header instead. This way entry names don't change when the compression setting does, and compressed and uncompressed files can share a folder.
+        Data is streamed through the compressor, so the compressed copy of a file is never held in memory.
     
     Default file extension: .json
     
     """
     handler_type = "JsonFileHandler"
-    def __init__(self, save_folder: str, name: str = "json_file_handler"):
+    def __init__(self, save_folder: str, name: str = "json_file_handler", codec: "str | serializers.AbstractCodec" = None, compression: str = None, compression_level: int = None):
         super().__init__(save_folder, ".json", name)
-        self.logger.info("Initialized JsonFileHandler name" +self.name+ " with save_folder: "+save_folder)
+        self.codec = serializers.get_codec(codec)
+        # set after the parent init so the .json extension is not changed, see the class docstring
+        self.compressor = serializers.get_compressor(compression)
+        self.compression_level = compression_level
+        self.logger.info("Initialized JsonFileHandler name" +self.name+ " with save_folder: "+str(save_folder) + " codec: " + self.codec.name + " compression: " + str(self.compressor))
     def write_to_file(self, filename: str, contents: dict, overwrite = False) -> None:
         """Writes the contents to the file, overwriting if overwrite is True. The contents must be a dict."""
         if not isinstance(contents, dict):
             raise exceptions.BadTypeError("Contents must be a dict")
-        contents = json.dumps(contents, indent=4)
-        super().write_to_file(filename, contents, overwrite)
+        filename = self._add_path(filename)
+        if not overwrite:
+            if self.check_if_file_exists(filename):
+                raise exceptions.FileExistsError("File already exists: "+filename)
+        self.logger.info("Writing to file: "+filename)
+        try:
+            with open(filename, "wb") as f:
+                serializers.write_save(f, contents, self.codec, self.compressor, self.compression_level)
+        except Exception as e:
+            self.logger.error("Error writing to file: "+filename)
+            raise e
     def get_file_contents(self, filename: str) -> dict:
         """Gets the file contents as a dict"""
-        contents = super().get_file_contents(filename)
+        filename = self._add_path(filename)
+        if not self.check_if_file_exists(filename):
+            raise exceptions.FileNotFoundError("File not found: "+filename)
         try:
-            contents = json.loads(contents)
-        except json.JSONDecodeError as e:
+            with open(filename, "rb") as f:
+                contents = serializers.read_save(f)
+        except (exceptions.UnknownCodecError, exceptions.CodecNotAvailableError) as e:
+            self.logger.error("Unable to read save file: " + filename + " " + str(e))
+            raise
+        except Exception as e:
             self.logger.error("Bad or corrupt JSON file: "+filename)
             raise exceptions.BadJSONFileError("Bad or corrupt JSON file: "+filename) from e
+        if not isinstance(contents, dict):
+            raise exceptions.BadJSONFileError("Bad or corrupt JSON file, expected an object: "+filename)
         return contents
     
 class MarkDownFileHandler(GeneralFileHandler):
+    """For handling markdown files, optionally compressed(gzip or zstd, see GeneralFileHandler). Compressed files use the .md.gz or .md.zst extension."""
     handler_type = "MarkDownFileHandler"
-    def __init__(self, save_folder: str, name: str = "markdown_file_handler"):
-        super().__init__(save_folder=save_folder, file_extension= ".md", name = name)
+    def __init__(self, save_folder: str, name: str = "markdown_file_handler", compression: str = None, compression_level: int = None):
+        super().__init__(save_folder=save_folder, file_extension= ".md", name = name, compression=compression, compression_level=compression_level)
         self.logger.info("Initialized MarkDownFileHandler name" +self.name+ " with save_folder: "+save_folder)
     
     
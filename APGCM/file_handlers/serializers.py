@@ -0,0 +1,424 @@
+import gzip
+import io
+import json
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+
+import exceptions
+
+# orjson, msgpack and zstandard are optional, the stdlib json codecs and gzip are always available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#=====(SAVE FILE HEADER)=====
+# Text codecs (json, json_compact, orjson) all produce plain JSON, so their files are written without a header and stay readable by any json tool(and by older versions of this project).
+# Binary codecs and compressed files get a single header line in front of the payload, recording which codec and compression wrote the file, so a folder can mix formats and still load.
+HEADER_PREFIX = b"#APGCM-SAVE "
+HEADER_END = b"\n"
+MAX_HEADER_LENGTH = 256
+
+
+class AbstractCodec(ABC):
+    """Base class for save file codecs, turns a save dictionary into bytes and back.
+    Attributes:
+        name (str): The name of the codec, recorded in the file header and used in the SAVE_CODEC setting.
+        is_text (bool): True if the codec produces plain JSON, in which case no header is written.
+        requires (str): The optional package needed by the codec, None if it only uses the standard library.
+    Methods:
+        dumps: Converts a dictionary to bytes.
+        loads: Converts bytes back to a dictionary.
+        is_available: Returns True if the codec's dependency is installed.
+    """
+    name = "abstract"
+    is_text = True
+    requires = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def dumps(self, obj: dict) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, data: bytes) -> dict:
+        pass
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} name={self.name}>"
+    
+    def dump(self, obj: dict, fp: BinaryIO) -> None:
+        """Writes the encoded dictionary to a binary file object."""
+        fp.write(self.dumps(obj))
+
+    def load(self, fp: BinaryIO) -> dict:
+        """Reads a dictionary from a binary file object."""
+        return self.loads(fp.read())
+
+
+class PrettyJsonCodec(AbstractCodec):
+    """The original format, indented json. Easy to read and edit by hand, but the largest and slowest of the codecs."""
+    name = "json"
+
+    def dumps(self, obj: dict) -> bytes:
+        return json.dumps(obj, indent=4).encode("utf-8")
+
+    def loads(self, data: bytes) -> dict:
+        return json.loads(data)
+
+
+class CompactJsonCodec(AbstractCodec):
+    """Json without indentation or ascii escaping, still plain json but noticeably smaller."""
+    name = "json_compact"
+
+    def dumps(self, obj: dict) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(self, data: bytes) -> dict:
+        return json.loads(data)
+
+
+class OrjsonCodec(AbstractCodec):
+    """Compact json using orjson, which is several times faster than the standard library. Requires the orjson package."""
+    name = "orjson"
+    requires = "orjson"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return orjson is not None
+
+    def dumps(self, obj: dict) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes) -> dict:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(AbstractCodec):
+    """Binary msgpack, the smallest of the codecs. Files are no longer human readable. Requires the msgpack package."""
+    name = "msgpack"
+    is_text = False
+    requires = "msgpack"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return msgpack is not None
+
+    def dumps(self, obj: dict) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> dict:
+        return msgpack.unpackb(data, raw=False)
+
+
+#=====(COMPRESSION)=====
+class AbstractCompressor(ABC):
+    """Base class for compressors. Compressors wrap a binary file object, so data is compressed or decompressed in chunks as it is written or read and the compressed and uncompressed data are never both held in memory in full.
+    Attributes:
+        name (str): The name of the compressor, recorded in the file header and used in the SAVE_COMPRESSION and EXPORT_COMPRESSION settings.
+        suffix (str): The file extension suffix used for compressed exports.
+        magic (bytes): The bytes every compressed stream starts with, used to detect compressed files without a header.
+        default_level (int): The compression level used when none is given.
+        requires (str): The optional package needed by the compressor, None if it only uses the standard library.
+    Methods:
+        writer: Wraps a binary file object, writing to the returned object compresses into the file.
+        reader: Wraps a binary file object, reading from the returned object decompresses from the file.
+    """
+    name = "abstract"
+    suffix = ""
+    magic = b""
+    default_level = None
+    requires = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def writer(self, fp: BinaryIO, level: int = None) -> BinaryIO:
+        pass
+
+    @abstractmethod
+    def reader(self, fp: BinaryIO) -> BinaryIO:
+        pass
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} name={self.name}>"
+
+
+class GzipCompressor(AbstractCompressor):
+    """Gzip from the standard library, levels 1(fastest) to 9(smallest)."""
+    name = "gzip"
+    suffix = ".gz"
+    magic = b"\x1f\x8b"
+    default_level = 6
+
+    def writer(self, fp: BinaryIO, level: int = None) -> BinaryIO:
+        if level is None:
+            level = self.default_level
+        # mtime=0 keeps the output identical for identical input
+        return gzip.GzipFile(fileobj=fp, mode="wb", compresslevel=level, mtime=0)
+
+    def reader(self, fp: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=fp, mode="rb")
+
+
+class ZstdCompressor(AbstractCompressor):
+    """Zstandard, faster than gzip at a similar or better ratio, levels 1 to 22. Requires the zstandard package."""
+    name = "zstd"
+    suffix = ".zst"
+    magic = b"\x28\xb5\x2f\xfd"
+    default_level = 3
+    requires = "zstandard"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return zstandard is not None
+
+    def writer(self, fp: BinaryIO, level: int = None) -> BinaryIO:
+        if level is None:
+            level = self.default_level
+        return zstandard.ZstdCompressor(level=level).stream_writer(fp, closefd=False)
+
+    def reader(self, fp: BinaryIO) -> BinaryIO:
+        return zstandard.ZstdDecompressor().stream_reader(fp, closefd=False)
+
+
+COMPRESSORS = {
+    compressor.name: compressor
+    for compressor in (GzipCompressor, ZstdCompressor)
+}
+
+
+def get_compressor(compression: "str | AbstractCompressor | None") -> "AbstractCompressor | None":
+    """Returns a compressor instance from a compressor name, None or "none" means no compression.
+    Raises:
+        exceptions.UnknownCodecError: if there is no compressor with that name.
+        exceptions.CodecNotAvailableError: if the compressor's optional dependency is not installed.
+    """
+    if compression is None or isinstance(compression, AbstractCompressor):
+        return compression
+    name = str(compression).strip().lower()
+    if name in ("", "none"):
+        return None
+    if name not in COMPRESSORS:
+        raise exceptions.UnknownCodecError(name, ["none"] + list(COMPRESSORS.keys()))
+    compressor_cls = COMPRESSORS[name]
+    if not compressor_cls.is_available():
+        raise exceptions.CodecNotAvailableError(name, compressor_cls.requires)
+    return compressor_cls()
+
+
+def _detect_compressor(start: bytes) -> "AbstractCompressor | None":
+    """Returns the compressor whose magic bytes start the data, if any."""
+    for compressor_cls in COMPRESSORS.values():
+        if start.startswith(compressor_cls.magic):
+            return get_compressor(compressor_cls.name)
+    return None
+
+
+def open_writer(path: str, compression: "str | AbstractCompressor | None" = None, level: int = None) -> BinaryIO:
+    """Opens a file for binary writing, compressing the data as it is written if compression is set."""
+    compressor = get_compressor(compression)
+    fp = open(path, "wb")
+    if compressor is None:
+        return fp
+    return _ClosingStream(compressor.writer(fp, level), fp)
+
+
+def open_reader(path: str) -> BinaryIO:
+    """Opens a file for binary reading, compressed files(detected by their magic bytes) are decompressed as they are read."""
+    fp = open(path, "rb")
+    compressor = _detect_compressor(fp.read(4))
+    fp.seek(0)
+    if compressor is None:
+        return fp
+    return _ClosingStream(compressor.reader(fp), fp)
+
+
+class _ClosingStream(io.RawIOBase):
+    """Wraps a compressed stream so closing it also closes the underlying file."""
+    def __init__(self, stream: BinaryIO, fp: BinaryIO):
+        self._stream = stream
+        self._fp = fp
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self._stream.read()
+        return self._stream.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data) -> int:
+        return self._stream.write(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self._stream.close()
+            finally:
+                self._fp.close()
+        super().close()
+
+
+CODECS = {
+    codec.name: codec
+    for codec in (PrettyJsonCodec, CompactJsonCodec, OrjsonCodec, MsgpackCodec)
+}
+DEFAULT_CODEC_NAME = PrettyJsonCodec.name
+
+
+def available_codecs() -> list[str]:
+    """Returns the names of the codecs that can be used with the installed packages."""
+    return [name for name, codec in CODECS.items() if codec.is_available()]
+
+
+def get_codec(codec: "str | AbstractCodec | None" = None) -> AbstractCodec:
+    """Returns a codec instance from a codec name. Codec instances are passed through unchanged and None gives the default codec.
+    Raises:
+        exceptions.UnknownCodecError: if there is no codec with that name.
+        exceptions.CodecNotAvailableError: if the codec's optional dependency is not installed.
+    """
+    if codec is None:
+        codec = DEFAULT_CODEC_NAME
+    if isinstance(codec, AbstractCodec):
+        return codec
+    name = str(codec).strip().lower()
+    if name not in CODECS:
+        raise exceptions.UnknownCodecError(name, list(CODECS.keys()))
+    codec_cls = CODECS[name]
+    if not codec_cls.is_available():
+        raise exceptions.CodecNotAvailableError(name, codec_cls.requires)
+    return codec_cls()
+
+
+def make_header(**fields) -> bytes:
+    """Makes the header line for a save file, fields are written as key=value pairs."""
+    pairs = " ".join(f"{key}={value}" for key, value in fields.items())
+    return HEADER_PREFIX + pairs.encode("ascii") + HEADER_END
+
+
+def split_header(data: bytes) -> tuple[dict, bytes]:
+    """Splits a save file into its header fields and payload. Files without a header are plain json and return an empty dict."""
+    if not data.startswith(HEADER_PREFIX):
+        return {}, data
+    end = data.find(HEADER_END, 0, MAX_HEADER_LENGTH)
+    if end == -1:
+        raise exceptions.BadJSONFileError("Save file header is missing its end of line.")
+    fields = {}
+    for pair in data[len(HEADER_PREFIX):end].decode("ascii").split():
+        key, _, value = pair.partition("=")
+        fields[key] = value
+    return fields, data[end + len(HEADER_END):]
+
+
+def write_save(fp: BinaryIO, obj: dict, codec: "str | AbstractCodec | None" = None, compression: "str | AbstractCompressor | None" = None, level: int = None) -> None:
+    """Writes a save dictionary to a binary file object. Binary codecs and compressed saves get a header, plain json is written as is.
+    When compressing, the payload is streamed through the compressor into fp, so the compressed save is never held in memory.
+    """
+    codec = get_codec(codec)
+    compressor = get_compressor(compression)
+    if compressor is None:
+        if not codec.is_text:
+            fp.write(make_header(codec=codec.name))
+        codec.dump(obj, fp)
+        return
+    fp.write(make_header(codec=codec.name, compression=compressor.name))
+    with compressor.writer(fp, level) as stream:
+        codec.dump(obj, stream)
+
+
+def read_save(fp: BinaryIO) -> dict:
+    """Reads a save dictionary written by any codec and compression from a binary file object.
+    The codec and compression are read from the header. Headerless files are json, optionally compressed(detected by the magic bytes).
+    """
+    start = fp.read(len(HEADER_PREFIX))
+    fields = {}
+    if start == HEADER_PREFIX:
+        line = fp.readline(MAX_HEADER_LENGTH)
+        if not line.endswith(HEADER_END):
+            raise exceptions.BadJSONFileError("Save file header is missing its end of line.")
+        fields, _ = split_header(start + line)
+        start = b""
+    compressor = get_compressor(fields.get("compression"))
+    if compressor is None and not fields:
+        compressor = _detect_compressor(start)
+    if compressor is not None:
+        # put back the bytes already read, then stream them through the decompressor
+        stream = compressor.reader(_PrefixedStream(start, fp))
+    else:
+        stream = _PrefixedStream(start, fp)
+    codec_name = fields.get("codec")
+    if codec_name is not None:
+        return get_codec(codec_name).load(stream)
+    return _loads_json(stream.read())
+
+
+def _loads_json(payload: bytes) -> dict:
+    """Loads plain json, orjson reads it faster when installed but is stricter than the json module(NaN, Infinity), so fall back on failure"""
+    if OrjsonCodec.is_available():
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(payload)
+
+
+class _PrefixedStream(io.RawIOBase):
+    """A read only stream that returns some already read bytes before the rest of a file object."""
+    def __init__(self, prefix: bytes, fp: BinaryIO):
+        self._prefix = prefix
+        self._fp = fp
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            data = self._prefix + self._fp.read()
+            self._prefix = b""
+            return data
+        if self._prefix:
+            data = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            if len(data) < size:
+                data += self._fp.read(size - len(data))
+            return data
+        return self._fp.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def encode_save(obj: dict, codec: "str | AbstractCodec | None" = None, compression: "str | AbstractCompressor | None" = None, level: int = None) -> bytes:
+    """Encodes a save dictionary to bytes, see write_save."""
+    buffer = io.BytesIO()
+    write_save(buffer, obj, codec, compression, level)
+    return buffer.getvalue()
+
+
+def decode_save(data: bytes) -> dict:
+    """Decodes a save file's bytes, see read_save."""
+    return read_save(io.BytesIO(data))
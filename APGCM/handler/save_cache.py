@@ -0,0 +1,107 @@
+import marshal
+from collections import OrderedDict
+
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+
+
+class SaveEntryCache:
+    """An LRU cache of parsed save dictionaries, used by JsonSaveHandler so that loading the same save repeatedly(/load, help mode, finding the most recent auto save) doesn't read and parse the file each time.
+    Entries are validated with a stamp, the file's modification time and size, so a file changed on disk is read again. Entries are evicted least recently used first once the byte budget is exceeded.
+    Entries are stored as immutable marshal bytes rather than dictionaries, so get always returns a fresh copy and changing a loaded save dictionary(as ChatWrapper.load_from_save_dict does) can't corrupt the cache.
+    Unmarshalling is a single C call, as fast as orjson parsing from memory and much faster than the json module or copy.deepcopy, and the byte budget is exact.
+    Args:
+        max_bytes (int): The byte budget, the total size of the marshalled entries. 0 disables the cache.
+    Attributes:
+        hits, misses, evictions, invalidations (int): Counters, see stats.
+        current_bytes (int): Size of the cached entries.
+    Methods:
+        get: Returns a copy of the cached entry if its stamp matches, otherwise None.
+        put: Caches a copy of an entry, evicting old entries if needed.
+        invalidate: Removes an entry.
+        clear: Removes all entries.
+        stats: Returns a dictionary of the counters and sizes.
+    """
+    version = "1.0.0"
+
+    def __init__(self, max_bytes: int = 0):
+        self.logger = BaseLogger(__file__, filename="save_handler.log", identifier="SaveEntryCache", level=DEFAULT_LOGGING_LEVEL)
+        self.max_bytes = max_bytes
+        # entry name -> (stamp, marshalled save dict, size)
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes is not None and self.max_bytes > 0
+
+    def get(self, entry_name: str, stamp: tuple) -> dict | None:
+        """Returns a copy of the entry if it is cached with the same stamp, None otherwise. A cached entry with a different stamp is dropped."""
+        cached = self._entries.get(entry_name)
+        if cached is None:
+            self.misses += 1
+            return None
+        cached_stamp, data, _ = cached
+        if cached_stamp != stamp:
+            self.logger.info(f"Entry {entry_name} changed on disk, invalidating")
+            self.invalidate(entry_name)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry_name)
+        self.hits += 1
+        return marshal.loads(data)
+
+    def put(self, entry_name: str, stamp: tuple, save_dict: dict) -> None:
+        """Caches a copy of the entry. Entries larger than the whole budget are not cached."""
+        if not self.enabled:
+            return
+        self.invalidate(entry_name, count=False)
+        try:
+            data = marshal.dumps(save_dict)
+        except ValueError:
+            # only happens if the dictionary holds something other than json types
+            self.logger.warning(f"Entry {entry_name} can't be marshalled, not caching")
+            return
+        size = len(data)
+        if size > self.max_bytes:
+            self.logger.info(f"Entry {entry_name} is larger than the cache({size} > {self.max_bytes} bytes), not caching")
+            return
+        self._entries[entry_name] = (stamp, data, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            evicted_name, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+            self.logger.debug(f"Evicted {evicted_name} from the save cache")
+
+    def invalidate(self, entry_name: str, count: bool = True) -> None:
+        """Removes the entry from the cache if it is there."""
+        cached = self._entries.pop(entry_name, None)
+        if cached is not None:
+            self.current_bytes -= cached[2]
+            if count:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<SaveEntryCache {self.stats()}>"
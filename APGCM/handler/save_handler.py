@@ -1,11 +1,13 @@
 import sys 
 from abc import ABC, abstractmethod
 import json 
+import os
 #sys.path.append("../gpt_cli")
 
 from file_handlers.gen_file import MarkDownFileHandler, TextFileHandler, GeneralFileHandler, JsonFileHandler
 from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
-from settings import DEFAULT_SAVES_DIR
+from handler.save_cache import SaveEntryCache
+from settings import DEFAULT_SAVES_DIR, SAVE_CODEC, SAVE_COMPRESSION, SAVE_COMPRESSION_LEVEL, SAVE_CACHE_MAX_BYTES
 import exceptions as e 
 import func as f
 
@@ -103,7 +105,14 @@ class JsonSaveHandler(AbstractCWSaveHandler):
     Dependencies:
         - JsonFileHandler
         - BaseLogger, DEFAULT_LOGGING_LEVEL from log_config.py
-        - DEFAULT_SAVES_DIR from settings.py
+        - DEFAULT_SAVES_DIR, SAVE_CODEC, SAVE_COMPRESSION, SAVE_COMPRESSION_LEVEL from settings.py
+    Codec and Compression:
+        The codec used to write entries defaults to SAVE_CODEC(json unless set in the .env file). Entries written with any codec can be read no matter which codec the handler uses, see file_handlers/serializers.py.
+        Entries can also be compressed with gzip or zstd, set with SAVE_COMPRESSION and SAVE_COMPRESSION_LEVEL. Like the codec, compression is detected when reading, so turning it on or off doesn't break existing saves.
+    Cache:
+        If cache_max_bytes(default SAVE_CACHE_MAX_BYTES, 0 disables it) is set, parsed entries are kept in a SaveEntryCache(handler/save_cache.py), an LRU cache checked against the file's modification time and size, so files changed outside the handler are still read again.
+        Entries written through the handler are cached as they are written, so a save followed by a load(like the discord bot's help mode) doesn't touch the disk.
+        read_entry always returns a copy, so changing the returned dictionary never changes the cache. See cache_stats for hit, miss and eviction counters.
     Raises:
         This class does not raise any exceptions on its own, however JsonFileHandler does raise the following exceptions, all children of PrettyGoodError:
             - FileNotFoundError
@@ -118,12 +127,29 @@ class JsonSaveHandler(AbstractCWSaveHandler):
         ```
     
     """
-    def __init__(self, save_dir=DEFAULT_SAVES_DIR):
+    def __init__(self, save_dir=DEFAULT_SAVES_DIR, codec: str = SAVE_CODEC, compression: str = SAVE_COMPRESSION, compression_level: int = SAVE_COMPRESSION_LEVEL, cache_max_bytes: int = SAVE_CACHE_MAX_BYTES):
         self.logger = BaseLogger(__file__, filename="save_handler.log", identifier="SaveHandler: " + self.name, level=DEFAULT_LOGGING_LEVEL)
         self.logger.info("Initializing JsonSaveHandler")
         self.save_dir = save_dir
-        self.file_handler = JsonFileHandler(self.save_dir, "SaveFileHandler")
+        self.file_handler = JsonFileHandler(self.save_dir, "SaveFileHandler", codec=codec, compression=compression, compression_level=compression_level)
+        self.cache = SaveEntryCache(cache_max_bytes)
         self.logger.info("Initialized JsonSaveHandler")
+    def _cache_key(self, entry_name: str) -> str:
+        """Entry names can be given with or without the .json extension, the cache uses the full path so both hit the same entry"""
+        return self.entry_path(entry_name)
+    def _stamp(self, entry_name: str) -> tuple | None:
+        """Returns the file's modification time and size, used to check cached entries. None if the file doesn't exist."""
+        return self.entry_stamp(entry_name)
+    def entry_path(self, entry_name: str) -> str:
+        """Returns the path of the entry's file."""
+        return self.file_handler._add_path(entry_name)
+    def entry_stamp(self, entry_name: str) -> tuple | None:
+        """Returns the entry file's modification time(ns) and size, which change whenever the entry is written. None if the file doesn't exist. Used by the cache and SaveSearcher."""
+        try:
+            stat = os.stat(self.entry_path(entry_name))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
     def check_entry(self, entry_name: str) -> bool:
         """Returns True if the entry exists, False if it doesn't."""
         return self.file_handler.check_if_file_exists(entry_name)
@@ -132,13 +158,33 @@ class JsonSaveHandler(AbstractCWSaveHandler):
         Will raise an FileExistsError(PrettyGoodError) if overwrite is False and the entry already exists. Either use the check_entry method or catch the exception if you don't want to overwrite -- otherwise set overwrite to True. 
         """
         self.file_handler.write_to_file(filename=entry_name, contents=save_dict ,  overwrite=overwrite)
+        if self.cache.enabled:
+            self.cache.put(self._cache_key(entry_name), self._stamp(entry_name), save_dict)
     def read_entry(self, entry_name: str)-> dict:
         """Returns the entry from the save file, a dictionary of the save file contents. Will raise a FileNotFoundError(PrettyGoodError) if the entry doesn't exist."""
-        return self.file_handler.get_file_contents(entry_name)
+        if not self.cache.enabled:
+            return self.file_handler.get_file_contents(entry_name)
+        key = self._cache_key(entry_name)
+        stamp = self._stamp(entry_name)
+        if stamp is None:
+            self.cache.invalidate(key)
+            return self.file_handler.get_file_contents(entry_name)
+        cached = self.cache.get(key, stamp)
+        if cached is not None:
+            self.logger.debug(f"Save cache hit for {entry_name}")
+            return cached
+        save_dict = self.file_handler.get_file_contents(entry_name)
+        self.cache.put(key, stamp, save_dict)
+        return save_dict
     def delete_entry(self, entry_name: str) -> None:
         """Deletes the entry from the save system. Will raise a FileNotFoundError(PrettyGoodError) if the entry doesn't exist."""
+        self.cache.invalidate(self._cache_key(entry_name))
         self.file_handler.delete_file(entry_name)
     @property
+    def cache_stats(self) -> dict:
+        """Returns the cache's entry count, size and hit, miss, eviction and invalidation counters."""
+        return self.cache.stats()
+    @property
     def entry_names(self) -> list[str]:
         """Returns a list of entry names."""
         return self.file_handler.get_filenames(remove_path=True)
@@ -0,0 +1,277 @@
+import json
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import Iterator
+
+import exceptions
+from chat.search import InvertedIndex, make_snippet, parse_query, tokenize
+from chat.stored_chatlog import embed_saved_messages, refers_to_storage
+from file_handlers import serializers
+from handler.save_handler import JsonSaveHandler
+from log_config import BaseLogger, DEFAULT_LOGGING_LEVEL
+from settings import SAVE_SEARCH_INDEX_PATH, SAVE_SEARCH_WORKERS
+
+"""Full text search across every save of a JsonSaveHandler("which saved conversation talked about X").
+SaveSearcher keeps the term counts of each save in an index file(SAVE_SEARCH_INDEX_PATH), keyed by the save file's modification time and size, so only new or changed saves are read.
+Changed saves are read in a process pool, saves are ranked from the index, and the best matching message of each top save is found in the pool too and returned as soon as it is ready.
+"""
+# tests can be found in tests/test_save_search.py
+
+SaveSearchResult = namedtuple("SaveSearchResult", ["entry_name", "score", "position", "role", "snippet"])
+
+
+def _saved_chatlog(save: dict) -> dict | None:
+    """Returns the chat log save inside a ChatWrapper save(or a TrimChatLog save), None if there isn't one. A save that refers to a file or database(see StoredChatLog Saving) has its messages read from there, None if they can't be."""
+    trim = save.get("trim_object", save)
+    chatlog = trim.get("chatlog") if isinstance(trim, dict) else None
+    if refers_to_storage(chatlog):
+        try:
+            chatlog = embed_saved_messages(chatlog)
+        except exceptions.ChatLogFileError:
+            return None
+    if isinstance(chatlog, dict) and isinstance(chatlog.get("messages"), list):
+        return chatlog
+    return None
+
+
+def _save_messages(save: dict) -> list[dict]:
+    """Returns the messages of a ChatWrapper save(or a TrimChatLog save): the full chat log if it was saved, otherwise the trimmed chat log."""
+    chatlog = _saved_chatlog(save)
+    if chatlog is not None:
+        messages = chatlog["messages"]
+    else:
+        trim = save.get("trim_object", save)
+        messages = (trim.get("trimmed_chatlog") if isinstance(trim, dict) else None) or []
+    return [msg for msg in messages if isinstance(msg, dict) and isinstance(msg.get("content"), str)]
+
+
+def _read_save(path: str) -> dict:
+    with open(path, "rb") as f:
+        return serializers.read_save(f)
+
+
+def scan_save(path: str) -> dict:
+    """Reads a save and returns only what ranking needs: its term counts, word count and message count. Runs in a worker process."""
+    terms: dict[str, int] = {}
+    length = 0
+    messages = _save_messages(_read_save(path))
+    for msg in messages:
+        for word in tokenize(msg["content"]):
+            terms[word] = terms.get(word, 0) + 1
+            length += 1
+    return {"terms": terms, "length": length, "messages": len(messages)}
+
+
+def best_message(path: str, query: str, snippet_width: int = 160) -> tuple | None:
+    """Returns (position, role, snippet) of the message of a save that best matches the query, or None if none do(ie a quoted phrase isn't in it). Runs in a worker process.
+    Uses the chat log's saved search index(see chat/search.py) when it covers every message.
+    """
+    save = _read_save(path)
+    messages = _save_messages(save)
+    index = None
+    chatlog = _saved_chatlog(save)
+    if chatlog is not None and isinstance(chatlog.get("search_index"), dict) and len(chatlog["messages"]) == len(messages):
+        try:
+            index = InvertedIndex.from_dict(chatlog["search_index"])
+        except exceptions.BadSaveDictionaryError:
+            index = None
+        if index is not None and len(index) != len(messages):
+            index = None
+    if index is None:
+        index = InvertedIndex()
+        index.extend(msg["content"] for msg in messages)
+    results = index.search(query, limit=1)
+    if len(results) == 0:
+        return None
+    position = results[0][0]
+    phrases, keywords = parse_query(query)
+    terms = keywords + [word for phrase in phrases for word in phrase]
+    msg = messages[position]
+    return position, msg.get("role"), make_snippet(msg["content"], terms, snippet_width)
+
+
+class SaveSearcher:
+    """Searches every save of a JsonSaveHandler, ranking the saves with BM25(each save is one document) and showing the best matching message of each.
+    Relies on:
+        - JsonSaveHandler from handler/save_handler.py
+        - InvertedIndex, tokenize, parse_query from chat/search.py
+        - SAVE_SEARCH_INDEX_PATH, SAVE_SEARCH_WORKERS from settings.py
+    Args:
+        save_handler (JsonSaveHandler): The saves to search.
+        index_path (str): The index file, defaults to SAVE_SEARCH_INDEX_PATH. None keeps the index in memory only.
+        max_workers (int): Processes used to read saves, defaults to SAVE_SEARCH_WORKERS(0 is one per CPU). 1 reads saves in this process.
+    Index:
+        For each save: the file's (modification time, size), its term counts, word count and message count. Saves whose stamp hasn't changed are never read again.
+        Saves that can't be read are recorded with no terms, so they aren't retried until they change.
+    Queries:
+        The same syntax as TrimChatLog.search, words and "quoted phrases". Saves are ranked on every word, then each top save's messages are searched, which drops saves without the phrases.
+        The top saves are read(in parallel, as many at a time as results are still needed) in rank order until limit saves match, so a result is never skipped for a lower ranked one.
+    Methods:
+        refresh: Reads new and changed saves, forgets deleted ones, and writes the index file if anything changed. Returns the number of saves read.
+        iter_search: Yields SaveSearchResults(entry_name, score, position, role, snippet) as they are ready. Not in rank order.
+        search: Returns the SaveSearchResults sorted best first.
+        close: Shuts down the process pool, it is started again when needed.
+    """
+
+    version = "1.0.0"
+
+    def __init__(
+        self,
+        save_handler: JsonSaveHandler,
+        index_path: str = SAVE_SEARCH_INDEX_PATH,
+        max_workers: int = SAVE_SEARCH_WORKERS,
+    ):
+        self.logger = BaseLogger(__file__, filename="save_handler.log", identifier="SaveSearcher", level=DEFAULT_LOGGING_LEVEL)
+        self.save_handler = save_handler
+        self.index_path = index_path
+        self.max_workers = max_workers if max_workers and max_workers > 0 else (os.cpu_count() or 1)
+        self._executor: Executor = None
+        # entry name -> {"stamp": [mtime_ns, size], "terms": {term: count}, "length": words, "messages": count}
+        self._entries: dict[str, dict] = {}
+        self._load_index()
+
+    # ==========(INDEX FILE)==========
+    def _load_index(self) -> None:
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self._entries = dict(saved["entries"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.logger.warning(f"Save search index {self.index_path} is unreadable, rebuilding it")
+            self._entries = {}
+        self.logger.info(f"Loaded the save search index, {len(self._entries)} saves")
+
+    def _write_index(self) -> None:
+        if self.index_path is None:
+            return
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "entries": self._entries}, f, separators=(",", ":"))
+        os.replace(temp_path, self.index_path)
+
+    # ==========(WORKERS)==========
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _map(self, function, args: list[tuple]) -> Iterator[tuple[tuple, object, Exception]]:
+        """Runs function on each set of args, yielding (args, result, error) as each finishes. Uses the pool only when there is more than one job and more than one worker."""
+        if len(args) <= 1 or self.max_workers == 1:
+            for arg in args:
+                try:
+                    yield arg, function(*arg), None
+                except Exception as e:
+                    yield arg, None, e
+            return
+        futures = {self._get_executor().submit(function, *arg): arg for arg in args}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    # ==========(REFRESHING)==========
+    def refresh(self) -> int:
+        """Reads the saves that are new or changed since they were indexed and forgets deleted ones. Returns the number of saves read."""
+        stamps = {}
+        for entry_name in self.save_handler.entry_names:
+            stamp = self.save_handler.entry_stamp(entry_name)
+            if stamp is not None:
+                stamps[entry_name] = list(stamp)
+        removed = [entry_name for entry_name in self._entries if entry_name not in stamps]
+        for entry_name in removed:
+            del self._entries[entry_name]
+        changed = [
+            (self.save_handler.entry_path(entry_name),)
+            for entry_name, stamp in stamps.items()
+            if self._entries.get(entry_name, {}).get("stamp") != stamp
+        ]
+        names = {self.save_handler.entry_path(entry_name): entry_name for entry_name in stamps}
+        for (path,), scanned, error in self._map(scan_save, changed):
+            entry_name = names[path]
+            if error is not None:
+                self.logger.warning(f"Unable to index save {entry_name}: {error}")
+                scanned = {"terms": {}, "length": 0, "messages": 0}
+            scanned["stamp"] = stamps[entry_name]
+            self._entries[entry_name] = scanned
+        if changed or removed:
+            self.logger.info(f"Save search index refreshed, read {len(changed)} saves, removed {len(removed)}")
+            self._write_index()
+        return len(changed)
+
+    # ==========(SEARCHING)==========
+    def rank(self, query: str, k1: float = 1.5, b: float = 0.75) -> list[tuple[str, float]]:
+        """Returns (entry name, score) of every indexed save containing any word of the query, best first. Uses the index only, call refresh first."""
+        phrases, keywords = parse_query(query)
+        terms = set(keywords)
+        for phrase in phrases:
+            terms.update(phrase)
+        if len(terms) == 0 or len(self._entries) == 0:
+            return []
+        total = len(self._entries)
+        average_length = max(sum(entry["length"] for entry in self._entries.values()) / total, 1)
+        idfs = {}
+        for term in terms:
+            df = sum(1 for entry in self._entries.values() if term in entry["terms"])
+            if df > 0:
+                idfs[term] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        scored = []
+        for entry_name, entry in self._entries.items():
+            score = 0.0
+            norm = 1 - b + b * entry["length"] / average_length
+            for term, idf in idfs.items():
+                tf = entry["terms"].get(term)
+                if tf:
+                    score += idf * tf * (k1 + 1) / (tf + k1 * norm)
+            if score > 0:
+                scored.append((entry_name, score))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored
+
+    def iter_search(self, query: str, limit: int = 5, snippet_width: int = 160) -> Iterator[SaveSearchResult]:
+        """Yields up to limit SaveSearchResults as the best matching message of each save is found. Results come in the order they finish, not rank order."""
+        self.refresh()
+        ranked = self.rank(query)
+        scores = dict(ranked)
+        paths = {self.save_handler.entry_path(entry_name): entry_name for entry_name, _ in ranked}
+        found = 0
+        start = 0
+        while found < limit and start < len(ranked):
+            # every match in a batch of the next best saves is a result, so results are yielded as soon as they are found
+            batch = ranked[start : start + limit - found]
+            start += len(batch)
+            jobs = [(self.save_handler.entry_path(entry_name), query, snippet_width) for entry_name, _ in batch]
+            for (path, _, _), match, error in self._map(best_message, jobs):
+                if error is not None:
+                    self.logger.warning(f"Unable to search save {paths[path]}: {error}")
+                    continue
+                if match is None:
+                    continue
+                found += 1
+                entry_name = paths[path]
+                yield SaveSearchResult(entry_name, scores[entry_name], *match)
+
+    def search(self, query: str, limit: int = 5, snippet_width: int = 160) -> list[SaveSearchResult]:
+        """Returns up to limit SaveSearchResults, best first."""
+        results = list(self.iter_search(query, limit=limit, snippet_width=snippet_width))
+        results.sort(key=lambda result: (-result.score, result.entry_name))
+        return results
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<SaveSearcher {len(self)} saves indexed, index file: {self.index_path}>"
@@ -16,11 +16,55 @@ def get_env_or_default(env_name: str, default: str) -> str:
 # ====(CHATLOG SETTINGS)====
 class ChatLogHandlers(Enum):
     CHATLOG_USERLIST = "ChatLogUserList"
+    CHATLOG_JSONL = "ChatLogJsonl"
+    CHATLOG_SQLITE = "ChatLogSqlite"
+    CHATLOG_TIERED = "ChatLogTiered"
 
 
 DEFAULT_CHATLOG_HANDLER = os.getenv(
     "DEFAULT_CHATLOG_HANDLER", ChatLogHandlers.CHATLOG_USERLIST.value
 )
+# where disk backed chat logs(ChatLogJsonl) keep their files
+CHATLOG_DIR = os.getenv("CHATLOG_DIR", "./files/chatlogs/")
+# database shared by every SQLite backed chat log(ChatLogSqlite)
+CHATLOG_DATABASE = os.getenv("CHATLOG_DATABASE", CHATLOG_DIR + "chatlogs.sqlite3")
+# whether saves of file and database backed chat logs(ChatLogJsonl, ChatLogSqlite) have every message, otherwise they refer to the file or session the messages are in(which is then never deleted)
+STORED_CHATLOG_EMBED = os.getenv("STORED_CHATLOG_EMBED", "True").lower().strip() in ("true", "1", "yes")
+# tiered chat logs(ChatLogTiered): the fewest messages kept as objects, messages per compressed block, compressed blocks kept in memory before spilling to CHATLOG_DIR
+TIERED_HOT_MESSAGES = int(os.getenv("TIERED_HOT_MESSAGES", 64))
+TIERED_BLOCK_MESSAGES = int(os.getenv("TIERED_BLOCK_MESSAGES", 32))
+TIERED_WARM_BLOCKS = int(os.getenv("TIERED_WARM_BLOCKS", 16))
+# threads used to count tokens in bulk(ie recounting the history after switching to a model with a different encoding), 0 is one per CPU
+TOKEN_COUNT_THREADS = int(os.getenv("TOKEN_COUNT_THREADS", 0))
+# estimate tokens from the size of each message instead of counting them, messages are only counted when it matters for trimming and before they are sent(see chat/tokenizer.py)
+TOKEN_ESTIMATE = os.getenv("TOKEN_ESTIMATE", "False").lower().strip() in ("true", "1", "yes")
+# how far(as a fraction) an estimate may be from the real count
+TOKEN_ESTIMATE_ERROR = float(os.getenv("TOKEN_ESTIMATE_ERROR", 0.5))
+# what TrimChatLog does with a message too long to fit on its own: truncate, head_tail, split or drop(see chat/trim_chat_log.py OversizePolicy)
+OVERSIZE_POLICY = os.getenv("OVERSIZE_POLICY", "truncate").lower().strip()
+# which message TrimChatLog trims first when over its limits: fifo, keep_first_user, longest_low_value or role_weighted(see chat/eviction.py)
+EVICTION_POLICY = os.getenv("EVICTION_POLICY", "fifo").lower().strip()
+# summarize the messages trimmed from the chat log instead of dropping them, the summary is sent after the system prompt(see chat/compaction.py)
+COMPACTION = os.getenv("COMPACTION", "False").lower().strip() in ("true", "1", "yes")
+# with COMPACTION, the most tokens the summary can have and how many trimmed messages are summarized at once
+COMPACTION_SUMMARY_TOKENS = int(os.getenv("COMPACTION_SUMMARY_TOKENS", 400))
+COMPACTION_BATCH = int(os.getenv("COMPACTION_BATCH", 8))
+# pull the old messages most like the newest user message back into each request from a vector index of the chat log(see chat/retrieval.py), needs numpy
+RETRIEVAL = os.getenv("RETRIEVAL", "False").lower().strip() in ("true", "1", "yes")
+# with RETRIEVAL, the tokens kept for the retrieved messages and the most messages retrieved
+RETRIEVAL_TOKENS = int(os.getenv("RETRIEVAL_TOKENS", 500))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 3))
+# keep the start of each request the same between requests so provider prompt caching works(see chat/trim_chat_log.py Prefix Stability)
+PREFIX_STABLE = os.getenv("PREFIX_STABLE", "False").lower().strip() in ("true", "1", "yes")
+# with PREFIX_STABLE, the ||time|| wildcard of the system prompt is rounded down to this many seconds
+PREFIX_TIME_GRANULARITY = int(os.getenv("PREFIX_TIME_GRANULARITY", 3600))
+# with PREFIX_STABLE, the fraction of the token limit trimmed below it when trimming, so the next few messages don't trim anything
+PREFIX_TRIM_FRACTION = float(os.getenv("PREFIX_TRIM_FRACTION", 0.25))
+# reserve room for the reply from the lengths of recent replies instead of max_completion_tokens, and send the rest of the context as the completion limit(see chat/trim_chat_log.py Adaptive Completion)
+ADAPTIVE_COMPLETION = os.getenv("ADAPTIVE_COMPLETION", "False").lower().strip() in ("true", "1", "yes")
+# with ADAPTIVE_COMPLETION, the fewest tokens reserved for a reply and the most a reply can be given(0 is the rest of the context)
+ADAPTIVE_COMPLETION_MIN = int(os.getenv("ADAPTIVE_COMPLETION_MIN", 256))
+ADAPTIVE_COMPLETION_CAP = int(os.getenv("ADAPTIVE_COMPLETION_CAP", 4096))
 
 
 # ====(LOGGING SETTINGS)====
@@ -45,6 +89,24 @@ if os.getenv("IS_SETUP", None) is not None:
 DEFAULT_EXPORT_DIR = os.getenv("DEFAULT_EXPORT_DIR", "./files/chats/")
 
 DEFAULT_SAVES_DIR = os.getenv("DEFAULT_SAVE_DIR", "./files/saves/")
+# codec used when writing save files, one of json, json_compact, orjson or msgpack. Files written with any codec can always be read back.
+SAVE_CODEC = os.getenv("SAVE_CODEC", "json")
+# optional compression for saves and markdown exports: none, gzip or zstd(requires the zstandard package)
+# levels can be left unset to use the compressor's default (gzip: 1-9, default 6, zstd: 1-22, default 3)
+SAVE_COMPRESSION = os.getenv("SAVE_COMPRESSION", "none")
+SAVE_COMPRESSION_LEVEL = os.getenv("SAVE_COMPRESSION_LEVEL", None)
+if SAVE_COMPRESSION_LEVEL is not None:
+    SAVE_COMPRESSION_LEVEL = int(SAVE_COMPRESSION_LEVEL)
+# byte budget of the JsonSaveHandler cache of parsed saves, 0 disables the cache
+SAVE_CACHE_MAX_BYTES = int(os.getenv("SAVE_CACHE_MAX_BYTES", 0))
+# term counts of every save used by SaveSearcher, kept outside the saves directory so it is never listed as a save
+SAVE_SEARCH_INDEX_PATH = os.getenv("SAVE_SEARCH_INDEX_PATH", "./files/save_search_index.json")
+# processes used to scan saves when searching them, 0 uses one per CPU
+SAVE_SEARCH_WORKERS = int(os.getenv("SAVE_SEARCH_WORKERS", 0))
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "none")
+EXPORT_COMPRESSION_LEVEL = os.getenv("EXPORT_COMPRESSION_LEVEL", None)
+if EXPORT_COMPRESSION_LEVEL is not None:
+    EXPORT_COMPRESSION_LEVEL = int(EXPORT_COMPRESSION_LEVEL)
 
 
 SYSTEM_PROMPT_DIR = os.getenv("SYSTEM_PROMPT_DIR", "./files/system_prompts/")
@@ -102,6 +164,11 @@ if AUTO_SAVE_FREQUENCY is not None:
         IS_AUTOSAVING = False
 else:
     IS_AUTOSAVING = False
+# =======(SNAPSHOT SETTINGS)=======
+# the most snapshots a ChatWrapper keeps(see ChatWrapper.push_snapshot), pushing another drops the oldest
+SNAPSHOT_STACK_SIZE = int(os.getenv("SNAPSHOT_STACK_SIZE", 8))
+# snapshots kept in memory before the oldest are written to the save handler in the background, 0 keeps them all in memory
+SNAPSHOT_SPILL_AFTER = int(os.getenv("SNAPSHOT_SPILL_AFTER", 0))
 
 #=============(EXPORTER CONTEXT MANAGER)================
 EXPORTER_CONTEXT_MANAGER_DIR = os.getenv("EXPORTER_CONTEXT_MANAGER_DIR", "./files/exporter_context_manager/")
@@ -109,6 +176,32 @@ BASE_NAME = os.getenv("BASE_NAME", "ecm__")
 # ====(SETTINGS BAG)====
 class SettingsObj:
     def __init__(self):
+        # CHATLOG SETTINGS
+        self.DEFAULT_CHATLOG_HANDLER = DEFAULT_CHATLOG_HANDLER
+        self.CHATLOG_DIR = CHATLOG_DIR
+        self.CHATLOG_DATABASE = CHATLOG_DATABASE
+        self.STORED_CHATLOG_EMBED = STORED_CHATLOG_EMBED
+        self.TIERED_HOT_MESSAGES = TIERED_HOT_MESSAGES
+        self.TIERED_BLOCK_MESSAGES = TIERED_BLOCK_MESSAGES
+        self.TIERED_WARM_BLOCKS = TIERED_WARM_BLOCKS
+        self.TOKEN_COUNT_THREADS = TOKEN_COUNT_THREADS
+        self.TOKEN_ESTIMATE = TOKEN_ESTIMATE
+        self.TOKEN_ESTIMATE_ERROR = TOKEN_ESTIMATE_ERROR
+        self.OVERSIZE_POLICY = OVERSIZE_POLICY
+        self.EVICTION_POLICY = EVICTION_POLICY
+        self.COMPACTION = COMPACTION
+        self.COMPACTION_SUMMARY_TOKENS = COMPACTION_SUMMARY_TOKENS
+        self.COMPACTION_BATCH = COMPACTION_BATCH
+        self.RETRIEVAL = RETRIEVAL
+        self.RETRIEVAL_TOKENS = RETRIEVAL_TOKENS
+        self.RETRIEVAL_TOP_K = RETRIEVAL_TOP_K
+        self.PREFIX_STABLE = PREFIX_STABLE
+        self.PREFIX_TIME_GRANULARITY = PREFIX_TIME_GRANULARITY
+        self.PREFIX_TRIM_FRACTION = PREFIX_TRIM_FRACTION
+        self.ADAPTIVE_COMPLETION = ADAPTIVE_COMPLETION
+        self.ADAPTIVE_COMPLETION_MIN = ADAPTIVE_COMPLETION_MIN
+        self.ADAPTIVE_COMPLETION_CAP = ADAPTIVE_COMPLETION_CAP
+
         # LOGGING SETTINGS
         self.level = level
         self.DEFAULT_LOGGING_LEVEL = DEFAULT_LOGGING_LEVEL
@@ -125,6 +218,14 @@ class SettingsObj:
         # CHAT SETTINGS
         self.DEFAULT_EXPORT_DIR = DEFAULT_EXPORT_DIR
         self.DEFAULT_SAVES_DIR = DEFAULT_SAVES_DIR
+        self.SAVE_CODEC = SAVE_CODEC
+        self.SAVE_COMPRESSION = SAVE_COMPRESSION
+        self.SAVE_COMPRESSION_LEVEL = SAVE_COMPRESSION_LEVEL
+        self.SAVE_CACHE_MAX_BYTES = SAVE_CACHE_MAX_BYTES
+        self.SAVE_SEARCH_INDEX_PATH = SAVE_SEARCH_INDEX_PATH
+        self.SAVE_SEARCH_WORKERS = SAVE_SEARCH_WORKERS
+        self.EXPORT_COMPRESSION = EXPORT_COMPRESSION
+        self.EXPORT_COMPRESSION_LEVEL = EXPORT_COMPRESSION_LEVEL
         self.SYSTEM_PROMPT_DIR = SYSTEM_PROMPT_DIR
         self.DEFAULT_SYSTEM_PROMPT = DEFAULT_SYSTEM_PROMPT
 
@@ -141,6 +242,10 @@ class SettingsObj:
         self.AUTO_SAVE_MAX_SAVES = AUTO_SAVE_MAX_SAVES
         self.AUTO_SAVE_ENTRY_NAME = AUTO_SAVE_ENTRY_NAME
         self.IS_AUTOSAVING = IS_AUTOSAVING
+
+        # SNAPSHOT SETTINGS
+        self.SNAPSHOT_STACK_SIZE = SNAPSHOT_STACK_SIZE
+        self.SNAPSHOT_SPILL_AFTER = SNAPSHOT_SPILL_AFTER
         
         # EXPORTER CONTEXT MANAGER
         self.EXPORTER_CONTEXT_MANAGER_DIR = EXPORTER_CONTEXT_MANAGER_DIR
@@ -170,6 +275,18 @@ def make_settings_string(show_api_key: bool = False) -> str:
     settings = [
         "====(CHATLOG SETTINGS)====",
         f" Default ChatLog Handler: {DEFAULT_CHATLOG_HANDLER}",
+        f" ChatLog Directory: {CHATLOG_DIR}",
+        f" ChatLog Database: {CHATLOG_DATABASE}",
+        f" Stored ChatLog Saves Embed Messages: {STORED_CHATLOG_EMBED}",
+        f" Tiered ChatLog: {TIERED_HOT_MESSAGES} hot messages, {TIERED_BLOCK_MESSAGES} messages a block, {TIERED_WARM_BLOCKS} warm blocks",
+        f" Token Count Threads: {TOKEN_COUNT_THREADS}",
+        f" Token Estimate: {TOKEN_ESTIMATE}, error bound: {TOKEN_ESTIMATE_ERROR}",
+        f" Oversize Policy: {OVERSIZE_POLICY}",
+        f" Eviction Policy: {EVICTION_POLICY}",
+        f" Compaction: {COMPACTION}, summary tokens: {COMPACTION_SUMMARY_TOKENS}, batch: {COMPACTION_BATCH}",
+        f" Retrieval: {RETRIEVAL}, tokens: {RETRIEVAL_TOKENS}, top k: {RETRIEVAL_TOP_K}",
+        f" Prefix Stable: {PREFIX_STABLE}, time granularity: {PREFIX_TIME_GRANULARITY}s, trim fraction: {PREFIX_TRIM_FRACTION}",
+        f" Adaptive Completion: {ADAPTIVE_COMPLETION}, min: {ADAPTIVE_COMPLETION_MIN}, cap: {ADAPTIVE_COMPLETION_CAP}",
         "=====(LOGGING SETTINGS)===",
         f"Default Logging Level: {DEFAULT_LOGGING_LEVEL}",
         f"Default Logging Directory: {DEFAULT_LOGGING_DIR}",
@@ -180,6 +297,12 @@ def make_settings_string(show_api_key: bool = False) -> str:
         "====(CHAT SETTINGS)====",
         f"Default Export Directory: {DEFAULT_EXPORT_DIR}",
         f"Default Saves Directory: {DEFAULT_SAVES_DIR}",
+        f"Save Codec: {SAVE_CODEC}",
+        f"Save Compression: {SAVE_COMPRESSION} (level: {SAVE_COMPRESSION_LEVEL})",
+        f"Save Cache Max Bytes: {SAVE_CACHE_MAX_BYTES}",
+        f"Save Search Index Path: {SAVE_SEARCH_INDEX_PATH}",
+        f"Save Search Workers: {SAVE_SEARCH_WORKERS}",
+        f"Export Compression: {EXPORT_COMPRESSION} (level: {EXPORT_COMPRESSION_LEVEL})",
         f"System Prompt Directory: {SYSTEM_PROMPT_DIR}",
         f"Default System Prompt: {DEFAULT_SYSTEM_PROMPT}",
         "====(FROM FILE SYSTEM)====",
@@ -193,6 +316,8 @@ def make_settings_string(show_api_key: bool = False) -> str:
         f"Auto Save Entries: {AUTO_SAVE_MAX_SAVES}",
         f"Auto Save Entry Name: {AUTO_SAVE_ENTRY_NAME}",
         f"Is Autosaving: {IS_AUTOSAVING}",
+        "====(SNAPSHOT SETTINGS)====",
+        f"Snapshot Stack Size: {SNAPSHOT_STACK_SIZE}, spill after: {SNAPSHOT_SPILL_AFTER}",
         "====(EXPORTER CONTEXT MANAGER)====",
         f"Exporter Context Manager Directory: {EXPORTER_CONTEXT_MANAGER_DIR}",
         f"Base Name: {BASE_NAME}"
@@ -22,7 +22,7 @@ TO BE MOVED TO DEDICATED DOCUMENTATION FILE, (Once created)
             "trim_object": dict (See TrimChatLog for more info),
                 model: str,
                 "max_tokens": int(optional but defaults to 8000),
-                "token_padding": int(optional but defaults to 500),
+                "token_padding": int(optional but defaults to 0),
                 "max_completion_tokens": int(optional but defaults to 1000),
                 "max_messages": int(optional but defaults to 200),
             "chat_completion_wrapper": dict (See ChatCompletionWrapper for more info),
@@ -0,0 +1,79 @@
+from file_handlers import serializers
+import time
+import json
+import os
+
+ROUNDS = 50
+
+
+def time_codec(name: str, save_dict: dict, compression: str = None, level: int = None) -> dict:
+    """Encodes and decodes the save dict ROUNDS times with the codec and compression, returns the size and average times"""
+    codec = serializers.get_codec(name)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        data = serializers.encode_save(save_dict, codec, compression, level)
+    encode_time = (time.perf_counter() - start) / ROUNDS
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        loaded = serializers.decode_save(data)
+    decode_time = (time.perf_counter() - start) / ROUNDS
+    assert loaded == save_dict
+    if compression is not None:
+        name = f"{name}+{compression}" + (f"-{level}" if level is not None else "")
+    return {"name": name, "size": len(data), "encode": encode_time, "decode": decode_time}
+
+
+def main():
+    divider = "-----------------------------------------------"*2
+    divider_len = len(divider)
+    print(divider)
+    print("\u001b[35m<<<===============(SAVE CODEC TIMING SCRIPT)===============<<<\u001b[0m".center(divider_len, " "))
+    print(divider)
+    print("\n")
+    print("Welcome to the save codec timing script.")
+    print("We will encode and decode ./testing/test_save.json with every available codec and compression and compare the sizes and times.")
+    print("Codecs that need a package that is not installed are skipped: ", [name for name in serializers.CODECS if name not in serializers.available_codecs()])
+    print("\n\n")
+
+    with open("./testing/test_save.json") as f:
+        save_dict = json.load(f)
+
+    results = [time_codec(name, save_dict) for name in serializers.available_codecs()]
+    for compression in serializers.COMPRESSORS:
+        if not serializers.COMPRESSORS[compression].is_available():
+            print(f"Skipping {compression}, it requires the {serializers.COMPRESSORS[compression].requires} package")
+            continue
+        for name in ("json_compact", "orjson", "msgpack"):
+            if name in serializers.available_codecs():
+                results.append(time_codec(name, save_dict, compression))
+        results.append(time_codec("orjson" if "orjson" in serializers.available_codecs() else "json_compact", save_dict, compression, 1))
+    baseline = results[0]
+    lines = [
+        "Test Results:",
+        f"Averaged over {ROUNDS} rounds",
+        f"{'codec':<22}{'bytes':>10}{'size %':>9}{'encode ms':>12}{'decode ms':>12}{'enc MB/s':>10}{'dec MB/s':>10}",
+    ]
+    for result in results:
+        mb = baseline["size"] / 1_000_000
+        lines.append(
+            f"{result['name']:<22}{result['size']:>10}{result['size'] / baseline['size'] * 100:>8.1f}%"
+            f"{result['encode'] * 1000:>12.2f}{result['decode'] * 1000:>12.2f}"
+            f"{mb / result['encode']:>10.1f}{mb / result['decode']:>10.1f}"
+        )
+    lines.append("MB/s is measured against the size of the json save, so the codecs can be compared directly.")
+    msg = "\n".join(lines)
+    print(msg)
+
+    ans = input("Save Test Results? (y/n)")
+    if ans == "y":
+        files_numb = len(os.listdir("./testing/test_results/"))
+        with open(f"./testing/test_results/time_save_codecs__{str(files_numb)}.txt", "w") as f:
+            f.write(msg)
+        print("Saved test results to ./testing/test_results/time_save_codecs__<numb>.txt")
+    else:
+        print("Not saving test results")
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import unittest
+
+import chat
+import exceptions
+from chat import arrays, tokenizer
+from chat.arrays import MessageArrays
+
+
+@unittest.skipUnless(arrays.is_available(), "message arrays need numpy")
+class TestMessageArrays(unittest.TestCase):
+    def setUp(self):
+        self.arrays = MessageArrays()
+        for i in range(100):
+            self.arrays.append(10 + i, "user" if i % 2 == 0 else "assistant", 1000.0 + i)
+
+    def test_growth_and_views(self):
+        self.assertEqual(len(self.arrays), 100)
+        self.assertEqual(self.arrays.tokens[-1], 109)
+        view = self.arrays.view(10, 20)
+        self.assertEqual(len(view.tokens), 10)
+        # a view shares the memory of the arrays
+        view.tokens[0] = 0
+        self.assertEqual(self.arrays.tokens[10], 0)
+        self.assertEqual(len(self.arrays.view(-5)), 3)
+        self.assertEqual(len(self.arrays.view(-5).roles), 5)
+
+    def test_role_totals_and_fit(self):
+        totals = self.arrays.role_totals()
+        self.assertEqual(totals["user"], {"messages": 50, "tokens": sum(10 + i for i in range(0, 100, 2))})
+        self.assertNotIn("system", totals)
+        self.assertEqual(self.arrays.role_totals(0, 2)["assistant"], {"messages": 1, "tokens": 11})
+        # 109 + 108 + 107 = 324 fits in 330, with 4 tokens of overhead each it doesn't
+        self.assertEqual(self.arrays.fit_from_end(330), 97)
+        self.assertEqual(self.arrays.fit_from_end(330, {"user": 4, "assistant": 4}), 98)
+        self.assertEqual(self.arrays.fit_from_end(330, max_messages=1), 99)
+        self.assertEqual(self.arrays.fit_from_end(5), 100)
+        self.assertEqual(self.arrays.fit_from_end(10, end=1), 0)
+
+    def test_time_range(self):
+        self.assertEqual(self.arrays.time_range(1010.0, 1020.0), (10, 20))
+        self.assertEqual(self.arrays.time_range(end_time=1000.5), (0, 1))
+        # times never go backwards
+        self.arrays.append(1, "user", 5.0)
+        self.assertEqual(self.arrays.timestamps[-1], 1099.0)
+
+    def test_save_and_load(self):
+        loaded = MessageArrays.from_dict(self.arrays.to_dict())
+        self.assertTrue((loaded.tokens == self.arrays.tokens).all())
+        self.assertTrue((loaded.timestamps == self.arrays.timestamps).all())
+        self.assertEqual(loaded.role_totals(), self.arrays.role_totals())
+        save = self.arrays.to_dict()
+        save["length"] = 5
+        with self.assertRaises(exceptions.BadSaveDictionaryError):
+            MessageArrays.from_dict(save)
+
+
+@unittest.skipUnless(arrays.is_available(), "message arrays need numpy")
+class TestChatLogArrays(unittest.TestCase):
+    def test_kept_with_the_messages(self):
+        chatlog = chat.ChatLog("gpt-4")
+        factory = chatlog.get_message_factory()
+        messages = [factory(f"message number {i} " * (i + 1), "user" if i % 2 == 0 else "assistant") for i in range(20)]
+        chatlog.add_messages(messages)
+        self.assertEqual(list(chatlog.arrays.tokens), [msg.tokens for msg in messages])
+        stats = chatlog.arrays.stats()
+        self.assertEqual(stats["tokens"], sum(msg.tokens for msg in messages))
+        self.assertEqual(stats["roles"]["assistant"]["messages"], 10)
+        loaded = chat.ChatLog("gpt-4")
+        loaded.load_from_dict(chatlog.make_save_dict())
+        self.assertTrue((loaded.arrays.timestamps == chatlog.arrays.timestamps).all())
+        # replacing data rebuilds them, without the times
+        chatlog.data = chatlog.data[:5]
+        self.assertEqual(len(chatlog.arrays), 5)
+        self.assertEqual(chatlog.arrays.stats()["first_time"], None)
+
+    def test_trim_chat_log_stats(self):
+        trim = chat.TrimChatLog(max_tokens=1000, max_completion_tokens=200)
+        for i in range(50):
+            trim.user_message = f"Question {i} " * 10
+            trim.assistant_message = f"Answer {i} " * 20
+        stats = trim.history_stats()
+        self.assertEqual(stats["messages"], 100)
+        self.assertEqual(stats["fitting_messages"], len(trim.trimmed_chatlog))
+        self.assertIn("History by role: user 50 messages", repr(trim))
+        lazy = chat.TrimChatLog()
+        lazy.load_from_save_dict(trim.make_save_dict())
+        lazy.user_message = "hello"
+        self.assertIsNone(lazy.history_stats())
+        times = list(lazy._pending_times)
+        lazy.load_full_history()
+        self.assertEqual(lazy.chatlog.arrays.timestamps[-1], times[-1])
+        self.assertEqual(lazy.history_stats()["messages"], 101)
+        self.assertEqual(lazy.history_stats()["tokens"], stats["tokens"] + tokenizer.count_tokens("hello", "gpt-4"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -172,6 +172,17 @@ class TestChatWrapper(unittest.TestCase):
         self.assertIsInstance(self.chat_wrapper.stream_handler, AbstractStreamOutputHandler)
         self.assertIsInstance(self.chat_wrapper.completion_wrapper.stream_handler, AbstractStreamOutputHandler)
         self.assertTrue(self.chat_wrapper._has_stream_handler())
+    def test_model_summarizer_does_not_stream(self):
+        """Test that the default summarizer has its own completion wrapper, not streamed to the chat's stream handler"""
+        self.chat_wrapper.add_stream_handler(self.stream_handler)
+        self.chat_wrapper.set_chat_completion_params(temperature=1.5)
+        self.chat_wrapper.use_model_summarizer()
+        summary_wrapper = self.chat_wrapper.trim_object.compactor.summarizer.completion_wrapper
+        self.assertIsNot(summary_wrapper, self.chat_wrapper.completion_wrapper)
+        self.assertIsNone(summary_wrapper.stream_handler)
+        self.assertFalse(summary_wrapper.stream)
+        self.assertIsNone(summary_wrapper.parameters.temperature)
+        self.assertIs(self.chat_wrapper.completion_wrapper.stream_handler, self.stream_handler)
     def test_not_a_stream_handler(self):
         """Test that the correct error is raised when the object is not a stream handler"""
         class Example:
@@ -0,0 +1,112 @@
+import unittest
+
+import chat
+from chat import tokenizer
+from chat.compaction import CompletionSummarizer, ExtractiveSummarizer, HistoryCompactor
+
+
+class StandInCompletionWrapper:
+    """Stands in for a ChatCompletionWrapper, replies with the first line of the new messages."""
+
+    def __init__(self):
+        self.requests = []
+
+    def chat(self, messages, max_tokens=None):
+        self.requests.append((messages, max_tokens))
+        return "Summary: " + messages[-1]["content"].split("New messages:\n")[1].splitlines()[0]
+
+
+class TestSummarizers(unittest.TestCase):
+    def test_extractive_keeps_budget_and_order(self):
+        messages = [
+            chat.Message("user", "My name is Sam and I am planning a trip to Japan. Hello there.", "gpt-4"),
+            chat.Message("assistant", "Japan is great in April for the cherry blossoms. Sure!", "gpt-4"),
+            chat.Message("user", "I want to visit Kyoto and Tokyo in April.", "gpt-4"),
+        ] * 3
+        summary = ExtractiveSummarizer().summarize(None, messages, 40, "gpt-4")
+        self.assertLessEqual(tokenizer.count_tokens(summary, "gpt-4"), 40)
+        lines = summary.splitlines()
+        # repeats are only kept once
+        self.assertEqual(len(lines), len(set(lines)))
+        self.assertIn("user: I want to visit Kyoto and Tokyo in April.", lines)
+        rolled = ExtractiveSummarizer().summarize(summary, [chat.Message("user", "Kyoto temples matter most to me.", "gpt-4")], 40, "gpt-4")
+        self.assertLessEqual(tokenizer.count_tokens(rolled, "gpt-4"), 40)
+        self.assertTrue(rolled.endswith("user: Kyoto temples matter most to me."))
+
+    def test_completion_summarizer(self):
+        wrapper = StandInCompletionWrapper()
+        summary = CompletionSummarizer(wrapper).summarize("old", [chat.Message("user", "hello", "gpt-4")], 50, "gpt-4")
+        self.assertEqual(summary, "Summary: user: hello")
+        self.assertEqual(wrapper.requests[0][1], 50)
+        self.assertIn("Summary so far:\nold", wrapper.requests[0][0][1]["content"])
+
+
+class TestHistoryCompactor(unittest.TestCase):
+    def test_background_batches(self):
+        compactor = HistoryCompactor("gpt-4", batch_messages=4, summary_tokens=100)
+        messages = [chat.Message("user", f"Fact number {i} is about topic {i}.", "gpt-4") for i in range(10)]
+        compactor.submit(messages[:3])
+        self.assertIsNone(compactor.summary)
+        compactor.submit(messages[3:])
+        self.assertTrue(compactor.flush(timeout=10))
+        self.assertEqual(compactor.pending, [])
+        self.assertIn("Fact number 9", compactor.summary)
+        content, tokens = compactor.snapshot()
+        self.assertEqual(tokens, tokenizer.count_tokens(content, "gpt-4"))
+        compactor.reset()
+        self.assertEqual(compactor.snapshot(), (None, 0))
+        compactor.close()
+
+    def test_thread_ends_when_idle(self):
+        """The thread only runs while there is something to summarize, so a compactor nobody closes can still be freed"""
+        compactor = HistoryCompactor("gpt-4", batch_messages=2, summary_tokens=100)
+        compactor.submit([chat.Message("user", f"Fact number {i}.", "gpt-4") for i in range(2)])
+        thread = compactor._thread
+        self.assertTrue(compactor.flush(timeout=10))
+        if thread is not None:
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+        self.assertIsNone(compactor._thread)
+        # started again for the next batch
+        compactor.submit([chat.Message("user", f"Fact number {i}.", "gpt-4") for i in range(2, 4)])
+        self.assertTrue(compactor.flush(timeout=10))
+        self.assertIn("Fact number 3", compactor.summary)
+        self.assertEqual(compactor.batches, 2)
+        compactor.close()
+        self.assertIsNone(compactor._thread)
+
+
+class TestTrimChatLogCompaction(unittest.TestCase):
+    def test_summary_is_sent_in_budget(self):
+        trim = chat.TrimChatLog(max_tokens=1000, max_completion_tokens=200, system_prompt="You are helpful.", compaction=True)
+        trim.compactor.background = False
+        trim.compactor.summary_tokens = 150
+        trim.user_message = "My name is Sam and my cat is called Miso."
+        for i in range(40):
+            trim.assistant_message = f"Reply {i} about the weather being nice today. " * 3
+            trim.user_message = f"Question {i}?"
+        finished = trim.get_finished_chatlog()
+        self.assertEqual(finished[1]["role"], "system")
+        self.assertIn("Miso", finished[1]["content"])
+        self.assertLessEqual(tokenizer.count_chat_tokens(finished, trim.model), trim.max_tokens - trim.max_completion_tokens)
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(trim.make_save_dict())
+        self.assertEqual(loaded.summary, trim.summary)
+        self.assertEqual(len(loaded.compactor.pending), len(trim.compactor.pending))
+        trim.reset()
+        self.assertIsNone(trim.summary)
+        self.assertEqual(len(trim.get_finished_chatlog()), 1)
+
+    def test_bulk_history_is_summarized(self):
+        trim = chat.TrimChatLog(max_tokens=1000, max_completion_tokens=200, compaction=True)
+        history = [{"role": "user", "content": "Remember the code word is pineapple."}]
+        history += [{"role": "assistant" if i % 2 else "user", "content": f"Message {i} with filler text. " * 5} for i in range(200)]
+        trim.add_messages_from_dict(history)
+        self.assertTrue(trim.compactor.flush(timeout=10))
+        self.assertIn("pineapple", trim.summary)
+        trim.compaction = False
+        self.assertIsNone(trim.summary)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
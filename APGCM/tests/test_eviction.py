@@ -0,0 +1,98 @@
+import unittest
+
+import chat
+import exceptions
+from chat import tokenizer
+from chat.eviction import EvictionQueue, LongestLowValueEviction, RoleWeightedEviction
+
+
+class TestEvictionQueue(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            chat.Message("user", "short question", "gpt-4"),
+            chat.Message("assistant", "a long answer " * 50, "gpt-4"),
+            chat.Message("user", "another short question", "gpt-4"),
+            chat.Message("assistant", "a short answer", "gpt-4"),
+            chat.Message("user", "the newest question", "gpt-4"),
+            chat.Message("assistant", "the newest answer", "gpt-4"),
+        ]
+
+    def test_longest_low_value_order(self):
+        queue = EvictionQueue(LongestLowValueEviction())
+        queue.rebuild(self.messages)
+        self.assertIs(queue.pop(), self.messages[1])
+        self.assertIs(queue.pop(), self.messages[3])
+        # the longer question first, and the newest two are kept while there is anything else
+        self.assertIs(queue.pop(), self.messages[2])
+        self.assertIs(queue.pop(), self.messages[0])
+        self.assertIsNone(queue.pop())
+
+    def test_tombstones_and_pins(self):
+        queue = EvictionQueue(RoleWeightedEviction())
+        queue.rebuild(self.messages)
+        queue.discard(self.messages[1])
+        self.assertTrue(queue.pin(self.messages[3]))
+        self.assertFalse(queue.is_fifo)
+        self.assertIs(queue.pop(), self.messages[0])
+        self.assertIs(queue.pop(), self.messages[2])
+        self.assertIsNone(queue.pop())
+        self.assertTrue(queue.unpin(self.messages[3]))
+        self.assertIs(queue.pop(), self.messages[3])
+        self.assertEqual(len(queue), 2)
+
+
+class TestTrimChatLogEviction(unittest.TestCase):
+    def fill(self, trim: chat.TrimChatLog) -> None:
+        trim.user_message = "Please help me plan a trip to Japan in April."
+        for i in range(60):
+            trim.assistant_message = f"Here is part {i} of the plan. " * 15
+            trim.user_message = f"What about day {i}?"
+
+    def test_keep_first_user(self):
+        trim = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, eviction_policy="keep_first_user")
+        self.fill(trim)
+        finished = trim.get_finished_chatlog()
+        self.assertEqual(finished[0]["content"], "Please help me plan a trip to Japan in April.")
+        self.assertEqual(finished[-1]["content"], "What about day 59?")
+        self.assertLessEqual(tokenizer.count_chat_tokens(finished, trim.model), trim.max_tokens - trim.max_completion_tokens)
+        stats = trim.eviction_stats
+        self.assertEqual(stats["policy"], "keep_first_user")
+        self.assertEqual(stats["evicted_messages"], trim.trimmed_messages)
+        self.assertEqual(stats["pinned_messages"], 1)
+        fifo = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200)
+        self.fill(fifo)
+        self.assertNotEqual(fifo.get_finished_chatlog()[0]["content"], "Please help me plan a trip to Japan in April.")
+
+    def test_longest_low_value_keeps_questions(self):
+        trim = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, eviction_policy="longest_low_value")
+        self.fill(trim)
+        roles = [msg.role for msg in trim.trimmed_chatlog]
+        # the short questions outlive the long answers
+        self.assertGreater(roles.count("user"), roles.count("assistant"))
+        self.assertLessEqual(trim.trimmed_chatlog_tokens, trim.max_chatlog_tokens)
+        self.assertEqual(trim.trimmed_chatlog_tokens, sum(trim._message_token_bounds(msg)[1] for msg in trim.trimmed_chatlog))
+        # adding the same messages at once ends with the same tokens in the limit
+        bulk = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, eviction_policy="longest_low_value")
+        bulk.add_messages(list(trim.chatlog.data))
+        self.assertLessEqual(bulk.trimmed_chatlog_tokens, bulk.max_chatlog_tokens)
+        self.assertEqual(bulk.trimmed_chatlog[0].content, "Please help me plan a trip to Japan in April.")
+
+    def test_pins_are_saved(self):
+        trim = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, eviction_policy="role_weighted")
+        trim.user_message = "Remember: my name is Sam."
+        self.assertTrue(trim.pin_message(trim.trimmed_chatlog[0]))
+        self.fill(trim)
+        self.assertEqual(trim.trimmed_chatlog[0].content, "Remember: my name is Sam.")
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(trim.make_save_dict())
+        self.assertEqual(loaded.eviction_policy.name, "role_weighted")
+        self.assertEqual(loaded.eviction_stats["pinned_messages"], 1)
+        self.assertEqual([msg.content for msg in loaded.trimmed_chatlog], [msg.content for msg in trim.trimmed_chatlog])
+
+    def test_bad_eviction_policy(self):
+        with self.assertRaises(exceptions.UnknownEvictionPolicyError):
+            chat.TrimChatLog(eviction_policy="random")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
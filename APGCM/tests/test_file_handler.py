@@ -41,6 +41,21 @@ class TestGeneralFileHandler(unittest.TestCase):
         with self.assertRaises(exceptions.FileExistsError):
             self.gen.write_to_file("test8.txt", "Hello World!")
         self.gen.write_to_file("test8.txt", "Hello World!", overwrite=True)
+    def test_compressed_file(self):
+        """Test that a compressed handler adds the compressor's suffix, writes a real gzip file and reads it back"""
+        import gzip
+        gen = GeneralFileHandler(save_folder = "./testing/file_handler", file_extension=".txt", compression="gzip")
+        gen.write_to_file("test9", "Hello World!" * 100)
+        path = self.file_path / "test9.txt.gz"
+        try:
+            self.assertTrue(path.exists())
+            self.assertLess(path.stat().st_size, 100 * len("Hello World!"))
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(f.read(), "Hello World!" * 100)
+            self.assertEqual(gen.get_file_contents("test9"), "Hello World!" * 100)
+            self.assertEqual(gen.get_filenames(remove_path=True), ["test9"])
+        finally:
+            os.remove(path)
         
     
         
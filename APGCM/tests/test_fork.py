@@ -0,0 +1,158 @@
+import gc
+import threading
+import time
+import unittest
+import weakref
+
+import chat
+from chat import arrays, tokenizer
+from chat_wrapper import ChatWrapper
+from settings import OPENAI_API_KEY
+
+
+class TestChatLogFork(unittest.TestCase):
+    def setUp(self):
+        self.chatlog = chat.ChatLog("gpt-4")
+        self.factory = self.chatlog.get_message_factory()
+        for i in range(10):
+            self.chatlog.add_message(self.factory(f"message {i}", "user" if i % 2 == 0 else "assistant"))
+
+    def test_copy_on_write(self):
+        fork = self.chatlog.fork()
+        # nothing is copied until one of them changes
+        self.assertIs(fork.data, self.chatlog.data)
+        self.assertNotEqual(fork.uuid, self.chatlog.uuid)
+        fork.add_message(self.factory("only in the fork", "user"))
+        self.assertIsNot(fork.data, self.chatlog.data)
+        self.assertEqual(len(self.chatlog), 10)
+        self.assertEqual(len(fork), 11)
+        # the messages themselves are still shared
+        self.assertIs(fork.data[0], self.chatlog.data[0])
+        self.assertEqual(fork.last("user").content, "only in the fork")
+        self.assertEqual(self.chatlog.last("user").content, "message 8")
+        self.assertEqual(fork.search("fork", limit=1)[0].position, 10)
+        self.assertEqual(self.chatlog.search("fork", limit=1), [])
+        self.chatlog.add_message(self.factory("only in the original", "assistant"))
+        self.assertEqual(fork.data[-1].content, "only in the fork")
+        if arrays.is_available():
+            self.assertEqual(len(fork.arrays), 11)
+            self.assertTrue((fork.arrays.timestamps[:10] == self.chatlog.arrays.timestamps[:10]).all())
+
+    def test_reset_and_recount(self):
+        fork = self.chatlog.fork()
+        fork.reset()
+        self.assertEqual(len(fork), 0)
+        self.assertEqual(len(self.chatlog), 10)
+        # a fork that was reset or dropped no longer shares anything
+        del fork
+        data = self.chatlog.data
+        self.chatlog.add_message(self.factory("message 10", "user"))
+        self.assertIs(self.chatlog.data, data)
+        fork = self.chatlog.fork()
+        fork.model = "text-davinci-003"
+        self.assertEqual(fork.recount_tokens(), 11)
+        # the original keeps its messages and their counts
+        self.assertEqual(self.chatlog.data[0].model, "gpt-4")
+        self.assertEqual(fork.data[0].model, "text-davinci-003")
+        self.assertEqual(fork.data[0].content, self.chatlog.data[0].content)
+
+    def tearDown(self):
+        del self.chatlog
+
+
+class TestTrimChatLogFork(unittest.TestCase):
+    def setUp(self):
+        self.trim = chat.TrimChatLog(max_tokens=600, max_completion_tokens=100, system_prompt="You are helpful.", reminder="Be brief.")
+        for i in range(40):
+            self.trim.user_message = f"Question {i} about something."
+            self.trim.assistant_message = f"Answer {i} to the question. " * 3
+
+    def test_fork_carries_on_separately(self):
+        finished = self.trim.get_finished_chatlog()
+        fork = self.trim.fork()
+        self.assertEqual(fork.get_finished_chatlog(), finished)
+        fork.system_prompt = "You are a pirate."
+        fork.reminder = "Say arr."
+        fork.user_message = "Where is the treasure?"
+        self.assertEqual(self.trim.get_finished_chatlog(), finished)
+        self.assertEqual(len(self.trim.chatlog), 80)
+        self.assertEqual(len(fork.chatlog), 81)
+        self.assertEqual(fork.get_finished_chatlog()[0]["content"], "You are a pirate.")
+        self.assertLessEqual(tokenizer.count_chat_tokens(fork.get_finished_chatlog(), fork.model), fork.max_tokens - fork.max_completion_tokens)
+        # a fork that is reset never touches the history
+        help_mode = self.trim.fork()
+        help_mode.reset()
+        self.assertEqual(len(help_mode.chatlog), 0)
+        self.assertEqual(self.trim.get_finished_chatlog(), finished)
+
+    def test_pins_and_pending_history(self):
+        pinned = self.trim.trimmed_chatlog[0]
+        self.trim.pin_message(pinned)
+        fork = self.trim.fork()
+        fork.unpin_message(pinned)
+        self.assertEqual(self.trim.eviction_stats["pinned_messages"], 1)
+        self.assertEqual(fork.eviction_stats["pinned_messages"], 0)
+        lazy = chat.TrimChatLog()
+        lazy.load_from_save_dict(self.trim.make_save_dict())
+        fork = lazy.fork()
+        fork.user_message = "Only in the fork."
+        self.assertTrue(lazy.is_history_pending)
+        self.assertEqual(len(fork.chatlog), 81)
+        self.assertEqual(len(lazy.chatlog), 80)
+
+    def test_model_change_on_a_fork(self):
+        fork = self.trim.fork()
+        tokens = self.trim.trimmed_chatlog_tokens
+        fork.model = "text-davinci-003"
+        self.assertTrue(all(msg.model == "gpt-4" for msg in self.trim.trimmed_chatlog))
+        self.assertTrue(all(msg.model == "text-davinci-003" for msg in fork.trimmed_chatlog))
+        self.assertEqual(self.trim.trimmed_chatlog_tokens, tokens)
+        # still the end of its own chat log, see Save Layout
+        self.assertIsNotNone(fork._trimmed_chatlog_range())
+
+    def test_dropped_forks_leave_no_threads(self):
+        """A fork's compactor thread only runs while it has a batch, so dropping the fork discards all of it"""
+        self.trim.compaction = True
+        self.trim.compactor.batch_messages = 4
+        threads = threading.active_count()
+        dropped = []
+        for i in range(5):
+            fork = self.trim.fork()
+            for j in range(10):
+                fork.user_message = f"Fork {i} question {j} about something else entirely."
+            self.assertTrue(fork.compactor.flush(timeout=10))
+            self.assertIsNotNone(fork.summary)
+            dropped.append(weakref.ref(fork.compactor))
+            del fork
+        deadline = time.monotonic() + 10
+        while threading.active_count() > threads and time.monotonic() < deadline:
+            time.sleep(0.01)
+        gc.collect()
+        self.assertEqual(threading.active_count(), threads)
+        self.assertTrue(all(ref() is None for ref in dropped))
+        self.trim.compaction = False
+
+    def tearDown(self):
+        del self.trim
+
+
+class TestChatWrapperFork(unittest.TestCase):
+    def test_fork(self):
+        chat_wrapper = ChatWrapper(API_KEY=OPENAI_API_KEY, model="gpt-4")
+        chat_wrapper.auto_setup()
+        chat_wrapper.system_prompt = "You are helpful."
+        chat_wrapper.user_message = "Hello"
+        chat_wrapper.assistant_message = "Hi there"
+        fork = chat_wrapper.fork()
+        fork.system_prompt = "You are a help desk."
+        fork.set_chat_completion_params(temperature=1.5)
+        fork.user_message = "How do I save?"
+        self.assertEqual(chat_wrapper.system_prompt, "You are helpful.")
+        self.assertIsNone(chat_wrapper.completion_wrapper.parameters.temperature)
+        self.assertEqual(len(chat_wrapper.trim_object.chatlog), 2)
+        self.assertEqual(len(fork.trim_object.chatlog), 3)
+        self.assertFalse(fork._is_autosaving)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
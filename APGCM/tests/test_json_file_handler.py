@@ -1,4 +1,5 @@
 from file_handlers import gen_file
+from file_handlers import serializers
 import func
 import unittest
 import logging 
@@ -66,6 +67,62 @@ class TestJSONFileHandler(unittest.TestCase):
             with open(self.file_path + "test8.json", "w") as f:
                 f.write("Hello World!")
             self.json.get_file_contents("test8.json")
+    def test_codecs_round_trip(self):
+        """Test that every available codec writes a file that reads back to the same dict"""
+        for name in serializers.available_codecs():
+            handler = gen_file.JsonFileHandler(save_folder = self.file_path, codec=name)
+            handler.write_to_file(f"codec_{name}.json", self.test_dict)
+            self.assertEqual(handler.get_file_contents(f"codec_{name}.json"), self.test_dict)
+    def test_mixed_codecs_in_one_folder(self):
+        """Test that a handler can read files written by a handler using a different codec"""
+        compact = gen_file.JsonFileHandler(save_folder = self.file_path, codec="json_compact")
+        compact.write_to_file("compact.json", self.test_dict)
+        self.json.write_to_file("pretty.json", self.test_dict)
+        self.assertEqual(self.json.get_file_contents("compact.json"), self.test_dict)
+        self.assertEqual(compact.get_file_contents("pretty.json"), self.test_dict)
+        # compact json is still plain json
+        with open(self.file_path + "compact.json", "r") as f:
+            self.assertEqual(json.load(f), self.test_dict)
+    def test_binary_codec_header(self):
+        """Test that binary codecs write a header recording the codec"""
+        class BinaryJsonCodec(serializers.AbstractCodec):
+            name = "json_compact"
+            is_text = False
+            def dumps(self, obj):
+                return json.dumps(obj).encode("utf-8")
+            def loads(self, data):
+                return json.loads(data)
+        handler = gen_file.JsonFileHandler(save_folder = self.file_path, codec=BinaryJsonCodec())
+        handler.write_to_file("header.json", self.test_dict)
+        with open(self.file_path + "header.json", "rb") as f:
+            self.assertTrue(f.read().startswith(serializers.HEADER_PREFIX + b"codec=json_compact\n"))
+        self.assertEqual(self.json.get_file_contents("header.json"), self.test_dict)
+    def test_compression_round_trip(self):
+        """Test that compressed files read back to the same dict, keep the .json extension and can be read by an uncompressed handler"""
+        for name in serializers.COMPRESSORS:
+            if not serializers.COMPRESSORS[name].is_available():
+                continue
+            handler = gen_file.JsonFileHandler(save_folder = self.file_path, codec="json_compact", compression=name, compression_level=1)
+            handler.write_to_file(f"compressed_{name}.json", self.test_dict)
+            self.assertTrue(os.path.exists(self.file_path + f"compressed_{name}.json"))
+            self.assertEqual(handler.get_file_contents(f"compressed_{name}.json"), self.test_dict)
+            self.assertEqual(self.json.get_file_contents(f"compressed_{name}.json"), self.test_dict)
+        # the uncompressed handler's files can be read by a compressed handler
+        self.json.write_to_file("plain.json", self.test_dict)
+        self.assertEqual(handler.get_file_contents("plain.json"), self.test_dict)
+    def test_headerless_gzip(self):
+        """Test that a gzipped json file without a header is detected and read"""
+        import gzip
+        with gzip.open(self.file_path + "gzipped.json", "wt") as f:
+            json.dump(self.test_dict, f)
+        self.assertEqual(self.json.get_file_contents("gzipped.json"), self.test_dict)
+    def test_unknown_codec(self):
+        with self.assertRaises(exceptions.UnknownCodecError):
+            gen_file.JsonFileHandler(save_folder = self.file_path, codec="not_a_codec")
+        with open(self.file_path + "unknown.json", "wb") as f:
+            f.write(serializers.make_header(codec="not_a_codec") + b"{}")
+        with self.assertRaises(exceptions.UnknownCodecError):
+            self.json.get_file_contents("unknown.json")
     def tearDown(self):
         del self.json
         for file in os.listdir(self.file_path):
@@ -0,0 +1,156 @@
+import os
+import shutil
+import unittest
+
+import chat
+import exceptions
+
+
+class TestJsonlChatLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = "./testing/file_handler/jsonl_chatlog/"
+        self.chatlog = chat.JsonlChatLog("gpt-4", directory=self.directory)
+        self.message_factory = chat.MessageFactory("gpt-4")
+
+    def add_conversation(self, chatlog, count: int = 10):
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            chatlog.add_message(self.message_factory(role=role, content=f"message {i}\nwith a newline"))
+
+    def test_add_and_get_messages(self):
+        """Messages come back from the file in either order, filtered by role and limited"""
+        self.add_conversation(self.chatlog)
+        self.assertEqual(len(self.chatlog), 10)
+        newest = next(iter(self.chatlog.get_messages(limit=1)))
+        self.assertEqual(newest.content, "message 9\nwith a newline")
+        self.assertEqual(newest.tokens, self.message_factory(role="assistant", content=newest.content).tokens)
+        users = self.chatlog.get_messages_as_list(role="user", limit=2)
+        self.assertEqual([msg.content for msg in users], ["message 8\nwith a newline", "message 6\nwith a newline"])
+        oldest = self.chatlog.get_messages_as_dict(limit=1)
+        self.assertEqual(oldest, [{"role": "user", "content": "message 0\nwith a newline"}])
+        self.assertEqual([msg.content for msg in self.chatlog.data[-2:]], ["message 8\nwith a newline", "message 9\nwith a newline"])
+
+    def test_not_a_message(self):
+        with self.assertRaises(exceptions.NotAMessageError):
+            self.chatlog.add_message("hello")
+
+    def test_reopen_file(self):
+        """A new chat log on the same file indexes it, and cuts off a partly written message"""
+        self.add_conversation(self.chatlog, 4)
+        path = self.chatlog.path
+        self.chatlog.close()
+        del self.chatlog
+        with open(path, "ab") as f:
+            f.write(b'{"role": "user", "con')
+        self.chatlog = chat.JsonlChatLog("gpt-4", path=path)
+        self.assertEqual(len(self.chatlog), 4)
+        self.assertEqual(os.path.getsize(path), self.chatlog.file_size)
+
+    def test_file_in_use(self):
+        self.add_conversation(self.chatlog, 1)
+        with self.assertRaises(exceptions.ChatLogFileError):
+            chat.JsonlChatLog("gpt-4", path=self.chatlog.path)
+
+    def test_save_and_load(self):
+        """Saves have every message, or refer to the file without embed_messages, and load into either chat log. An unchanged file is reopened instead of copied"""
+        self.add_conversation(self.chatlog)
+        embedded = self.chatlog.make_save_dict()
+        self.assertEqual(embedded["messages"], self.chatlog.get_finished_chatlog())
+        self.assertFalse(chat.refers_to_storage(embedded))
+        self.chatlog.embed_messages = False
+        save = self.chatlog.make_save_dict()
+        self.assertNotIn("messages", save)
+        self.assertEqual(save["message_count"], 10)
+        in_memory = chat.ChatLog("gpt-4")
+        in_memory.load_from_dict(chat.embed_saved_messages(save))
+        self.assertEqual(in_memory.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+
+        # the original is still using the file, so it is copied
+        copied = chat.JsonlChatLog("gpt-4", directory=self.directory)
+        copied.load_from_dict(save)
+        self.assertNotEqual(copied.path, self.chatlog.path)
+        self.assertEqual(copied.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+
+        path = self.chatlog.path
+        self.chatlog.close()
+        del self.chatlog
+        reopened = chat.JsonlChatLog("gpt-4", directory=self.directory)
+        reopened.load_from_dict(save)
+        self.assertEqual(reopened.path, path)
+        self.assertEqual(reopened.get_finished_chatlog(), copied.get_finished_chatlog())
+        # a file a save refers to is kept when the chat log is reset
+        reopened.reset()
+        self.assertTrue(path.exists())
+        self.chatlog = reopened
+
+    def test_load_in_memory_save(self):
+        chatlog = chat.ChatLog("gpt-4")
+        self.add_conversation(chatlog, 3)
+        self.chatlog.load_from_dict(chatlog.make_save_dict())
+        self.assertEqual(self.chatlog.get_finished_chatlog(), chatlog.get_finished_chatlog())
+
+    def test_reset(self):
+        self.add_conversation(self.chatlog, 2)
+        path = self.chatlog.path
+        self.chatlog.reset()
+        self.assertEqual(len(self.chatlog), 0)
+        self.assertFalse(path.exists())
+        # saving(ie autosaving) between resets leaves no files behind
+        for _ in range(3):
+            self.add_conversation(self.chatlog, 2)
+            self.chatlog.make_save_dict()
+            self.chatlog.reset()
+        self.add_conversation(self.chatlog, 2)
+        self.assertEqual(list(self.chatlog.path.parent.glob("*.jsonl")), [self.chatlog.path])
+
+    def test_make_chatlog(self):
+        self.assertIsInstance(chat.make_chatlog("gpt-4", "ChatLogUserList"), chat.ChatLog)
+        self.assertIs(chat.get_chatlog_class("ChatLogJsonl"), chat.JsonlChatLog)
+        self.assertIs(chat.get_chatlog_class("ChatLogSqlite"), chat.SqliteChatLog)
+        with self.assertRaises(exceptions.UnknownChatLogHandlerError):
+            chat.make_chatlog("gpt-4", "bad")
+
+    def test_trim_chat_log_with_jsonl(self):
+        """TrimChatLog works the same with a JsonlChatLog, including loading its saves lazily"""
+        trim = chat.TrimChatLog(chatlog=self.chatlog)
+        trim.add_messages_from_dict([{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi"}])
+        save = trim.make_save_dict()
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(save)
+        self.assertEqual(loaded.get_finished_chatlog(), trim.get_finished_chatlog())
+        self.assertEqual(loaded.chatlog.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+
+    def test_fork(self):
+        """A fork reads the file until it adds a message, then copies it, a fork that is reset never touches it"""
+        self.add_conversation(self.chatlog)
+        fork = self.chatlog.fork()
+        self.assertIsInstance(fork, chat.JsonlChatLog)
+        self.assertEqual(fork.path, self.chatlog.path)
+        self.chatlog.add_message(self.message_factory(role="user", content="only in the original"))
+        self.assertEqual(len(fork), 10)
+        self.assertEqual(fork.data[-1].content, "message 9\nwith a newline")
+        fork.add_message(self.message_factory(role="user", content="only in the fork"))
+        self.assertNotEqual(fork.path, self.chatlog.path)
+        self.assertEqual([msg.content for msg in fork.data][9:], ["message 9\nwith a newline", "only in the fork"])
+        self.assertEqual(self.chatlog.data[-1].content, "only in the original")
+        help_mode = self.chatlog.fork()
+        help_mode.reset()
+        self.assertTrue(self.chatlog.path.exists())
+        self.assertEqual(len(self.chatlog), 11)
+        # resetting the original copies the file for the forks still reading it
+        reader = self.chatlog.fork()
+        path = self.chatlog.path
+        self.chatlog.reset()
+        self.assertFalse(path.exists())
+        self.assertEqual(len(reader), 11)
+        self.assertEqual(reader.data[-1].content, "only in the original")
+        for chatlog in (fork, help_mode, reader):
+            chatlog.reset()
+
+    def tearDown(self):
+        del self.chatlog
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import chat
+import exceptions
+from chat import tokenizer
+
+
+class TestModeProfiles(unittest.TestCase):
+    def setUp(self):
+        self.profile = chat.ModeProfile("casual", "You are laid back. Your model is ||model||.", "Keep it short.")
+        self.trim = chat.TrimChatLog(max_tokens=600, max_completion_tokens=100, system_prompt="You are helpful.", reminder="Be brief.")
+        for i in range(40):
+            self.trim.user_message = f"Question {i} about something."
+            self.trim.assistant_message = f"Answer {i} to the question. " * 3
+
+    def test_same_as_setting_both(self):
+        by_hand = self.trim.fork()
+        by_hand.system_prompt = self.profile.system_prompt
+        by_hand.reminder = self.profile.reminder
+        self.trim.apply_profile(self.profile)
+        self.assertEqual(self.trim.get_finished_chatlog(), by_hand.get_finished_chatlog())
+        self.assertEqual(self.trim.max_chatlog_tokens, by_hand.max_chatlog_tokens)
+        self.assertEqual(self.trim.raw_system_prompt, self.profile.system_prompt)
+        self.assertEqual(self.trim.reminder, "System Reminder: Keep it short.")
+        budget = self.trim.system_prompt_tokens + self.trim._reminder_obj.tokens + 2 * tokenizer.message_overhead("system", "gpt-4")
+        self.assertEqual(self.profile.budget("gpt-4"), budget)
+
+    def test_prepared_once(self):
+        prepared = self.profile.prepare("gpt-4")
+        self.trim.apply_profile(self.profile)
+        self.assertIs(self.profile.prepare("gpt-4"), prepared)
+        # a copy, sharing the compiled prompt
+        self.assertIsNot(self.trim.system_prompt_object, prepared.system_prompt)
+        self.assertIs(self.trim.system_prompt_object._renderer, prepared.system_prompt._renderer)
+        self.trim.model = "text-davinci-003"
+        self.assertEqual(prepared.system_prompt.model, "gpt-4")
+        self.assertEqual(prepared.reminder.model, "gpt-4")
+        self.trim.apply_profile(self.profile)
+        self.assertIn("text-davinci-003", self.trim.system_prompt.content)
+        self.assertEqual(len(self.profile._prepared), 2)
+
+    def test_registry(self):
+        chat.register_profile(self.profile, models=["gpt-4"])
+        try:
+            self.trim.apply_profile("casual")
+            self.assertEqual(self.trim.raw_system_prompt, self.profile.system_prompt)
+            no_prompt = chat.register_profile(chat.ModeProfile("plain"))
+            self.trim.apply_profile("plain")
+            self.assertIsNone(self.trim.system_prompt)
+            self.assertFalse(self.trim._has_reminder)
+            self.assertEqual(no_prompt.budget("gpt-4"), 0)
+        finally:
+            chat.unregister_profile("casual")
+            chat.unregister_profile("plain")
+        with self.assertRaises(exceptions.UnknownProfileError):
+            self.trim.apply_profile("casual")
+        with self.assertRaises(exceptions.BadTypeError):
+            chat.ModeProfile("bad", system_prompt=5)
+
+    def tearDown(self):
+        del self.trim
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,126 @@
+import unittest
+
+import chat
+import exceptions
+from chat import retrieval, tokenizer
+from chat.retrieval import HashingEmbedder, VectorIndex
+
+TOPICS = [
+    "My dog is called Biscuit, he is a golden retriever who loves swimming.",
+    "The train to Kyoto leaves at nine in the morning from platform four.",
+    "Sourdough bread needs a starter that is fed with flour and water every day.",
+    "The quarterly report is due on Friday and needs the sales figures.",
+]
+
+
+@unittest.skipUnless(retrieval.is_available(), "retrieval needs numpy")
+class TestVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VectorIndex()
+        for text in TOPICS:
+            self.index.add(text)
+
+    def test_search(self):
+        position, score = self.index.search("what breed is my dog biscuit", limit=1)[0]
+        self.assertEqual(position, 0)
+        self.assertGreater(score, 0.2)
+        self.assertEqual(self.index.search("when does the train to kyoto leave", limit=1)[0][0], 1)
+        self.assertEqual(self.index.search("zebra", limit=3), [])
+        # skipped positions aren't returned
+        self.assertNotIn(0, [position for position, _ in self.index.search("my dog biscuit", limit=3, keep=lambda position: position != 0)])
+
+    def test_incremental_matches_batch(self):
+        batch = VectorIndex()
+        batch.extend(TOPICS * 40)
+        incremental = VectorIndex()
+        for text in TOPICS * 40:
+            incremental.add(text)
+        self.assertEqual(len(incremental), len(batch))
+        self.assertTrue((batch.matrix == incremental.matrix).all())
+        self.assertTrue(abs(batch.scores("bread flour") - incremental.scores("bread flour")).max() < 1e-6)
+
+    def test_save_and_load(self):
+        loaded = VectorIndex.from_dict(self.index.to_dict())
+        self.assertEqual(len(loaded), len(self.index))
+        self.assertEqual(loaded.embedder.to_dict(), self.index.embedder.to_dict())
+        self.assertTrue(abs(loaded.scores("sales report friday") - self.index.scores("sales report friday")).max() < 1e-3)
+        loaded.add("Biscuit chased a ball into the lake.")
+        self.assertEqual(loaded.search("biscuit lake", limit=1)[0][0], 4)
+        save = self.index.to_dict()
+        save["counts"] = "not base64!"
+        with self.assertRaises(exceptions.BadSaveDictionaryError):
+            VectorIndex.from_dict(save)
+        with self.assertRaises(exceptions.BadSaveDictionaryError):
+            VectorIndex.from_dict(dict(self.index.to_dict(), embedder={"name": "unknown"}))
+
+    def test_bigrams(self):
+        index = VectorIndex(HashingEmbedder(dims=256, bigrams=True))
+        index.extend(["new york city", "york new city"])
+        self.assertEqual(index.search("new york", limit=1)[0][0], 0)
+
+
+@unittest.skipUnless(retrieval.is_available(), "retrieval needs numpy")
+class TestChatLogRetrieval(unittest.TestCase):
+    def test_index_is_kept_and_saved(self):
+        chatlog = chat.ChatLog("gpt-4")
+        factory = chatlog.get_message_factory()
+        for text in TOPICS:
+            chatlog.add_message(factory(text, "user"))
+        self.assertNotIn("vector_index", chatlog.make_save_dict())
+        self.assertEqual(chatlog.retrieve("sourdough starter", limit=1)[0].message.content, TOPICS[2])
+        index = chatlog._vector_index
+        chatlog.add_message(factory("Biscuit had his vaccinations at the vet today.", "user"))
+        self.assertIs(chatlog._get_vector_index(), index)
+        self.assertEqual(len(index), 5)
+        loaded = chat.ChatLog("gpt-4")
+        loaded.load_from_dict(chatlog.make_save_dict())
+        self.assertEqual(len(loaded._vector_index), 5)
+        self.assertEqual([result.position for result in loaded.retrieve("biscuit vet", limit=2)], [4, 0])
+        loaded.reset()
+        self.assertEqual(loaded.retrieve("biscuit", limit=2), [])
+
+
+@unittest.skipUnless(retrieval.is_available(), "retrieval needs numpy")
+class TestTrimChatLogRetrieval(unittest.TestCase):
+    def make_trim(self) -> chat.TrimChatLog:
+        trim = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, system_prompt="You are helpful.", retrieval=True)
+        trim.retrieval_tokens = 200
+        trim.user_message = TOPICS[0]
+        trim.assistant_message = "Golden retrievers love water, Biscuit sounds like a great dog."
+        for i in range(60):
+            trim.user_message = f"Tell me about topic number {i} in history and geography."
+            trim.assistant_message = f"Topic {i} covers many events in history, rivers, mountains and cities. " * 4
+        return trim
+
+    def test_old_messages_are_retrieved(self):
+        trim = self.make_trim()
+        trim.user_message = "What breed is my dog Biscuit again?"
+        finished = trim.get_finished_chatlog()
+        self.assertEqual(finished[-1]["role"], "system")
+        self.assertTrue(finished[-1]["content"].startswith(trim.retrieval_prefix))
+        self.assertIn("golden retriever", finished[-1]["content"])
+        self.assertEqual(trim.retrieved[0].position, 0)
+        self.assertNotIn(TOPICS[0], [msg.content for msg in trim.trimmed_chatlog])
+        self.assertLessEqual(tokenizer.count_chat_tokens(finished, trim.model), trim.max_tokens - trim.max_completion_tokens)
+        # nothing like the question, nothing sent
+        trim.user_message = "Quantum chromodynamics?"
+        self.assertEqual(trim.get_finished_chatlog()[-1]["content"], "Quantum chromodynamics?")
+        self.assertEqual(trim.retrieved, [])
+
+    def test_budget_and_saves(self):
+        trim = self.make_trim()
+        trim.retrieval_tokens = 60
+        trim.user_message = "Biscuit and topic 3 rivers?"
+        finished = trim.get_finished_chatlog()
+        self.assertLessEqual(tokenizer.count_tokens(finished[-1]["content"], trim.model) + tokenizer.message_overhead("system", trim.model), 60)
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(trim.make_save_dict())
+        self.assertTrue(loaded.retrieval)
+        loaded.retrieval_tokens = 60
+        self.assertEqual(loaded.get_finished_chatlog(), finished)
+        trim.retrieval = False
+        self.assertEqual(trim.get_finished_chatlog()[-1]["content"], "Biscuit and topic 3 rivers?")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
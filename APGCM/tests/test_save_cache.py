@@ -0,0 +1,80 @@
+import os
+import time
+import unittest
+
+from handler.save_handler import JsonSaveHandler
+import marshal
+from handler.save_cache import SaveEntryCache
+
+
+class TestSaveCache(unittest.TestCase):
+    def setUp(self):
+        self.save_dir = "./testing/file_handler/save_cache/"
+        self.handler = JsonSaveHandler(save_dir=self.save_dir, cache_max_bytes=1_000_000)
+        self.save_dict = {"model": "gpt-4", "messages": [{"role": "user", "content": "Hello World!"}] * 10, "meta": {"version": "1.0.0"}}
+
+    def test_read_hits_cache(self):
+        self.handler.write_entry("test", self.save_dict)
+        self.assertEqual(self.handler.read_entry("test"), self.save_dict)
+        self.assertEqual(self.handler.read_entry("test.json"), self.save_dict)
+        stats = self.handler.cache_stats
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 0)
+
+    def test_returns_copies(self):
+        """Changing a returned dictionary must not change what the cache hands out next time"""
+        self.handler.write_entry("test", self.save_dict)
+        loaded = self.handler.read_entry("test")
+        loaded["model"] = "changed"
+        loaded["messages"][0]["content"] = "changed"
+        loaded["meta"]["uuid"] = "added"
+        self.assertEqual(self.handler.read_entry("test"), self.save_dict)
+        # the dict passed to write_entry is copied too
+        self.save_dict["messages"].append({"role": "assistant", "content": "changed"})
+        self.assertEqual(len(self.handler.read_entry("test")["messages"]), 10)
+
+    def test_invalidated_by_file_change(self):
+        self.handler.write_entry("test", self.save_dict)
+        other = JsonSaveHandler(save_dir=self.save_dir, cache_max_bytes=0)
+        changed = dict(self.save_dict, model="gpt-3.5-turbo-16k")
+        # make sure the modification time changes even on coarse clocks
+        time.sleep(0.01)
+        other.write_entry("test", changed, overwrite=True)
+        stamp = os.stat(self.save_dir + "test.json")
+        os.utime(self.save_dir + "test.json", ns=(stamp.st_atime_ns, stamp.st_mtime_ns + 1_000_000))
+        self.assertEqual(self.handler.read_entry("test")["model"], "gpt-3.5-turbo-16k")
+        self.assertEqual(self.handler.cache_stats["invalidations"], 1)
+
+    def test_delete_invalidates(self):
+        self.handler.write_entry("test", self.save_dict)
+        self.handler.delete_entry("test")
+        self.assertFalse(self.handler.check_entry("test"))
+        self.assertEqual(self.handler.cache_stats["entries"], 0)
+
+    def test_lru_eviction(self):
+        size = len(marshal.dumps(self.save_dict))
+        cache = SaveEntryCache(max_bytes=size * 2)
+        cache.put("a", (1, 1), self.save_dict)
+        cache.put("b", (1, 1), self.save_dict)
+        # a becomes the most recently used, so b is evicted
+        self.assertIsNotNone(cache.get("a", (1, 1)))
+        cache.put("c", (1, 1), self.save_dict)
+        self.assertIsNone(cache.get("b", (1, 1)))
+        self.assertIsNotNone(cache.get("a", (1, 1)))
+        self.assertIsNotNone(cache.get("c", (1, 1)))
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.current_bytes, cache.max_bytes)
+
+    def test_disabled(self):
+        handler = JsonSaveHandler(save_dir=self.save_dir, cache_max_bytes=0)
+        handler.write_entry("test", self.save_dict)
+        self.assertEqual(handler.read_entry("test"), self.save_dict)
+        self.assertEqual(handler.cache_stats["entries"], 0)
+
+    def tearDown(self):
+        for file in os.listdir(self.save_dir):
+            os.remove(self.save_dir + file)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
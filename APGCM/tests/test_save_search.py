@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+
+import chat
+from handler.save_handler import JsonSaveHandler
+from handler.save_search import SaveSearcher
+
+
+def make_save(*contents: str) -> dict:
+    trim = chat.TrimChatLog()
+    for i, content in enumerate(contents):
+        if i % 2 == 0:
+            trim.user_message = content
+        else:
+            trim.assistant_message = content
+    return {"trim_object": trim.make_save_dict(), "model": "gpt-4"}
+
+
+class TestSaveSearcher(unittest.TestCase):
+    def setUp(self):
+        self.save_dir = "./testing/file_handler/save_search/"
+        self.handler = JsonSaveHandler(save_dir=self.save_dir)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.temp_dir.name, "index.json")
+        self.handler.write_entry("cooking", make_save("How long should I boil pasta?", "About ten minutes, taste it to check."), overwrite=True)
+        self.handler.write_entry("travel", make_save("What should I see in Rome?", "The Colosseum and the Pantheon."), overwrite=True)
+        self.handler.write_entry("rome_food", make_save("Where can I eat pasta in Rome?", "Try Trastevere for pasta carbonara."), overwrite=True)
+        self.searcher = SaveSearcher(self.handler, index_path=self.index_path, max_workers=1)
+
+    def test_ranking(self):
+        results = self.searcher.search("pasta")
+        self.assertEqual({r.entry_name for r in results}, {"cooking", "rome_food"})
+        self.assertEqual(self.searcher.search("rome pasta")[0].entry_name, "rome_food")
+        best = self.searcher.search("colosseum")[0]
+        self.assertEqual((best.entry_name, best.position, best.role), ("travel", 1, "assistant"))
+        self.assertIn("Colosseum", best.snippet)
+        self.assertEqual(self.searcher.search("elephants"), [])
+
+    def test_phrases_drop_saves(self):
+        results = self.searcher.search('"pasta carbonara"')
+        self.assertEqual([r.entry_name for r in results], ["rome_food"])
+
+    def test_unchanged_saves_are_not_read_again(self):
+        self.assertEqual(self.searcher.refresh(), 3)
+        self.assertEqual(self.searcher.refresh(), 0)
+        # the index file is used by a new searcher
+        self.assertEqual(SaveSearcher(self.handler, index_path=self.index_path, max_workers=1).refresh(), 0)
+        time.sleep(0.01)
+        self.handler.write_entry("travel", make_save("What should I see in Paris?", "The Louvre."), overwrite=True)
+        self.handler.delete_entry("cooking")
+        self.assertEqual(self.searcher.refresh(), 1)
+        self.assertEqual(len(self.searcher), 2)
+        self.assertEqual(self.searcher.search("louvre")[0].entry_name, "travel")
+
+    def test_unreadable_save(self):
+        with open(self.save_dir + "broken.json", "w") as f:
+            f.write("{not json")
+        self.assertEqual(self.searcher.refresh(), 4)
+        self.assertEqual(self.searcher.refresh(), 0)
+        self.assertEqual(len(self.searcher.search("pasta")), 2)
+
+    def test_stored_chatlog_saves(self):
+        """Saves that refer to a jsonl file are searched by reading the file"""
+        trim = chat.TrimChatLog()
+        trim.add_chatlog(chat.JsonlChatLog("gpt-4", directory=self.temp_dir.name, embed_messages=False))
+        trim.user_message = "Which museum has the Mona Lisa?"
+        trim.assistant_message = "The Louvre in Paris."
+        save = {"trim_object": trim.make_save_dict(), "model": "gpt-4"}
+        self.assertTrue(chat.refers_to_storage(save["trim_object"]["chatlog"]))
+        self.handler.write_entry("museum", save, overwrite=True)
+        best = self.searcher.search("louvre")[0]
+        self.assertEqual((best.entry_name, best.position, best.role), ("museum", 1, "assistant"))
+        # a save whose file is gone is searched by its trimmed chat log
+        trim.chatlog.path.unlink()
+        searcher = SaveSearcher(self.handler, index_path=None, max_workers=1)
+        try:
+            self.assertEqual(searcher.search("louvre")[0].entry_name, "museum")
+        finally:
+            searcher.close()
+
+    def test_process_pool(self):
+        searcher = SaveSearcher(self.handler, index_path=None, max_workers=2)
+        try:
+            results = list(searcher.iter_search("pasta rome colosseum", limit=3))
+            self.assertEqual(len(results), 3)
+        finally:
+            searcher.close()
+
+    def tearDown(self):
+        self.searcher.close()
+        self.temp_dir.cleanup()
+        for file in os.listdir(self.save_dir):
+            os.remove(self.save_dir + file)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
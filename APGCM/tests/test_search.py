@@ -0,0 +1,125 @@
+import tempfile
+import unittest
+
+import chat
+from chat.search import make_snippet, parse_query
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = chat.InvertedIndex()
+        self.index.extend(
+            [
+                "The quick brown fox jumps over the lazy dog",
+                "A lazy afternoon with a brown dog",
+                "Foxes are quick, dogs are lazy",
+                "Nothing to see here",
+            ]
+        )
+
+    def test_keywords_are_ranked(self):
+        results = self.index.search("quick fox")
+        self.assertEqual(results[0][0], 0)
+        self.assertEqual({position for position, _ in results}, {0, 2})
+        self.assertEqual(self.index.search("elephant"), [])
+        self.assertEqual(self.index.search(""), [])
+
+    def test_phrases(self):
+        """Quoted phrases must appear word for word"""
+        self.assertEqual([p for p, _ in self.index.search('"lazy dog"')], [0])
+        self.assertEqual([p for p, _ in self.index.search('"brown dog"')], [1])
+        self.assertEqual(self.index.search('"dog lazy"'), [])
+
+    def test_limit_and_keep(self):
+        self.assertEqual(len(self.index.search("lazy", limit=2)), 2)
+        results = self.index.search("lazy", keep=lambda position: position != 0)
+        self.assertEqual({position for position, _ in results}, {1, 2})
+
+    def test_save_and_load(self):
+        loaded = chat.InvertedIndex.from_dict(self.index.to_dict())
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.search('"lazy dog" quick'), self.index.search('"lazy dog" quick'))
+
+    def test_loaded_index_can_grow(self):
+        """Adding to a loaded index and to a saved one gives the same index as adding to the original"""
+        saved = self.index.to_dict()
+        loaded = chat.InvertedIndex.from_dict(saved)
+        extended = chat.InvertedIndex.extend_saved(saved, ["the lazy fox sleeps"])
+        loaded.add("the lazy fox sleeps")
+        self.index.add("the lazy fox sleeps")
+        self.assertEqual(loaded.to_dict(), self.index.to_dict())
+        self.assertEqual(extended["postings"], self.index.to_dict()["postings"])
+        self.assertEqual(len(saved["lengths"]), 4)
+
+    def test_parse_query_and_snippet(self):
+        self.assertEqual(parse_query('find "exact words" here'), ([["exact", "words"]], ["find", "here"]))
+        text = "a" * 300 + " needle " + "b" * 300
+        snippet = make_snippet(text, ["needle"], width=100)
+        self.assertIn("needle", snippet)
+        self.assertTrue(snippet.startswith("...") and snippet.endswith("..."))
+
+
+class TestChatLogSearch(unittest.TestCase):
+    def setUp(self):
+        self.message_factory = chat.MessageFactory("gpt-4")
+        self.chatlog = chat.ChatLog("gpt-4")
+        self.chatlog.add_messages(
+            [
+                self.message_factory(role="user", content="What is the capital of France?"),
+                self.message_factory(role="assistant", content="The capital of France is Paris."),
+                self.message_factory(role="user", content="And of Germany?"),
+                self.message_factory(role="assistant", content="Berlin is the capital of Germany."),
+            ]
+        )
+
+    def test_search(self):
+        results = self.chatlog.search("capital germany")
+        self.assertEqual(results[0].position, 3)
+        self.assertEqual(results[0].message.content, "Berlin is the capital of Germany.")
+        self.assertEqual([r.position for r in self.chatlog.search("capital", role="user")], [0])
+
+    def test_index_is_incremental(self):
+        index = self.chatlog._get_search_index()
+        self.chatlog.add_message(self.message_factory(role="user", content="Thanks!"))
+        self.assertIs(self.chatlog._get_search_index(), index)
+        self.assertEqual(self.chatlog.search("thanks")[0].position, 4)
+        self.chatlog.reset()
+        self.assertEqual(self.chatlog.search("capital"), [])
+
+    def test_saved_index_is_used(self):
+        save = self.chatlog.make_save_dict()
+        self.assertIn("search_index", save)
+        loaded = chat.ChatLog()
+        loaded.load_from_dict(save)
+        self.assertEqual(len(loaded._search_index), 4)
+        self.assertEqual(loaded.search("paris")[0].position, 1)
+        # an index covering only the first messages is finished by add_message
+        save["messages"].append({"role": "user", "content": "What about Spain?"})
+        loaded = chat.ChatLog()
+        loaded.load_from_dict(save)
+        self.assertEqual(loaded.search("spain")[0].position, 4)
+
+    def test_stored_chatlog(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stored = chat.JsonlChatLog("gpt-4", directory=directory)
+            stored.load_from_dict(self.chatlog.make_save_dict())
+            self.assertIsNotNone(stored._search_index)
+            stored.add_message(self.message_factory(role="user", content="What about Spain?"))
+            self.assertEqual(stored.search("spain")[0].position, 4)
+            stored.reset()
+            self.assertEqual(stored.search("spain"), [])
+            stored.close()
+
+
+class TestTrimChatLogSearch(unittest.TestCase):
+    def test_search_loads_pending_history(self):
+        trim = chat.TrimChatLog()
+        for i in range(10):
+            trim.user_message = f"question number {i}"
+            trim.assistant_message = f"answer number {i}"
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(trim.make_save_dict())
+        self.assertTrue(loaded.is_history_pending)
+        results = loaded.search('"answer number 3"')
+        self.assertFalse(loaded.is_history_pending)
+        self.assertEqual([r.position for r in results], [7])
@@ -0,0 +1,133 @@
+import shutil
+import threading
+import time
+import unittest
+
+import chat
+import exceptions
+from chat_wrapper import ChatWrapper
+from chat_wrapper.snapshots import SnapshotStack
+from handler.save_handler import DummySaveHandler
+from settings import OPENAI_API_KEY
+
+
+class TestSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.save_handler = DummySaveHandler()
+        self.chat_wrapper = ChatWrapper(API_KEY=OPENAI_API_KEY, model="gpt-4", save_handler=self.save_handler)
+        self.chat_wrapper.auto_setup()
+        self.chat_wrapper.auto_setup_autosaving(frequency=100)
+        self.chat_wrapper.system_prompt = "You are helpful."
+        for i in range(5):
+            self.chat_wrapper.user_message = f"Question {i}"
+            self.chat_wrapper.assistant_message = f"Answer {i}"
+
+    def test_push_and_pop(self):
+        finished = self.chat_wrapper.trim_object.get_finished_chatlog()
+        info = self.chat_wrapper.push_snapshot("help_mode")
+        self.assertEqual((info.label, info.messages, info.spilled), ("help_mode", 10, False))
+        self.chat_wrapper.set_is_saving(False)
+        self.chat_wrapper.trim_object.reset()
+        self.chat_wrapper.system_prompt = "You are a help desk."
+        self.chat_wrapper.set_chat_completion_params(temperature=1.5)
+        self.chat_wrapper.user_message = "How do I save?"
+        self.assertEqual(self.chat_wrapper.peek_snapshot(), info)
+        self.assertEqual(self.chat_wrapper.pop_snapshot(), info)
+        self.assertEqual(self.chat_wrapper.trim_object.get_finished_chatlog(), finished)
+        self.assertIsNone(self.chat_wrapper.completion_wrapper.parameters.temperature)
+        self.assertTrue(self.chat_wrapper._is_autosaving)
+        self.assertIsNone(self.chat_wrapper.peek_snapshot())
+        with self.assertRaises(exceptions.SnapshotStackEmptyError):
+            self.chat_wrapper.pop_snapshot()
+        # nothing was written to get there and back
+        self.assertEqual(self.save_handler.entry_names, [])
+
+    def test_help_mode_closes_the_dropped_compactor(self):
+        self.chat_wrapper.trim_object.compaction = True
+        self.chat_wrapper.trim_object.compactor.batch_messages = 2
+        threads = threading.active_count()
+        for i in range(5):
+            self.chat_wrapper.push_snapshot("help_mode")
+            self.chat_wrapper.trim_object.reset()
+            help_compactor = self.chat_wrapper.trim_object.compactor
+            help_compactor.submit([chat.Message("user", f"Help question {i}.", "gpt-4") for _ in range(2)])
+            self.chat_wrapper.pop_snapshot()
+            self.assertTrue(help_compactor._closed)
+            self.assertIsNot(self.chat_wrapper.trim_object.compactor, help_compactor)
+        deadline = time.monotonic() + 10
+        while threading.active_count() > threads and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(threading.active_count(), threads)
+        self.chat_wrapper.trim_object.compaction = False
+
+    def test_bounded(self):
+        self.chat_wrapper.snapshots = SnapshotStack(max_snapshots=2)
+        for label in ("first", "second", "third"):
+            self.chat_wrapper.push_snapshot(label)
+            self.chat_wrapper.user_message = label
+        self.assertEqual(len(self.chat_wrapper.snapshots), 2)
+        self.assertEqual(self.chat_wrapper.pop_snapshot().label, "third")
+        self.assertEqual(self.chat_wrapper.user_message, "second")
+        self.assertEqual(self.chat_wrapper.pop_snapshot().label, "second")
+        self.assertEqual(len(self.chat_wrapper.snapshots), 0)
+
+    def test_spill(self):
+        self.chat_wrapper.snapshots = SnapshotStack(max_snapshots=3, spill_after=1, save_handler=self.save_handler)
+        for label in ("first", "second", "third", "fourth"):
+            self.chat_wrapper.push_snapshot(label)
+            self.chat_wrapper.user_message = label
+        self.chat_wrapper.snapshots.wait()
+        # first was dropped, second and third were written, fourth is still in memory
+        self.assertEqual(len(self.save_handler.entry_names), 2)
+        self.assertEqual(self.chat_wrapper.all_non_rotating_entry_names, [])
+        self.assertFalse(self.chat_wrapper.pop_snapshot().spilled)
+        uuid = self.chat_wrapper.uuid
+        info = self.chat_wrapper.pop_snapshot()
+        self.assertEqual((info.label, info.spilled), ("third", True))
+        self.assertEqual(self.chat_wrapper.user_message, "second")
+        self.assertEqual(len(self.chat_wrapper.trim_object.chatlog), 12)
+        self.assertEqual(self.chat_wrapper.uuid, uuid)
+        self.assertTrue(self.chat_wrapper._is_autosaving)
+        self.chat_wrapper.snapshots.wait()
+        self.assertEqual(len(self.save_handler.entry_names), 1)
+
+    def test_help_mode_with_stored_chat_logs(self):
+        """Resetting the chat log after a snapshot clears the fork, never the file or session the snapshot's history is in"""
+        directory = "./testing/file_handler/snapshot_chatlogs/"
+        for chatlog in (chat.JsonlChatLog("gpt-4", directory=directory), chat.SqliteChatLog("gpt-4", database=":memory:")):
+            with self.subTest(chatlog=type(chatlog).__name__):
+                self.chat_wrapper.trim_object.reset()
+                self.chat_wrapper.trim_object.add_chatlog(chatlog)
+                for i in range(5):
+                    self.chat_wrapper.user_message = f"Question {i}"
+                    self.chat_wrapper.assistant_message = f"Answer {i}"
+                finished = self.chat_wrapper.trim_object.get_finished_chatlog()
+                self.chat_wrapper.push_snapshot("help_mode")
+                self.chat_wrapper.set_is_saving(False)
+                self.chat_wrapper.trim_object.reset()
+                self.chat_wrapper.system_prompt = "You are a help desk."
+                self.chat_wrapper.user_message = "How do I save?"
+                help_chatlog = self.chat_wrapper.trim_object.chatlog
+                self.assertIsInstance(help_chatlog, type(chatlog))
+                self.assertEqual(len(chatlog), 10)
+                self.assertEqual(chatlog.get_finished_chatlog()[-1]["content"], "Answer 4")
+                self.chat_wrapper.pop_snapshot()
+                self.assertIs(self.chat_wrapper.trim_object.chatlog, chatlog)
+                self.assertEqual(self.chat_wrapper.trim_object.get_finished_chatlog(), finished)
+                # the help mode messages went with the fork
+                self.assertEqual(len(help_chatlog), 0)
+                if isinstance(chatlog, chat.JsonlChatLog):
+                    self.assertTrue(chatlog.path.exists())
+                    self.assertEqual(sorted(path.name for path in chatlog.path.parent.iterdir()), [chatlog.path.name])
+                else:
+                    self.assertEqual(chat.SqliteChatLog.sessions(":memory:"), {chatlog.session_id: 10})
+                chatlog.reset()
+        chat.SqliteChatLog.close_database(":memory:")
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def tearDown(self):
+        del self.chat_wrapper
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,128 @@
+import time
+import unittest
+
+import chat
+import exceptions
+
+
+class TestSqliteChatLog(unittest.TestCase):
+    def setUp(self):
+        self.database = ":memory:"
+        self.chatlog = chat.SqliteChatLog("gpt-4", database=self.database)
+        self.message_factory = chat.MessageFactory("gpt-4")
+
+    def add_conversation(self, chatlog, count: int = 10):
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            chatlog.add_message(self.message_factory(role=role, content=f"message {i}"))
+
+    def test_add_and_get_messages(self):
+        """Messages come back in either order, filtered by role and limited, with or without a limit"""
+        self.add_conversation(self.chatlog)
+        self.assertEqual(len(self.chatlog), 10)
+        newest = next(iter(self.chatlog.get_messages(limit=1)))
+        self.assertEqual(newest.content, "message 9")
+        users = self.chatlog.get_messages_as_list(role="user", limit=2)
+        self.assertEqual([msg.content for msg in users], ["message 8", "message 6"])
+        self.assertEqual(len(list(self.chatlog.get_messages(role="assistant"))), 5)
+        self.assertEqual(self.chatlog.get_messages_as_dict(limit=1), [{"role": "user", "content": "message 0"}])
+        self.assertEqual(self.chatlog.data[3].content, "message 3")
+
+    def test_paging(self):
+        """Iterating without a limit crosses page boundaries in both directions"""
+        self.chatlog.add_messages([self.message_factory(role="user", content=str(i)) for i in range(600)])
+        self.assertEqual([msg.content for msg in self.chatlog.data], [str(i) for i in range(600)])
+        self.assertEqual([msg.content for msg in self.chatlog.get_messages()], [str(i) for i in range(599, -1, -1)])
+
+    def test_sessions_are_separate(self):
+        other = chat.SqliteChatLog("gpt-4", database=self.database)
+        self.add_conversation(self.chatlog, 3)
+        self.add_conversation(other, 2)
+        self.assertEqual(len(self.chatlog), 3)
+        self.assertEqual(len(other), 2)
+        sessions = chat.SqliteChatLog.sessions(self.database)
+        self.assertEqual(sessions[self.chatlog.session_id], 3)
+        with self.assertRaises(exceptions.ChatLogFileError):
+            chat.SqliteChatLog("gpt-4", session_id=other.session_id, database=self.database)
+
+    def test_get_messages_between(self):
+        self.add_conversation(self.chatlog, 2)
+        middle = time.time()
+        time.sleep(0.01)
+        self.add_conversation(self.chatlog, 2)
+        self.assertEqual(len(self.chatlog.get_messages_between(start=middle)), 2)
+        self.assertEqual(len(self.chatlog.get_messages_between(end=middle, role="user")), 1)
+
+    def test_save_and_load(self):
+        """Saves have every message, or refer to the session without embed_messages, and load into any chat log. An unchanged session is continued instead of copied"""
+        self.add_conversation(self.chatlog)
+        embedded = self.chatlog.make_save_dict()
+        self.assertEqual(embedded["messages"], self.chatlog.get_finished_chatlog())
+        self.assertFalse(chat.refers_to_storage(embedded))
+        self.chatlog.embed_messages = False
+        save = self.chatlog.make_save_dict()
+        self.assertNotIn("messages", save)
+        self.assertEqual(save["message_count"], 10)
+        in_memory = chat.ChatLog("gpt-4")
+        in_memory.load_from_dict(chat.embed_saved_messages(save))
+        self.assertEqual(in_memory.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+
+        copied = chat.SqliteChatLog("gpt-4", database=self.database)
+        copied.load_from_dict(save)
+        self.assertNotEqual(copied.session_id, self.chatlog.session_id)
+        self.assertEqual(copied.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+
+        session_id = self.chatlog.session_id
+        del self.chatlog
+        continued = chat.SqliteChatLog("gpt-4", database=self.database)
+        continued.load_from_dict(save)
+        self.assertEqual(continued.session_id, session_id)
+        # a session a save refers to is kept when the chat log is reset
+        continued.reset()
+        self.assertEqual(chat.SqliteChatLog.sessions(self.database)[session_id], 10)
+        self.chatlog = continued
+
+    def test_reset(self):
+        self.add_conversation(self.chatlog, 2)
+        session_id = self.chatlog.session_id
+        self.chatlog.reset()
+        self.assertEqual(len(self.chatlog), 0)
+        self.assertNotIn(session_id, chat.SqliteChatLog.sessions(self.database))
+        # saving(ie autosaving) between resets leaves no sessions behind
+        for _ in range(3):
+            self.add_conversation(self.chatlog, 2)
+            self.chatlog.make_save_dict()
+            self.chatlog.reset()
+        self.add_conversation(self.chatlog, 2)
+        self.assertEqual(chat.SqliteChatLog.sessions(self.database), {self.chatlog.session_id: 2})
+
+    def test_fork(self):
+        """A fork reads the session until it adds a message, then copies it, a fork that is reset never touches it"""
+        self.add_conversation(self.chatlog)
+        fork = self.chatlog.fork()
+        self.assertIsInstance(fork, chat.SqliteChatLog)
+        self.chatlog.add_message(self.message_factory(role="user", content="only in the original"))
+        self.assertEqual(len(fork), 10)
+        self.assertEqual(fork.last().content, "message 9")
+        self.assertEqual(len(list(fork.get_messages())), 10)
+        fork.add_message(self.message_factory(role="user", content="only in the fork"))
+        self.assertNotEqual(fork.session_id, self.chatlog.session_id)
+        self.assertEqual([msg.content for msg in fork.get_messages(reverse=False)][9:], ["message 9", "only in the fork"])
+        self.assertEqual(self.chatlog.last().content, "only in the original")
+        help_mode = self.chatlog.fork()
+        help_mode.reset()
+        self.assertEqual(chat.SqliteChatLog.sessions(self.database)[self.chatlog.session_id], 11)
+        # resetting the original copies the session for the forks still reading it
+        reader = self.chatlog.fork()
+        self.chatlog.reset()
+        self.assertEqual(len(reader), 11)
+        self.assertEqual(reader.last().content, "only in the original")
+        self.assertEqual(chat.SqliteChatLog.sessions(self.database)[reader.session_id], 11)
+
+    def tearDown(self):
+        del self.chatlog
+        chat.SqliteChatLog.close_database(self.database)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,9 +18,9 @@ class TestSystemPrompt(unittest.TestCase):
         self.assertEqual(self.system_prompt._system_prompt, self.test_system_prompt)
         self.assertIsInstance(self.system_prompt.system_prompt, str)
     def test_system_prompt_tokens(self):
-        """Tests that the number of tokens in the system prompt is correct."""
-        test_tokens = func.count_tokens_in_str(model = 'gpt-4', string = self.test_system_prompt) + 20
+        """Tests that the number of tokens in the system prompt is counted with the wildcards filled in."""
         self.system_prompt.system_prompt = self.test_system_prompt
+        test_tokens = func.count_tokens_in_str(model = 'gpt-4', string = self.system_prompt.system_prompt)
         self.assertEqual(self.system_prompt.system_prompt_tokens, test_tokens)
     def test_wildcard_model(self):
         """Tests that the model wildcard is replaced with the model name."""
@@ -37,6 +37,11 @@ class TestSystemPrompt(unittest.TestCase):
         test_message = chat.Message(role='system', content="test", model = 'gpt-4')
         self.system_prompt.system_prompt = "test"
         self.assertEqual(self.system_prompt.system_prompt_message, test_message)
+    def test_time_granularity(self):
+        """Tests that the time wildcard is rounded down to the time granularity."""
+        self.system_prompt.time_granularity = 3600
+        self.system_prompt.system_prompt = "||time||"
+        self.assertTrue(self.system_prompt.system_prompt.endswith(":00:00"))
 
             
         
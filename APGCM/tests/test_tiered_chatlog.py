@@ -0,0 +1,114 @@
+import os
+import shutil
+import unittest
+
+import chat
+import exceptions
+
+
+class TestTieredChatLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = "./testing/file_handler/tiered_chatlog/"
+        self.chatlog = chat.TieredChatLog("gpt-4", hot_messages=4, block_messages=3, warm_blocks=2, directory=self.directory)
+        self.message_factory = chat.MessageFactory("gpt-4")
+
+    def add_conversation(self, chatlog, count: int = 30):
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            chatlog.add_message(self.message_factory(role=role, content=f"message {i}"))
+
+    def test_tiers(self):
+        """Old messages are packed into blocks, the oldest blocks are written to disk"""
+        self.add_conversation(self.chatlog)
+        sizes = self.chatlog.tier_sizes()
+        self.assertEqual(sizes["hot"] + sizes["warm"] + sizes["cold"], 30)
+        self.assertLess(sizes["hot"], 4 + 2 * 3)
+        self.assertEqual(sizes["warm"], 2 * 3)
+        self.assertGreater(sizes["cold"], 0)
+        self.assertTrue(os.path.exists(self.chatlog._cold_path))
+
+    def test_reads_across_tiers(self):
+        self.add_conversation(self.chatlog)
+        self.assertEqual([msg.content for msg in self.chatlog.data], [f"message {i}" for i in range(30)])
+        self.assertEqual([msg.content for msg in self.chatlog.data[::7]], [f"message {i}" for i in range(0, 30, 7)])
+        oldest = self.chatlog.data[0]
+        self.assertEqual(oldest.tokens, self.message_factory(role="user", content="message 0").tokens)
+        users = self.chatlog.get_messages_as_list(role="user", limit=3)
+        self.assertEqual([msg.content for msg in users], ["message 28", "message 26", "message 24"])
+        assistants = self.chatlog.get_messages_as_list(role="assistant", limit=2, reverse=False)
+        self.assertEqual([msg.content for msg in assistants], ["message 1", "message 3"])
+        self.assertEqual(self.chatlog.last("user").content, "message 28")
+        self.assertEqual(self.chatlog.get_messages_as_list(role="system"), None)
+        self.assertEqual(self.chatlog.search('"message 2"')[0].position, 2)
+
+    def test_window_stays_hot(self):
+        """TrimChatLog's window is never compressed, and shares its Message objects with the hot tier"""
+        trim = chat.TrimChatLog(max_messages=12)
+        trim.chatlog = chat.TieredChatLog("gpt-4", hot_messages=2, block_messages=3, warm_blocks=None, directory=self.directory)
+        for i in range(20):
+            trim.user_message = f"question {i}"
+            trim.assistant_message = f"answer {i}"
+        tiered = trim.chatlog
+        self.assertGreaterEqual(tiered.tier_sizes()["hot"], len(trim.trimmed_chatlog))
+        hot_ids = {id(msg) for msg in tiered._hot}
+        self.assertTrue(all(id(msg) in hot_ids for msg in trim.trimmed_chatlog))
+        self.assertEqual(tiered.tier_sizes()["cold"], 0)
+
+    def test_not_a_message(self):
+        with self.assertRaises(exceptions.NotAMessageError):
+            self.chatlog.add_message("hello")
+
+    def test_save_and_load(self):
+        """Saves have every message and load into any chat log"""
+        self.add_conversation(self.chatlog)
+        save = self.chatlog.make_save_dict()
+        in_memory = chat.ChatLog("gpt-4")
+        in_memory.load_from_dict(save)
+        self.assertEqual(in_memory.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+        loaded = chat.TieredChatLog(hot_messages=4, block_messages=3, warm_blocks=2, directory=self.directory)
+        loaded.load_from_dict(in_memory.make_save_dict())
+        self.assertEqual(loaded.get_finished_chatlog(), self.chatlog.get_finished_chatlog())
+        self.assertEqual(loaded.tier_sizes(), self.chatlog.tier_sizes())
+        loaded.reset()
+
+    def test_reset_deletes_cold_file(self):
+        self.add_conversation(self.chatlog)
+        path = self.chatlog._cold_path
+        self.chatlog.reset()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(self.chatlog), 0)
+        self.add_conversation(self.chatlog, 3)
+        self.assertEqual([msg.content for msg in self.chatlog.data], ["message 0", "message 1", "message 2"])
+
+    def test_memory_is_bounded(self):
+        """Warm blocks are compressed and capped, however long the conversation"""
+        self.add_conversation(self.chatlog, 300)
+        sizes = self.chatlog.tier_sizes()
+        self.assertEqual(sizes["warm"], 2 * 3)
+        self.assertLess(sizes["hot"], 4 + 2 * 3)
+        self.assertEqual(len(self.chatlog._block_cache), 0)
+        self.assertEqual(self.chatlog.data[5].content, "message 5")
+        self.assertLessEqual(len(self.chatlog._block_cache), self.chatlog._cached_blocks)
+
+    def test_fork(self):
+        """A fork shares the blocks, the cold file is kept until no chat log uses it"""
+        self.add_conversation(self.chatlog)
+        fork = self.chatlog.fork()
+        self.assertIsInstance(fork, chat.TieredChatLog)
+        fork.add_message(self.message_factory(role="user", content="only in the fork"))
+        self.assertEqual(len(self.chatlog), 30)
+        self.assertEqual(fork.get_finished_chatlog()[:30], self.chatlog.get_finished_chatlog())
+        path = self.chatlog._cold_path
+        self.chatlog.reset()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(fork.data[0].content, "message 0")
+        fork.reset()
+        self.assertFalse(os.path.exists(path))
+
+    def tearDown(self):
+        self.chatlog.reset()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
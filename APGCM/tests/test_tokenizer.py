@@ -0,0 +1,181 @@
+import shutil
+import unittest
+
+import chat
+from chat import tokenizer
+
+# text-davinci-003 uses p50k_base, gpt-4 and gpt-3.5-turbo use cl100k_base
+OTHER_ENCODING_MODEL = "text-davinci-003"
+
+
+class TestTokenizer(unittest.TestCase):
+    def test_encodings(self):
+        self.assertTrue(tokenizer.same_encoding("gpt-4", "gpt-3.5-turbo"))
+        self.assertFalse(tokenizer.same_encoding("gpt-4", OTHER_ENCODING_MODEL))
+        self.assertEqual(tokenizer.encoding_name("not-a-model"), tokenizer.FALLBACK_ENCODING)
+
+    def test_batch_matches_single_counts(self):
+        strings = [f"message number {i} " * (i % 7 + 1) for i in range(200)]
+        expected = [tokenizer.count_tokens(string, "gpt-4") for string in strings]
+        self.assertEqual(tokenizer.count_tokens_batch(strings, "gpt-4", num_threads=4), expected)
+        self.assertEqual(tokenizer.count_tokens_batch(strings, "gpt-4", num_threads=1), expected)
+
+
+class TestTokenizedText(unittest.TestCase):
+    def test_cuts_fit_exactly(self):
+        text = tokenizer.TokenizedText("héllo wörld, 日本語のテキスト. " * 40, "gpt-4")
+        self.assertEqual(text.text(), "héllo wörld, 日本語のテキスト. " * 40)
+        self.assertLessEqual(tokenizer.count_tokens(text.head(25), "gpt-4"), 25)
+        self.assertLessEqual(tokenizer.count_tokens(text.head_tail(25, " ... "), "gpt-4"), 25)
+        chunks = text.chunks(9)
+        self.assertEqual("".join(chunks), text.text())
+        self.assertTrue(all(tokenizer.count_tokens(chunk, "gpt-4") <= 9 for chunk in chunks))
+
+
+class TestChatFormat(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(tokenizer.chat_format("gpt-3.5-turbo-0301").tokens_per_message, 4)
+        self.assertEqual(tokenizer.chat_format("gpt-3.5-turbo-0613"), tokenizer.chat_format("gpt-4"))
+        self.assertEqual(tokenizer.chat_format("not-a-model"), tokenizer.DEFAULT_CHAT_FORMAT)
+
+    def test_count_chat_tokens(self):
+        messages = [{"role": "system", "content": "You are helpful."}, {"role": "user", "content": "Hi"}]
+        expected = 3 + sum(3 + tokenizer.count_tokens(msg["role"], "gpt-4") + tokenizer.count_tokens(msg["content"], "gpt-4") for msg in messages)
+        self.assertEqual(tokenizer.count_chat_tokens(messages, "gpt-4"), expected)
+
+    def test_request_fits_without_padding(self):
+        """A long log of short messages is where the per message overhead adds up"""
+        trim = chat.TrimChatLog(max_tokens=1000, max_completion_tokens=200, token_padding=0, max_messages=None,
+                                system_prompt="You are ||model||, it is ||date|| ||time||.", reminder="Be brief.")
+        for i in range(500):
+            trim.user_message = "ok"
+            trim.assistant_message = f"{i}"
+        finished = trim.get_finished_chatlog()
+        request_tokens = tokenizer.count_chat_tokens(finished, trim.model)
+        self.assertLessEqual(request_tokens, trim.max_tokens - trim.max_completion_tokens)
+        # the next message would not have fit
+        self.assertGreater(request_tokens + tokenizer.message_overhead("user", trim.model) + 1, trim.max_tokens - trim.max_completion_tokens - 5)
+
+    def test_load_recounts_with_overhead(self):
+        trim = chat.TrimChatLog(max_tokens=1000, max_completion_tokens=200, system_prompt="Hello")
+        for i in range(50):
+            trim.user_message = f"message {i}"
+        save = trim.make_save_dict()
+        save["trimmed_chatlog_tokens"] = 0
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(save)
+        self.assertEqual(loaded.trimmed_chatlog_tokens, trim.trimmed_chatlog_tokens)
+        self.assertEqual(loaded.max_chatlog_tokens, trim.max_chatlog_tokens)
+
+
+class TestModelSwitch(unittest.TestCase):
+    def setUp(self):
+        self.trim = chat.TrimChatLog(max_messages=6)
+        for i in range(10):
+            self.trim.user_message = f"Hello there, this is question {i}?"
+            self.trim.assistant_message = f"General Kenobi! The answer is {i}."
+
+    def assert_counts(self, messages, model):
+        for msg in messages:
+            self.assertEqual(msg.tokens, tokenizer.count_tokens(msg.content, model))
+
+    def test_same_encoding_keeps_counts(self):
+        newest = self.trim.trimmed_chatlog[-1]
+        newest.tokens = 1
+        self.trim.model = "gpt-3.5-turbo"
+        self.assertEqual(newest.tokens, 1)
+
+    def test_other_encoding_recounts(self):
+        self.trim.model = OTHER_ENCODING_MODEL
+        self.assert_counts(self.trim.trimmed_chatlog, OTHER_ENCODING_MODEL)
+        self.assert_counts(self.trim.chatlog.data, OTHER_ENCODING_MODEL)
+        overhead = sum(tokenizer.message_overhead(msg.role, OTHER_ENCODING_MODEL) for msg in self.trim.trimmed_chatlog)
+        self.assertEqual(self.trim.trimmed_chatlog_tokens, sum(msg.tokens for msg in self.trim.trimmed_chatlog) + overhead)
+
+    def test_pending_history_is_recounted(self):
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(self.trim.make_save_dict())
+        self.assertTrue(loaded.is_history_pending)
+        loaded.model = OTHER_ENCODING_MODEL
+        self.assert_counts(loaded.trimmed_chatlog, OTHER_ENCODING_MODEL)
+        self.assert_counts(loaded.chatlog.data, OTHER_ENCODING_MODEL)
+
+    def test_stored_chatlogs_are_recounted(self):
+        directory = "./testing/file_handler/tokenizer/"
+        try:
+            for chatlog in (
+                chat.JsonlChatLog("gpt-4", directory=directory),
+                chat.TieredChatLog("gpt-4", hot_messages=2, block_messages=2, warm_blocks=1, directory=directory),
+            ):
+                chatlog.load_from_dict(self.trim.chatlog.make_save_dict())
+                chatlog.model = OTHER_ENCODING_MODEL
+                self.assertEqual(chatlog.recount_tokens(), 20)
+                self.assert_counts(chatlog.data, OTHER_ENCODING_MODEL)
+                save = chatlog.make_save_dict()
+                self.assertEqual(save["token_counts"], [tokenizer.count_tokens(msg["content"], OTHER_ENCODING_MODEL) for msg in chatlog.get_finished_chatlog()])
+                chatlog.reset()
+                chatlog.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestTokenEstimates(unittest.TestCase):
+    def setUp(self):
+        tokenizer.estimator.reset_stats()
+
+    def test_estimated_message(self):
+        content = "How many tokens are in this sentence, roughly?"
+        msg = chat.Message("user", content, "gpt-4", estimate=True)
+        self.assertFalse(msg.is_counted)
+        self.assertIsNone(msg.counted_tokens)
+        low, high = msg.token_bounds
+        self.assertLessEqual(high, len(content.encode("utf-8")))
+        self.assertEqual(msg.tokens, tokenizer.count_tokens(content, "gpt-4"))
+        self.assertTrue(msg.is_counted)
+        self.assertEqual(msg.token_bounds, (msg.tokens, msg.tokens))
+        self.assertEqual(tokenizer.estimator.stats()["counted"], 1)
+
+    def test_long_history_is_mostly_not_counted(self):
+        trim = chat.TrimChatLog(max_tokens=2000, max_completion_tokens=200, token_padding=100, max_messages=None, token_estimate=True)
+        factory = trim.get_message_factory()
+        history = []
+        for i in range(300):
+            history.append(factory(f"This is user message number {i}, asking about the weather in a few cities. " * 3, role="user"))
+            history.append(factory(f"Reply {i}: it is sunny in the first city and raining in the other ones.", role="assistant"))
+        trim.add_messages(history)
+        finished = trim.get_finished_chatlog()
+        exact = tokenizer.count_chat_tokens(finished, "gpt-4") - tokenizer.chat_format("gpt-4").reply_tokens
+        self.assertLessEqual(exact, trim.max_chatlog_tokens)
+        self.assertEqual(trim.trimmed_chatlog_tokens, exact)
+        self.assertTrue(all(msg.is_counted for msg in trim.trimmed_chatlog))
+        stats = trim.token_estimate_stats
+        self.assertEqual(stats["estimated"], 600)
+        self.assertGreater(stats["avoided"], 5 * stats["counted"])
+
+    def test_estimated_window_matches_exact_window(self):
+        """Estimating only changes which messages are counted, not which are kept"""
+        exact = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=100, token_padding=100, max_messages=None)
+        estimated = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=100, token_padding=100, max_messages=None, token_estimate=True)
+        for trim in (exact, estimated):
+            for i in range(100):
+                trim.user_message = "word " * (i % 37 + 1)
+                trim.assistant_message = f"answer {i} " * (i % 11 + 1)
+            trim.add_messages_from_dict([{"role": "user", "content": f"bulk {i} " * (i % 13 + 1)} for i in range(100)])
+            trim.get_finished_chatlog()
+        self.assertEqual(len(estimated.trimmed_chatlog), len(exact.trimmed_chatlog))
+        self.assertEqual(estimated.trimmed_chatlog_tokens, exact.trimmed_chatlog_tokens)
+        self.assertEqual(estimated.trimmed_messages, exact.trimmed_messages)
+
+    def test_save_keeps_uncounted_messages_uncounted(self):
+        trim = chat.TrimChatLog(max_tokens=1000, max_completion_tokens=100, token_padding=100, token_estimate=True)
+        trim.add_messages_from_dict([{"role": "user", "content": f"message {i} " * 20} for i in range(50)])
+        save = trim.make_save_dict()
+        self.assertIn(None, save["chatlog"]["token_counts"])
+        loaded = chat.TrimChatLog()
+        loaded.load_from_save_dict(save)
+        self.assertEqual(loaded.trimmed_chatlog_tokens, trim.trimmed_chatlog_tokens)
+        self.assertEqual(len(loaded.chatlog), 50)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
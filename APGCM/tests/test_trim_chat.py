@@ -140,6 +140,146 @@ class TestTrimChatLog(unittest.TestCase):
             self.trim.reminder = 1
         with self.assertRaises(exceptions.BadTypeError):
             self.trim.reminder = True
+    def test_lazy_load(self):
+        """Tests that loading a save leaves the full chat log pending until it is used, and that it has the saved messages and the ones added since"""
+        self.trim.system_prompt = "hello"
+        self.trim.reminder = "remember"
+        self.trim.user_message = "first"
+        self.trim.assistant_message = "second"
+        test_trim = chat.TrimChatLog()
+        test_trim.load_from_save_dict(self.trim.make_save_dict())
+        self.assertTrue(test_trim.is_history_pending)
+        self.assertEqual(test_trim.get_finished_chatlog(), self.trim.get_finished_chatlog())
+        test_trim.user_message = "third"
+        self.assertTrue(test_trim.is_history_pending)
+        self.assertEqual(
+            [msg.content for msg in test_trim.chatlog.data],
+            ["first", "second", "third"],
+        )
+        self.assertFalse(test_trim.is_history_pending)
+    def test_lazy_save_matches_loaded_save(self):
+        """Tests that saving before the full chat log is loaded gives the same save as saving after"""
+        self.trim.add_messages_from_dict(func.get_test_chat_log())
+        lazy_trim = chat.TrimChatLog()
+        lazy_trim.load_from_save_dict(self.trim.make_save_dict())
+        lazy_trim.user_message = "hello"
+        loaded_trim = chat.TrimChatLog()
+        loaded_trim.load_from_save_dict(self.trim.make_save_dict())
+        loaded_trim.user_message = "hello"
+        loaded_trim.load_full_history()
+        lazy_save = lazy_trim.make_save_dict()
+        self.assertTrue(lazy_trim.is_history_pending)
+        loaded_save = loaded_trim.make_save_dict()
+        for save in (lazy_save, loaded_save):
+            save["timestamp"] = 0.00
+            save["chatlog"]["meta"] = {}
+            # the message arrays have when each message was added, the two hello messages weren't added at the same time
+            if "arrays" in save["chatlog"]:
+                save["chatlog"]["arrays"]["timestamps"] = None
+        self.assertEqual(lazy_save, loaded_save)
+    def test_lazy_reset(self):
+        """Tests that resetting drops a pending chat log without loading it"""
+        self.trim.user_message = "hello"
+        test_trim = chat.TrimChatLog()
+        test_trim.load_from_save_dict(self.trim.make_save_dict())
+        test_trim.reset()
+        self.assertFalse(test_trim.is_history_pending)
+        self.assertEqual(len(test_trim.chatlog), 0)
+    def test_window_saved_as_range(self):
+        """Tests that the trimmed chat log is saved as a range into the chatlog, and that loading the full chat log shares the Message objects"""
+        self.trim.set_token_info(max_messages=3)
+        for i in range(6):
+            self.trim.user_message = str(i)
+        save = self.trim.make_save_dict()
+        self.assertIsNone(save["trimmed_chatlog"])
+        self.assertEqual(save["trimmed_chatlog_range"], {"start": 3, "end": 6})
+        test_trim = chat.TrimChatLog()
+        test_trim.load_from_save_dict(save)
+        self.assertEqual(test_trim.get_finished_chatlog(), self.trim.get_finished_chatlog())
+        test_trim.user_message = "6"
+        test_trim.load_full_history()
+        for chatlog_message, window_message in zip(test_trim.chatlog.data[-3:], test_trim.trimmed_chatlog):
+            self.assertIs(chatlog_message, window_message)
+    def test_window_saved_as_list(self):
+        """Tests that a trimmed chat log that isn't the end of the chatlog, or has no chatlog, is still saved as a list"""
+        self.trim.user_message = "hello"
+        self.trim.add_chatlog(chat.ChatLog("gpt-4"))
+        self.trim.user_message = "world"
+        save = self.trim.make_save_dict()
+        self.assertEqual(save["trimmed_chatlog"], [{"role": "user", "content": "hello"}, {"role": "user", "content": "world"}])
+        self.assertNotIn("trimmed_chatlog_range", save)
+        self.trim.add_chatlog(None)
+        self.assertIsNotNone(self.trim.make_save_dict()["trimmed_chatlog"])
+    def test_bad_window_range(self):
+        """Tests that a range outside of the chatlog raises an error"""
+        self.trim.user_message = "hello"
+        save = self.trim.make_save_dict()
+        save["trimmed_chatlog_range"] = {"start": 0, "end": 5}
+        with self.assertRaises(exceptions.BadSaveDictionaryError):
+            chat.TrimChatLog().load_from_save_dict(save)
+    def test_oversized_message_is_kept(self):
+        """Tests that a message too long on its own is cut to fit instead of trimming everything"""
+        long_message = " ".join(f"word{i}" for i in range(3000))
+        for policy in ("truncate", "head_tail", "split"):
+            trim = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, oversize_policy=policy)
+            trim.user_message = "hello"
+            trim.user_message = long_message
+            finished = trim.get_finished_chatlog()
+            self.assertGreater(len(finished), 0)
+            self.assertLessEqual(chat.tokenizer.count_chat_tokens(finished, trim.model), trim.max_tokens - trim.max_completion_tokens)
+            self.assertEqual(trim.trimmed_chatlog_tokens, chat.tokenizer.count_chat_tokens(finished, trim.model) - 3)
+            self.assertEqual(trim.chatlog.data[-1].content, long_message)
+            if policy != "truncate":
+                self.assertTrue(finished[-1]["content"].endswith("word2999"))
+        drop = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, oversize_policy="drop")
+        drop.add_messages_from_dict([{"role": "user", "content": long_message}])
+        self.assertEqual(drop.get_finished_chatlog(), [])
+    def test_prefix_stable(self):
+        """Tests that prefix stability keeps the start of requests the same and still fits the limits"""
+        shared_ratios = []
+        for prefix_stable in (False, True):
+            trim = chat.TrimChatLog(max_tokens=1500, max_completion_tokens=200, system_prompt="It is ||time||.", prefix_stable=prefix_stable)
+            for i in range(100):
+                trim.user_message = f"question {i} " * 10
+                finished = trim.get_finished_chatlog()
+                self.assertLessEqual(chat.tokenizer.count_chat_tokens(finished, trim.model), trim.max_tokens - trim.max_completion_tokens)
+                trim.assistant_message = f"answer {i} " * 20
+            shared_ratios.append(trim.prefix_stats["shared_ratio"])
+            self.assertEqual(trim.prefix_stats["requests"], 100)
+        self.assertGreater(shared_ratios[1], 0.5)
+        self.assertGreater(shared_ratios[1], shared_ratios[0])
+    def test_adaptive_completion(self):
+        """Tests that adaptive completion reserves room from recent replies and gives the reply the rest of the context"""
+        fixed = chat.TrimChatLog(max_tokens=2000, max_completion_tokens=1000)
+        adaptive = chat.TrimChatLog(max_tokens=2000, max_completion_tokens=1000, adaptive_completion=True)
+        adaptive.min_completion_tokens = 50
+        for trim in (fixed, adaptive):
+            for i in range(60):
+                trim.user_message = f"question {i} " * 10
+                trim.assistant_message = f"answer {i} " * 5
+            trim.user_message = "last question"
+        finished = adaptive.get_finished_chatlog()
+        self.assertLess(adaptive.completion_reservation, 1000)
+        self.assertEqual(chat.tokenizer.count_chat_tokens(finished, adaptive.model), adaptive.prompt_tokens)
+        self.assertEqual(adaptive.completion_tokens, min(adaptive.max_tokens - adaptive.prompt_tokens, adaptive.completion_cap or adaptive.max_tokens))
+        self.assertGreaterEqual(adaptive.completion_tokens, adaptive.completion_reservation)
+        self.assertGreater(len(finished), len(fixed.get_finished_chatlog()))
+        self.assertEqual(fixed.completion_tokens, 1000)
+    def test_adaptive_completion_prompt_over_budget(self):
+        """Tests that a system prompt bigger than max_tokens still leaves min_completion_tokens for the reply"""
+        adaptive = chat.TrimChatLog(max_tokens=300, max_completion_tokens=100, adaptive_completion=True, system_prompt="You are helpful. " * 200)
+        adaptive.min_completion_tokens = 50
+        adaptive.user_message = "Hello"
+        with self.assertLogs(adaptive.logger._logger, level="WARNING"):
+            adaptive.get_finished_chatlog()
+        self.assertGreater(adaptive.prompt_tokens, adaptive.max_tokens)
+        self.assertEqual(adaptive.completion_tokens, 50)
+        adaptive.min_completion_tokens = 0
+        adaptive.get_finished_chatlog()
+        self.assertEqual(adaptive.completion_tokens, 1)
+    def test_bad_oversize_policy(self):
+        with self.assertRaises(exceptions.UnknownOversizePolicyError):
+            self.trim.oversize_policy = "shrink"
     
     def tearDown(self):
         del self.trim
@@ -0,0 +1,138 @@
+import pickle
+import unittest
+
+import chat
+
+
+class TestMessageView(unittest.TestCase):
+    def setUp(self):
+        self.message_factory = chat.MessageFactory("gpt-4")
+        self.messages = [
+            self.message_factory(role="user" if i % 2 == 0 else "assistant", content=f"message {i}")
+            for i in range(6)
+        ]
+
+    def test_directions_and_limit(self):
+        view = chat.MessageView(self.messages, limit=2)
+        self.assertEqual([msg.content for msg in view], ["message 5", "message 4"])
+        self.assertEqual(len(view), 2)
+        view = chat.MessageView(self.messages, reverse=False)
+        self.assertEqual([msg.content for msg in view], [f"message {i}" for i in range(6)])
+        self.assertEqual(list(chat.MessageView(self.messages, limit=0)), [])
+
+    def test_positions_and_offset(self):
+        """Only the given positions are visited, shifted by offset"""
+        view = chat.MessageView(self.messages, positions=[11, 13], offset=10)
+        self.assertEqual([msg.content for msg in view], ["message 3", "message 1"])
+        self.assertEqual(view.first().content, "message 3")
+        self.assertIsNone(chat.MessageView([], limit=1).first())
+
+    def test_view_does_not_copy(self):
+        """The view sees messages added after it was made"""
+        view = chat.MessageView(self.messages, reverse=False)
+        self.messages.append(self.message_factory(role="user", content="late"))
+        self.assertEqual(list(view)[-1].content, "late")
+
+
+class TestMessageWindow(unittest.TestCase):
+    def setUp(self):
+        self.message_factory = chat.MessageFactory("gpt-4")
+        self.window = chat.MessageWindow()
+        for i in range(6):
+            self.window.append(self.message_factory(role="user" if i % 2 == 0 else "assistant", content=f"message {i}"))
+
+    def test_last_after_trimming(self):
+        """popleft keeps the role positions correct"""
+        self.assertEqual(self.window.last("user").content, "message 4")
+        for _ in range(5):
+            self.window.popleft()
+        self.assertEqual(self.window.start, 5)
+        self.assertIsNone(self.window.last("user"))
+        self.assertEqual(self.window.last("assistant").content, "message 5")
+        self.assertEqual(self.window.last().content, "message 5")
+        self.window.append(self.message_factory(role="user", content="message 6"))
+        self.assertEqual(self.window.last("user").content, "message 6")
+
+    def test_view(self):
+        view = self.window.view(role="user", limit=2)
+        self.assertEqual([msg.content for msg in view], ["message 4", "message 2"])
+        view = self.window.view(role="assistant", reverse=False, pretty=True)
+        self.assertEqual(list(view), [msg.pretty for msg in self.window if msg.role == "assistant"])
+
+    def test_untracked_changes_rebuild(self):
+        """Changes other than append and popleft mark the index stale, and it is rebuilt when used"""
+        self.window.pop()
+        self.assertEqual(self.window.last("assistant").content, "message 3")
+        self.window.appendleft(self.message_factory(role="system", content="first"))
+        self.assertEqual(self.window.last("system").content, "first")
+        self.window[-1] = self.message_factory(role="assistant", content="replaced")
+        self.assertEqual(self.window.last("assistant").content, "replaced")
+        self.assertEqual(self.window.last("user").content, "message 2")
+
+    def test_maxlen_and_pickle(self):
+        window = chat.MessageWindow(list(self.window), maxlen=3)
+        window.append(self.message_factory(role="user", content="message 6"))
+        self.assertEqual([msg.content for msg in window], ["message 4", "message 5", "message 6"])
+        self.assertEqual(window.last("assistant").content, "message 5")
+        copied = pickle.loads(pickle.dumps(window))
+        self.assertIsInstance(copied, chat.MessageWindow)
+        self.assertEqual(copied.last("user").content, "message 6")
+
+
+class TestChatLogViews(unittest.TestCase):
+    def setUp(self):
+        self.message_factory = chat.MessageFactory("gpt-4")
+        self.chatlog = chat.ChatLog("gpt-4")
+        for i in range(6):
+            self.chatlog.add_message(self.message_factory(role="user" if i % 2 == 0 else "assistant", content=f"message {i}"))
+
+    def test_last(self):
+        self.assertEqual(self.chatlog.last("user").content, "message 4")
+        self.assertEqual(self.chatlog.last().content, "message 5")
+        self.assertIsNone(self.chatlog.last("system"))
+
+    def test_index_rebuilt_after_reset_and_replace(self):
+        self.chatlog.reset()
+        self.assertIsNone(self.chatlog.last("user"))
+        self.chatlog.add_message(self.message_factory(role="user", content="again"))
+        self.assertEqual(self.chatlog.last("user").content, "again")
+        self.chatlog.data = [self.message_factory(role="assistant", content="replaced")]
+        self.assertIsNone(self.chatlog.last("user"))
+        self.assertEqual(self.chatlog.last("assistant").content, "replaced")
+        self.chatlog.data.append(self.message_factory(role="user", content="appended directly"))
+        self.assertEqual(self.chatlog.last("user").content, "appended directly")
+
+    def test_get_messages_matches_view(self):
+        self.assertEqual(
+            [msg.content for msg in self.chatlog.get_messages(role="assistant", limit=2)],
+            ["message 5", "message 3"],
+        )
+
+
+class TestTrimChatLogViews(unittest.TestCase):
+    def setUp(self):
+        self.trim = chat.TrimChatLog(max_messages=4)
+        for i in range(6):
+            if i % 2 == 0:
+                self.trim.user_message = f"message {i}"
+            else:
+                self.trim.assistant_message = f"message {i}"
+
+    def test_window_is_a_message_window(self):
+        self.assertIsInstance(self.trim.trimmed_chatlog, chat.MessageWindow)
+        self.assertEqual(len(self.trim.trimmed_chatlog), 4)
+        self.assertEqual(self.trim.user_message, "message 4")
+        self.assertEqual(self.trim.assistant_message, "message 5")
+        self.assertEqual(self.trim.user_message_as_Message.content, "message 4")
+
+    def test_trimmed_messages_as_dict_reverse(self):
+        """reverse=True used to slice the deque, which raised a TypeError"""
+        messages = self.trim.get_trimmed_messages_as_dict(reverse=True)
+        self.assertEqual([msg["content"] for msg in messages], ["message 5", "message 4", "message 3", "message 2"])
+        messages = self.trim.get_trimmed_messages_as_dict(role="user", limit=1, reverse=True)
+        self.assertEqual(messages, [{"role": "user", "content": "message 4"}])
+
+    def test_setting_the_window_wraps_it(self):
+        self.trim.trimmed_chatlog = [self.trim.chatlog.data[0]]
+        self.assertIsInstance(self.trim.trimmed_chatlog, chat.MessageWindow)
+        self.assertEqual(self.trim.user_message, "message 0")
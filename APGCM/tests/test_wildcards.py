@@ -0,0 +1,58 @@
+import datetime
+import unittest
+
+import chat
+from chat import tokenizer, wildcards
+
+
+class TestWildcardRenderer(unittest.TestCase):
+    def tearDown(self):
+        wildcards.unregister_wildcard("counter")
+
+    def test_render_matches_replace(self):
+        template = "||model|| on ||date|| at ||time||, cut off ||cut_off||, ||unknown|| stays. ||model||"
+        context = wildcards.make_context("gpt-4")
+        expected = (
+            template.replace("||model||", "gpt-4")
+            .replace("||date||", context.now.strftime("%B %d, %Y"))
+            .replace("||time||", context.now.strftime("%H:%M:%S"))
+            .replace("||cut_off||", "September 21, 2021")
+        )
+        renderer = wildcards.WildcardRenderer(template)
+        self.assertEqual(renderer.render(context), expected)
+        self.assertEqual(renderer.count_tokens(context), tokenizer.count_tokens(expected, "gpt-4"))
+        self.assertTrue(wildcards.WildcardRenderer("no wildcards ||here||").is_static)
+
+    def test_registered_wildcard_lifetime(self):
+        calls = []
+
+        def value(context):
+            calls.append(context)
+            return str(len(calls))
+
+        renderer = wildcards.WildcardRenderer("count ||counter||")
+        self.assertEqual(renderer.render(wildcards.make_context("gpt-4")), "count ||counter||")
+        wildcards.register_wildcard(wildcards.Wildcard("counter", value, lifetime=3600))
+        # compiled again now that counter is registered
+        self.assertEqual(renderer.render(wildcards.make_context("gpt-4")), "count 1")
+        self.assertEqual(renderer.render(wildcards.make_context("gpt-4")), "count 1")
+        wildcards.register_wildcard(wildcards.Wildcard("counter", value, lifetime=0))
+        self.assertEqual(renderer.render(wildcards.make_context("gpt-4")), "count 2")
+        self.assertEqual(renderer.render(wildcards.make_context("gpt-4")), "count 3")
+
+    def test_system_prompt_and_reminder(self):
+        system_prompt = chat.SystemPrompt("gpt-4", "You are ||model||.")
+        self.assertEqual(system_prompt.system_prompt_message.content, "You are gpt-4.")
+        self.assertEqual(system_prompt.system_prompt_tokens, tokenizer.count_tokens("You are gpt-4.", "gpt-4"))
+        system_prompt.model = "gpt-3.5-turbo"
+        self.assertEqual(system_prompt.system_prompt, "You are gpt-3.5-turbo.")
+        reminder = chat.Reminder("gpt-4", "it is ||time||", prepend="Note: ")
+        # the time is the 24 hour clock, not the month
+        hour = datetime.datetime.now().strftime("%H")
+        self.assertRegex(reminder.prepared_reminder, r"^Note: it is \d\d:\d\d:\d\d$")
+        self.assertTrue(reminder.prepared_reminder[12:14] in (hour, f"{(int(hour) + 1) % 24:02d}"))
+        self.assertEqual(reminder.count_tokens(), tokenizer.count_tokens(reminder.prepared_reminder, "gpt-4"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -11,6 +11,8 @@ from config import ChangeConfig
 from discord import app_commands
 from APGCM import DEFAULT_LOGGING_LEVEL, BaseLogger, exceptions, chat_utilities
 from APGCM.log_config import DEFAULT_LOGGING_LEVEL, BaseLogger
+from APGCM import JsonSaveHandler, SaveSearcher
+from APGCM import ModeProfile, register_profile, get_profile
 from bot.bot_helpers import (
     get_chat_history,
     make_chat_wrapper,
@@ -33,6 +35,14 @@ class Modes(Enum):
     ASSISTANT_MODE = 3
 
 
+# the mode profile(see APGCM/chat/profiles.py) of each mode, help mode is toggled rather than switched to
+MODE_PROFILE_NAMES = {
+    Modes.DEFAULT_MODE.value: "default",
+    Modes.CASUAL_MODE.value: "casual",
+    Modes.ASSISTANT_MODE.value: "assistant",
+}
+
+
 def split_response(response: str, max_len: int = 1990) -> list:
     """Take a string and split it into a list of strings, each of which is no longer than 2000 characters."""
 
@@ -93,7 +103,7 @@ class DiscordBot(commands.Cog):
         home_channel (int): The channel ID that the bot treats as its "home" channel. Most activity is limited to this channel.
         config (ChangeConfig): The bot's configuration object.
         help_mode (bool): Whether help mode is enabled. Help mode provides demo prompts and disables autosaving.
-        current_mode (str): The current conversation mode. Can be "default", "casual", or "assistant".
+        current_mode (str): The current conversation mode. Can be "default", "casual", "assistant", "help" or a mode added with /modes add_mode.
         
     Methods:
         on_ready(): Called when the bot has connected to Discord. Sends a ready message to the home channel.
@@ -102,7 +112,7 @@ class DiscordBot(commands.Cog):
 
         process_mode_change(mode): Changes conversation mode by updating prompt, reminder, etc.
 
-        toggle_help(): Toggles help mode on/off by settings props and loading/saving history.
+        toggle_help(): Toggles help mode on/off by setting props and taking/going back to a ChatWrapper snapshot.
 
         process_ai_message(message): Passes a message to the AI and sends the response.
 
@@ -140,10 +150,10 @@ class DiscordBot(commands.Cog):
 
         # return type deals with the way chatwrapper returns messages, we want it to return a string. In this bot we don't need the other return types.
         self.cw.return_type = "string"
+        self._register_mode_profiles()
         self.cw.system_prompt = DISCORD_SETTINGS_BAG.DEFAULT_DISCORD_SYSTEM_PROMPT
         self.cw.load_auto_save()  # will load the most recent auto save if one exists
-        # we don't need a record of previous messages, unset the chatlog
-        self.cw.trim_object.add_chatlog(None)
+        # the full chat log of a save is only loaded when print_history or export need it, so there is no need to unset it
         self.cw.reminder = DISCORD_SETTINGS_BAG.DEFAULT_REMINDER
         self.home_channel = int(home_channel)
         self.logger.info("Discord bot initialized!")
@@ -154,6 +164,8 @@ class DiscordBot(commands.Cog):
         self.current_mode = "default"
         self.accumulator_mode = False
         self._accumulated_message = ""
+        # made the first time search_saves is used
+        self._save_searcher: SaveSearcher = None
 
     autosaving = app_commands.Group(
         name="autosaving", description="Autosaving commands"
@@ -175,6 +187,16 @@ class DiscordBot(commands.Cog):
         ):
             self.home_channel = self.config.home_channel
 
+    def _register_mode_profiles(self):
+        """Registers the profiles of the built in modes, compiled and counted for the model now so switching to one only trims."""
+        for name, system_prompt, reminder in (
+            ("default", DISCORD_SETTINGS_BAG.DEFAULT_DISCORD_SYSTEM_PROMPT, DISCORD_SETTINGS_BAG.DEFAULT_REMINDER),
+            ("casual", DISCORD_SETTINGS_BAG.CASUAL_MODE_SYSTEM_PROMPT, DISCORD_SETTINGS_BAG.CASUAL_MODE_REMINDER),
+            ("assistant", DISCORD_SETTINGS_BAG.ASSISTANT_MODE_SYSTEM_PROMPT, DISCORD_SETTINGS_BAG.ASSISTANT_MODE_REMINDER),
+            ("help", DISCORD_SETTINGS_BAG.HELP_MODE_PROMPT, DISCORD_SETTINGS_BAG.HELP_MODE_REMINDER),
+        ):
+            register_profile(ModeProfile(name, system_prompt, reminder), models=[self.cw.model])
+
     def _sync_autosaving(self):
         self.cw.set_is_saving(config.auto_saving_enabled)
         self.cw.set_auto_save_info(auto_save_frequency=config.auto_save_frequency)
@@ -184,31 +206,20 @@ class DiscordBot(commands.Cog):
         """Returns a string containing all of the save names."""
         return ", ".join(self.cw.all_entry_names)
 
-    def process_mode_change(self, mode: int) -> None:
-        """Processes a mode change."""
+    async def process_mode_change(self, mode: int | str) -> None:
+        """Processes a mode change, to one of Modes or the name of a registered mode profile. The old auto saves are deleted off the event loop."""
+        name = MODE_PROFILE_NAMES.get(mode, mode)
+        if name == "help" or not isinstance(name, str):
+            raise ValueError("Invalid mode!")
+        profile = get_profile(name)  # raises UnknownProfileError before anything changes
         if self.help_mode:
             self.toggle_help()
             print("Help mode disabled!")
-        if mode == Modes.DEFAULT_MODE.value:
-            self.cw.system_prompt = DISCORD_SETTINGS_BAG.DEFAULT_DISCORD_SYSTEM_PROMPT
-            self.cw.reminder = DISCORD_SETTINGS_BAG.DEFAULT_REMINDER
-            self.current_mode = "default"
-            print("Mode set to default!")
-
-        elif mode == Modes.CASUAL_MODE.value:
-            self.cw.system_prompt = DISCORD_SETTINGS_BAG.CASUAL_MODE_SYSTEM_PROMPT
-            self.cw.reminder = DISCORD_SETTINGS_BAG.CASUAL_MODE_REMINDER
-            self.current_mode = "casual"
-            print("Mode set to casual!")
-        elif mode == Modes.ASSISTANT_MODE.value:
-            self.cw.system_prompt = DISCORD_SETTINGS_BAG.ASSISTANT_MODE_SYSTEM_PROMPT
-            self.cw.reminder = DISCORD_SETTINGS_BAG.ASSISTANT_MODE_REMINDER
-            self.current_mode = "assistant"
-            print("Mode set to assistant!")
-        else:
-            raise ValueError("Invalid mode!")
+        self.cw.apply_profile(profile)
+        self.current_mode = name
+        print(f"Mode set to {name}!")
 
-        self.cw.rotating_save_handler.reset()  # so the old values don't get automatically loaded
+        await asyncio.to_thread(self.cw.rotating_save_handler.reset)  # so the old values don't get automatically loaded
 
     def toggle_help(self) -> Tuple[bool, str]:
         """
@@ -219,16 +230,16 @@ class DiscordBot(commands.Cog):
             self.help_mode = False
             self.current_mode = self.old_mode
             self.logger.info("Help mode disabled!")
-            if self.cw.check_entry_name("temp_help_mode_save"):
-                self.cw.load("temp_help_mode_save")
-                self.cw.set_is_saving(True)
-                self.cw.delete_entry("temp_help_mode_save")
+            snapshot = self.cw.peek_snapshot()
+            if snapshot is not None and snapshot.label == "help_mode":
+                # drop the help mode chat and carry on where we were
+                self.cw.pop_snapshot()
                 return True, "Help mode disabled"
             else:
-                self.logger.warning("Help mode save does not exist!")
+                self.logger.warning("Chat from before help mode does not exist!")
                 return (
                     False,
-                    "Help mode save does not exist! If you are seeing this message, something has gone horribly wrong. Please contact the developer.",
+                    "The chat from before help mode does not exist! If you are seeing this message, something has gone horribly wrong. Please contact the developer.",
                 )
         else:
             self.old_mode = self.current_mode
@@ -236,13 +247,11 @@ class DiscordBot(commands.Cog):
             self.help_mode = True
             self.logger.info("Help mode enabled!")
 
-            self.cw.save("temp_help_mode_save", overwrite=True)
-            self.cw.set_is_saving(
-                False
-            )  # turn off auto saving so we dont loose previous autosaves
-            self.cw.trim_object.reset()  # reset the chat log
-            self.cw.reminder = DISCORD_SETTINGS_BAG.HELP_MODE_REMINDER
-            self.cw.system_prompt = DISCORD_SETTINGS_BAG.HELP_MODE_PROMPT
+            # a snapshot shares the chat log instead of saving it and loading it back
+            self.cw.push_snapshot("help_mode")
+            self.cw.set_is_saving(False)  # so we dont loose previous autosaves, the snapshot turns it back on
+            self.cw.trim_object.reset()  # reset the chat log, only the fork the snapshot left in use
+            self.cw.apply_profile("help")
             return True, "Help mode enabled"
 
     async def process_ai_message(self, message: discord.Message) -> None:
@@ -400,7 +409,7 @@ class DiscordBot(commands.Cog):
         description="Sets the system prompt to the default system prompt.",
     )
     async def default_mode(self, interaction: discord.Interaction) -> None:
-        self.process_mode_change(Modes.DEFAULT_MODE.value)
+        await self.process_mode_change(Modes.DEFAULT_MODE.value)
         self.logger.info("Default mode command called!")
         await interaction.response.send_message("Mode set to default!", delete_after=20)
 
@@ -423,7 +432,7 @@ class DiscordBot(commands.Cog):
         description="Sets the system prompt to the casual system prompt.",
     )
     async def casual_mode(self, interaction: discord.Interaction) -> None:
-        self.process_mode_change(Modes.CASUAL_MODE.value)
+        await self.process_mode_change(Modes.CASUAL_MODE.value)
         self.logger.info("Casual mode command called!")
         print("Mode set to casual!")
         await interaction.response.send_message("Mode set to casual!", delete_after=20)
@@ -433,12 +442,59 @@ class DiscordBot(commands.Cog):
         description="Sets the system prompt to the assistant system prompt.",
     )
     async def assistant_mode(self, interaction: discord.Interaction) -> None:
-        self.process_mode_change(Modes.ASSISTANT_MODE.value)
+        await self.process_mode_change(Modes.ASSISTANT_MODE.value)
         self.logger.info("Assistant mode command called!")
         await interaction.response.send_message(
             "Mode set to assistant!", delete_after=20
         )
 
+    @modes.command(
+        name="add_mode",
+        description="Adds a mode with its own system prompt and reminder, or replaces one.",
+    )
+    @app_commands.describe(
+        name="The name of the mode.",
+        system_prompt="The system prompt of the mode, can use wildcards like ||time||.",
+        reminder="The reminder of the mode.",
+    )
+    async def add_mode(
+        self,
+        interaction: discord.Interaction,
+        name: str,
+        system_prompt: str,
+        reminder: Optional[str] = None,
+    ) -> None:
+        name = name.lower().strip()
+        if name == "help":
+            await interaction.response.send_message(
+                "Help mode can't be replaced!", delete_after=20
+            )
+            return
+        profile = register_profile(
+            ModeProfile(name, system_prompt, reminder, description="Added with /modes add_mode"),
+            models=[self.cw.model],
+        )
+        self.logger.info(f"Mode {name} added!")
+        await interaction.response.send_message(
+            f"Mode {name} added, it takes {profile.budget(self.cw.model)} tokens. Use /modes switch_mode to use it.",
+            delete_after=20,
+        )
+
+    @modes.command(name="switch_mode", description="Switches to a mode by name.")
+    @app_commands.describe(name="The name of the mode.")
+    async def switch_mode(self, interaction: discord.Interaction, name: str) -> None:
+        try:
+            await self.process_mode_change(name.lower().strip())
+        except (exceptions.UnknownProfileError, ValueError):
+            await interaction.response.send_message(
+                f"There is no mode called {name}!", delete_after=20
+            )
+            return
+        self.logger.info(f"Switch mode command called, mode {name}!")
+        await interaction.response.send_message(
+            f"Mode set to {self.current_mode}!", delete_after=20
+        )
+
     @modes.command(name="which_mode", description="Shows the current mode.")
     async def which_mode(self, interaction: discord.Interaction) -> None:
         await interaction.response.send_message(
@@ -602,7 +658,7 @@ class DiscordBot(commands.Cog):
         ecm = chat_utilities.auto_get_exporter(self.cw)
         # ECM is a context manager that creates a markdown file, returns it in enter, and then deletes it in exit
         with ecm as f:
-            file = discord.File(f, filename="export.md")
+            file = discord.File(f, filename="export" + ecm.extension)
             channel = interaction.channel
             await channel.send(file=file, delete_after=60)
         await interaction.response.send_message("Export complete!", delete_after=20)
@@ -745,6 +801,39 @@ class DiscordBot(commands.Cog):
                 "No chat history to print!", delete_after=20
             )
 
+    @app_commands.command(
+        name="search", description="Searches the chat history, use quotes for exact phrases."
+    )
+    @app_commands.describe(
+        query='Words to search for, use "quotes" for exact phrases.',
+        limit="The most results to show.",
+    )
+    async def search(
+        self,
+        interaction: discord.Interaction,
+        *,
+        query: str,
+        limit: app_commands.Range[int, 1, 20] = 5,
+    ) -> None:
+        """Searches the chat wrapper's full chat history and shows the best matching snippets with their positions."""
+        self.logger.info("Search command called!")
+        results = self.cw.trim_object.search(query, limit=limit)
+        if len(results) == 0:
+            await interaction.response.send_message(
+                f"Nothing in the chat history matches: {query}", delete_after=20
+            )
+            return
+        lines = [f"Results for: {query}"]
+        for result in results:
+            lines.append(f"#{result.position} ({result.message.role}): {result.snippet}")
+        data = "\n".join(lines)
+        await interaction.response.send_message(
+            f"Found {len(results)} results.", delete_after=20
+        )
+        for msg in split_response(data):
+            if len(msg) > 0:
+                await interaction.channel.send(msg, delete_after=60)
+
     # _______________(END GENERAL COMMANDS)_______________#
 
     # ==============================(SAVING COMMANDS)==============================#
@@ -818,6 +907,54 @@ class DiscordBot(commands.Cog):
                 "Save does not exist! Please use the get_saves command to see a list of all saves."
             )
 
+    @saving.command(
+        name="search_saves",
+        description="Searches every save for a conversation, use quotes for exact phrases.",
+    )
+    @app_commands.describe(
+        query='Words to search for, use "quotes" for exact phrases.',
+        limit="The most saves to show.",
+    )
+    async def search_saves(
+        self,
+        interaction: discord.Interaction,
+        *,
+        query: str,
+        limit: app_commands.Range[int, 1, 10] = 5,
+    ) -> None:
+        """Searches every save and shows each matching save's best message as soon as it is found.
+        Saves are read in a process pool, in a thread so the bot keeps responding, and the pool is shut down when the search is done. Only saves changed since the last search are read again.
+        """
+        self.logger.info("Search saves command called!")
+        if not isinstance(self.cw.save_handler, JsonSaveHandler):
+            await interaction.response.send_message(
+                "Searching saves needs a JsonSaveHandler!", delete_after=20
+            )
+            return
+        if self._save_searcher is None or self._save_searcher.save_handler is not self.cw.save_handler:
+            self._save_searcher = SaveSearcher(self.cw.save_handler)
+        await interaction.response.send_message(
+            f"Searching saves for: {query}", delete_after=60
+        )
+        results = self._save_searcher.iter_search(query, limit=limit)
+        found = 0
+        try:
+            while True:
+                result = await asyncio.to_thread(next, results, None)
+                if result is None:
+                    break
+                found += 1
+                msg = f"**{result.entry_name}** #{result.position} ({result.role}): {result.snippet}"
+                await interaction.channel.send(msg[:1990], delete_after=60)
+        finally:
+            results.close()
+            # the worker processes aren't kept between searches, the index of the saves is
+            await asyncio.to_thread(self._save_searcher.close)
+        if found == 0:
+            await interaction.channel.send(
+                f"No saves match: {query}", delete_after=20
+            )
+
     @saving.command(
         name="get_saves", description="Shows a list of all save names the bot has."
     )
@@ -5,7 +5,6 @@ from typing import Union, Optional, Any, Tuple, List, Callable, Iterable
 def make_chat_wrapper() -> ChatWrapper:
     fact = ChatFactory()
     cw = fact.get_chat()
-    cw.trim_object.add_chatlog(chatlog = None)
     cw.return_type = "string"
     save_handler = JsonSaveHandler()
     cw.add_save_handler(save_handler)
@@ -84,8 +83,10 @@ HELP_INFO = "\n".join(
         "`sys_prompt` - Sets the system prompt for the chat bot.",
         "`reminder` - Sets a reminder for the chat bot.",
         "`print_history` - Shows chat history(might be long)",
+        "`search` <query> [limit=5] - Searches the chat history and shows the best matching snippets. Use \"quotes\" for exact phrases.",
         "`get_saves`[include_autosaves=False] - Shows a list of all save names the bot has. Include autosaves by setting the optional parameter to True.",
         "`load` <save_name> - Loads the save with the given name.",
+        "`search_saves` <query> [limit=5] - Searches every save and shows the best matching message of each matching save. Use \"quotes\" for exact phrases.",
         "`save` <save_name> [overwrite=False] - Saves the chat wrapper's current state to a save with the given name. Set overwrite to True to overwrite the save if it already exists.",
         "`debug` - Prints the chat wrapper's debug information to the channel.",
         "`reset`[hard_reset=False] - Resets the chat wrapper's chat log. Set hard_reset to True to completely reset the chat wrapper, including the chat log, and deletes autosaves.",
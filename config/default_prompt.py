@@ -20,8 +20,10 @@ Here are the commands that APGDB recognizes:
         "`sys_prompt` - Sets the system prompt for the chat bot.",
         "`reminder` - Sets a reminder for the chat bot.",
         "`print_history` - Shows chat history(might be long)",
+        "`search` <query> [limit=5] - Searches the chat history and shows the best matching snippets. Use \"quotes\" for exact phrases.",
         "`get_saves`[include_autosaves=False] - Shows a list of all save names the bot has. Include autosaves by setting the optional parameter to True.",
         "`load` <save_name> - Loads the save with the given name.",
+        "`search_saves` <query> [limit=5] - Searches every save and shows the best matching message of each matching save. Use \"quotes\" for exact phrases.",
         "`save` <save_name> [overwrite=False] - Saves the chat wrapper's current state to a save with the given name. Set overwrite to True to overwrite the save if it already exists.",
         "`debug` - Prints the chat wrapper's debug information to the channel.",
         "`reset`[hard_reset=False] - Resets the chat wrapper's chat log. Set hard_reset to True to completely reset the chat wrapper, including the chat log, and deletes autosaves.",